@@ -1,6 +1,33 @@
+from .async_message_bus import AsyncMessageBus
 from .client import AsyncClient, CallbackClient, Client, SimpleClient
-from .message import Message, MessageProperties
+from .deduplication import DeduplicationFilter
+from .dispatcher import Dispatcher, ExecutorDispatcher, SynchronousDispatcher
+from .message import BinaryCodec, JSONCodec, Message, MessageCodec, MessageProperties
 from .message_bus import MessageBus
-from .routing import BroadcastRoutingPolicy, DirectOrFallbackRoutingPolicy, HashBasedRoutingPolicy, RoutingPolicy
-from .storage import FileBasedStorage, InMemoryStorage, RedisStorage, SQLStorage, StorageBackend
+from .retry import RetryPolicy
+from .routing import (
+    BroadcastRoutingPolicy,
+    ConsistentHashRoutingPolicy,
+    DirectOrFallbackRoutingPolicy,
+    HashBasedRoutingPolicy,
+    RoutingPolicy,
+    TopicRoutingPolicy,
+)
+from .sharding import ConsistentHashRing, ShardedMessageBus, ShardError
+from .shared_memory_message_bus import SharedMemoryMessageBus
+from .storage import (
+    AsyncRedisStorage,
+    AsyncSQLStorage,
+    AsyncStorageBackend,
+    Compressor,
+    FileBasedStorage,
+    InboxFullError,
+    InboxLimits,
+    InMemoryStorage,
+    OverflowPolicy,
+    RedisStorage,
+    SharedMemoryStorage,
+    SQLStorage,
+    StorageBackend,
+)
 from .utils import GemstoneGenerator, Priority
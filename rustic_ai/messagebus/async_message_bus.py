@@ -0,0 +1,125 @@
+from typing import List, Optional
+
+from .deduplication import DeduplicationFilter
+from .dispatcher import Dispatcher
+from .message import Message
+from .message_bus import MessageBus
+from .routing import RoutingPolicy
+from .storage import AsyncStorageBackend, StorageBackend
+
+
+class AsyncMessageBus(MessageBus):
+    """
+    A MessageBus for clients running on an asyncio event loop, such as AsyncClient.
+
+    Sending wakes the waiting AsyncClients through their event loop, so any number of clients can wait on
+    their inboxes from a single loop, without a thread per reader.
+
+    With an async storage backend, the async methods await it, so the storage round trips of many coroutines
+    are in flight at once instead of blocking the loop. The async backend works on the data of the storage
+    backend of the bus, like AsyncRedisStorage with RedisStorage or AsyncSQLStorage with SQLStorage, which
+    serves the synchronous methods, such as the replies, the scheduled messages and the dead letters.
+    Without one, the async methods call the storage backend of the bus on the loop itself, which suits storage
+    backends that do not block, like InMemoryStorage.
+    """
+
+    def __init__(
+        self,
+        id: Optional[str] = None,
+        machine_id: int = 1,
+        storage_backend: Optional[StorageBackend] = None,
+        routing_policy: Optional[RoutingPolicy] = None,
+        hybrid_clock: bool = False,
+        dispatcher: Optional[Dispatcher] = None,
+        deduplication_filter: Optional[DeduplicationFilter] = None,
+        async_storage_backend: Optional[AsyncStorageBackend] = None,
+    ):
+        """
+        Initialize the AsyncMessageBus like a MessageBus, with an optional async storage backend.
+
+        :param storage_backend: Storage backend to use for message storage
+        :param routing_policy: Routing policy to use for message delivery
+        :param hybrid_clock: Whether message IDs stay monotonic when the clock moves backwards, instead of failing
+        :param dispatcher: Dispatcher delivering new message notifications to the recipients
+        :param deduplication_filter: Filter dropping the messages sent again with the same idempotency key
+        :param async_storage_backend: Async storage backend on the data of the storage backend,
+            awaited by the async methods
+        """
+        if async_storage_backend is not None and storage_backend is None:
+            raise ValueError("An async storage backend needs the storage backend sharing its data")
+        super().__init__(
+            id, machine_id, storage_backend, routing_policy, hybrid_clock, dispatcher, deduplication_filter
+        )
+        self.async_storage: Optional[AsyncStorageBackend] = async_storage_backend
+
+    async def async_send_message(self, message: Message) -> None:
+        """
+        Send a message to the recipients determined by the routing policy.
+
+        :param message: The message to send
+        """
+        if self.async_storage is None:
+            self.send_message(message)
+            return
+
+        recipients, kept = self._route_message(message)
+        if not recipients:
+            return
+        try:
+            await self.async_storage.add_message_to_inboxes(self.id, recipients, message)
+        except BaseException:
+            self.deduplication_filter.forget(kept)
+            raise
+
+        self._notify(recipients)
+
+    async def async_send_messages(self, messages: List[Message]) -> None:
+        """
+        Send a batch of messages, notifying every recipient once for the whole batch.
+
+        :param messages: The messages to send
+        """
+        if self.async_storage is None:
+            self.send_messages(messages)
+            return
+
+        batches, kept_messages = self._route_messages(messages, deduplicate=True)
+        try:
+            for recipient_id, batch in batches.items():
+                await self.async_storage.add_messages_to_inbox(self.id, recipient_id, batch)
+        except BaseException:
+            self.deduplication_filter.forget(kept_messages)
+            raise
+
+        self._notify(batches)
+
+    async def async_get_next_unread_message(self, client_id: str, last_read_message_id: int) -> Optional[Message]:
+        """
+        Get the next unread message for the given client ID, starting from the last read message ID.
+
+        :param client_id: The client ID requesting the next unread message
+        :param last_read_message_id: The last read message ID for the client
+        :return: The next unread message if available, otherwise None
+        """
+        if self.async_storage is None:
+            return self.get_next_unread_message(client_id, last_read_message_id)
+        return await self.async_storage.get_next_unread_message(self.id, client_id, last_read_message_id)
+
+    async def async_get_thread(self, thread_id: int) -> List[Message]:
+        """
+        Get the messages of a thread still held by the inboxes, from the thread index of the storage backend.
+
+        :param thread_id: The ID of the thread, which is the ID of its first message
+        :return: The messages of the thread, once each, ordered by ID
+        """
+        if self.async_storage is None:
+            return self.get_thread(thread_id)
+        return await self.async_storage.get_thread(self.id, thread_id)
+
+    async def async_close(self) -> None:
+        """
+        Close the bus, then release the connections of the async storage backend.
+        """
+        self.close()
+        if self.async_storage is not None:
+            await self.async_storage.close()
@@ -1,45 +1,202 @@
 import asyncio
-from typing import Optional
+from typing import Dict, List, Optional
 
-from ..message import Message
+from ..async_message_bus import AsyncMessageBus
+from ..message import JSON, Message
 from ..message_bus import MessageBus
+from ..utils import Priority, get_expiry_time, get_time_after
 from .client import Client
 
 
 class AsyncClient(Client):
     """
-    WARNING: WIP DO NOT USE
-    An asynchronous implementation of the Client, using asyncio's Queue to manage messages.
+    An asynchronous implementation of the Client, waiting for messages on an asyncio event loop.
+
+    Messages are read with `await client.receive()` or `async for message in client`. New message
+    notifications are handed to the event loop with `call_soon_threadsafe`, so senders may run on any thread.
+    On a bus other than an AsyncMessageBus, the blocking calls to the bus run on the default executor of the
+    loop, so a slow storage backend never blocks the loop.
     """
 
-    def __init__(self, client_id: str, message_bus: MessageBus) -> None:
+    def __init__(
+        self, client_id: str, message_bus: MessageBus, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
         """
         Initialize the asynchronous client with a unique ID and a reference to the message bus.
 
         :param client_id: Unique identifier for this client
         :param message_bus: Reference to the message bus instance
+        :param loop: The event loop the client waits on, the running loop if not given
         """
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        self.loop = loop
+        # Created on the loop by the first wait, as the client may be created outside any loop
+        self.new_message_event: Optional[asyncio.Event] = None
+        self.wakeup_pending = False
+        self.closed = False
         super().__init__(client_id, message_bus)
 
     def get_next_unread_message(self) -> Optional[Message]:
         """
-        Synchronously get the next unread message from the queue for this client.
+        Synchronously get the next unread message for this client.
+
         :return: The next unread message, if one exists
         """
         message = self.message_bus.get_next_unread_message(self.client_id, self.last_read_message_id)
+        if message is not None:
+            self.last_read_message_id = message.id
         return message
 
-    async def async_get_next_unread_message(self) -> asyncio.Future[Optional[Message]]:
+    async def async_get_next_unread_message(self) -> Optional[Message]:
         """
-        Asynchronously get the next unread message from the queue for this client.
+        Asynchronously get the next unread message for this client, without waiting for one.
 
         :return: The next unread message, if one exists
         """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.get_next_unread_message)  # type: ignore
+        if isinstance(self.message_bus, AsyncMessageBus):
+            message = await self.message_bus.async_get_next_unread_message(self.client_id, self.last_read_message_id)
+            if message is not None:
+                self.last_read_message_id = message.id
+            return message
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_next_unread_message)
+
+    async def receive(self, timeout: Optional[float] = None) -> Message:
+        """
+        Wait for the next unread message.
+
+        :param timeout: Optional maximum time to wait, in seconds
+        :return: The next unread message
+        :raises asyncio.TimeoutError: If no message arrived in time
+        :raises StopAsyncIteration: If the client is closed
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self.new_message_event is None:
+            self.new_message_event = asyncio.Event()
+
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while True:
+            # Clear before reading, so a notification arriving after the read is not lost
+            self.new_message_event.clear()
+            message = await self.async_get_next_unread_message()
+            if message is not None:
+                return message
+            if self.closed:
+                raise StopAsyncIteration
+
+            remaining = None if deadline is None else deadline - self.loop.time()
+            await asyncio.wait_for(self.new_message_event.wait(), remaining)
+
+    def __aiter__(self) -> 'AsyncClient':
+        return self
+
+    async def __anext__(self) -> Message:
+        return await self.receive()
 
     def notify_new_message(self) -> None:
         """
-        Schedule a new task to fetch and process the new message asynchronously.
+        Wake the coroutine waiting for a message, from any thread. Notifications arriving before
+        the wake-up runs are coalesced into a single one.
         """
-        pass
+        loop = self.loop
+        if loop is None or self.new_message_event is None or self.wakeup_pending:
+            # Nobody waits yet, or a wake-up is already scheduled
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is loop:
+            self.new_message_event.set()
+        elif not loop.is_closed():
+            self.wakeup_pending = True
+            loop.call_soon_threadsafe(self._wake_up)
+
+    def _wake_up(self) -> None:
+        self.wakeup_pending = False
+        if self.new_message_event is not None:
+            self.new_message_event.set()
+
+    def close(self) -> None:
+        """
+        Stop iterating over the messages once the unread ones are consumed. Must be called on the event loop.
+        """
+        self.closed = True
+        if self.new_message_event is not None:
+            self.new_message_event.set()
+
+    async def async_request(
+        self,
+        content: JSON,
+        recipient: str,
+        timeout: Optional[float] = None,
+        priority: Priority = Priority.NORMAL,
+        topic: Optional[str] = None,
+    ) -> Message:
+        """
+        Send a request to a client and wait for its reply on the event loop.
+
+        :param content: The content of the request
+        :param recipient: The ID of the client to send the request to
+        :param timeout: Optional time in seconds to wait for the reply
+        :param priority: Optional priority level of the request
+        :param topic: Optional topic of the request
+        :return: The reply
+        :raises TimeoutError: If no reply arrived in time
+        """
+        # Cancelling the coroutine cancels the request too
+        return await asyncio.wrap_future(self.request(content, recipient, timeout, priority, topic))
+
+    async def async_send_message(
+        self,
+        content: JSON,
+        recipients: Optional[List[str]] = None,
+        priority: Priority = Priority.NORMAL,
+        topic: Optional[str] = None,
+        ttl: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        deliver_at: Optional[int] = None,
+        delay: Optional[float] = None,
+    ) -> Message:
+        """
+        Send a message through the message bus from the event loop.
+
+        :param content: The content of the message to send
+        :param recipients: Optional list of recipient client IDs
+        :param priority: Optional priority level of the message
+        :param topic: Optional topic of the message
+        :param ttl: Optional time to live of the message in seconds, after which it is dropped unread
+        :param idempotency_key: Optional key of the message, the message is dropped if one with the same key
+            was recently sent by this client, so a send can be retried safely
+        :param deliver_at: Optional time to deliver the message at, in milliseconds since the Unix epoch.
+            A scheduled message is kept by the storage backend until then, and delivered with a new ID.
+        :param delay: Optional delay in seconds before the message is delivered, instead of `deliver_at`
+        """
+        assert isinstance(content, Dict)
+        if delay is not None:
+            deliver_at = get_time_after(delay)
+        message_id = self.message_bus.generate_message_id(priority)
+        message = Message(
+            message_id,
+            sender=self.client_id,
+            content=content,
+            recipients=recipients,
+            priority=priority,
+            topic=topic,
+            expires_at=get_expiry_time(ttl, deliver_at),
+            idempotency_key=idempotency_key,
+        )
+        if deliver_at is not None:
+            self.message_bus.schedule_message(message, deliver_at)
+            return message
+        if isinstance(self.message_bus, AsyncMessageBus):
+            await self.message_bus.async_send_message(message)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.message_bus.send_message, message)
+        return message
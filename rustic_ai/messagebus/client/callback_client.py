@@ -1,28 +1,52 @@
 import logging
-from typing import Callable, Optional
+import threading
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
 
 from ..message import Message
 from ..message_bus import MessageBus
+from ..retry import RetryPolicy
 from .client import Client
 
 
 class CallbackClient(Client):
     """
     A client implementation that uses a callback function to process incoming messages.
+
+    With a retry policy, a message whose callback fails is handled again after a growing delay, and sent to
+    the dead-letter inbox of the bus after the last attempt. The delays run on the retry scheduler of the bus,
+    and a retry due is handled on a notification of the client through the delivery path, so nothing waits on it.
+    Notifications of the client are handled one at a time: one arriving while another thread handles messages
+    is left to that thread, which reads again before returning.
+    Without a retry policy, the failure is logged and the message dropped.
     """
 
-    def __init__(self, client_id: str, message_bus: MessageBus, message_callback: Callable[[Message], None]) -> None:
+    def __init__(
+        self,
+        client_id: str,
+        message_bus: MessageBus,
+        message_callback: Callable[[Message], None],
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
         """
         Initialize the callback client with a unique ID, a reference to the message bus, and a callback function.
 
         :param client_id: Unique identifier for this client
         :param message_bus: Reference to the message bus instance
         :param message_callback: The callback function to be triggered when a new message arrives
+        :param retry_policy: Optional policy to handle again the messages whose callback fails
         """
         super().__init__(client_id, message_bus)
         if not callable(message_callback):
             raise TypeError('message_callback must be a callable function')
         self.message_callback: Callable[[Message], None] = message_callback
+        self.retry_policy = retry_policy
+        # The messages due for another attempt, with their number of failed attempts
+        self.retries: Deque[Tuple[Message, int]] = deque()
+        # Whether a thread is handling the messages, and whether it must read again for a later notification
+        self.notifying = False
+        self.pending = False
+        self.notify_lock = threading.Lock()
         self.logger = logging.getLogger(__name__)
 
     def get_next_unread_message(self) -> Optional[Message]:
@@ -48,15 +72,53 @@ class CallbackClient(Client):
 
     def notify_new_message(self) -> None:
         """
-        Fetch the new message and handle it with the callback function.
+        Fetch the new messages and handle them with the callback function, after the retries due.
+        A batch of messages comes with a single notification, so all unread messages are handled.
+        """
+        with self.notify_lock:
+            if self.notifying:
+                self.pending = True
+                return
+            self.notifying = True
+
+        while True:
+            try:
+                while self.retries:
+                    self._try_message(*self.retries.popleft())
+                message = self.get_next_unread_message()
+                while message is not None:
+                    self._try_message(message, 0)
+                    message = self.get_next_unread_message()
+            except Exception as e:
+                self.logger.error('Error fetching message: %s', e)
+
+            with self.notify_lock:
+                if not self.pending:
+                    self.notifying = False
+                    return
+                self.pending = False
+
+    def _try_message(self, message: Message, failures: int) -> None:
+        """
+        Handle a message, scheduling another attempt or sending it to the dead letters if it fails.
+
+        :param message: The message to handle
+        :param failures: The number of failed attempts to handle it so far
         """
         try:
-            message = self.get_next_unread_message()
-            if message is not None:
-                self.handle_message(message)
+            self.handle_message(message)
         except Exception as e:
-            self.logger.error('Error handling message: %s', e)
-            pass
+            failures += 1
+            if self.retry_policy is None:
+                self.logger.error('Error handling message: %s', e)
+            elif failures < self.retry_policy.max_attempts:
+                self.logger.warning('Error handling message %s, attempt %d: %s', message.id, failures, e)
+                self.message_bus.retries.schedule(
+                    self.retry_policy.get_delay(failures), self, lambda: self.retries.append((message, failures))
+                )
+            else:
+                self.logger.error('Error handling message %s, sent to the dead letters: %s', message.id, e)
+                self.message_bus.send_to_dead_letters(message, self.client_id, e, failures)
 
     def process_all_unread_messages(self) -> None:
         """
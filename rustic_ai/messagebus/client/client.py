@@ -3,7 +3,8 @@ from typing import Dict, List, Optional
 
 from ..message import JSON, Message
 from ..message_bus import MessageBus
-from ..utils import Priority
+from ..rpc import ReplyFuture
+from ..utils import Priority, get_expiry_time, get_time_after
 
 
 class Client(ABC):
@@ -29,7 +30,15 @@ class Client(ABC):
             self.message_bus.unregister_client(self)
 
     def send_message(
-        self, content: JSON, recipients: Optional[List[str]] = None, priority: Priority = Priority.NORMAL
+        self,
+        content: JSON,
+        recipients: Optional[List[str]] = None,
+        priority: Priority = Priority.NORMAL,
+        topic: Optional[str] = None,
+        ttl: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        deliver_at: Optional[int] = None,
+        delay: Optional[float] = None,
     ) -> Message:
         """
         Send a message through the message bus.
@@ -37,10 +46,124 @@ class Client(ABC):
         :param content: The content of the message to send
         :param recipients: Optional list of recipient client IDs
         :param priority: Optional priority level of the message
+        :param topic: Optional topic of the message
+        :param ttl: Optional time to live of the message in seconds, after which it is dropped unread
+        :param idempotency_key: Optional key of the message, the message is dropped if one with the same key
+            was recently sent by this client, so a send can be retried safely
+        :param deliver_at: Optional time to deliver the message at, in milliseconds since the Unix epoch.
+            A scheduled message is kept by the storage backend until then, and delivered with a new ID.
+        :param delay: Optional delay in seconds before the message is delivered, instead of `deliver_at`
         """
         assert isinstance(content, Dict)
+        if delay is not None:
+            deliver_at = get_time_after(delay)
         message_id = self.message_bus.generate_message_id(priority)
-        message = Message(message_id, sender=self.client_id, content=content, recipients=recipients, priority=priority)
+        message = Message(
+            message_id,
+            sender=self.client_id,
+            content=content,
+            recipients=recipients,
+            priority=priority,
+            topic=topic,
+            expires_at=get_expiry_time(ttl, deliver_at),
+            idempotency_key=idempotency_key,
+        )
+        if deliver_at is not None:
+            self.message_bus.schedule_message(message, deliver_at)
+            return message
+        self.message_bus.send_message(message)
+        return message
+
+    def send_messages(
+        self,
+        contents: List[JSON],
+        recipients: Optional[List[str]] = None,
+        priority: Priority = Priority.NORMAL,
+        topic: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> List[Message]:
+        """
+        Send a batch of messages through the message bus at once.
+
+        :param contents: The contents of the messages to send
+        :param recipients: Optional list of recipient client IDs, shared by all the messages
+        :param priority: Optional priority level of the messages
+        :param topic: Optional topic of the messages
+        :param ttl: Optional time to live of the messages in seconds, after which they are dropped unread
+        """
+        assert all(isinstance(content, Dict) for content in contents)
+        message_ids = self.message_bus.generate_message_ids(len(contents), priority)
+        expires_at = get_expiry_time(ttl)
+        messages = [
+            Message(
+                message_id,
+                sender=self.client_id,
+                content=content,
+                recipients=recipients,
+                priority=priority,
+                topic=topic,
+                expires_at=expires_at,
+            )
+            for message_id, content in zip(message_ids, contents)
+        ]
+        self.message_bus.send_messages(messages)
+        return messages
+
+    def request(
+        self,
+        content: JSON,
+        recipient: str,
+        timeout: Optional[float] = None,
+        priority: Priority = Priority.NORMAL,
+        topic: Optional[str] = None,
+    ) -> ReplyFuture:
+        """
+        Send a request to a client and get the future of its reply. The reply is handed to the future as it
+        is sent, without going through the inbox of this client.
+
+        :param content: The content of the request
+        :param recipient: The ID of the client to send the request to
+        :param timeout: Optional time in seconds after which the future fails with a TimeoutError
+        :param priority: Optional priority level of the request
+        :param topic: Optional topic of the request
+        :return: The future of the reply, which can be cancelled to stop waiting for it
+        """
+        assert isinstance(content, Dict)
+        message_id = self.message_bus.generate_message_id(priority)
+        message = Message(
+            message_id, sender=self.client_id, content=content, recipients=[recipient], priority=priority, topic=topic
+        )
+        # Registered before sending, so a reply sent right away is not missed
+        future = self.message_bus.register_request(message_id, self.client_id, timeout)
+        try:
+            self.message_bus.send_message(message)
+        except Exception:
+            future.cancel()
+            raise
+        return future
+
+    def reply(self, request: Message, content: JSON, priority: Optional[Priority] = None) -> Message:
+        """
+        Reply to a message, in its thread.
+
+        :param request: The message to reply to
+        :param content: The content of the reply
+        :param priority: Optional priority level of the reply, the priority of the request if not given
+        """
+        assert isinstance(content, Dict)
+        if priority is None:
+            priority = Priority(request.priority)
+        message_id = self.message_bus.generate_message_id(priority)
+        message = Message(
+            message_id,
+            sender=self.client_id,
+            content=content,
+            recipients=[request.sender],
+            priority=priority,
+            thread_id=request.thread_id,
+            in_reply_to=request.id,
+            topic=request.topic,
+        )
         self.message_bus.send_message(message)
         return message
 
@@ -61,6 +184,22 @@ class Client(ABC):
         """
         pass  # pragma: no cover
 
+    def subscribe(self, topic_pattern: str) -> None:
+        """
+        Subscribe to the messages of the topics matching a pattern.
+
+        :param topic_pattern: The topic pattern, where `*` matches one segment and `#` any number of segments
+        """
+        self.message_bus.subscribe(self.client_id, topic_pattern)
+
+    def unsubscribe(self, topic_pattern: Optional[str] = None) -> None:
+        """
+        Unsubscribe from a topic pattern.
+
+        :param topic_pattern: The topic pattern, all the subscribed patterns if not given
+        """
+        self.message_bus.unsubscribe(self.client_id, topic_pattern)
+
     def remove_sent_message(self, recipient_ids: List[str], message_id: int) -> None:
         """
         Remove a sent message from the message bus.
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from .message import Message
+
+
+class DeduplicationFilter:
+    """
+    A filter of the keys seen within a sliding time window, using a fixed amount of memory.
+
+    Keys are kept in an ordered dictionary in the order they were first seen, so the keys leaving the window
+    are always at its front. Checking a key is a dictionary lookup, and every key is evicted at most once,
+    so the filter costs constant time per key. Once `capacity` keys are in the window, the oldest ones are
+    forgotten early, which bounds the memory under any load at the price of missing very late duplicates.
+    """
+
+    def __init__(self, window: float = 300.0, capacity: int = 100_000) -> None:
+        """
+        Initialize the filter.
+
+        :param window: How long a key is remembered, in seconds.
+        :param capacity: The maximum number of keys remembered.
+        """
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+
+        self.window = int(window * 1000)
+        self.capacity = capacity
+        self.keys: 'OrderedDict[Hashable, int]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """
+        The number of keys remembered, including the ones out of the window not evicted yet.
+        """
+        return len(self.keys)
+
+    def is_duplicate(self, key: Hashable, now: Optional[int] = None) -> bool:
+        """
+        Check whether a key was seen within the window, and remember it if it was not.
+
+        :param key: The key.
+        :param now: The current time in milliseconds, the monotonic clock if not given.
+        :return: True if the key was seen within the window.
+        """
+        if now is None:
+            now = time.monotonic_ns() // 1_000_000
+
+        with self.lock:
+            self._evict(now)
+            if key in self.keys:
+                return True
+
+            self.keys[key] = now
+            if len(self.keys) > self.capacity:
+                self.keys.popitem(last=False)
+            return False
+
+    def _evict(self, now: int) -> None:
+        """
+        Forget the keys which left the window.
+        """
+        horizon = now - self.window
+        while self.keys:
+            key, seen_at = next(iter(self.keys.items()))
+            if seen_at > horizon:
+                break
+            del self.keys[key]
+
+    def filter(self, messages: List[Message]) -> List[Message]:
+        """
+        Drop the messages whose idempotency key was seen from the same sender within the window,
+        including earlier in the same batch. Messages without a key are always kept.
+
+        :param messages: The messages.
+        :return: The messages to send.
+        """
+        return [
+            message
+            for message in messages
+            if message.idempotency_key is None or not self.is_duplicate((message.sender, message.idempotency_key))
+        ]
+
+    def forget(self, messages: List[Message]) -> None:
+        """
+        Forget the idempotency keys of messages kept by `filter` which could not be sent after all,
+        so that a retry of these messages is not dropped as a duplicate.
+
+        :param messages: The messages.
+        """
+        with self.lock:
+            for message in messages:
+                if message.idempotency_key is not None:
+                    self.keys.pop((message.sender, message.idempotency_key), None)
+
+    def clear(self) -> None:
+        """
+        Forget all the keys.
+        """
+        with self.lock:
+            self.keys.clear()
@@ -0,0 +1,118 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .client.client import Client
+
+
+class Dispatcher(ABC):
+    """
+    Abstract base class for the delivery of new message notifications to the clients of a message bus.
+    """
+
+    @abstractmethod
+    def dispatch(self, client: 'Client') -> None:
+        """
+        Notify a client of new messages.
+
+        :param client: The client to notify
+        """
+        pass  # pragma: no cover
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop dispatching notifications.
+
+        :param wait: Whether to wait for the pending notifications to be delivered
+        """
+        pass
+
+
+class SynchronousDispatcher(Dispatcher):
+    """
+    A dispatcher notifying clients on the thread sending the message, before the send returns.
+    """
+
+    def dispatch(self, client: 'Client') -> None:
+        client.notify_new_message()
+
+
+class ExecutorDispatcher(Dispatcher):
+    """
+    A dispatcher notifying clients on an executor, off the thread sending the message.
+
+    Notifications of a client are delivered one at a time, in order. A notification arriving while the client
+    is being notified is coalesced with the other pending ones into a single notification delivered right after,
+    as a notification only tells the client there are new messages to read.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, max_workers: Optional[int] = None) -> None:
+        """
+        Initialize the dispatcher.
+
+        :param executor: The executor to run notifications on, a thread pool owned by the dispatcher if not given
+        :param max_workers: The number of threads of the owned thread pool, ignored if an executor is given
+        """
+        self.owns_executor = executor is None
+        self.executor: Executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="messagebus-dispatcher"
+        )
+        self.logger = logging.getLogger(__name__)
+
+        # Per client, whether another notification is pending behind the one being delivered
+        self.active: Dict[str, bool] = {}
+        self.condition = threading.Condition()
+
+    def dispatch(self, client: 'Client') -> None:
+        with self.condition:
+            if client.client_id in self.active:
+                self.active[client.client_id] = True
+                return
+            self.active[client.client_id] = False
+
+        try:
+            self.executor.submit(self._deliver, client)
+        except RuntimeError:
+            # The executor is shut down
+            with self.condition:
+                del self.active[client.client_id]
+                self.condition.notify_all()
+            raise
+
+    def _deliver(self, client: 'Client') -> None:
+        """
+        Notify a client until no notification is pending for it.
+
+        :param client: The client to notify
+        """
+        while True:
+            try:
+                client.notify_new_message()
+            except Exception as e:
+                self.logger.error('Error notifying client %s: %s', client.client_id, e)
+
+            with self.condition:
+                if not self.active[client.client_id]:
+                    del self.active[client.client_id]
+                    self.condition.notify_all()
+                    return
+                self.active[client.client_id] = False
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every dispatched notification has been delivered.
+
+        :param timeout: Optional maximum time to wait, in seconds
+        :return: Whether all notifications were delivered before the timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.active, timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if wait:
+            self.wait_until_idle()
+        if self.owns_executor:
+            self.executor.shutdown(wait=wait)
@@ -0,0 +1,107 @@
+import bisect
+import zlib
+from typing import Iterable, List, Set
+
+# 2^64 divided by the golden ratio, spreading the 32 bit CRC of a key over 64 bits when multiplied by it
+GOLDEN_RATIO_64 = 0x9E3779B97F4A7C15
+MASK_64 = (1 << 64) - 1
+
+
+def hash_key(key: str) -> int:
+    """
+    Hash a key to a 64 bit integer, stable across processes and machines unlike the built-in hash.
+
+    The CRC of the key is cheap to compute but linear, so keys differing in a few characters would land
+    on related points. Multiplying it by an odd constant breaks that relation, and spreads the points of
+    similar keys over the whole ring.
+
+    :param key: The key to hash.
+    :return: The hash of the key.
+    """
+    return (zlib.crc32(key.encode("utf-8")) * GOLDEN_RATIO_64) & MASK_64
+
+
+class ConsistentHashRing:
+    """
+    Places keys on nodes with consistent hashing.
+
+    Every node is hashed to many points of a ring, its virtual nodes, and a key belongs to the node owning
+    the first point at or after the hash of the key. Adding a node only moves to it the keys it takes over,
+    and removing a node only moves its own keys, spread over the remaining nodes.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = 64) -> None:
+        """
+        Initialize the ring.
+
+        :param nodes: The IDs of the initial nodes.
+        :param virtual_nodes: The number of points of each node on the ring, more points spread keys more evenly.
+        """
+        self.virtual_nodes = virtual_nodes
+        self.points: List[int] = []
+        self.owners: List[str] = []
+        self.members: Set[str] = set()
+        self.add_nodes(nodes)
+
+    @property
+    def nodes(self) -> List[str]:
+        """
+        The IDs of the nodes of the ring, sorted.
+        """
+        return sorted(self.members)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self.members
+
+    def add_node(self, node: str) -> None:
+        """
+        Add a node to the ring. Adding a node already on the ring has no effect.
+
+        :param node: The ID of the node.
+        """
+        self.add_nodes([node])
+
+    def add_nodes(self, nodes: Iterable[str]) -> None:
+        """
+        Add nodes to the ring, sorting the points once for all of them. Nodes already on the ring are skipped.
+
+        :param nodes: The IDs of the nodes.
+        """
+        new_nodes = [node for node in dict.fromkeys(nodes) if node not in self.members]
+        if not new_nodes:
+            return
+        self.members.update(new_nodes)
+        points = [(hash_key(f"{node}#{replica}"), node) for node in new_nodes for replica in range(self.virtual_nodes)]
+        # The existing points are already sorted, so the sort merges the new ones in
+        points.extend(zip(self.points, self.owners))
+        points.sort()
+        self.points = [point for point, _ in points]
+        self.owners = [owner for _, owner in points]
+
+    def remove_node(self, node: str) -> None:
+        """
+        Remove a node from the ring.
+
+        :param node: The ID of the node.
+        """
+        if node not in self.members:
+            return
+        self.members.discard(node)
+        kept = [(point, owner) for point, owner in zip(self.points, self.owners) if owner != node]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def get_node(self, key: str) -> str:
+        """
+        Find the node a key belongs to.
+
+        :param key: The key.
+        :return: The ID of the node.
+        """
+        if not self.points:
+            raise ValueError("The hash ring has no nodes")
+        index = bisect.bisect_left(self.points, hash_key(key))
+        return self.owners[index % len(self.points)]
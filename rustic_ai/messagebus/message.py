@@ -1,6 +1,9 @@
 import json
+import struct
+import time
+from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Dict, List, Optional, Union
+from typing import Any, ClassVar, Dict, List, Optional, Tuple, Union
 
 from .utils import Priority
 
@@ -8,8 +11,41 @@ JSONVALUE = Union[int, str, float, bool, List['JSONVALUE'], Dict[str, 'JSONVALUE
 JSON = Dict[str, JSONVALUE]
 
 
+# Marker for content that has not been decoded from its JSON encoding yet.
+_UNDECODED: Any = object()
+
+# Separates the JSON encoded headers from the JSON encoded content in a serialized message.
+# json.dumps escapes newlines, so the separator can never occur inside either part.
+_SEPARATOR = "\n"
+
+
 class Message:
-    """A message that can be sent between clients through the message bus."""
+    """
+    A message that can be sent between clients through the message bus.
+
+    Messages are slotted to keep their memory footprint small. When a message is deserialized,
+    the header fields are decoded eagerly while the content is decoded only on first access.
+    """
+
+    __slots__ = (
+        "id",
+        "sender",
+        "recipients",
+        "priority",
+        "thread_id",
+        "in_reply_to",
+        "topic",
+        "expires_at",
+        "idempotency_key",
+        "_content",
+        "_encoded_content",
+        "_serialized",
+        "_encoded",
+    )
+
+    # Registered wire codecs, keyed by name and by the tag byte every record they encode starts with
+    _codecs: ClassVar[Dict[str, 'MessageCodec']] = {}
+    _codecs_by_tag: ClassVar[Dict[int, 'MessageCodec']] = {}
 
     def __init__(
         self,
@@ -21,6 +57,8 @@ class Message:
         thread_id: Optional[int] = None,
         in_reply_to: Optional[int] = None,
         topic: Optional[str] = None,
+        expires_at: Optional[int] = None,
+        idempotency_key: Optional[str] = None,
     ):
         """
         Initialize the message with a unique ID, sender, content, recipients, and priority.
@@ -29,50 +67,211 @@ class Message:
         :param content: The content of the message, either a string or a dict
         :param recipients: A list of recipients for the message
         :param priority: The priority of the message, default is 0
+        :param expires_at: Optional time after which the message is dropped, in milliseconds since the Unix epoch
+        :param idempotency_key: Optional key identifying the message across retries, a message bus drops
+            the messages of a sender with a key it has recently seen
         """
         self.id: int = id
         self.sender: str = sender
-        self.content: JSON = content
+        self._content: JSON = content
         self.recipients: List[str] = recipients if recipients else []
         self.priority: int = priority
         self.thread_id: Optional[int] = thread_id if thread_id is not None else id
         self.in_reply_to: Optional[int] = in_reply_to
         self.topic: Optional[str] = topic
+        self.expires_at: Optional[int] = expires_at
+        self.idempotency_key: Optional[str] = idempotency_key
+
+        # Encoded forms are computed at most once and shared by every recipient of the message.
+        self._encoded_content: Optional[Union[str, bytes, memoryview]] = None
+        self._serialized: Optional[str] = None
+        self._encoded: Optional[Tuple[str, bytes]] = None
+
+    @classmethod
+    def from_encoded_content(
+        cls, id: int, sender: str, encoded_content: Union[str, bytes, memoryview], **kwargs: Any
+    ) -> 'Message':
+        """
+        Create a message from JSON encoded content, which is decoded only when first accessed.
+
+        :param id: The ID of the message
+        :param sender: The sender of the message
+        :param encoded_content: The content of the message as a JSON string, or a buffer holding its UTF-8 encoding
+        :param kwargs: The remaining header fields of the message
+        :return: The message with its content not yet decoded
+        """
+        message = cls(id, sender, _UNDECODED, **kwargs)
+        message._encoded_content = encoded_content
+        return message
+
+    def is_expired(self, now: Optional[int] = None) -> bool:
+        """
+        Check whether the message expired.
+
+        :param now: The current time in milliseconds since the Unix epoch, the wall clock time if not given
+        :return: True if the message has an expiry time and it has passed
+        """
+        if self.expires_at is None:
+            return False
+        if now is None:
+            now = time.time_ns() // 1_000_000
+        return self.expires_at <= now
+
+    @property
+    def content(self) -> JSON:
+        if self._content is _UNDECODED:
+            encoded_content = self._encoded_content
+            if isinstance(encoded_content, memoryview):
+                encoded_content = bytes(encoded_content)
+            self._content = json.loads(encoded_content)  # type: ignore
+        return self._content
+
+    @content.setter
+    def content(self, content: JSON) -> None:
+        self.set_content(content)
 
     def set_content(self, content: JSON) -> None:
         """
-        Set the content of the message.
+        Set the content of the message, invalidating any cached encoded form.
 
         :param content: The new content for the message, either a string or a dict
         """
-        self.content = content
+        self._content = content
+        self._encoded_content = None
+        self._serialized = None
+        self._encoded = None
 
     def get_content(self) -> str:
         """
         Get the content of the message in JSON string format.
+        The encoded content is cached until the content is changed with `set_content`.
 
         :return: The content of the message as a JSON string
         """
-        return json.dumps(self.content)
+        if self._encoded_content is None:
+            self._encoded_content = json.dumps(self._content)
+        elif not isinstance(self._encoded_content, str):
+            self._encoded_content = str(self._encoded_content, "utf-8")
+        return self._encoded_content
+
+    def get_headers(self) -> Dict[str, Any]:
+        """
+        Get the header fields of the message, i.e. everything except the content.
+
+        :return: The message headers, keyed by the constructor argument names
+        """
+        return {
+            "id": self.id,
+            "sender": self.sender,
+            "recipients": self.recipients,
+            "priority": self.priority,
+            "thread_id": self.thread_id,
+            "in_reply_to": self.in_reply_to,
+            "topic": self.topic,
+            "expires_at": self.expires_at,
+            "idempotency_key": self.idempotency_key,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the message fields as a dictionary.
+
+        :return: The message as a dictionary, keyed by the constructor argument names
+        """
+        message_dict = self.get_headers()
+        message_dict["content"] = self.content
+        return message_dict
 
     def serialize(self) -> str:
         """
-        Serialize the message into a JSON string format.
+        Serialize the message into a string holding the JSON encoded headers and content.
+        The serialized form is cached until the content is changed with `set_content`.
 
-        :return: The serialized message as a JSON string
+        :return: The serialized message
         """
-        return json.dumps(self.__dict__)
+        if self._serialized is None:
+            self._serialized = json.dumps(self.get_headers()) + _SEPARATOR + self.get_content()
+        return self._serialized
 
     @classmethod
-    def deserialize(cls, message_json: str) -> 'Message':
+    def deserialize(cls, message_json: Union[str, bytes]) -> 'Message':
         """
-        Deserialize a JSON string into a Message object.
+        Deserialize a string produced by `serialize` into a Message object.
+        Only the headers are decoded here, the content is decoded on first access.
 
-        :param message_json: The JSON string representing the message
+        :param message_json: The string representing the message
         :return: The deserialized message object
         """
-        message_data = json.loads(message_json)
-        message = cls(**message_data)
+        if isinstance(message_json, bytes):
+            message_json = message_json.decode("utf-8")
+
+        headers, separator, encoded_content = message_json.partition(_SEPARATOR)
+        if not separator:
+            # A message serialized as a single JSON document, before headers and content were split
+            return cls(**json.loads(message_json))
+
+        message = cls.from_encoded_content(encoded_content=encoded_content, **json.loads(headers))
+        message._serialized = message_json
+        return message
+
+    @classmethod
+    def register_codec(cls, codec: 'MessageCodec') -> None:
+        """
+        Register a wire codec, making it available to `encode` by name and to `decode` by its tag.
+
+        :param codec: The codec to register
+        """
+        if codec.tag == b"\x00":
+            raise ValueError("Codec tag b'\\x00' is reserved for compressed storage payloads")
+
+        existing = cls._codecs_by_tag.get(codec.tag[0])
+        if existing is not None and existing.name != codec.name:
+            raise ValueError(f"Codec tag {codec.tag!r} is already used by the {existing.name} codec")
+
+        cls._codecs[codec.name] = codec
+        cls._codecs_by_tag[codec.tag[0]] = codec
+
+    @classmethod
+    def get_codec(cls, name: str) -> 'MessageCodec':
+        """
+        Get a registered wire codec by name.
+
+        :param name: The name of the codec
+        :return: The codec
+        """
+        try:
+            return cls._codecs[name]
+        except KeyError:
+            raise ValueError(f"Unknown message codec: {name}") from None
+
+    def encode(self, codec: str = "json") -> bytes:
+        """
+        Encode the message into bytes with the given wire codec.
+        The encoded form is cached until the content is changed with `set_content`.
+
+        :param codec: The name of the codec to use
+        :return: The encoded message, starting with the tag byte of the codec
+        """
+        if self._encoded is None or self._encoded[0] != codec:
+            self._encoded = (codec, self.get_codec(codec).encode(self))
+        return self._encoded[1]
+
+    @classmethod
+    def decode(cls, data: Union[bytes, memoryview]) -> 'Message':
+        """
+        Decode bytes produced by `encode`, using the codec recorded in the leading tag byte.
+
+        :param data: The encoded message, or a buffer holding it
+        :return: The decoded message object
+        """
+        try:
+            codec = cls._codecs_by_tag[data[0]]
+        except KeyError:
+            raise ValueError(f"Unknown message codec tag: {data[:1]!r}") from None
+
+        message = codec.decode(data)
+        if isinstance(data, bytes):
+            message._encoded = (codec.name, data)
         return message
 
     def __lt__(self, other: 'Message') -> bool:
@@ -116,3 +315,158 @@ class MessageProperties(Enum):
     RECIPIENTS = "recipients"
     SENDER = "sender"
     PRIORITY = "priority"
+
+
+class MessageCodec(ABC):
+    """
+    Abstract base class for a message wire format.
+
+    Every record produced by a codec starts with the codec's tag byte, so a record can be decoded
+    with `Message.decode` without knowing which codec wrote it.
+    """
+
+    name: str
+    tag: bytes
+
+    @abstractmethod
+    def encode(self, message: Message) -> bytes:
+        """
+        Encode a message into a record starting with the tag byte.
+
+        :param message: The message to encode
+        :return: The encoded record
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def decode(self, data: Union[bytes, memoryview]) -> Message:
+        """
+        Decode a record produced by `encode`.
+
+        :param data: The encoded record, including the tag byte, or a buffer holding it
+        :return: The decoded message
+        """
+        pass  # pragma: no cover
+
+
+class JSONCodec(MessageCodec):
+    """
+    The JSON wire format, holding the output of `Message.serialize`.
+    Its tag is the opening brace of the JSON encoded headers.
+    """
+
+    name = "json"
+    tag = b"{"
+
+    def encode(self, message: Message) -> bytes:
+        return message.serialize().encode("utf-8")
+
+    def decode(self, data: Union[bytes, memoryview]) -> Message:
+        return Message.deserialize(bytes(data))
+
+
+class BinaryCodec(MessageCodec):
+    """
+    A compact binary wire format.
+
+    A record is the tag byte, a fixed-width header holding the id, thread id, reply id, priority,
+    flags and the lengths of the variable-width fields, the expiry time and the length prefixed
+    idempotency key if the message has them, followed by the UTF-8 encoded sender, topic and NUL
+    separated recipients, and finally the JSON encoded content.
+    """
+
+    name = "binary"
+    tag = b"\x01"
+
+    # id, thread_id, in_reply_to, priority, flags, sender length, topic length, recipients length
+    HEADER = struct.Struct("!QQQBBHHI")
+
+    FLAG_IN_REPLY_TO = 0x01
+    FLAG_TOPIC = 0x02
+    FLAG_EXPIRES_AT = 0x04
+    FLAG_IDEMPOTENCY_KEY = 0x08
+
+    EXPIRES_AT = struct.Struct("!Q")
+    KEY_LENGTH = struct.Struct("!H")
+
+    def encode(self, message: Message) -> bytes:
+        sender = message.sender.encode("utf-8")
+        topic = message.topic.encode("utf-8") if message.topic is not None else b""
+        recipients = "\0".join(message.recipients).encode("utf-8")
+
+        flags = 0
+        if message.in_reply_to is not None:
+            flags |= self.FLAG_IN_REPLY_TO
+        if message.topic is not None:
+            flags |= self.FLAG_TOPIC
+        if message.expires_at is not None:
+            flags |= self.FLAG_EXPIRES_AT
+        if message.idempotency_key is not None:
+            flags |= self.FLAG_IDEMPOTENCY_KEY
+
+        header = self.HEADER.pack(
+            message.id,
+            message.thread_id if message.thread_id is not None else message.id,
+            message.in_reply_to or 0,
+            message.priority,
+            flags,
+            len(sender),
+            len(topic),
+            len(recipients),
+        )
+        optional = b""
+        if message.expires_at is not None:
+            optional += self.EXPIRES_AT.pack(message.expires_at)
+        if message.idempotency_key is not None:
+            key = message.idempotency_key.encode("utf-8")
+            optional += self.KEY_LENGTH.pack(len(key)) + key
+        return b"".join((self.tag, header, optional, sender, topic, recipients, message.get_content().encode("utf-8")))
+
+    def decode(self, data: Union[bytes, memoryview]) -> Message:
+        (
+            id,
+            thread_id,
+            in_reply_to,
+            priority,
+            flags,
+            sender_length,
+            topic_length,
+            recipients_length,
+        ) = self.HEADER.unpack_from(data, 1)
+
+        # Slicing a view does not copy, the content stays in the record buffer until it is first accessed
+        view = memoryview(data)
+        offset = 1 + self.HEADER.size
+        expires_at = None
+        if flags & self.FLAG_EXPIRES_AT:
+            expires_at = self.EXPIRES_AT.unpack_from(data, offset)[0]
+            offset += self.EXPIRES_AT.size
+        idempotency_key = None
+        if flags & self.FLAG_IDEMPOTENCY_KEY:
+            key_length = self.KEY_LENGTH.unpack_from(data, offset)[0]
+            offset += self.KEY_LENGTH.size
+            idempotency_key = str(view[offset : offset + key_length], "utf-8")
+            offset += key_length
+        sender = str(view[offset : offset + sender_length], "utf-8")
+        offset += sender_length
+        topic = str(view[offset : offset + topic_length], "utf-8")
+        offset += topic_length
+        recipients = str(view[offset : offset + recipients_length], "utf-8")
+        offset += recipients_length
+
+        return Message.from_encoded_content(
+            id,
+            sender,
+            view[offset:],
+            recipients=recipients.split("\0") if recipients else [],
+            priority=priority,
+            thread_id=thread_id,
+            in_reply_to=in_reply_to if flags & self.FLAG_IN_REPLY_TO else None,
+            topic=topic if flags & self.FLAG_TOPIC else None,
+            expires_at=expires_at,
+            idempotency_key=idempotency_key,
+        )
+
+
+Message.register_codec(JSONCodec())
+Message.register_codec(BinaryCodec())
@@ -1,9 +1,14 @@
-from typing import TYPE_CHECKING, Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
 
 import shortuuid
 
+from .deduplication import DeduplicationFilter
+from .dispatcher import Dispatcher, SynchronousDispatcher
 from .message import Message
+from .retry import RetryScheduler
 from .routing import BroadcastRoutingPolicy, RoutingPolicy
+from .rpc import ReplyFuture, ReplyIndex
+from .scheduler import MessageScheduler
 from .storage import InMemoryStorage, StorageBackend
 from .utils import GemstoneGenerator, Priority
 
@@ -15,28 +20,52 @@ class MessageBus:
     """
     MessageBus is a central component responsible for managing clients, sending messages,
     and handling routing and storage policies.
+
+    Messages whose handlers keep failing are kept in the dead-letter inbox of the bus, which is not routed to.
     """
 
+    # The ID of the inbox of the dead letters, reserved for the bus
+    DEAD_LETTER_INBOX = "__dead_letters__"
+
     def __init__(
         self,
         id: Optional[str] = None,
         machine_id: int = 1,
         storage_backend: Optional[StorageBackend] = None,
         routing_policy: Optional[RoutingPolicy] = None,
+        hybrid_clock: bool = False,
+        dispatcher: Optional[Dispatcher] = None,
+        deduplication_filter: Optional[DeduplicationFilter] = None,
     ):
         """
         Initialize the MessageBus with the given storage backend and routing policy.
         If no storage backend is provided, InMemoryStorage will be used.
         If no routing policy is provided, BroadcastRoutingPolicy will be used.
+        If no dispatcher is provided, recipients are notified on the sender's thread by a SynchronousDispatcher.
+        If no deduplication filter is provided, idempotency keys are remembered for five minutes.
 
         :param storage_backend: Storage backend to use for message storage
         :param routing_policy: Routing policy to use for message delivery
+        :param hybrid_clock: Whether message IDs stay monotonic when the clock moves backwards, instead of failing
+        :param dispatcher: Dispatcher delivering new message notifications to the recipients
+        :param deduplication_filter: Filter dropping the messages sent again with the same idempotency key
         """
         self.id = id if id else shortuuid.uuid()
         self.clients: Dict[str, 'Client'] = {}
-        self.id_generator: GemstoneGenerator = GemstoneGenerator(machine_id)
+        self.id_generator: GemstoneGenerator = GemstoneGenerator(machine_id, hybrid_clock)
         self.storage: StorageBackend = storage_backend or InMemoryStorage()
         self.routing_policy: RoutingPolicy = routing_policy or BroadcastRoutingPolicy()
+        self.dispatcher: Dispatcher = dispatcher or SynchronousDispatcher()
+        self.deduplication_filter: DeduplicationFilter = deduplication_filter or DeduplicationFilter()
+        self.replies = ReplyIndex()
+        self.retries = RetryScheduler(self.dispatcher)
+        self.dead_letter_inbox_created = False
+
+        # Resume the delivery of the messages scheduled before a restart
+        self.scheduler = MessageScheduler(self)
+        due_time = self.storage.get_next_due_time(self.id)
+        if due_time is not None:
+            self.scheduler.notify(due_time)
 
     def generate_message_id(self, priority: Priority) -> int:
         """
@@ -44,7 +73,17 @@ class MessageBus:
 
         :return: A new message ID
         """
-        return self.id_generator.get_id(priority).to_int()
+        return self.id_generator.get_int_id(priority)
+
+    def generate_message_ids(self, count: int, priority: Priority) -> List[int]:
+        """
+        Generate a block of new message IDs at once.
+
+        :param count: The number of IDs to generate
+        :param priority: The priority of the messages
+        :return: The new message IDs, in increasing order
+        """
+        return self.id_generator.reserve(count, priority)
 
     def register_client(self, client: 'Client') -> None:
         """
@@ -52,8 +91,11 @@ class MessageBus:
 
         :param client: The client to register
         """
+        if client.client_id == self.DEAD_LETTER_INBOX:
+            raise ValueError(f"{self.DEAD_LETTER_INBOX} is reserved for the dead letters")
         self.clients[client.client_id] = client
         self.storage.create_inbox(self.id, client.client_id)
+        self.routing_policy.client_registered(client.client_id)
 
     def unregister_client(self, client: 'Client') -> None:
         """
@@ -63,29 +105,199 @@ class MessageBus:
         """
         self.clients.pop(client.client_id, None)
         self.storage.remove_inbox(self.id, client.client_id)
+        self.routing_policy.client_unregistered(client.client_id)
+        self.replies.cancel(client.client_id)
 
-    def send_message(self, message: Message) -> None:
+    def subscribe(self, client_id: str, topic_pattern: str) -> None:
         """
-        Send a message to the recipients determined by the routing policy.
+        Subscribe a client to the messages of the topics matching a pattern.
+        Only the routing policies routing by topic, like TopicRoutingPolicy, use subscriptions.
 
-        :param message: The message to send
+        :param client_id: The ID of the subscribing client
+        :param topic_pattern: The topic pattern, where `*` matches one segment and `#` any number of segments
         """
+        if client_id not in self.clients:
+            raise ValueError(f"Unknown client: {client_id}")
+        self.routing_policy.subscribe(client_id, topic_pattern)
 
+    def unsubscribe(self, client_id: str, topic_pattern: Optional[str] = None) -> None:
+        """
+        Unsubscribe a client from a topic pattern.
+
+        :param client_id: The ID of the unsubscribing client
+        :param topic_pattern: The topic pattern, all the patterns of the client if not given
+        """
+        self.routing_policy.unsubscribe(client_id, topic_pattern)
+
+    def _get_recipients(self, message: Message) -> List[str]:
+        """
+        Get the recipients of a message, either listed in the message or determined by the routing policy.
+
+        :param message: The message to route
+        :return: The IDs of the recipients
+        """
         if set(message.recipients).difference(self.clients.keys()):
             raise ValueError("Invalid recipient(s) specified")
 
         if message.recipients:
-            recipients = message.recipients
+            return message.recipients
         else:
-            recipients = self.routing_policy.get_recipients(message, self.clients)
+            return self.routing_policy.get_recipients(message, self.clients)
+
+    def send_message(self, message: Message) -> None:
+        """
+        Send a message to the recipients determined by the routing policy.
+        A message with the idempotency key of a message recently sent by the same sender is dropped.
+        The key is only kept if the message is stored, so a message whose storage fails can be sent again.
+
+        :param message: The message to send
+        """
+        recipients, kept = self._route_message(message)
+        if not recipients:
+            return
+        try:
+            self.storage.add_message_to_inboxes(self.id, recipients, message)
+        except BaseException:
+            self.deduplication_filter.forget(kept)
+            raise
+
+        self._notify(recipients)
+
+    def _route_message(self, message: Message) -> Tuple[List[str], List[Message]]:
+        """
+        Route a message, dropping it if its idempotency key was recently seen, and resolving the replies it answers.
+
+        :param message: The message to send
+        :return: The recipients whose inboxes get the message, and the messages kept by the deduplication filter
+        """
+        recipients = self._get_recipients(message)
+        kept = self.deduplication_filter.filter([message])
+        if not kept:
+            return [], kept
+        return self.replies.resolve(message, recipients), kept
+
+    def send_messages(self, messages: List[Message]) -> None:
+        """
+        Send a batch of messages. The messages are grouped by recipient, every inbox is written
+        with a single bulk operation and every recipient is notified once for the whole batch.
+        All the messages are routed before any is stored, so an invalid recipient fails the whole batch.
+        The messages with the idempotency key of a message recently sent by the same sender are dropped.
+
+        :param messages: The messages to send
+        """
+        self._send_messages(messages, deduplicate=True)
+
+    def _send_messages(self, messages: List[Message], deduplicate: bool) -> None:
+        """
+        Route, store and notify a batch of messages.
+
+        :param messages: The messages to send
+        :param deduplicate: Whether to drop the messages with a recently seen idempotency key
+        """
+        batches, kept_messages = self._route_messages(messages, deduplicate)
+        try:
+            for recipient_id, batch in batches.items():
+                self.storage.add_messages_to_inbox(self.id, recipient_id, batch)
+        except BaseException:
+            # The batch may be sent again, possibly reaching twice the inboxes written before the failure
+            if deduplicate:
+                self.deduplication_filter.forget(kept_messages)
+            raise
+
+        self._notify(batches)
+
+    def _route_messages(
+        self, messages: List[Message], deduplicate: bool
+    ) -> Tuple[Dict[str, List[Message]], List[Message]]:
+        """
+        Route a batch of messages and group them by recipient.
+
+        :param messages: The messages to send
+        :param deduplicate: Whether to drop the messages with a recently seen idempotency key
+        :return: The messages of each recipient, and the messages kept by the deduplication filter
+        """
+        routes = [(message, self._get_recipients(message)) for message in messages]
+        kept_messages = self.deduplication_filter.filter(messages) if deduplicate else messages
+        kept = set(map(id, kept_messages))
+
+        batches: Dict[str, List[Message]] = {}
+        for message, recipients in routes:
+            if id(message) in kept:
+                for recipient_id in self.replies.resolve(message, recipients):
+                    batches.setdefault(recipient_id, []).append(message)
+        return batches, kept_messages
+
+    def register_request(self, request_id: int, client_id: str, timeout: Optional[float] = None) -> ReplyFuture:
+        """
+        Wait for the reply to a request, before the request is sent. The first message sent to the requester
+        with the ID of the request in its `in_reply_to` field resolves the future as it is routed, and never
+        reaches the inbox of the requester.
+
+        :param request_id: The ID of the request message
+        :param client_id: The ID of the requesting client
+        :param timeout: Optional time in seconds after which the future fails with a TimeoutError
+        :return: The future of the reply
+        """
+        return self.replies.register(request_id, client_id, timeout)
+
+    def schedule_message(self, message: Message, deliver_at: int) -> None:
+        """
+        Schedule a message, to be sent when it is due. The message is kept by the storage backend until then,
+        and routed when it is sent. It is sent with a new ID, so that it comes after the messages already sent.
+        A message with the idempotency key of a message recently sent by the same sender is dropped.
+
+        :param message: The message to send
+        :param deliver_at: The time to send the message at, in milliseconds since the Unix epoch
+        """
+        kept = self.deduplication_filter.filter([message])
+        if not kept:
+            return
+        try:
+            self.storage.schedule_message(self.id, message, deliver_at)
+        except BaseException:
+            self.deduplication_filter.forget(kept)
+            raise
+        self.scheduler.notify(deliver_at)
+
+    def deliver_scheduled_messages(self, messages: List[Message]) -> None:
+        """
+        Send scheduled messages which are due, with new IDs.
+
+        :param messages: The scheduled messages
+        """
+        self._send_messages([self._restamp(message) for message in messages], deduplicate=False)
+
+    def _restamp(self, message: Message) -> Message:
+        """
+        Copy a message with a new ID. A message starting its own thread starts it with the new ID.
+
+        :param message: The message
+        :return: The copy of the message
+        """
+        message_id = self.generate_message_id(Priority(message.priority))
+        return Message.from_encoded_content(
+            message_id,
+            message.sender,
+            message.get_content(),
+            recipients=message.recipients,
+            priority=message.priority,
+            thread_id=message_id if message.thread_id == message.id else message.thread_id,
+            in_reply_to=message.in_reply_to,
+            topic=message.topic,
+            expires_at=message.expires_at,
+            idempotency_key=message.idempotency_key,
+        )
 
-        for recipient_id in recipients:
-            self.storage.add_message_to_inbox(self.id, recipient_id, message)
+    def _notify(self, recipient_ids: Iterable[str]) -> None:
+        """
+        Notify the recipients of new messages through the dispatcher.
 
-        # Notify the recipients of new messages
-        for recipient_id in recipients:
-            if recipient_id in self.clients:
-                self.clients[recipient_id].notify_new_message()
+        :param recipient_ids: The IDs of the recipients
+        """
+        for recipient_id in recipient_ids:
+            client = self.clients.get(recipient_id)
+            if client is not None:
+                self.dispatcher.dispatch(client)
 
     def get_next_unread_message(self, client_id: str, last_read_message_id: int) -> Optional[Message]:
         """
@@ -97,6 +309,15 @@ class MessageBus:
         """
         return self.storage.get_next_unread_message(self.id, client_id, last_read_message_id)
 
+    def get_thread(self, thread_id: int) -> List[Message]:
+        """
+        Get the messages of a thread still held by the inboxes, from the thread index of the storage backend.
+
+        :param thread_id: The ID of the thread, which is the ID of its first message
+        :return: The messages of the thread, once each, ordered by ID
+        """
+        return self.storage.get_thread(self.id, thread_id)
+
     def remove_received_message(self, sender_id: str, recipient_ids: List[str], message_id: int) -> None:
         """
         Remove a sent message from the listed recipient's inbox.
@@ -113,10 +334,63 @@ class MessageBus:
         else:
             self.storage.remove_received_message(self.id, sender_id, recipient_ids, message_id)
 
+    def send_to_dead_letters(self, message: Message, client_id: str, error: BaseException, attempts: int) -> Message:
+        """
+        Keep a message a client failed to handle in the dead-letter inbox of the bus.
+
+        The dead letter is a new message from the client, whose content holds the failed message,
+        the error and the number of attempts.
+
+        :param message: The message which could not be handled
+        :param client_id: The ID of the client which failed to handle it
+        :param error: The error of the last attempt
+        :param attempts: The number of attempts
+        :return: The dead letter
+        """
+        dead_letter = Message(
+            self.generate_message_id(Priority(message.priority)),
+            sender=client_id,
+            content={
+                "message": message.to_dict(),
+                "error": f"{type(error).__name__}: {error}",
+                "attempts": attempts,
+            },
+            priority=Priority(message.priority),
+        )
+        self._ensure_dead_letter_inbox()
+        self.storage.add_message_to_inbox(self.id, self.DEAD_LETTER_INBOX, dead_letter)
+        return dead_letter
+
+    def _ensure_dead_letter_inbox(self) -> None:
+        if not self.dead_letter_inbox_created:
+            self.storage.create_inbox(self.id, self.DEAD_LETTER_INBOX)
+            self.dead_letter_inbox_created = True
+
+    def get_next_dead_letter(self, last_read_message_id: int = 0) -> Optional[Message]:
+        """
+        Get the next dead letter, starting from the last one read.
+
+        :param last_read_message_id: The ID of the last dead letter read
+        :return: The next dead letter if available, otherwise None
+        """
+        self._ensure_dead_letter_inbox()
+        return self.storage.get_next_unread_message(self.id, self.DEAD_LETTER_INBOX, last_read_message_id)
+
     def set_routing_policy(self, routing_policy: RoutingPolicy) -> None:
         """
-        Set a new routing policy for the MessageBus.
+        Set a new routing policy for the MessageBus. It is told about the clients already registered.
 
         :param routing_policy: The new routing policy to use
         """
         self.routing_policy = routing_policy
+        for client_id in self.clients:
+            routing_policy.client_registered(client_id)
+
+    def close(self) -> None:
+        """
+        Stop delivering scheduled messages. They stay in the storage, to be delivered by the next bus using it.
+        The timeouts of the pending requests and the pending retries of failed messages stop too.
+        """
+        self.scheduler.close()
+        self.replies.close()
+        self.retries.close()
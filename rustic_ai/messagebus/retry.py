@@ -0,0 +1,107 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+from .dispatcher import Dispatcher, ExecutorDispatcher, SynchronousDispatcher
+from .timer_wheel import TimerService
+from .utils import get_time_after
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .client.client import Client
+
+
+class RetryPolicy:
+    """
+    How many times a message whose handler fails is handled, and how long to wait between the attempts.
+
+    The delay grows exponentially with the number of failures, up to a maximum.
+    """
+
+    def __init__(
+        self, max_attempts: int = 3, initial_delay: float = 0.1, multiplier: float = 2.0, max_delay: float = 30.0
+    ) -> None:
+        """
+        Initialize the policy.
+
+        :param max_attempts: The number of attempts to handle a message, including the first one.
+        :param initial_delay: The delay in seconds before the second attempt.
+        :param multiplier: The factor applied to the delay after each failed retry.
+        :param max_delay: The maximum delay in seconds between two attempts.
+        """
+        if max_attempts < 1:
+            raise ValueError("The number of attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+
+    def get_delay(self, failures: int) -> float:
+        """
+        Get the delay before the next attempt.
+
+        :param failures: The number of failed attempts so far.
+        :return: The delay in seconds.
+        """
+        return min(self.initial_delay * self.multiplier ** (failures - 1), self.max_delay)
+
+
+class RetryScheduler:
+    """
+    Runs the retries of the message handlers of a message bus when they are due.
+
+    Retries are timers of a timer wheel shared by all the clients of the bus, so waiting retries cost
+    no thread, and nothing ever sleeps on the delivery path. A retry due is queued on its client by the
+    thread of the wheel, and the client is then notified through the delivery path rather than on that
+    thread: the dispatcher of the bus when it delivers off the sender's thread, or a single delivery
+    thread of the scheduler when the bus notifies recipients on the sender's thread.
+    """
+
+    def __init__(self, dispatcher: Optional[Dispatcher] = None) -> None:
+        """
+        Initialize the scheduler. Its threads start with the first retry.
+
+        :param dispatcher: The dispatcher of the bus, a SynchronousDispatcher if not given
+        """
+        self.dispatcher = dispatcher or SynchronousDispatcher()
+        self.delivery: Optional[Dispatcher] = None
+        self.lock = threading.Lock()
+        self.timers = TimerService(self._run, name="message-retries")
+
+    def schedule(self, delay: float, client: 'Client', callback: Callable[[], None]) -> None:
+        """
+        Notify a client after a delay, running a callback queueing its retry first.
+
+        :param delay: The delay in seconds.
+        :param client: The client to notify once the retry is queued.
+        :param callback: The callback, run on the thread of the scheduler, which must be quick.
+        """
+        self.timers.schedule(get_time_after(delay), (client, callback))
+
+    def _run(self, retries: List[Tuple['Client', Callable[[], None]]]) -> None:
+        for client, callback in retries:
+            try:
+                callback()
+                self._get_delivery().dispatch(client)
+            except Exception:
+                logging.exception("Error in message retry")
+
+    def _get_delivery(self) -> Dispatcher:
+        """
+        Get the dispatcher notifying the clients of their retries, off the thread of the timers.
+        """
+        if not isinstance(self.dispatcher, SynchronousDispatcher):
+            return self.dispatcher
+        with self.lock:
+            if self.delivery is None:
+                self.delivery = ExecutorDispatcher(max_workers=1)
+            return self.delivery
+
+    def close(self) -> None:
+        """
+        Stop the scheduler. The pending retries never run.
+        """
+        self.timers.close()
+        with self.lock:
+            if self.delivery is not None:
+                self.delivery.shutdown(wait=False)
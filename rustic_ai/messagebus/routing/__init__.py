@@ -1,4 +1,6 @@
 from .broadcast_routing_policy import BroadcastRoutingPolicy
+from .consistent_hash_routing_policy import ConsistentHashRoutingPolicy
 from .direct_or_fallback_policy import DirectOrFallbackRoutingPolicy
 from .hash_based_routing_policy import HashBasedRoutingPolicy
 from .routing import RoutingPolicy
+from .topic_routing_policy import TopicRoutingPolicy
@@ -0,0 +1,75 @@
+import threading
+from typing import TYPE_CHECKING, Dict, List
+
+from ..hash_ring import ConsistentHashRing
+from ..message import Message, MessageProperties
+from .hash_based_routing_policy import HashBasedRoutingPolicy
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ..client.client import Client
+
+
+class ConsistentHashRoutingPolicy(HashBasedRoutingPolicy):
+    """
+    A hash-based routing policy placing the clients on a consistent hash ring.
+
+    A message goes to the client owning the first point of the ring at or after the hash of its properties,
+    found by bisection. The ring is updated as clients register and unregister, rather than rebuilt for
+    each message, and a change of membership only moves the keys of about one client in n, so messages
+    with the same properties keep going to the same client while it stays registered.
+    """
+
+    def __init__(self, message_properties: List[MessageProperties], virtual_nodes: int = 64):
+        """
+        Initializes the ConsistentHashRoutingPolicy with a list of message properties.
+
+        :param message_properties: List of message properties to be used in generating the hash value.
+        :param virtual_nodes: The number of points of each client on the ring, more points spread keys more evenly.
+        """
+        super().__init__(message_properties)
+        self.ring = ConsistentHashRing(virtual_nodes=virtual_nodes)
+        self.lock = threading.Lock()
+
+    def client_registered(self, client_id: str) -> None:
+        """
+        Add a client joining the message bus to the ring.
+
+        :param client_id: The ID of the client.
+        """
+        with self.lock:
+            self.ring.add_node(client_id)
+
+    def client_unregistered(self, client_id: str) -> None:
+        """
+        Remove a client leaving the message bus from the ring.
+
+        :param client_id: The ID of the client.
+        """
+        with self.lock:
+            self.ring.remove_node(client_id)
+
+    def get_recipients(self, message: Message, clients: Dict[str, 'Client']) -> List[str]:
+        """
+        Returns the client owning the hash of the properties of a given message on the ring.
+
+        :param message: The message to be routed.
+        :param clients: A dictionary of available clients, keyed by client ID.
+        :return: A list of recipient client IDs.
+        """
+        key = self._get_hash_input(message)
+        with self.lock:
+            chosen_client = self.ring.get_node(key) if self.ring.points else None
+            if chosen_client is None or chosen_client not in clients:
+                # The ring missed registrations, e.g. the policy was set after clients registered
+                self._sync(clients)
+                chosen_client = self.ring.get_node(key)
+        return [chosen_client]
+
+    def _sync(self, clients: Dict[str, 'Client']) -> None:
+        """
+        Make the nodes of the ring the given clients.
+        """
+        for client_id in self.ring.nodes:
+            if client_id not in clients:
+                self.ring.remove_node(client_id)
+        self.ring.add_nodes(clients)
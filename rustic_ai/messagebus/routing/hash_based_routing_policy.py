@@ -22,6 +22,13 @@ class HashBasedRoutingPolicy(RoutingPolicy):
         """
         self.message_properties = [prop.value for prop in message_properties]
 
+    def _get_hash_input(self, message: Message) -> str:
+        """
+        Build the string hashed to route a message, from the configured properties of the message.
+        """
+        message_dict = message.to_dict()
+        return "".join(str(message_dict.get(prop)) for prop in self.message_properties)
+
     def get_recipients(self, message: Message, clients: Dict[str, 'Client']) -> List[str]:
         """
         Returns the list of recipients for a given message. The recipients are selected
@@ -31,8 +38,7 @@ class HashBasedRoutingPolicy(RoutingPolicy):
         :param clients: A dictionary of available clients, keyed by client ID.
         :return: A list of recipient client IDs.
         """
-        message_dict = message.__dict__
-        hash_input = "".join(str(message_dict.get(prop)) for prop in self.message_properties)
+        hash_input = self._get_hash_input(message)
         hashed_value = sha256(hash_input.encode('utf-8')).hexdigest()
         client_ids = list(clients.keys())
         chosen_client = client_ids[int(hashed_value, 16) % len(client_ids)]
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 from ..message import Message
 
@@ -29,3 +29,37 @@ class RoutingPolicy(ABC):
         :return: A list of recipient client IDs.
         """
         pass  # pragma: no cover
+
+    def client_registered(self, client_id: str) -> None:
+        """
+        Hook called when a client registers with the message bus.
+
+        :param client_id: The ID of the client.
+        """
+        pass
+
+    def client_unregistered(self, client_id: str) -> None:
+        """
+        Hook called when a client unregisters from the message bus.
+
+        :param client_id: The ID of the client.
+        """
+        pass
+
+    def subscribe(self, client_id: str, topic_pattern: str) -> None:
+        """
+        Hook called when a client subscribes to a topic pattern. Policies not routing by topic ignore it.
+
+        :param client_id: The ID of the client.
+        :param topic_pattern: The topic pattern.
+        """
+        pass
+
+    def unsubscribe(self, client_id: str, topic_pattern: Optional[str] = None) -> None:
+        """
+        Hook called when a client unsubscribes from a topic pattern. Policies not routing by topic ignore it.
+
+        :param client_id: The ID of the client.
+        :param topic_pattern: The topic pattern, all the patterns of the client if not given.
+        """
+        pass
@@ -0,0 +1,174 @@
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from ..message import Message
+from .routing import RoutingPolicy
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ..client.client import Client
+
+TOPIC_SEPARATOR = "."
+SINGLE_LEVEL_WILDCARD = "*"
+MULTI_LEVEL_WILDCARD = "#"
+
+
+class _Node:
+    """
+    A node of the subscription index, for one segment of the subscribed patterns.
+    """
+
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        self.subscribers: Set[str] = set()
+
+
+class SubscriptionIndex:
+    """
+    A trie of topic patterns, mapping them to the clients subscribed to them.
+
+    Topics are dot-separated segments. In a pattern, `*` matches exactly one segment and `#` matches
+    any number of segments, including none. Matching a topic walks the trie segment by segment, so its
+    cost depends on the depth of the topic rather than on the number of subscriptions.
+    """
+
+    def __init__(self) -> None:
+        self.root = _Node()
+        self.patterns: Dict[str, Set[str]] = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _split(pattern: str) -> List[str]:
+        segments = pattern.split(TOPIC_SEPARATOR)
+        if not all(segments):
+            raise ValueError(f"Invalid topic pattern: {pattern!r}")
+        return segments
+
+    def add(self, client_id: str, pattern: str) -> None:
+        """
+        Subscribe a client to a topic pattern.
+
+        :param client_id: The ID of the client.
+        :param pattern: The topic pattern.
+        """
+        segments = self._split(pattern)
+        with self.lock:
+            node = self.root
+            for segment in segments:
+                node = node.children.setdefault(segment, _Node())
+            node.subscribers.add(client_id)
+            self.patterns.setdefault(client_id, set()).add(pattern)
+
+    def remove(self, client_id: str, pattern: Optional[str] = None) -> None:
+        """
+        Unsubscribe a client from a topic pattern.
+
+        :param client_id: The ID of the client.
+        :param pattern: The topic pattern, all the patterns of the client if not given.
+        """
+        with self.lock:
+            patterns = self.patterns.get(client_id, set())
+            for subscribed in [pattern] if pattern is not None else list(patterns):
+                if subscribed in patterns:
+                    self._remove(self.root, self._split(subscribed), client_id)
+                    patterns.discard(subscribed)
+            if not patterns:
+                self.patterns.pop(client_id, None)
+
+    def _remove(self, node: _Node, segments: List[str], client_id: str) -> bool:
+        """
+        Remove a subscriber from the node of a pattern, pruning the nodes left empty.
+
+        :return: Whether the node is left empty.
+        """
+        if segments:
+            child = node.children[segments[0]]
+            if self._remove(child, segments[1:], client_id):
+                del node.children[segments[0]]
+        else:
+            node.subscribers.discard(client_id)
+        return not node.subscribers and not node.children
+
+    def match(self, topic: str) -> Set[str]:
+        """
+        Find the clients subscribed to patterns matching a topic.
+
+        :param topic: The topic.
+        :return: The IDs of the subscribed clients.
+        """
+        segments = topic.split(TOPIC_SEPARATOR)
+        subscribers: Set[str] = set()
+        with self.lock:
+            self._match(self.root, segments, 0, subscribers)
+        return subscribers
+
+    def _match(self, node: _Node, segments: List[str], position: int, subscribers: Set[str]) -> None:
+        multi_level = node.children.get(MULTI_LEVEL_WILDCARD)
+        if multi_level is not None:
+            # `#` consumes any number of the remaining segments
+            for next_position in range(position, len(segments) + 1):
+                self._match(multi_level, segments, next_position, subscribers)
+
+        if position == len(segments):
+            subscribers.update(node.subscribers)
+            return
+
+        for key in (segments[position], SINGLE_LEVEL_WILDCARD):
+            child = node.children.get(key)
+            if child is not None:
+                self._match(child, segments, position + 1, subscribers)
+
+
+class TopicRoutingPolicy(RoutingPolicy):
+    """
+    This class implements a publish/subscribe routing policy. A message is routed to the clients
+    subscribed to a topic pattern matching its topic, excluding its sender.
+    Messages without a topic have no recipients.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the TopicRoutingPolicy with no subscriptions.
+        """
+        self.subscriptions = SubscriptionIndex()
+
+    def subscribe(self, client_id: str, topic_pattern: str) -> None:
+        """
+        Subscribe a client to a topic pattern, such as `agents.*.results` or `logs.#`.
+
+        :param client_id: The ID of the client.
+        :param topic_pattern: The topic pattern.
+        """
+        self.subscriptions.add(client_id, topic_pattern)
+
+    def unsubscribe(self, client_id: str, topic_pattern: Optional[str] = None) -> None:
+        """
+        Unsubscribe a client from a topic pattern.
+
+        :param client_id: The ID of the client.
+        :param topic_pattern: The topic pattern, all the patterns of the client if not given.
+        """
+        self.subscriptions.remove(client_id, topic_pattern)
+
+    def client_unregistered(self, client_id: str) -> None:
+        """
+        Drop the subscriptions of a client leaving the message bus.
+
+        :param client_id: The ID of the client.
+        """
+        self.subscriptions.remove(client_id)
+
+    def get_recipients(self, message: Message, clients: Dict[str, 'Client']) -> List[str]:
+        """
+        Returns the clients subscribed to the topic of a given message, except its sender.
+
+        :param message: The message to be routed.
+        :param clients: A dictionary of available clients, keyed by client ID.
+        :return: A list of recipient client IDs.
+        """
+        if message.topic is None:
+            return []
+
+        subscribers = self.subscriptions.match(message.topic)
+        return sorted(client_id for client_id in subscribers if client_id != message.sender and client_id in clients)
@@ -0,0 +1,135 @@
+import threading
+from concurrent.futures import Future, InvalidStateError
+from functools import partial
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .message import Message
+from .timer_wheel import TimerHandle, TimerService
+from .utils import get_time_after
+
+if TYPE_CHECKING:  # pragma: no cover
+    ReplyFuture = Future[Message]
+else:
+    ReplyFuture = Future
+
+
+class ReplyIndex:
+    """
+    The requests of a message bus waiting for their reply, keyed by the ID of the request message.
+
+    A message replying to a pending request resolves its future as the bus routes it, with a single lookup
+    on its `in_reply_to` field, instead of going through the inbox of the requester. Request timeouts are
+    scheduled on a timer wheel, so any number of requests can wait without a thread each.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty index.
+        """
+        self.lock = threading.Lock()
+        # The requester, the future and the timeout of each pending request, by request ID
+        self.pending: Dict[int, Tuple[str, ReplyFuture, Optional[TimerHandle]]] = {}
+        self.timeouts = TimerService(self._expire, name="reply-timeouts")
+
+    def __len__(self) -> int:
+        """
+        The number of pending requests.
+        """
+        return len(self.pending)
+
+    def register(self, request_id: int, client_id: str, timeout: Optional[float] = None) -> ReplyFuture:
+        """
+        Register a request before it is sent.
+
+        :param request_id: The ID of the request message.
+        :param client_id: The ID of the client waiting for the reply.
+        :param timeout: Optional time in seconds after which the future fails with a TimeoutError.
+        :return: The future of the reply, which can be cancelled to stop waiting.
+        """
+        future: ReplyFuture = Future()
+        with self.lock:
+            # Scheduled under the lock, so the timeout cannot fire before the request is registered
+            handle = self.timeouts.schedule(get_time_after(timeout), request_id) if timeout is not None else None
+            self.pending[request_id] = (client_id, future, handle)
+        future.add_done_callback(partial(self._discard, request_id))
+        return future
+
+    def resolve(self, message: Message, recipient_ids: List[str]) -> List[str]:
+        """
+        Resolve the pending request a message replies to, if it is sent to the requester.
+
+        :param message: The message being routed.
+        :param recipient_ids: The recipients of the message.
+        :return: The recipients the message must still be delivered to, without the requester it resolved.
+        """
+        if message.in_reply_to is None or not self.pending:
+            return recipient_ids
+
+        with self.lock:
+            entry = self.pending.get(message.in_reply_to)
+            if entry is None or entry[0] not in recipient_ids:
+                return recipient_ids
+            del self.pending[message.in_reply_to]
+
+        client_id, future, handle = entry
+        if handle is not None:
+            self.timeouts.cancel(handle)
+        if not self._settle(future, message):
+            # The requester stopped waiting in the meantime, the reply goes to its inbox
+            return recipient_ids
+        return [recipient_id for recipient_id in recipient_ids if recipient_id != client_id]
+
+    def cancel(self, client_id: str) -> None:
+        """
+        Cancel the pending requests of a client.
+
+        :param client_id: The ID of the client.
+        """
+        with self.lock:
+            futures = [future for requester_id, future, _ in self.pending.values() if requester_id == client_id]
+        for future in futures:
+            future.cancel()
+
+    def _discard(self, request_id: int, future: ReplyFuture) -> None:
+        """
+        Forget a request once its future is done, whether it was resolved, timed out or cancelled.
+        """
+        with self.lock:
+            entry = self.pending.get(request_id)
+            if entry is None or entry[1] is not future:
+                return
+            del self.pending[request_id]
+        if entry[2] is not None:
+            self.timeouts.cancel(entry[2])
+
+    def _expire(self, request_ids: List[Any]) -> None:
+        """
+        Fail the requests whose timeout passed.
+        """
+        for request_id in request_ids:
+            with self.lock:
+                entry = self.pending.pop(request_id, None)
+            if entry is not None:
+                self._settle(entry[1], TimeoutError(f"No reply to request {request_id}"))
+
+    @staticmethod
+    def _settle(future: ReplyFuture, result: Any) -> bool:
+        """
+        Set the result or the exception of a future, unless it is already done.
+
+        :return: Whether the future was settled.
+        """
+        try:
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            return False
+        return True
+
+    def close(self) -> None:
+        """
+        Stop the timeouts of the pending requests.
+        """
+        self.timeouts.close()
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from .message import Message
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .message_bus import MessageBus
+
+
+class MessageScheduler:
+    """
+    Moves the scheduled messages of a message bus into the inboxes of their recipients when they are due.
+
+    Scheduled messages are kept by the storage backend of the bus, so they survive restarts and cost no thread
+    while they wait. A single background thread sleeps until the earliest due time it knows of, delivers the
+    messages due in batches, and asks the storage for the next due time. It starts with the first message
+    scheduled, or with the bus if the storage holds scheduled messages already.
+
+    A message which cannot be sent, e.g. to a recipient which is not registered or when its inbox is full, is
+    scheduled again a little later, as after a restart the messages due may come before their recipients
+    register again. It is dropped after a few attempts. A message which cannot be scheduled again either is
+    held in memory and tried again with the next batch, so a message taken from the storage is never lost
+    while the bus runs.
+    """
+
+    def __init__(
+        self, message_bus: 'MessageBus', batch_size: int = 1000, retry_delay: float = 1.0, max_attempts: int = 10
+    ) -> None:
+        """
+        Initialize the scheduler.
+
+        :param message_bus: The message bus delivering the messages.
+        :param batch_size: The maximum number of messages taken from the storage at once.
+        :param retry_delay: The delay in seconds before a message which could not be routed is tried again.
+        :param max_attempts: The number of attempts to route a message before it is dropped.
+        """
+        self.message_bus = message_bus
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        # The number of failed attempts of the messages being retried, by message ID
+        self.attempts: Dict[int, int] = {}
+        # The messages due which could not be sent nor scheduled again
+        self.held: List[Message] = []
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.next_due_time: Optional[int] = None
+        self.closed = False
+
+    def notify(self, due_time: int) -> None:
+        """
+        Tell the scheduler about a message due at a point in time, from any thread.
+
+        :param due_time: The due time in milliseconds since the Unix epoch.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            if self.next_due_time is None or due_time < self.next_due_time:
+                self.next_due_time = due_time
+                self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="message-scheduler", daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                now = time.time_ns() // 1_000_000
+                if self.next_due_time is None or self.next_due_time > now:
+                    timeout = None if self.next_due_time is None else (self.next_due_time - now) / 1000
+                    self.condition.wait(timeout)
+                    continue
+                self.next_due_time = None
+
+            try:
+                messages = self.held + self.message_bus.storage.pop_due_messages(
+                    self.message_bus.id, now, self.batch_size
+                )
+                self.held = []
+                self._deliver(messages)
+                due_time = self.message_bus.storage.get_next_due_time(self.message_bus.id)
+            except Exception:
+                logging.exception("Failed to deliver the scheduled messages of message bus %s", self.message_bus.id)
+                due_time = time.time_ns() // 1_000_000 + 1000
+            if self.held:
+                held_due_time = time.time_ns() // 1_000_000 + int(self.retry_delay * 1000)
+                due_time = held_due_time if due_time is None else min(due_time, held_due_time)
+
+            with self.condition:
+                if due_time is not None and (self.next_due_time is None or due_time < self.next_due_time):
+                    self.next_due_time = due_time
+
+    def _deliver(self, messages: List[Message]) -> None:
+        """
+        Send messages which are due, one at a time if the batch fails, retrying the messages which fail alone.
+        A batch failing in the storage may have reached some inboxes, which then get those messages twice.
+        """
+        if not messages:
+            return
+        try:
+            self.message_bus.deliver_scheduled_messages(messages)
+        except Exception:
+            for message in messages:
+                try:
+                    self.message_bus.deliver_scheduled_messages([message])
+                except Exception as e:
+                    self._retry(message, e)
+                else:
+                    self.attempts.pop(message.id, None)
+        else:
+            for message in messages:
+                self.attempts.pop(message.id, None)
+
+    def _retry(self, message: Message, error: Exception) -> None:
+        """
+        Schedule a message which could not be sent again, or drop it after too many attempts.
+        """
+        attempts = self.attempts.pop(message.id, 0) + 1
+        if attempts >= self.max_attempts:
+            logging.warning("Dropped scheduled message %s after %d attempts: %s", message.id, attempts, error)
+            return
+        self.attempts[message.id] = attempts
+        deliver_at = time.time_ns() // 1_000_000 + int(self.retry_delay * 1000)
+        try:
+            self.message_bus.storage.schedule_message(self.message_bus.id, message, deliver_at)
+        except Exception:
+            logging.exception("Failed to schedule message %s again, held in memory", message.id)
+            self.held.append(message)
+
+    def close(self) -> None:
+        """
+        Stop the background thread. The scheduled messages stay in the storage.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
@@ -0,0 +1,3 @@
+from ..hash_ring import ConsistentHashRing
+from .sharded_message_bus import ShardedMessageBus
+from .transport import ShardConnection, ShardError, ShardServer
@@ -0,0 +1,402 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, cast
+
+from ..deduplication import DeduplicationFilter
+from ..dispatcher import Dispatcher
+from ..hash_ring import ConsistentHashRing
+from ..message import Message
+from ..message_bus import MessageBus
+from ..routing import RoutingPolicy
+from ..storage import StorageBackend
+from ..utils import EPOCH
+from .transport import (
+    CLIENT_REGISTERED,
+    CLIENT_SUBSCRIBED,
+    CLIENT_UNREGISTERED,
+    CLIENT_UNSUBSCRIBED,
+    Address,
+    Delivery,
+    MembershipChange,
+    ShardConnection,
+    ShardError,
+    ShardServer,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ..client.client import Client
+
+# The end of the time window covering every message ID
+END_OF_TIME = EPOCH + (1 << 39)
+
+
+class ShardedMessageBus(MessageBus):
+    """
+    A shard of a message bus spread over several processes or machines.
+
+    Clients are placed on the shards by consistent hashing of their IDs, and a client must register with the
+    shard it belongs to. Each shard stores the inboxes of its clients and serves the other shards over TCP:
+    messages sent to clients of other shards are forwarded to them.
+
+    Every shard tells the others when its clients register, unregister, subscribe and unsubscribe, so the
+    routing policy of each shard sees the clients of the whole bus. A message without recipients is routed
+    once, by the shard it is sent through, and then forwarded to the shards of the recipients chosen.
+
+    Messages sent to a client of a shard that has not registered yet wait in its inbox until it does.
+    Shards must use distinct machine IDs so that message IDs stay unique across the bus, and clients replying
+    from their callbacks should be notified by an ExecutorDispatcher, as a send waits for the shards it sends to.
+    """
+
+    def __init__(
+        self,
+        shard_id: str,
+        shards: Optional[Dict[str, Address]] = None,
+        id: Optional[str] = None,
+        machine_id: int = 1,
+        storage_backend: Optional[StorageBackend] = None,
+        routing_policy: Optional[RoutingPolicy] = None,
+        hybrid_clock: bool = False,
+        dispatcher: Optional[Dispatcher] = None,
+        address: Address = ("127.0.0.1", 0),
+        virtual_nodes: int = 64,
+        deduplication_filter: Optional[DeduplicationFilter] = None,
+    ):
+        """
+        Initialize the shard and start serving the other shards.
+
+        :param shard_id: The ID of this shard.
+        :param shards: The addresses of the other shards, keyed by shard ID.
+        :param id: The ID of the message bus, shared by all its shards.
+        :param machine_id: The machine ID of the message IDs generated by this shard, unique across shards.
+        :param address: The address to serve the other shards on, on any free port if the port is 0.
+        :param virtual_nodes: The number of points of each shard on the hash ring.
+        :param deduplication_filter: Filter dropping the messages sent again through this shard
+            with the same idempotency key.
+        """
+        super().__init__(
+            id, machine_id, storage_backend, routing_policy, hybrid_clock, dispatcher, deduplication_filter
+        )
+        self.shard_id = shard_id
+        self.ring = ConsistentHashRing([shard_id], virtual_nodes)
+        self.peers: Dict[str, ShardConnection] = {}
+        # The clients with an inbox on this shard, registered or not
+        self.inboxes: Set[str] = set()
+        # The shard of every client registered with the bus, and the topic patterns of the clients of this shard
+        self.members: Dict[str, str] = {}
+        self.subscriptions: Dict[str, Set[str]] = {}
+        self.lock = threading.RLock()
+
+        for peer_id, peer_address in (shards or {}).items():
+            self.ring.add_node(peer_id)
+            self.peers[peer_id] = ShardConnection(peer_address)
+
+        self.server = ShardServer(self, address)
+        self.address = self.server.address
+
+    def get_shard(self, client_id: str) -> str:
+        """
+        Get the shard a client belongs to.
+
+        :param client_id: The ID of the client
+        :return: The ID of the shard
+        """
+        return self.ring.get_node(client_id)
+
+    def add_shard(self, shard_id: str, address: Address) -> List[str]:
+        """
+        Add a shard to the bus, moving to it the inboxes of the clients it takes over.
+        Every shard of the bus must be told about the new shard.
+
+        :param shard_id: The ID of the new shard
+        :param address: The address of the new shard
+        :return: The IDs of the clients moved, which must now register with the new shard
+        """
+        with self.lock:
+            self.peers[shard_id] = ShardConnection(address)
+            self.ring.add_node(shard_id)
+            moved = self._rebalance()
+            changes: List[MembershipChange] = [
+                (CLIENT_REGISTERED, self.shard_id, client_id, None) for client_id in self.clients
+            ]
+            changes.extend(
+                (CLIENT_SUBSCRIBED, self.shard_id, client_id, topic_pattern)
+                for client_id, topic_patterns in self.subscriptions.items()
+                for topic_pattern in topic_patterns
+            )
+            if changes:
+                self.peers[shard_id].update_membership(changes)
+            return moved
+
+    def remove_shard(self, shard_id: str) -> List[str]:
+        """
+        Remove a shard from the bus. Removing this shard moves the inboxes of all its clients
+        to the remaining shards, removing another shard moves nothing as its clients were elsewhere.
+        Every shard of the bus must be told about the removal.
+
+        :param shard_id: The ID of the shard leaving
+        :return: The IDs of the clients moved, which must now register with their new shards
+        """
+        with self.lock:
+            self.ring.remove_node(shard_id)
+            peer = self.peers.pop(shard_id, None)
+            if peer is not None:
+                peer.close()
+            if shard_id != self.shard_id:
+                self.update_membership(
+                    [
+                        (CLIENT_UNREGISTERED, shard_id, client_id, None)
+                        for client_id, member_shard_id in list(self.members.items())
+                        if member_shard_id == shard_id
+                    ]
+                )
+            return self._rebalance() if self.ring.points else []
+
+    def _rebalance(self) -> List[str]:
+        """
+        Move the inboxes of the clients now belonging to other shards, with their unread messages.
+        Only the clients whose shard changed are moved.
+
+        :return: The IDs of the clients moved
+        """
+        moved = sorted(client_id for client_id in self.inboxes if self.get_shard(client_id) != self.shard_id)
+        for client_id in moved:
+            messages = self.storage.get_messages_in_time_range(self.id, client_id, EPOCH, END_OF_TIME)
+            if messages:
+                self.peers[self.get_shard(client_id)].deliver([(message, [client_id]) for message in messages])
+
+            client = self.clients.get(client_id)
+            if client is not None:
+                self.unregister_client(client)
+            else:
+                self._remove_inbox(client_id)
+        return moved
+
+    def _ensure_inbox(self, client_id: str) -> None:
+        with self.lock:
+            if client_id not in self.inboxes:
+                self.storage.create_inbox(self.id, client_id)
+                self.inboxes.add(client_id)
+
+    def _remove_inbox(self, client_id: str) -> None:
+        with self.lock:
+            self.inboxes.discard(client_id)
+            self.storage.remove_inbox(self.id, client_id)
+
+    def register_client(self, client: 'Client') -> None:
+        """
+        Register a new client with this shard, which must be the shard it belongs to.
+
+        :param client: The client to register
+        """
+        if client.client_id == self.DEAD_LETTER_INBOX:
+            raise ValueError(f"{self.DEAD_LETTER_INBOX} is reserved for the dead letters")
+        shard_id = self.get_shard(client.client_id)
+        if shard_id != self.shard_id:
+            raise ValueError(f"Client {client.client_id} belongs to shard {shard_id}, not {self.shard_id}")
+
+        self._ensure_inbox(client.client_id)
+        self.clients[client.client_id] = client
+        self._change_membership((CLIENT_REGISTERED, self.shard_id, client.client_id, None))
+
+    def unregister_client(self, client: 'Client') -> None:
+        """
+        Unregister a client from this shard.
+
+        :param client: The client to unregister
+        """
+        if self.clients.get(client.client_id) is not client:
+            return
+        del self.clients[client.client_id]
+        self._remove_inbox(client.client_id)
+        self._change_membership((CLIENT_UNREGISTERED, self.shard_id, client.client_id, None))
+        self.replies.cancel(client.client_id)
+
+    def subscribe(self, client_id: str, topic_pattern: str) -> None:
+        """
+        Subscribe a client of this shard to the messages of the topics matching a pattern, on every shard.
+
+        :param client_id: The ID of the subscribing client
+        :param topic_pattern: The topic pattern, where `*` matches one segment and `#` any number of segments
+        """
+        if client_id not in self.clients:
+            raise ValueError(f"Unknown client: {client_id}")
+        self._change_membership((CLIENT_SUBSCRIBED, self.shard_id, client_id, topic_pattern))
+
+    def unsubscribe(self, client_id: str, topic_pattern: Optional[str] = None) -> None:
+        """
+        Unsubscribe a client of this shard from a topic pattern, on every shard.
+
+        :param client_id: The ID of the unsubscribing client
+        :param topic_pattern: The topic pattern, all the patterns of the client if not given
+        """
+        self._change_membership((CLIENT_UNSUBSCRIBED, self.shard_id, client_id, topic_pattern))
+
+    def _change_membership(self, change: MembershipChange) -> None:
+        """
+        Apply a change of the clients of this shard, then tell the other shards about it.
+        A shard that cannot be reached misses the change, until it is added to this shard again.
+        """
+        self.update_membership([change])
+        with self.lock:
+            peers = list(self.peers.items())
+        for peer_id, peer in peers:
+            try:
+                peer.update_membership([change])
+            except (OSError, ShardError) as e:
+                logging.warning("Shard %s missed a change of the clients of shard %s: %s", peer_id, self.shard_id, e)
+
+    def update_membership(self, changes: List[MembershipChange]) -> None:
+        """
+        Apply changes of the clients of a shard to the routing policy of this shard.
+
+        :param changes: The changes
+        """
+        with self.lock:
+            for kind, shard_id, client_id, topic_pattern in changes:
+                if kind == CLIENT_REGISTERED:
+                    self.members[client_id] = shard_id
+                    self.routing_policy.client_registered(client_id)
+                elif kind == CLIENT_UNREGISTERED:
+                    if self.members.get(client_id) == shard_id:
+                        del self.members[client_id]
+                        self.routing_policy.client_unregistered(client_id)
+                    if shard_id == self.shard_id:
+                        self.subscriptions.pop(client_id, None)
+                elif kind == CLIENT_SUBSCRIBED:
+                    assert topic_pattern is not None
+                    self.routing_policy.subscribe(client_id, topic_pattern)
+                    if shard_id == self.shard_id:
+                        self.subscriptions.setdefault(client_id, set()).add(topic_pattern)
+                elif kind == CLIENT_UNSUBSCRIBED:
+                    self.routing_policy.unsubscribe(client_id, topic_pattern)
+                    if shard_id == self.shard_id and client_id in self.subscriptions:
+                        if topic_pattern is None:
+                            del self.subscriptions[client_id]
+                        else:
+                            self.subscriptions[client_id].discard(topic_pattern)
+
+    def set_routing_policy(self, routing_policy: RoutingPolicy) -> None:
+        """
+        Set a new routing policy for this shard. It is told about the clients of every shard already registered.
+
+        :param routing_policy: The new routing policy to use
+        """
+        with self.lock:
+            self.routing_policy = routing_policy
+            for client_id in self.members:
+                routing_policy.client_registered(client_id)
+
+    def send_message(self, message: Message) -> None:
+        """
+        Send a message to its recipients on every shard.
+
+        :param message: The message to send
+        """
+        self.send_messages([message])
+
+    def _send_messages(self, messages: List[Message], deduplicate: bool) -> None:
+        """
+        Send a batch of messages, with a single request to each shard involved.
+        Idempotency keys are checked by the shard the messages are sent through.
+
+        :param messages: The messages to send
+        :param deduplicate: Whether to drop the messages with a recently seen idempotency key
+        """
+        if deduplicate:
+            messages = self.deduplication_filter.filter(messages)
+
+        with self.lock:
+            # Routing policies only look at the IDs of the clients, the clients of other shards have no object here
+            clients = cast(Dict[str, 'Client'], {client_id: self.clients.get(client_id) for client_id in self.members})
+            routes = [
+                (message, message.recipients or self.routing_policy.get_recipients(message, clients))
+                for message in messages
+            ]
+
+        deliveries: Dict[str, List[Delivery]] = {}
+        for message, recipients in routes:
+            recipients_by_shard: Dict[str, List[str]] = {}
+            for recipient_id in recipients:
+                recipients_by_shard.setdefault(self.get_shard(recipient_id), []).append(recipient_id)
+            for shard_id, recipient_ids in recipients_by_shard.items():
+                deliveries.setdefault(shard_id, []).append((message, recipient_ids))
+
+        try:
+            for shard_id, shard_deliveries in deliveries.items():
+                if shard_id == self.shard_id:
+                    self.deliver(shard_deliveries)
+                else:
+                    self.peers[shard_id].deliver(shard_deliveries)
+        except BaseException:
+            # The batch may be sent again, possibly reaching twice the shards delivered to before the failure
+            if deduplicate:
+                self.deduplication_filter.forget(messages)
+            raise
+
+    def deliver(self, deliveries: List[Delivery]) -> None:
+        """
+        Store messages in the inboxes of their recipients on this shard and notify them.
+        Replies to the pending requests of clients of this shard resolve them instead.
+
+        :param deliveries: The messages with their recipients, or None for the routing policy to choose them
+        """
+        batches: Dict[str, List[Message]] = {}
+        for message, recipient_ids in deliveries:
+            if recipient_ids is None:
+                recipient_ids = self.routing_policy.get_recipients(message, self.clients)
+            for recipient_id in self.replies.resolve(message, recipient_ids):
+                batches.setdefault(recipient_id, []).append(message)
+
+        for recipient_id, batch in batches.items():
+            self._ensure_inbox(recipient_id)
+            self.storage.add_messages_to_inbox(self.id, recipient_id, batch)
+
+        self._notify(batches)
+
+    def remove_received_message(self, sender_id: str, recipient_ids: List[str], message_id: int) -> None:
+        """
+        Remove a sent message from the listed recipient's inbox, on every shard.
+
+        :param sender_id: The sender's client ID
+        :param recipient_ids: The recipient's client ID, should not be empty.
+            If the first element is '*', the message will be removed from all recipients.
+        :param message_id: The message ID to remove
+        """
+        assert recipient_ids, ValueError('recipient_ids must not be empty')
+
+        recipients_by_shard: Dict[str, List[str]] = {}
+        if recipient_ids[0] == '*':
+            recipients_by_shard = {shard_id: ['*'] for shard_id in self.ring.nodes}
+        else:
+            for recipient_id in recipient_ids:
+                recipients_by_shard.setdefault(self.get_shard(recipient_id), []).append(recipient_id)
+
+        for shard_id, shard_recipient_ids in recipients_by_shard.items():
+            if shard_id == self.shard_id:
+                self.remove_delivered_message(sender_id, shard_recipient_ids, message_id)
+            else:
+                self.peers[shard_id].remove_delivered_message(sender_id, shard_recipient_ids, message_id)
+
+    def remove_delivered_message(self, sender_id: str, recipient_ids: List[str], message_id: int) -> None:
+        """
+        Remove a message from inboxes of this shard.
+
+        :param sender_id: The sender's client ID
+        :param recipient_ids: The IDs of the recipients on this shard, or ['*'] for all of them
+        :param message_id: The message ID to remove
+        """
+        if recipient_ids[0] == '*':
+            with self.lock:
+                recipient_ids = list(self.inboxes)
+        self.storage.remove_received_message(self.id, sender_id, recipient_ids, message_id)
+
+    def close(self) -> None:
+        """
+        Stop serving the other shards and close the connections to them.
+        """
+        super().close()
+        self.server.close()
+        with self.lock:
+            peers, self.peers = list(self.peers.values()), {}
+        for peer in peers:
+            peer.close()
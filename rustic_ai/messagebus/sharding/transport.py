@@ -0,0 +1,312 @@
+import logging
+import socket
+import socketserver
+import struct
+import threading
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from ..message import Message
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .sharded_message_bus import ShardedMessageBus
+
+Address = Tuple[str, int]
+
+# A message to deliver on a shard, with its recipients on the shard, or None to route it there
+Delivery = Tuple[Message, Optional[List[str]]]
+
+# A change of the clients of a shard: the kind of change, the shard, the client and the topic pattern if any
+MembershipChange = Tuple[int, str, str, Optional[str]]
+
+# Requests and responses are framed by their type and the length of their payload
+FRAME = struct.Struct("!BI")
+DELIVERY = struct.Struct("!BII")
+REMOVAL = struct.Struct("!QH")
+# kind of change, shard ID length, client ID length, topic pattern length or NO_PATTERN
+MEMBERSHIP_CHANGE = struct.Struct("!BHHH")
+NO_PATTERN = 0xFFFF
+
+DELIVER = 1
+REMOVE = 2
+UPDATE_MEMBERSHIP = 3
+
+CLIENT_REGISTERED = 0
+CLIENT_UNREGISTERED = 1
+CLIENT_SUBSCRIBED = 2
+CLIENT_UNSUBSCRIBED = 3
+
+OK = 0
+ERROR = 1
+
+
+class ShardError(Exception):
+    """
+    Raised when a shard fails to handle a request.
+    """
+
+    pass
+
+
+def encode_deliveries(deliveries: List[Delivery]) -> bytes:
+    """
+    Encode messages and their recipients with the binary message codec.
+
+    :param deliveries: The messages and their recipients.
+    :return: The encoded deliveries.
+    """
+    parts = []
+    for message, recipient_ids in deliveries:
+        recipients = "\0".join(recipient_ids or []).encode("utf-8")
+        data = message.encode("binary")
+        parts.append(DELIVERY.pack(recipient_ids is None, len(recipients), len(data)) + recipients + data)
+    return b"".join(parts)
+
+
+def decode_deliveries(data: bytes) -> List[Delivery]:
+    """
+    Decode messages and their recipients encoded by `encode_deliveries`.
+
+    :param data: The encoded deliveries.
+    :return: The messages and their recipients.
+    """
+    deliveries: List[Delivery] = []
+    offset = 0
+    while offset < len(data):
+        routed, recipients_length, message_length = DELIVERY.unpack_from(data, offset)
+        offset += DELIVERY.size
+        recipients = data[offset : offset + recipients_length].decode("utf-8")
+        offset += recipients_length
+        message = Message.decode(data[offset : offset + message_length])
+        offset += message_length
+        deliveries.append((message, None if routed else (recipients.split("\0") if recipients else [])))
+    return deliveries
+
+
+def encode_removal(sender_id: str, recipient_ids: List[str], message_id: int) -> bytes:
+    """
+    Encode the removal of a message from inboxes.
+
+    :param sender_id: The ID of the sender client.
+    :param recipient_ids: The IDs of the recipients.
+    :param message_id: The ID of the message.
+    :return: The encoded removal.
+    """
+    sender = sender_id.encode("utf-8")
+    return REMOVAL.pack(message_id, len(sender)) + sender + "\0".join(recipient_ids).encode("utf-8")
+
+
+def decode_removal(data: bytes) -> Tuple[str, List[str], int]:
+    """
+    Decode a removal encoded by `encode_removal`.
+
+    :param data: The encoded removal.
+    :return: The ID of the sender, the IDs of the recipients and the ID of the message.
+    """
+    message_id, sender_length = REMOVAL.unpack_from(data)
+    sender_id = data[REMOVAL.size : REMOVAL.size + sender_length].decode("utf-8")
+    recipient_ids = data[REMOVAL.size + sender_length :].decode("utf-8").split("\0")
+    return sender_id, recipient_ids, message_id
+
+
+def encode_membership(changes: List[MembershipChange]) -> bytes:
+    """
+    Encode changes of the clients of a shard.
+
+    :param changes: The changes.
+    :return: The encoded changes.
+    """
+    parts = []
+    for kind, shard_id, client_id, topic_pattern in changes:
+        shard = shard_id.encode("utf-8")
+        client = client_id.encode("utf-8")
+        pattern = b"" if topic_pattern is None else topic_pattern.encode("utf-8")
+        pattern_length = NO_PATTERN if topic_pattern is None else len(pattern)
+        parts.append(MEMBERSHIP_CHANGE.pack(kind, len(shard), len(client), pattern_length) + shard + client + pattern)
+    return b"".join(parts)
+
+
+def decode_membership(data: bytes) -> List[MembershipChange]:
+    """
+    Decode changes encoded by `encode_membership`.
+
+    :param data: The encoded changes.
+    :return: The changes.
+    """
+    changes: List[MembershipChange] = []
+    offset = 0
+    while offset < len(data):
+        kind, shard_length, client_length, pattern_length = MEMBERSHIP_CHANGE.unpack_from(data, offset)
+        offset += MEMBERSHIP_CHANGE.size
+        shard_id = data[offset : offset + shard_length].decode("utf-8")
+        offset += shard_length
+        client_id = data[offset : offset + client_length].decode("utf-8")
+        offset += client_length
+        topic_pattern = None
+        if pattern_length != NO_PATTERN:
+            topic_pattern = data[offset : offset + pattern_length].decode("utf-8")
+            offset += pattern_length
+        changes.append((kind, shard_id, client_id, topic_pattern))
+    return changes
+
+
+def _read_exactly(sock: socket.socket, length: int) -> Optional[bytes]:
+    chunks = []
+    while length:
+        chunk = sock.recv(length)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_frame(sock: socket.socket) -> Optional[Tuple[int, bytes]]:
+    header = _read_exactly(sock, FRAME.size)
+    if header is None:
+        return None
+    kind, length = FRAME.unpack(header)
+    payload = _read_exactly(sock, length)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+def _write_frame(sock: socket.socket, kind: int, payload: bytes) -> None:
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+class _ShardRequestHandler(socketserver.BaseRequestHandler):
+    server: '_ShardTCPServer'
+
+    def handle(self) -> None:
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            frame = _read_frame(self.request)
+            if frame is None:
+                return
+
+            kind, payload = frame
+            try:
+                if kind == DELIVER:
+                    self.server.message_bus.deliver(decode_deliveries(payload))
+                elif kind == REMOVE:
+                    self.server.message_bus.remove_delivered_message(*decode_removal(payload))
+                elif kind == UPDATE_MEMBERSHIP:
+                    self.server.message_bus.update_membership(decode_membership(payload))
+                else:
+                    raise ShardError(f"Unknown request type: {kind}")
+            except Exception as e:
+                logging.exception("Shard %s failed to handle a request", self.server.message_bus.shard_id)
+                _write_frame(self.request, ERROR, f"{type(e).__name__}: {e}".encode("utf-8"))
+            else:
+                _write_frame(self.request, OK, b"")
+
+
+class _ShardTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: Address, message_bus: 'ShardedMessageBus') -> None:
+        super().__init__(address, _ShardRequestHandler)
+        self.message_bus = message_bus
+
+
+class ShardServer:
+    """
+    Serves the requests of the other shards to a shard, over TCP.
+    """
+
+    def __init__(self, message_bus: 'ShardedMessageBus', address: Address = ("127.0.0.1", 0)) -> None:
+        """
+        Start serving.
+
+        :param message_bus: The shard to serve.
+        :param address: The address to listen on, on any free port if the port is 0.
+        """
+        self.server = _ShardTCPServer(address, message_bus)
+        self.address: Address = self.server.server_address[:2]  # type: ignore
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"shard-{message_bus.shard_id}")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self) -> None:
+        """
+        Stop serving.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class ShardConnection:
+    """
+    A connection to another shard. Requests on a connection are sent one at a time, so messages sent
+    to a shard arrive in order.
+    """
+
+    def __init__(self, address: Address) -> None:
+        """
+        Initialize the connection, connecting on the first request.
+
+        :param address: The address of the shard server.
+        """
+        self.address = address
+        self.socket: Optional[socket.socket] = None
+        self.lock = threading.Lock()
+
+    def _request(self, kind: int, payload: bytes) -> None:
+        with self.lock:
+            if self.socket is None:
+                self.socket = socket.create_connection(self.address)
+                self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                _write_frame(self.socket, kind, payload)
+                response = _read_frame(self.socket)
+            except OSError:
+                self._close()
+                raise
+            if response is None:
+                self._close()
+                raise ShardError(f"Shard at {self.address} closed the connection")
+
+        status, error = response
+        if status != OK:
+            raise ShardError(error.decode("utf-8"))
+
+    def deliver(self, deliveries: List[Delivery]) -> None:
+        """
+        Deliver messages on the shard.
+
+        :param deliveries: The messages and their recipients on the shard.
+        """
+        self._request(DELIVER, encode_deliveries(deliveries))
+
+    def remove_delivered_message(self, sender_id: str, recipient_ids: List[str], message_id: int) -> None:
+        """
+        Remove a message from inboxes of the shard.
+
+        :param sender_id: The ID of the sender client.
+        :param recipient_ids: The IDs of the recipients on the shard, or ['*'] for all of them.
+        :param message_id: The ID of the message.
+        """
+        self._request(REMOVE, encode_removal(sender_id, recipient_ids, message_id))
+
+    def update_membership(self, changes: List[MembershipChange]) -> None:
+        """
+        Tell the shard about changes of the clients of another shard.
+
+        :param changes: The changes.
+        """
+        self._request(UPDATE_MEMBERSHIP, encode_membership(changes))
+
+    def _close(self) -> None:
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+        with self.lock:
+            self._close()
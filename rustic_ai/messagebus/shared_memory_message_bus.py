@@ -0,0 +1,219 @@
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, cast
+
+from .deduplication import DeduplicationFilter
+from .dispatcher import Dispatcher
+from .message import Message
+from .message_bus import MessageBus
+from .routing import RoutingPolicy
+from .storage import SharedMemoryStorage
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .client.client import Client
+
+
+class SharedMemoryMessageBus(MessageBus):
+    """
+    A message bus spanning the processes of a machine, over a SharedMemoryStorage.
+
+    Each process creates a bus with the same ID over a storage with the same namespace, and registers its own
+    clients with it. The clients are listed with their topic patterns in the registry of the storage, so the
+    routing policy of every process sees the clients of all of them, and a client may be sent messages from any
+    process. A write to the inbox of a client of another process wakes that process through the named pipe of
+    the inbox, which notifies the client through its dispatcher.
+
+    Processes must use distinct machine IDs so that message IDs stay unique across the bus. Scheduled messages
+    and dead letters stay in the process they were made in, threads are read from the inboxes of this process,
+    and a pending request is only resolved by a reply sent from the process of the requester. The clients of
+    a process exiting without unregistering them are dropped when the registry changes next.
+    """
+
+    storage: SharedMemoryStorage
+
+    def __init__(
+        self,
+        id: Optional[str] = None,
+        machine_id: int = 1,
+        storage_backend: Optional[SharedMemoryStorage] = None,
+        routing_policy: Optional[RoutingPolicy] = None,
+        hybrid_clock: bool = False,
+        dispatcher: Optional[Dispatcher] = None,
+        deduplication_filter: Optional[DeduplicationFilter] = None,
+    ):
+        """
+        Initialize the bus of this process and read the clients of the other processes.
+
+        :param id: The ID of the message bus, shared by all its processes.
+        :param machine_id: The machine ID of the message IDs generated by this process, unique across processes.
+        :param storage_backend: The storage, whose namespace is shared by all the processes of the bus.
+        """
+        super().__init__(
+            id,
+            machine_id,
+            storage_backend or SharedMemoryStorage(),
+            routing_policy,
+            hybrid_clock,
+            dispatcher,
+            deduplication_filter,
+        )
+        self.registry = self.storage.get_registry(self.id)
+        # The topic patterns of every client of the bus, as of a generation of the registry
+        self.members: Dict[str, Set[str]] = {}
+        self.generation: Optional[int] = None
+        # The routing policies only look at the IDs of the clients, the clients of other processes have no object
+        self.routed_clients: Dict[str, 'Client'] = {}
+        # The topic patterns of the clients of this process
+        self.subscriptions: Dict[str, Set[str]] = {}
+        self.lock = threading.RLock()
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """
+        Apply the changes of the registry since it was last read to the routing policy.
+        """
+        with self.lock:
+            if self.registry.get_generation() == self.generation:
+                return
+            generation, members = self.registry.get_clients()
+            for client_id in self.members.keys() - members.keys():
+                self.routing_policy.client_unregistered(client_id)
+                if client_id not in self.clients:
+                    self.storage.detach_inbox(self.id, client_id)
+            for client_id, topic_patterns in members.items():
+                known = self.members.get(client_id)
+                if known is None:
+                    self.routing_policy.client_registered(client_id)
+                    known = set()
+                for topic_pattern in topic_patterns - known:
+                    self.routing_policy.subscribe(client_id, topic_pattern)
+                for topic_pattern in known - topic_patterns:
+                    self.routing_policy.unsubscribe(client_id, topic_pattern)
+            self.members = members
+            self.generation = generation
+            self.routed_clients = cast(
+                Dict[str, 'Client'], {client_id: self.clients.get(client_id) for client_id in members}
+            )
+
+    def register_client(self, client: 'Client') -> None:
+        """
+        Register a new client of this process with the bus, and watch its inbox for the messages of other processes.
+
+        :param client: The client to register
+        """
+        if client.client_id == self.DEAD_LETTER_INBOX:
+            raise ValueError(f"{self.DEAD_LETTER_INBOX} is reserved for the dead letters")
+        self._refresh()
+        with self.lock:
+            if client.client_id in self.members and client.client_id not in self.clients:
+                raise ValueError(f"Client {client.client_id} is registered by another process")
+            self.clients[client.client_id] = client
+            self.storage.create_inbox(self.id, client.client_id)
+            self.storage.watch_inbox(self.id, client.client_id, lambda: self._notify([client.client_id]))
+            self.registry.add(client.client_id)
+            self._refresh()
+
+    def unregister_client(self, client: 'Client') -> None:
+        """
+        Unregister a client of this process from the bus.
+
+        :param client: The client to unregister
+        """
+        with self.lock:
+            if self.clients.get(client.client_id) is not client:
+                return
+            del self.clients[client.client_id]
+            self.subscriptions.pop(client.client_id, None)
+            self.registry.remove(client.client_id)
+            self.storage.remove_inbox(self.id, client.client_id)
+            self._refresh()
+        self.replies.cancel(client.client_id)
+
+    def subscribe(self, client_id: str, topic_pattern: str) -> None:
+        """
+        Subscribe a client of this process to the messages of the topics matching a pattern, in every process.
+
+        :param client_id: The ID of the subscribing client
+        :param topic_pattern: The topic pattern, where `*` matches one segment and `#` any number of segments
+        """
+        with self.lock:
+            if client_id not in self.clients:
+                raise ValueError(f"Unknown client: {client_id}")
+            topic_patterns = self.subscriptions.setdefault(client_id, set())
+            topic_patterns.add(topic_pattern)
+            self.registry.add(client_id, topic_patterns)
+            self._refresh()
+
+    def unsubscribe(self, client_id: str, topic_pattern: Optional[str] = None) -> None:
+        """
+        Unsubscribe a client of this process from a topic pattern, in every process.
+
+        :param client_id: The ID of the unsubscribing client
+        :param topic_pattern: The topic pattern, all the patterns of the client if not given
+        """
+        with self.lock:
+            if client_id not in self.clients:
+                return
+            topic_patterns = self.subscriptions.setdefault(client_id, set())
+            if topic_pattern is None:
+                topic_patterns.clear()
+            else:
+                topic_patterns.discard(topic_pattern)
+            self.registry.add(client_id, topic_patterns)
+            self._refresh()
+
+    def _get_recipients(self, message: Message) -> List[str]:
+        """
+        Get the recipients of a message among the clients of every process.
+
+        :param message: The message to route
+        :return: The IDs of the recipients
+        """
+        self._refresh()
+        with self.lock:
+            if set(message.recipients).difference(self.members):
+                raise ValueError("Invalid recipient(s) specified")
+
+            if message.recipients:
+                return message.recipients
+            return self.routing_policy.get_recipients(message, self.routed_clients)
+
+    def remove_received_message(self, sender_id: str, recipient_ids: List[str], message_id: int) -> None:
+        """
+        Remove a sent message from the listed recipient's inbox, in every process.
+
+        :param sender_id: The sender's client ID
+        :param recipient_ids: The recipient's client ID, should not be empty.
+            If the first element is '*', the message will be removed from all recipients.
+        :param message_id: The message ID to remove
+        """
+        assert recipient_ids, ValueError('recipient_ids must not be empty')
+
+        if recipient_ids[0] == '*':
+            self._refresh()
+            with self.lock:
+                recipient_ids = list(self.members)
+        self.storage.remove_received_message(self.id, sender_id, recipient_ids, message_id)
+
+    def set_routing_policy(self, routing_policy: RoutingPolicy) -> None:
+        """
+        Set a new routing policy for this process. It is told about the clients of every process and their topic
+        patterns.
+
+        :param routing_policy: The new routing policy to use
+        """
+        with self.lock:
+            self.routing_policy = routing_policy
+            self.members = {}
+            self.generation = None
+            self._refresh()
+
+    def close(self) -> None:
+        """
+        Unregister the clients of this process from the other processes and stop watching their inboxes,
+        which are kept.
+        """
+        super().close()
+        with self.lock:
+            for client_id in self.clients:
+                self.storage.unwatch_inbox(self.id, client_id)
+                self.registry.remove(client_id)
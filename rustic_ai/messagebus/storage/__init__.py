@@ -1,5 +1,12 @@
+from .async_redis_storage import AsyncRedisStorage
+from .async_sql_storage import AsyncSQLStorage
+from .async_storage import AsyncStorageBackend
+from .blob_store import BlobStore, FileBlobStore, InMemoryBlobStore
+from .compression import Compressor
 from .file_based_storage import FileBasedStorage
 from .in_memory_storage import InMemoryStorage
+from .limits import InboxFullError, InboxLimits, OverflowPolicy
 from .redis_storage import RedisStorage
-from .sql_storage import SQLStorage
+from .shared_memory_storage import ClientRegistry, SharedMemoryStorage
+from .sql_storage import SchemaVersionError, SQLBlobStore, SQLStorage
 from .storage import StorageBackend
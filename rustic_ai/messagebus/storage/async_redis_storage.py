@@ -0,0 +1,238 @@
+from typing import List, Optional
+
+import redis.asyncio
+
+from ..message import Message
+from ..utils import get_id_ranges
+from .async_storage import AsyncStorageBackend
+from .compression import Compressor
+from .redis_storage import RedisInboxes
+
+
+class AsyncRedisStorage(RedisInboxes, AsyncStorageBackend):
+    """
+    A Redis-based storage system for the message bus, built on redis.asyncio.
+    It shares the layout of RedisStorage, so both can work on the same inboxes.
+    """
+
+    def __init__(
+        self, redis_connection: redis.asyncio.Redis, codec: str = "json", compression: Optional[Compressor] = None
+    ):
+        """
+        Initialize the storage with an asyncio Redis connection.
+
+        :param redis_connection: The connection to the Redis server.
+        :param codec: The name of the wire codec used to encode stored messages.
+        :param compression: Optional compressor applied to large encoded messages.
+        """
+        super().__init__(codec, compression)
+        self.redis = redis_connection
+
+    @classmethod
+    def create_storage(
+        cls, host: str, port: int, db: int, codec: str = "json", compression: Optional[Compressor] = None
+    ):
+        """
+        Initialize the storage with Redis connection parameters.
+
+        :param host: The hostname of the Redis server.
+        :param port: The port of the Redis server.
+        :param db: The database number to use in the Redis server.
+        :param codec: The name of the wire codec used to encode stored messages.
+        :param compression: Optional compressor applied to large encoded messages.
+        """
+        return cls(redis.asyncio.Redis(host=host, port=port, db=db), codec, compression)
+
+    async def create_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Create a new inbox for a client. Since Redis creates keys on the fly,
+        we don't need to do anything in this method.
+
+        :param client_id: The ID of the client.
+        """
+        pass
+
+    async def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Remove the inbox of a client.
+
+        :param client_id: The ID of the client.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, client_id)
+        thread_map_id = self._get_thread_map_id(inbox_id)
+        threads = self._parse_thread_map(await self.redis.zrange(thread_map_id, 0, -1))
+        pipeline = self.redis.pipeline(transaction=False)
+        for thread_key, entries in self._get_thread_entries_of(message_bus_id, client_id, threads).items():
+            pipeline.zrem(thread_key, *entries)
+        pipeline.delete(inbox_id, self._get_expiry_id(inbox_id), thread_map_id)
+        await pipeline.execute()
+
+    async def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        """
+        Add a message to the recipient's inbox.
+
+        :param recipient_id: The ID of the recipient client.
+        :param message: The message to be added.
+        """
+        await self.add_messages_to_inbox(message_bus_id, recipient_id, [message])
+
+    async def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients in a single round trip.
+
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for recipient_id in recipient_ids:
+            self._add_messages(pipeline, message_bus_id, recipient_id, [message])
+        await pipeline.execute()
+
+    async def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient in a single round trip, with a single ZADD
+        to the inbox, a second one for the expiring messages and one per thread index.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        if not messages:
+            return
+
+        pipeline = self.redis.pipeline(transaction=False)
+        self._add_messages(pipeline, message_bus_id, recipient_id, messages)
+        await pipeline.execute()
+
+    async def get_next_unread_message(
+        self, message_bus_id: str, recipient_id: str, last_read_message_id: int
+    ) -> Optional[Message]:
+        """
+        Retrieve the next unread message for a client.
+
+        :param recipient_id: The ID of the recipient client.
+        :param last_read_message_id: The ID of the last read message.
+        :return: The next unread message, if one exists.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        message_data = await self.redis.zrange(inbox_id, 0, 0)
+        while message_data:
+            message = self._decode(message_data[0])
+            if not message.is_expired() and message.id != last_read_message_id:
+                return message
+            pipeline = self.redis.pipeline(transaction=False)
+            self._remove_messages(pipeline, message_bus_id, recipient_id, [(message_data[0], message)])
+            await pipeline.execute()
+            message_data = await self.redis.zrange(inbox_id, 0, 0)
+        return None
+
+    async def remove_received_message(
+        self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
+    ) -> None:
+        """
+        Remove a sent message from the recipient's inbox. The message is looked up by its score,
+        in all the inboxes in a single round trip.
+
+        :param sender_id: The ID of the sender client.
+        :param recipient_ids: The List of IDs for the recipient client.
+        :param message_id: The ID of the message to be removed.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for recipient_id in recipient_ids:
+            pipeline.zrangebyscore(self._get_inbox_id(message_bus_id, recipient_id), message_id, message_id)
+
+        removals = self.redis.pipeline(transaction=False)
+        for recipient_id, candidates in zip(recipient_ids, await pipeline.execute()):
+            for message_data in candidates:
+                message = self._decode(message_data)
+                if message.sender == sender_id and message.id == message_id:
+                    self._remove_messages(removals, message_bus_id, recipient_id, [(message_data, message)])
+                    break
+        await removals.execute()
+
+    async def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for low, high in id_ranges:
+            pipeline.zrangebyscore(inbox_id, low, high)
+        return self._filter_time_range(id_ranges, await pipeline.execute())
+
+    async def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window, with their entries in the thread indexes.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        self._queue_time_range(pipeline, inbox_id, id_ranges)
+        records, threads = self._select_time_range_records(id_ranges, await pipeline.execute())
+        if not records:
+            return 0
+
+        pipeline = self.redis.pipeline(transaction=False)
+        self._remove_records(pipeline, message_bus_id, recipient_id, records, threads)
+        return (await pipeline.execute())[0]
+
+    async def purge_expired_messages(self, message_bus_id: str, recipient_id: str) -> int:
+        """
+        Remove the expired messages of an inbox, found by a range query on its expiry set.
+
+        :param recipient_id: The ID of the recipient client.
+        :return: The number of messages removed.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        expired = await self.redis.zrangebyscore(self._get_expiry_id(inbox_id), "-inf", self._now())
+        if not expired:
+            return 0
+
+        pipeline = self.redis.pipeline()
+        self._remove_messages(pipeline, message_bus_id, recipient_id, [(data, self._decode(data)) for data in expired])
+        return (await pipeline.execute())[0]
+
+    async def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread still stored, from the index of the thread. Each message is looked up
+        by score in an inbox holding it, with a single round trip for the whole thread.
+
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        thread_key = self._get_thread_key(message_bus_id, thread_id)
+        members = await self.redis.zrange(thread_key, 0, -1)
+        if not members:
+            return []
+
+        lookups = self._get_thread_lookups(message_bus_id, members)
+        pipeline = self.redis.pipeline(transaction=False)
+        for inbox_id, message_id in lookups:
+            pipeline.zrangebyscore(inbox_id, message_id, message_id)
+        messages, stale = self._collect_thread(lookups, members, await pipeline.execute())
+        if stale:
+            # Left behind by a removal racing with the addition of the message
+            await self.redis.zrem(thread_key, *stale)
+        return messages
+
+    async def close(self) -> None:
+        """
+        Close the connection to the Redis server.
+        """
+        await self.redis.aclose()  # type: ignore  # the stubs of redis predate aclose
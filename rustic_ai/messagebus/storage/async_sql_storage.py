@@ -0,0 +1,352 @@
+import asyncio
+import time
+from typing import Any, List, Optional, Union
+
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..message import Message
+from ..utils import get_id_ranges
+from .async_storage import AsyncStorageBackend
+from .blob_store import blob_reference, get_blob_digest
+from .compression import Compressor, decompress
+from .sql_storage import MessageTable, SQLBlobStore, create_tables, unexpired
+
+
+class AsyncSQLStorage(AsyncStorageBackend):
+    """
+    A SQL based storage system for the message bus, built on the asyncio engine of SQLAlchemy.
+    It shares the tables of SQLStorage, so both can work on the same database.
+    """
+
+    def __init__(
+        self,
+        connection_string: str,
+        compression: Optional[Compressor] = None,
+        blob_threshold: Optional[int] = None,
+    ):
+        """
+        Initialize the storage system. The tables are created on first use.
+
+        :param connection_string: SQLAlchemy compatible connection string with an asyncio driver,
+            such as `sqlite+aiosqlite://` or `postgresql+asyncpg://...`
+        :param compression: Optional compressor applied to large message contents
+        :param blob_threshold: Optional content size in bytes from which contents are stored once in the blob table
+        """
+        self.compression = compression
+        self.blob_threshold = blob_threshold
+        self.engine: AsyncEngine = create_async_engine(connection_string)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        # The blob store runs on the synchronous view of the sessions of this storage, through run_sync
+        self.blob_store = SQLBlobStore(sessionmaker(self.engine.sync_engine))
+        self.tables_created = False
+        self.tables_lock = asyncio.Lock()
+
+    async def _create_tables(self) -> None:
+        if self.tables_created:
+            return
+        async with self.tables_lock:
+            if not self.tables_created:
+                async with self.engine.begin() as connection:
+                    await connection.run_sync(create_tables)
+                self.tables_created = True
+
+    async def create_inbox(self, message_bus_id: str, client_id: str) -> None:
+        # No action required as inboxes are not explicitly created in this storage
+        pass
+
+    async def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Remove the inbox of a client.
+
+        :param message_bus_id: The ID of the message bus.
+        :param client_id: The ID of the client.
+        """
+        await self._delete(MessageTable.message_bus_id == message_bus_id, MessageTable.recipient_id == client_id)
+
+    async def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        """
+        Add a message to the recipient's inbox.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param message: The message to be added.
+        """
+        await self.add_message_to_inboxes(message_bus_id, [recipient_id], message)
+
+    async def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients in a single transaction.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        await self._create_tables()
+        async with self.Session.begin() as session:
+            content = await self._store_content(session, message, len(recipient_ids))
+            session.add_all(
+                [
+                    MessageTable(
+                        id=message.id,
+                        message_bus_id=message_bus_id,
+                        sender_id=message.sender,
+                        recipient_id=recipient_id,
+                        content=content,
+                        priority=message.priority,
+                        expires_at=message.expires_at,
+                        thread_id=message.thread_id,
+                        in_reply_to=message.in_reply_to,
+                        topic=message.topic,
+                    )
+                    for recipient_id in recipient_ids
+                ]
+            )
+
+    async def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient with a single multi-row insert.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        if not messages:
+            return
+
+        await self._create_tables()
+        async with self.Session.begin() as session:
+            rows = [
+                {
+                    "id": message.id,
+                    "message_bus_id": message_bus_id,
+                    "sender_id": message.sender,
+                    "recipient_id": recipient_id,
+                    "content": await self._store_content(session, message, 1),
+                    "priority": message.priority,
+                    "expires_at": message.expires_at,
+                    "thread_id": message.thread_id,
+                    "in_reply_to": message.in_reply_to,
+                    "topic": message.topic,
+                }
+                for message in messages
+            ]
+            await session.execute(insert(MessageTable.__table__), rows)
+
+    async def _store_content(self, session: AsyncSession, message: Message, references: int) -> bytes:
+        """
+        Prepare the content of a message for its rows, moving it to the blob table if it is large.
+
+        :param session: The session adding the message.
+        :param message: The message.
+        :param references: The number of rows that will hold the content.
+        :return: The content to store in the rows.
+        """
+        content = message.get_content().encode("utf-8")
+        if self.compression:
+            content = self.compression.compress(content)
+        if self.blob_threshold is not None and len(content) >= self.blob_threshold:
+            data = content
+            digest = await session.run_sync(lambda sync_session: self.blob_store.put(data, references, sync_session))
+            content = blob_reference(digest)
+        return content
+
+    async def get_next_unread_message(
+        self, message_bus_id: str, recipient_id: str, last_read_message_id: int
+    ) -> Optional[Message]:
+        """
+        Retrieve the next unread message for a client.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param last_read_message_id: The ID of the last read message.
+        :return: The next unread message, if one exists.
+        """
+        await self._create_tables()
+        async with self.Session() as session:
+            statement = (
+                select(MessageTable)
+                .where(
+                    and_(
+                        MessageTable.message_bus_id == message_bus_id,
+                        MessageTable.recipient_id == recipient_id,
+                        MessageTable.id > last_read_message_id,
+                        unexpired(),
+                    )
+                )
+                .order_by(MessageTable.id)
+                .limit(1)
+            )
+            result = (await session.execute(statement)).scalars().first()
+            if result is None:
+                return None
+            return await self._to_message(session, result)
+
+    async def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+        if not id_ranges:
+            return []
+
+        await self._create_tables()
+        async with self.Session() as session:
+            statement = (
+                select(MessageTable)
+                .where(
+                    and_(
+                        MessageTable.message_bus_id == message_bus_id,
+                        MessageTable.recipient_id == recipient_id,
+                        or_(*[MessageTable.id.between(low, high - 1) for low, high in id_ranges]),
+                        unexpired(),
+                    )
+                )
+                .order_by(MessageTable.id)
+            )
+            results = (await session.execute(statement)).scalars().all()
+            return [await self._to_message(session, result) for result in results]
+
+    async def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread, found with a range scan on the thread index.
+
+        :param message_bus_id: The ID of the message bus.
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        await self._create_tables()
+        async with self.Session() as session:
+            statement = (
+                select(MessageTable)
+                .where(
+                    and_(
+                        MessageTable.message_bus_id == message_bus_id,
+                        MessageTable.thread_id == thread_id,
+                        unexpired(),
+                    )
+                )
+                .order_by(MessageTable.id)
+            )
+            messages: List[Message] = []
+            for result in (await session.execute(statement)).scalars().all():
+                # A message has a row per recipient
+                if not messages or messages[-1].id != int(result.id):
+                    messages.append(await self._to_message(session, result))
+            return messages
+
+    async def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+        if not id_ranges:
+            return 0
+
+        return await self._delete(
+            MessageTable.message_bus_id == message_bus_id,
+            MessageTable.recipient_id == recipient_id,
+            or_(*[MessageTable.id.between(low, high - 1) for low, high in id_ranges]),
+        )
+
+    async def remove_received_message(
+        self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
+    ) -> None:
+        """
+        Remove a message from the recipient's inbox.
+
+        :param message_bus_id: The ID of the message bus.
+        :param sender_id: The ID of the sender client.
+        :param recipient_ids: The List of IDs for the recipient client.
+        :param message_id: The ID of the message to be removed.
+        """
+        await self._delete(
+            MessageTable.message_bus_id == message_bus_id,
+            MessageTable.recipient_id.in_(recipient_ids),
+            MessageTable.sender_id == sender_id,
+            MessageTable.id == message_id,
+        )
+
+    async def purge_expired_messages(self, message_bus_id: str, recipient_id: str) -> int:
+        """
+        Remove the expired messages of an inbox, found with a range scan on the expiry index.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :return: The number of messages removed.
+        """
+        return await self._delete(
+            MessageTable.message_bus_id == message_bus_id,
+            MessageTable.recipient_id == recipient_id,
+            MessageTable.expires_at <= time.time_ns() // 1_000_000,
+        )
+
+    async def _delete(self, *conditions: Any) -> int:
+        """
+        Delete the messages matching the given conditions, releasing the blobs they reference.
+
+        :param conditions: The conditions on the message table.
+        :return: The number of messages deleted.
+        """
+        await self._create_tables()
+        async with self.Session.begin() as session:
+            if self.blob_threshold is not None:
+                # The stubs of SQLAlchemy predate the 2.0 select signature
+                statement = select(MessageTable.content).where(and_(*conditions))  # type: ignore
+                digests = [get_blob_digest(content) for content in (await session.execute(statement)).scalars()]
+
+                def release(sync_session: Session) -> None:
+                    for digest in digests:
+                        if digest is not None:
+                            self.blob_store.release(digest, 1, sync_session)
+
+                await session.run_sync(release)
+            result: Any = await session.execute(delete(MessageTable.__table__).where(and_(*conditions)))
+            return result.rowcount
+
+    async def _to_message(self, session: AsyncSession, result: Any) -> Message:
+        """
+        Build a message from its row, resolving its content from the blob table if needed.
+
+        :param session: The session the row was read with.
+        :param result: The row.
+        :return: The message.
+        """
+        content: Union[bytes, memoryview] = result.content
+        digest = get_blob_digest(content)
+        if digest is not None:
+            blob_digest = digest
+            content = await session.run_sync(lambda sync_session: self.blob_store.get(blob_digest, sync_session))
+        return Message.from_encoded_content(
+            int(result.id),
+            result.sender_id,
+            decompress(content),
+            priority=result.priority,
+            thread_id=result.thread_id,
+            in_reply_to=result.in_reply_to,
+            topic=result.topic,
+            expires_at=result.expires_at,
+        )
+
+    async def close(self) -> None:
+        """
+        Close the connections to the database.
+        """
+        await self.engine.dispose()
@@ -0,0 +1,158 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from ..message import Message
+from ..utils import EPOCH
+
+
+class AsyncStorageBackend(ABC):
+    """
+    Abstract base class for the storage mechanism of the message bus, for use from an asyncio event loop.
+
+    It mirrors StorageBackend with coroutines, so many storage round trips can be in flight at once
+    instead of blocking the event loop one after the other.
+    """
+
+    @abstractmethod
+    async def create_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Abstract method to create a new inbox for a client with the given ID.
+
+        :param client_id: The ID of the client for which to create an inbox.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    async def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Abstract method to remove the inbox for a client with the given ID.
+
+        :param client_id: The ID of the client whose inbox is to be removed.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    async def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        """
+        Abstract method to add a message to the inbox of the client with the given ID.
+
+        :param recipient_id: The ID of the recipient client.
+        :param message: The message to be added.
+        """
+        pass  # pragma: no cover
+
+    async def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients, concurrently.
+
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        await asyncio.gather(
+            *(self.add_message_to_inbox(message_bus_id, recipient_id, message) for recipient_id in recipient_ids)
+        )
+
+    async def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient.
+
+        Backends should override this to write the whole batch in a single operation.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        for message in messages:
+            await self.add_message_to_inbox(message_bus_id, recipient_id, message)
+
+    @abstractmethod
+    async def get_next_unread_message(
+        self, message_bus_id: str, recipient_id: str, last_read_message_id: int
+    ) -> Optional[Message]:
+        """
+        Abstract method to retrieve the next unread message for a client with the given ID.
+
+        :param recipient_id: The ID of the recipient client.
+        :param last_read_message_id: The ID of the last read message.
+        :return: The next unread message, if one exists.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    async def remove_received_message(
+        self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
+    ) -> None:
+        """
+        Abstract method to remove a sent message from the recipient's inbox.
+
+        :param sender_id: The ID of the sender client.
+        :param recipient_ids: The ID of the recipient client.
+        :param message_id: The ID of the message to be removed.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    async def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Abstract method to read the messages of an inbox sent within a time window, without removing them.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    async def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Abstract method to remove the messages of an inbox sent within a time window.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        pass  # pragma: no cover
+
+    async def purge_messages_before(self, message_bus_id: str, recipient_id: str, timestamp: int) -> int:
+        """
+        Remove the messages of an inbox sent before a point in time, to enforce a retention period.
+
+        :param recipient_id: The ID of the recipient client.
+        :param timestamp: The point in time in milliseconds since the Unix epoch.
+        :return: The number of messages removed.
+        """
+        return await self.remove_messages_in_time_range(message_bus_id, recipient_id, EPOCH, timestamp)
+
+    async def purge_expired_messages(self, message_bus_id: str, recipient_id: str) -> int:
+        """
+        Remove the expired messages of an inbox.
+
+        Expired messages are never returned by the reads of a storage. Backends which purge them
+        in the background, or which leave them to the store itself, have nothing to do here.
+
+        :param recipient_id: The ID of the recipient client.
+        :return: The number of messages removed.
+        """
+        return 0
+
+    async def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread still stored, in any inbox, through an index of the threads
+        rather than a scan of the inboxes.
+
+        :param thread_id: The ID of the thread, which is the ID of its first message.
+        :return: The messages of the thread, once each whatever their number of recipients, ordered by ID.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not index threads")
+
+    async def close(self) -> None:
+        """
+        Release the connections of the storage.
+        """
+        pass
@@ -0,0 +1,217 @@
+import hashlib
+import mmap
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Union
+
+from .compression import COMPRESSED_MARKER
+
+# A payload stored in a blob store is replaced by this prefix followed by the hex digest of the payload.
+# It shares the NUL marker of compressed payloads, so it can never be mistaken for an encoded message.
+BLOB_REFERENCE_PREFIX = COMPRESSED_MARKER + b"r"
+# The size of a reference, known before the payload is stored
+BLOB_REFERENCE_SIZE = len(BLOB_REFERENCE_PREFIX) + 2 * hashlib.sha256().digest_size
+
+
+def blob_reference(digest: str) -> bytes:
+    """
+    Create the reference stored in place of a payload held in a blob store.
+
+    :param digest: The digest of the payload.
+    :return: The reference.
+    """
+    return BLOB_REFERENCE_PREFIX + digest.encode("ascii")
+
+
+def get_blob_digest(data: Union[bytes, memoryview]) -> Optional[str]:
+    """
+    Get the digest of the blob referenced by a stored payload.
+
+    :param data: The stored payload.
+    :return: The digest of the referenced blob, or None if the payload is not a blob reference.
+    """
+    if bytes(data[:2]) != BLOB_REFERENCE_PREFIX:
+        return None
+    return bytes(data[2:]).decode("ascii")
+
+
+class BlobStore(ABC):
+    """
+    Abstract base class for a content-addressed, reference-counted store of large payloads.
+
+    A payload is stored once no matter how many inboxes hold it. Every inbox entry holds a reference,
+    and the payload is deleted when the last reference is released.
+    """
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """
+        Compute the content address of a payload.
+
+        :param data: The payload.
+        :return: The hex digest of the payload.
+        """
+        return hashlib.sha256(data).hexdigest()
+
+    @abstractmethod
+    def put(self, data: bytes, references: int = 1) -> str:
+        """
+        Store a payload, or add references to it if it is already stored.
+
+        :param data: The payload.
+        :param references: The number of references to add.
+        :return: The digest of the payload.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def get(self, digest: str) -> memoryview:
+        """
+        Get a stored payload without copying it.
+
+        :param digest: The digest of the payload.
+        :return: A read-only view of the payload.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def release(self, digest: str, references: int = 1) -> None:
+        """
+        Release references to a payload, deleting it when no references are left.
+
+        :param digest: The digest of the payload.
+        :param references: The number of references to release.
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def __contains__(self, digest: object) -> bool:
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass  # pragma: no cover
+
+
+class InMemoryBlobStore(BlobStore):
+    """
+    A blob store holding payloads in memory.
+    """
+
+    def __init__(self) -> None:
+        self.blobs: Dict[str, bytes] = {}
+        self.references: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def put(self, data: bytes, references: int = 1) -> str:
+        digest = self.digest(data)
+        with self.lock:
+            if digest not in self.blobs:
+                self.blobs[digest] = bytes(data)
+                self.references[digest] = 0
+            self.references[digest] += references
+        return digest
+
+    def get(self, digest: str) -> memoryview:
+        return memoryview(self.blobs[digest]).toreadonly()
+
+    def release(self, digest: str, references: int = 1) -> None:
+        with self.lock:
+            if digest not in self.references:
+                return
+            self.references[digest] -= references
+            if self.references[digest] <= 0:
+                del self.blobs[digest]
+                del self.references[digest]
+
+    def __contains__(self, digest: object) -> bool:
+        return digest in self.blobs
+
+    def __len__(self) -> int:
+        return len(self.blobs)
+
+
+class FileBlobStore(BlobStore):
+    """
+    A blob store holding each payload in its own file, next to a file holding its reference count.
+    Payloads are memory-mapped when read, so readers access them without copying.
+
+    A mapping pins the file it was made from. A payload file is never written in place, a new one replaces it,
+    and releasing the last reference only unlinks it, so the views of messages read before stay valid
+    while the payload is stored again or deleted. Where a mapped file cannot be unlinked, as on Windows,
+    payloads are copied when read instead.
+
+    Reference counts are guarded by a lock within the process, the store must not be shared by processes.
+    """
+
+    # Whether payloads are memory-mapped, which needs mapped files to be unlinkable
+    MAP_PAYLOADS = os.name == "posix"
+    TEMPORARY_SUFFIX = ".tmp"
+
+    def __init__(self, directory: str) -> None:
+        """
+        Initialize the blob store.
+
+        :param directory: The directory to store the payloads in.
+        """
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def _get_blob_file(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def _get_references_file(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.refs")
+
+    def _read_references(self, digest: str) -> int:
+        try:
+            with open(self._get_references_file(digest), 'r') as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def _write_references(self, digest: str, references: int) -> None:
+        with open(self._get_references_file(digest), 'w') as f:
+            f.write(str(references))
+
+    def put(self, data: bytes, references: int = 1) -> str:
+        digest = self.digest(data)
+        with self.lock:
+            existing = self._read_references(digest)
+            if not existing:
+                os.makedirs(self.directory, exist_ok=True)
+                # A file left by a previous payload may still be mapped, so it is replaced rather than truncated
+                temporary_file = f"{self._get_blob_file(digest)}{self.TEMPORARY_SUFFIX}"
+                with open(temporary_file, 'wb') as f:
+                    f.write(data)
+                os.replace(temporary_file, self._get_blob_file(digest))
+            self._write_references(digest, existing + references)
+        return digest
+
+    def get(self, digest: str) -> memoryview:
+        with open(self._get_blob_file(digest), 'rb') as f:
+            if not self.MAP_PAYLOADS:
+                return memoryview(f.read()).toreadonly()
+            # The mapping stays valid after the file is closed, and after it is unlinked
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)
+
+    def release(self, digest: str, references: int = 1) -> None:
+        with self.lock:
+            remaining = self._read_references(digest) - references
+            if remaining > 0:
+                self._write_references(digest, remaining)
+                return
+
+            for path in (self._get_blob_file(digest), self._get_references_file(digest)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def __contains__(self, digest: object) -> bool:
+        return isinstance(digest, str) and os.path.exists(self._get_blob_file(digest))
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.directory):
+            return 0
+        return sum(1 for name in os.listdir(self.directory) if not name.endswith((".refs", self.TEMPORARY_SUFFIX)))
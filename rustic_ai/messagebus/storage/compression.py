@@ -0,0 +1,76 @@
+import bz2
+import lzma
+import zlib
+from typing import Callable, Dict, Optional, Tuple, Union
+
+# Compressed payloads start with this marker followed by a byte naming the algorithm.
+# Neither JSON text nor any registered message codec starts with a NUL byte, so payloads
+# stored without compression are left untouched and remain readable.
+COMPRESSED_MARKER = b"\x00"
+
+Buffer = Union[bytes, memoryview]
+
+_ALGORITHMS: Dict[str, Tuple[bytes, Callable[[bytes, Optional[int]], bytes], Callable[[Buffer], bytes]]] = {
+    "zlib": (b"z", lambda data, level: zlib.compress(data, -1 if level is None else level), zlib.decompress),
+    "lzma": (b"x", lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+    "bz2": (b"b", lambda data, level: bz2.compress(data, 9 if level is None else level), bz2.decompress),
+}
+
+_DECOMPRESSORS: Dict[int, Callable[[Buffer], bytes]] = {
+    tag[0]: decompress for tag, _, decompress in _ALGORITHMS.values()
+}
+
+
+class Compressor:
+    """
+    Compresses payloads written by a storage backend.
+
+    Only payloads of at least `threshold` bytes are compressed, and only if compressing them saves space.
+    Compressed payloads are tagged with the algorithm, so `decompress` can read them without knowing
+    how the backend was configured.
+    """
+
+    def __init__(self, algorithm: str = "zlib", threshold: int = 1024, level: Optional[int] = None):
+        """
+        Initialize the compressor.
+
+        :param algorithm: The compression algorithm, one of zlib, lzma or bz2.
+        :param threshold: The minimum payload size in bytes to compress.
+        :param level: The compression level, the algorithm's default if not given.
+        """
+        if algorithm not in _ALGORITHMS:
+            raise ValueError(f"Unknown compression algorithm: {algorithm}")
+
+        self.algorithm = algorithm
+        self.threshold = threshold
+        self.level = level
+        self._tag, self._compress, _ = _ALGORITHMS[algorithm]
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a payload if it is large enough.
+
+        :param data: The payload to compress.
+        :return: The tagged compressed payload, or the payload itself if it was not compressed.
+        """
+        if len(data) < self.threshold:
+            return data
+
+        compressed = COMPRESSED_MARKER + self._tag + self._compress(data, self.level)
+        return compressed if len(compressed) < len(data) else data
+
+
+def decompress(data: Buffer) -> Buffer:
+    """
+    Decompress a payload written by a `Compressor`. Payloads that are not compressed are returned as they are.
+
+    :param data: The stored payload, or a buffer holding it.
+    :return: The original payload.
+    """
+    if data[:1] != COMPRESSED_MARKER:
+        return data
+
+    try:
+        return _DECOMPRESSORS[data[1]](data[2:])
+    except KeyError:
+        raise ValueError(f"Unknown compression tag: {data[1:2]!r}") from None
@@ -1,26 +1,223 @@
 import heapq
-import json
 import os
-from typing import Dict, List, Optional
+import struct
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from ..message import Message
+from ..timer_wheel import TimerService
+from ..utils import get_id_ranges, get_timestamp
+from .blob_store import BLOB_REFERENCE_SIZE, FileBlobStore, blob_reference, get_blob_digest
+from .compression import Compressor, decompress
+from .limits import InboxBudget, InboxKey, InboxLimits, OverflowPolicy
 from .storage import StorageBackend
 
+# An inbox entry is the message ID, used for ordering, and the encoded message
+InboxEntry = Tuple[int, bytes]
+# A message to add is the recipient ID, the message and its record, before large records are put in the blob store
+NewEntry = Tuple[str, Message, bytes]
+# An entry of a thread is the message ID and the ID of a client whose inbox holds the message
+ThreadEntry = Tuple[int, str]
+
+
+class ThreadIndex:
+    """
+    The index of the threads of a message bus, held in memory and logged to a file.
+
+    An entry of a thread is the ID of a message and the ID of a client whose inbox holds it. The file logs
+    the entries added and removed, and is replayed when the index is loaded. It is rewritten with the live
+    entries only once it logs more removed entries than live ones, so it stays within twice their size.
+    """
+
+    # kind, thread ID, message ID, client ID length
+    RECORD = struct.Struct("!BQQH")
+    ADDED = 0
+    REMOVED = 1
+
+    def __init__(self, path: str) -> None:
+        """
+        Load the index from its file.
+
+        :param path: The path of the file.
+        """
+        self.path = path
+        self.threads: Dict[int, List[ThreadEntry]] = {}
+        self.thread_ids: Dict[ThreadEntry, int] = {}
+        # The number of records of the file not standing for a live entry
+        self.dead = 0
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset < len(data):
+            kind, thread_id, message_id, length = self.RECORD.unpack_from(data, offset)
+            offset += self.RECORD.size
+            entry = (message_id, data[offset : offset + length].decode("utf-8"))
+            offset += length
+            if kind == self.ADDED:
+                self._add(thread_id, entry)
+            else:
+                self._remove(entry)
+                self.dead += 2
+
+    def _add(self, thread_id: int, entry: ThreadEntry) -> None:
+        if entry in self.thread_ids:
+            # The same message added again to an inbox is indexed once
+            self.dead += 1
+            return
+        self.thread_ids[entry] = thread_id
+        self.threads.setdefault(thread_id, []).append(entry)
+
+    def _remove(self, entry: ThreadEntry) -> Optional[int]:
+        thread_id = self.thread_ids.pop(entry, None)
+        if thread_id is not None:
+            thread = self.threads[thread_id]
+            thread.remove(entry)
+            if not thread:
+                del self.threads[thread_id]
+        return thread_id
+
+    def _encode(self, kind: int, thread_id: int, entry: ThreadEntry) -> bytes:
+        client = entry[1].encode("utf-8")
+        return self.RECORD.pack(kind, thread_id, entry[0], len(client)) + client
+
+    def _log(self, records: List[bytes]) -> None:
+        if self.dead > len(self.thread_ids):
+            self._compact()
+        elif records:
+            with open(self.path, 'ab') as f:
+                f.write(b"".join(records))
+
+    def _compact(self) -> None:
+        if not self.thread_ids:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        else:
+            with open(self.path, 'wb') as f:
+                f.write(
+                    b"".join(self._encode(self.ADDED, thread_id, entry) for entry, thread_id in self.thread_ids.items())
+                )
+        self.dead = 0
+
+    def add(self, messages: Iterable[Message], client_id: str) -> None:
+        """
+        Index messages added to the inbox of a client.
+
+        :param messages: The messages.
+        :param client_id: The ID of the client.
+        """
+        records = []
+        for message in messages:
+            entry = (message.id, client_id)
+            if message.thread_id is not None and entry not in self.thread_ids:
+                self._add(message.thread_id, entry)
+                records.append(self._encode(self.ADDED, message.thread_id, entry))
+        self._log(records)
+
+    def remove(self, message_ids: Iterable[int], client_id: str) -> None:
+        """
+        Drop the entries of messages removed from the inbox of a client.
+
+        :param message_ids: The IDs of the messages.
+        :param client_id: The ID of the client.
+        """
+        records = []
+        for message_id in message_ids:
+            entry = (message_id, client_id)
+            thread_id = self._remove(entry)
+            if thread_id is not None:
+                records.append(self._encode(self.REMOVED, thread_id, entry))
+                self.dead += 2
+        self._log(records)
+
+    def get(self, thread_id: int) -> List[ThreadEntry]:
+        """
+        Get the entries of a thread.
+
+        :return: The (message ID, client ID) entries, in the order they were added.
+        """
+        return list(self.threads.get(thread_id, []))
+
 
 class FileBasedStorage(StorageBackend):
     """
     FileBasedStorage represents a file-based storage system for the message bus.
+
+    Each inbox is a file of frames. A frame is a fixed-width header holding the message ID and the
+    record length, followed by the message record encoded with the configured wire codec
+    and, optionally, compressed. Records of at least `blob_threshold` bytes are kept once in a
+    content-addressed blob store, and the inbox frames hold a reference to them.
+
+    Inbox files are rewritten when messages are read or removed, so access to them is guarded by a lock
+    within the process. The directory must not be shared by processes.
+
+    Inboxes can be bounded by limits. The size of a message is the size of its frame.
+
+    Messages with an expiry time are skipped on read. The messages added by this storage are also removed
+    in the background by a timer wheel when they expire, with one rewrite per inbox for all the messages
+    expiring on the same tick.
+
+    Scheduled messages are kept in a schedule file per message bus, as frames prefixed by their due time.
+
+    Threads are indexed by a ThreadIndex per message bus, listing the message ID and the recipient of each
+    message in an inbox. Entries are dropped as their messages leave the inboxes, and reading a thread only
+    loads the inboxes it lists.
     """
 
-    def __init__(self, directory: str):
+    FRAME_HEADER = struct.Struct("!QI")
+    DUE_TIME = struct.Struct("!Q")
+
+    def __init__(
+        self,
+        directory: str,
+        codec: str = "json",
+        compression: Optional[Compressor] = None,
+        blob_threshold: Optional[int] = None,
+        limits: Optional[InboxLimits] = None,
+    ):
         """
         Initialize the storage with a directory to save the inbox files.
 
         :param directory: The directory to store inbox files.
+        :param codec: The name of the wire codec used to encode stored messages.
+        :param compression: Optional compressor applied to large encoded messages.
+        :param blob_threshold: Optional record size in bytes from which records are kept in the blob store.
+        :param limits: Optional budgets of the inboxes, unbounded if not given.
         """
         self.directory = directory
+        self.codec = Message.get_codec(codec).name
+        self.compression = compression
+        self.blob_threshold = blob_threshold
+        self.blob_store = FileBlobStore(os.path.join(directory, ".blobs"))
+        self.thread_indexes: Dict[str, ThreadIndex] = {}
+        self.lock = threading.RLock()
+        self.expiry = TimerService(self._expire, name="file-storage-expiry")
         os.makedirs(directory, exist_ok=True)
 
+        self.budget = InboxBudget(limits, self.lock) if limits else None
+        if self.budget:
+            self._load_usage(self.budget)
+
+    def _load_usage(self, budget: InboxBudget) -> None:
+        """
+        Account for the messages already in the inbox files.
+
+        :param budget: The budget to account them in.
+        """
+        for message_bus_id in os.listdir(self.directory):
+            message_bus_directory = os.path.join(self.directory, message_bus_id)
+            if message_bus_id == ".blobs" or not os.path.isdir(message_bus_directory):
+                continue
+            for file_name in os.listdir(message_bus_directory):
+                if file_name.endswith(".inbox"):
+                    client_id = file_name[: -len(".inbox")]
+                    for _, record in self._load_inbox(message_bus_id, client_id):
+                        budget.add((message_bus_id, client_id), self._frame_size(record))
+
     def _get_inbox_file(self, message_bus_id: str, client_id: str) -> str:
         """
         Get the file path for a given client's inbox.
@@ -32,16 +229,17 @@ class FileBasedStorage(StorageBackend):
         if not os.path.exists(message_bus_directory):
             os.makedirs(message_bus_directory, exist_ok=True)
 
-        return os.path.join(message_bus_directory, f"{client_id}.json")
+        return os.path.join(message_bus_directory, f"{client_id}.inbox")
 
     def create_inbox(self, message_bus_id: str, client_id: str) -> None:
         """
-        Create a new inbox for a client.
+        Create the inbox of a client, keeping it if it already exists.
 
         :param client_id: The ID of the client.
         """
-        with open(self._get_inbox_file(message_bus_id, client_id), 'w') as f:
-            json.dump([], f)
+        with self.lock:
+            if not os.path.exists(self._get_inbox_file(message_bus_id, client_id)):
+                self._save_inbox(message_bus_id, client_id, [])
 
     def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
         """
@@ -49,7 +247,13 @@ class FileBasedStorage(StorageBackend):
 
         :param client_id: The ID of the client.
         """
-        os.remove(self._get_inbox_file(message_bus_id, client_id))
+        with self.lock:
+            inbox = self._load_inbox(message_bus_id, client_id)
+            self._release_blobs(record for _, record in inbox)
+            self._get_thread_index(message_bus_id).remove((message_id for message_id, _ in inbox), client_id)
+            os.remove(self._get_inbox_file(message_bus_id, client_id))
+            if self.budget:
+                self.budget.remove_inbox((message_bus_id, client_id))
 
     def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
         """
@@ -58,9 +262,211 @@ class FileBasedStorage(StorageBackend):
         :param recipient_id: The ID of the recipient client.
         :param message: The message to be added.
         """
-        inbox = self._load_inbox(message_bus_id, recipient_id)
-        heapq.heappush(inbox, message.serialize())  # type: ignore
-        self._save_inbox(message_bus_id, recipient_id, inbox)
+        with self.lock:
+            self._add(message_bus_id, [(recipient_id, message, self._encode(message))])
+
+    def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients, encoding it only once.
+
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        with self.lock:
+            record = self._encode(message)
+            self._add(message_bus_id, [(recipient_id, message, record) for recipient_id in recipient_ids])
+
+    def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient with a single append.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        with self.lock:
+            self._add(message_bus_id, [(recipient_id, message, self._encode(message)) for message in messages])
+
+    def _add(self, message_bus_id: str, entries: List[NewEntry]) -> None:
+        """
+        Add encoded messages to inboxes, all of them or none if one is rejected.
+
+        The messages are admitted in the budgets of their inboxes first, then the large records are put
+        in the blob store, once per record with a reference per inbox, and the frames of each inbox are
+        appended at once.
+
+        :param entries: The recipient ID, the message and the encoded record of each message.
+        """
+        admitted = self._admit(message_bus_id, entries)
+
+        # Records are shared by the entries of a message sent to several inboxes, so they are told apart by identity
+        references = Counter(id(record) for _, _, record in admitted if self._is_blob(record))
+        digests: Dict[int, str] = {}
+        try:
+            for _, _, record in admitted:
+                if id(record) in references and id(record) not in digests:
+                    digests[id(record)] = self.blob_store.put(record, references[id(record)])
+        except BaseException:
+            for key, digest in digests.items():
+                self.blob_store.release(digest, references[key])
+            self._unadmit(message_bus_id, admitted)
+            raise
+
+        frames: Dict[str, List[bytes]] = {}
+        messages: Dict[str, List[Message]] = {}
+        for recipient_id, message, record in admitted:
+            if id(record) in digests:
+                record = blob_reference(digests[id(record)])
+            frames.setdefault(recipient_id, []).append(self.FRAME_HEADER.pack(message.id, len(record)) + record)
+            messages.setdefault(recipient_id, []).append(message)
+        for recipient_id, recipient_frames in frames.items():
+            self._append_to_inbox(message_bus_id, recipient_id, b"".join(recipient_frames))
+            self._get_thread_index(message_bus_id).add(messages[recipient_id], recipient_id)
+            for message in messages[recipient_id]:
+                self._schedule_expiry(message_bus_id, recipient_id, message)
+
+    def _schedule_expiry(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        if message.expires_at is not None:
+            self.expiry.schedule(message.expires_at, (message_bus_id, recipient_id, message.id))
+
+    def _expire(self, items: List[Any]) -> None:
+        """
+        Remove the messages whose expiry timers fired, rewriting each inbox once.
+
+        :param items: The (message bus ID, recipient ID, message ID) of the timers.
+        """
+        expired: Dict[InboxKey, Set[int]] = {}
+        for message_bus_id, recipient_id, message_id in items:
+            expired.setdefault((message_bus_id, recipient_id), set()).add(message_id)
+
+        with self.lock:
+            for (message_bus_id, recipient_id), message_ids in expired.items():
+                try:
+                    inbox = self._load_inbox(message_bus_id, recipient_id)
+                except FileNotFoundError:
+                    continue
+                removed = [entry for entry in inbox if entry[0] in message_ids]
+                if removed:
+                    kept = [entry for entry in inbox if entry[0] not in message_ids]
+                    self._save_inbox(message_bus_id, recipient_id, kept)
+                    self._discard(message_bus_id, recipient_id, removed)
+
+    def close(self) -> None:
+        """
+        Stop the background removal of expired messages.
+        """
+        self.expiry.close()
+
+    def _encode(self, message: Message) -> bytes:
+        record = message.encode(self.codec)
+        if self.compression:
+            record = self.compression.compress(record)
+        return record
+
+    def _is_blob(self, record: bytes) -> bool:
+        return self.blob_threshold is not None and len(record) >= self.blob_threshold
+
+    def _frame(self, message: Message, references: int) -> bytes:
+        record = self._encode(message)
+        if self._is_blob(record):
+            record = blob_reference(self.blob_store.put(record, references))
+        return self.FRAME_HEADER.pack(message.id, len(record)) + record
+
+    def _frame_size(self, record: bytes) -> int:
+        return self.FRAME_HEADER.size + len(record)
+
+    def _stored_size(self, record: bytes) -> int:
+        """
+        Get the size of the frame of an encoded record, holding a blob reference instead if the record is large.
+        """
+        return self.FRAME_HEADER.size + (BLOB_REFERENCE_SIZE if self._is_blob(record) else len(record))
+
+    def _admit(self, message_bus_id: str, entries: List[NewEntry]) -> List[NewEntry]:
+        """
+        Make room for new messages in the budgets of their inboxes.
+
+        :param entries: The recipient ID, the message and the encoded record of each message.
+        :return: The entries to store, without the messages the drop policy chose to drop.
+        :raises InboxFullError: If a message does not fit, once the budget taken by the others is given back.
+        """
+        if not self.budget:
+            return entries
+
+        admitted: List[NewEntry] = []
+        try:
+            for entry in entries:
+                recipient_id, message, record = entry
+                if self.budget.admit(
+                    (message_bus_id, recipient_id), self._stored_size(record), message.id, self._evict
+                ):
+                    admitted.append(entry)
+        except BaseException:
+            self._unadmit(message_bus_id, admitted)
+            raise
+        return admitted
+
+    def _unadmit(self, message_bus_id: str, entries: List[NewEntry]) -> None:
+        """
+        Give back the budget taken by admitted messages which are not stored after all.
+        """
+        if not self.budget:
+            return
+        for recipient_id, _, record in entries:
+            self.budget.remove((message_bus_id, recipient_id), self._stored_size(record))
+
+    def _discard(self, message_bus_id: str, client_id: str, entries: List[InboxEntry]) -> None:
+        """
+        Release the blobs, the budget and the thread entries held by messages removed from an inbox.
+        """
+        for _, record in entries:
+            self._release_blobs([record])
+            if self.budget:
+                self.budget.remove((message_bus_id, client_id), self._frame_size(record))
+        self._get_thread_index(message_bus_id).remove((message_id for message_id, _ in entries), client_id)
+
+    def _evict(self, key: InboxKey, policy: OverflowPolicy, message_id: int) -> Optional[int]:
+        """
+        Remove a message from an inbox to make room for a new one.
+
+        :param key: The inbox.
+        :param policy: The overflow policy choosing the message to remove.
+        :param message_id: The ID of the new message.
+        :return: The size of the removed message, or None if the new message is the one to drop.
+        """
+        inbox = self._load_inbox(*key)
+        if not inbox:
+            return None
+
+        if policy == OverflowPolicy.DROP_LOWEST_PRIORITY:
+            # Lower priorities have higher IDs, and so do newer messages within a priority
+            victim = max(inbox)
+            if message_id > victim[0]:
+                return None
+        else:
+            victim = min(inbox, key=lambda entry: (get_timestamp(entry[0]), entry[0]))
+
+        inbox.remove(victim)
+        self._save_inbox(key[0], key[1], inbox)
+        self._release_blobs([victim[1]])
+        self._get_thread_index(key[0]).remove([victim[0]], key[1])
+        return self._frame_size(victim[1])
+
+    def _decode(self, record: bytes) -> Message:
+        data: Union[bytes, memoryview] = record
+        digest = get_blob_digest(record)
+        if digest is not None:
+            data = self.blob_store.get(digest)
+        return Message.decode(decompress(data))
+
+    def _release_blobs(self, records: Iterable[bytes]) -> None:
+        for record in records:
+            digest = get_blob_digest(record)
+            if digest is not None:
+                self.blob_store.release(digest)
+
+    def _append_to_inbox(self, message_bus_id: str, recipient_id: str, frame: bytes) -> None:
+        # Frames are ordered when the inbox is loaded, so new messages can simply be appended
+        with open(self._get_inbox_file(message_bus_id, recipient_id), 'ab') as f:
+            f.write(frame)
 
     def get_next_unread_message(
         self, message_bus_id: str, recipient_id: str, last_read_message_id: int
@@ -72,23 +478,28 @@ class FileBasedStorage(StorageBackend):
         :param last_read_message_id: The ID of the last read message.
         :return: The next unread message, if one exists.
         """
-        response: Optional[Message] = None
+        with self.lock:
+            response: Optional[Message] = None
 
-        try:
-            inbox = self._load_inbox(message_bus_id, recipient_id)
-        except FileNotFoundError:
-            pass
-        else:
-            if inbox:
-                next_message_serialized = heapq.heappop(inbox)
-                next_message = Message.deserialize(next_message_serialized)  # type: ignore
-                while next_message.id == last_read_message_id:
-                    next_message_serialized = heapq.heappop(inbox)
-                    next_message = Message.deserialize(next_message_serialized)  # type: ignore
-                response = next_message
-                self._save_inbox(message_bus_id, recipient_id, inbox)
+            try:
+                inbox = self._load_inbox(message_bus_id, recipient_id)
+            except FileNotFoundError:
+                pass
+            else:
+                popped = []
+                while inbox:
+                    next_message_id, next_message_record = heapq.heappop(inbox)
+                    popped.append((next_message_id, next_message_record))
+                    if next_message_id != last_read_message_id:
+                        message = self._decode(next_message_record)
+                        if not message.is_expired():
+                            response = message
+                            break
+                if popped:
+                    self._save_inbox(message_bus_id, recipient_id, inbox)
+                    self._discard(message_bus_id, recipient_id, popped)
 
-        return response
+            return response
 
     def remove_received_message(
         self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
@@ -100,32 +511,219 @@ class FileBasedStorage(StorageBackend):
         :param recipient_ids: The List of IDs for the recipient client.
         :param message_id: The ID of the message to be removed.
         """
-        for recipient_id in recipient_ids:
-            inbox = self._load_inbox(message_bus_id, recipient_id)
-            inbox = [m for m in inbox if self._filter_message(m, sender_id, message_id)]  # type: ignore
-            heapq.heapify(inbox)
-            self._save_inbox(message_bus_id, recipient_id, inbox)
+        with self.lock:
+            for recipient_id in recipient_ids:
+                inbox = self._load_inbox(message_bus_id, recipient_id)
+                removed = [entry for entry in inbox if self._is_sent_message(entry, sender_id, message_id)]
+                if removed:
+                    self._save_inbox(message_bus_id, recipient_id, [entry for entry in inbox if entry not in removed])
+                    self._discard(message_bus_id, recipient_id, removed)
+
+    def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+        Frames are selected by the message ID in their header, only the selected records are decoded.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        with self.lock:
+            try:
+                inbox = self._load_inbox(message_bus_id, recipient_id)
+            except FileNotFoundError:
+                return []
+
+            id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+            selected = sorted(entry for entry in inbox if self._in_id_ranges(entry[0], id_ranges))
+            messages = [self._decode(record) for _, record in selected]
+            return [message for message in messages if not message.is_expired()]
+
+    def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window, without decoding them.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        with self.lock:
+            try:
+                inbox = self._load_inbox(message_bus_id, recipient_id)
+            except FileNotFoundError:
+                return 0
+
+            id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+            kept: List[InboxEntry] = []
+            removed: List[InboxEntry] = []
+            for entry in inbox:
+                (removed if self._in_id_ranges(entry[0], id_ranges) else kept).append(entry)
+
+            if removed:
+                self._save_inbox(message_bus_id, recipient_id, kept)
+                self._discard(message_bus_id, recipient_id, removed)
+            return len(removed)
+
+    def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread still stored, from the thread index of the message bus.
+
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        with self.lock:
+            thread_index = self._get_thread_index(message_bus_id)
+            entries = thread_index.get(thread_id)
+            message_ids_by_client: Dict[str, Set[int]] = {}
+            for message_id, client_id in entries:
+                message_ids_by_client.setdefault(client_id, set()).add(message_id)
+
+            records: Dict[int, bytes] = {}
+            live: Set[Tuple[int, str]] = set()
+            for client_id, message_ids in message_ids_by_client.items():
+                try:
+                    inbox = self._load_inbox(message_bus_id, client_id)
+                except FileNotFoundError:
+                    continue
+                for message_id, record in inbox:
+                    if message_id in message_ids:
+                        records.setdefault(message_id, record)
+                        live.add((message_id, client_id))
+
+            # Entries of messages removed from the files by other means are dropped
+            for message_id, client_id in set(entries) - live:
+                thread_index.remove([message_id], client_id)
+
+            messages = [self._decode(records[message_id]) for message_id in sorted(records)]
+            return [message for message in messages if not message.is_expired()]
+
+    def _get_thread_index(self, message_bus_id: str) -> ThreadIndex:
+        thread_index = self.thread_indexes.get(message_bus_id)
+        if thread_index is None:
+            message_bus_directory = os.path.join(self.directory, message_bus_id)
+            os.makedirs(message_bus_directory, exist_ok=True)
+            thread_index = ThreadIndex(os.path.join(message_bus_directory, ".threads"))
+            self.thread_indexes[message_bus_id] = thread_index
+        return thread_index
+
+    def schedule_message(self, message_bus_id: str, message: Message, deliver_at: int) -> None:
+        """
+        Append a message to the schedule file of the message bus.
+
+        :param message: The message.
+        :param deliver_at: The due time of the message in milliseconds since the Unix epoch.
+        """
+        with self.lock:
+            frame = self.DUE_TIME.pack(deliver_at) + self._frame(message, 1)
+            with open(self._get_schedule_file(message_bus_id), 'ab') as f:
+                f.write(frame)
+
+    def pop_due_messages(self, message_bus_id: str, now: int, limit: int) -> List[Message]:
+        """
+        Remove and return the scheduled messages which are due.
+
+        :param now: The current time in milliseconds since the Unix epoch.
+        :param limit: The maximum number of messages to return.
+        :return: The messages due, earliest first.
+        """
+        with self.lock:
+            schedule = sorted(self._load_schedule(message_bus_id))
+            due = [entry for entry in schedule[:limit] if entry[0] <= now]
+            if not due:
+                return []
+
+            self._save_schedule(message_bus_id, schedule[len(due) :])
+            messages = [self._decode(record) for _, _, record in due]
+            self._release_blobs(record for _, _, record in due)
+            return messages
+
+    def get_next_due_time(self, message_bus_id: str) -> Optional[int]:
+        """
+        Get the due time of the earliest scheduled message.
+
+        :return: The due time in milliseconds since the Unix epoch, or None if no message is scheduled.
+        """
+        with self.lock:
+            schedule = self._load_schedule(message_bus_id)
+            return min(schedule)[0] if schedule else None
 
-    def _filter_message(self, message_serialized: str, sender_id: str, message_id: int):
-        message: Message = Message.deserialize(message_serialized)
-        return message.sender != sender_id or message.id != message_id
+    def _get_schedule_file(self, message_bus_id: str) -> str:
+        message_bus_directory = os.path.join(self.directory, message_bus_id)
+        os.makedirs(message_bus_directory, exist_ok=True)
+        return os.path.join(message_bus_directory, ".scheduled")
 
-    def _load_inbox(self, message_bus_id: str, client_id: str) -> List[Dict]:
+    def _load_schedule(self, message_bus_id: str) -> List[Tuple[int, int, bytes]]:
+        """
+        Load the scheduled messages of a message bus.
+
+        :return: The (due time, message ID, record) entries, in no particular order.
+        """
+        try:
+            with open(self._get_schedule_file(message_bus_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        schedule: List[Tuple[int, int, bytes]] = []
+        offset = 0
+        while offset < len(data):
+            deliver_at = self.DUE_TIME.unpack_from(data, offset)[0]
+            message_id, length = self.FRAME_HEADER.unpack_from(data, offset + self.DUE_TIME.size)
+            offset += self.DUE_TIME.size + self.FRAME_HEADER.size
+            schedule.append((deliver_at, message_id, data[offset : offset + length]))
+            offset += length
+        return schedule
+
+    def _save_schedule(self, message_bus_id: str, schedule: List[Tuple[int, int, bytes]]) -> None:
+        with open(self._get_schedule_file(message_bus_id), 'wb') as f:
+            f.write(
+                b"".join(
+                    self.DUE_TIME.pack(deliver_at) + self.FRAME_HEADER.pack(message_id, len(record)) + record
+                    for deliver_at, message_id, record in schedule
+                )
+            )
+
+    @staticmethod
+    def _in_id_ranges(message_id: int, id_ranges: List[Tuple[int, int]]) -> bool:
+        return any(low <= message_id < high for low, high in id_ranges)
+
+    def _is_sent_message(self, entry: InboxEntry, sender_id: str, message_id: int) -> bool:
+        return entry[0] == message_id and self._decode(entry[1]).sender == sender_id
+
+    def _load_inbox(self, message_bus_id: str, client_id: str) -> List[InboxEntry]:
         """
         Load an inbox from a file.
 
         :param client_id: The ID of the client.
-        :return: The list of messages in the client's inbox.
+        :return: The messages in the client's inbox as a heap of (message ID, record) entries.
         """
-        with open(self._get_inbox_file(message_bus_id, client_id), 'r') as f:
-            return json.load(f)
+        with open(self._get_inbox_file(message_bus_id, client_id), 'rb') as f:
+            data = f.read()
+
+        inbox: List[InboxEntry] = []
+        offset = 0
+        header_size = self.FRAME_HEADER.size
+        while offset < len(data):
+            message_id, length = self.FRAME_HEADER.unpack_from(data, offset)
+            offset += header_size
+            inbox.append((message_id, data[offset : offset + length]))
+            offset += length
+
+        heapq.heapify(inbox)
+        return inbox
 
-    def _save_inbox(self, message_bus_id: str, client_id: str, inbox: List[Dict]) -> None:
+    def _save_inbox(self, message_bus_id: str, client_id: str, inbox: List[InboxEntry]) -> None:
         """
         Save an inbox to a file.
 
         :param client_id: The ID of the client.
-        :param inbox: The list of messages to be saved in the client's inbox.
+        :param inbox: The (message ID, record) entries to be saved in the client's inbox.
         """
-        with open(self._get_inbox_file(message_bus_id, client_id), 'w') as f:
-            json.dump(inbox, f)
+        with open(self._get_inbox_file(message_bus_id, client_id), 'wb') as f:
+            f.write(b"".join(self.FRAME_HEADER.pack(message_id, len(record)) + record for message_id, record in inbox))
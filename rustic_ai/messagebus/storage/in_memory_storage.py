@@ -1,32 +1,96 @@
+import bisect
 import heapq
-from typing import Dict, List, Optional
+import logging
+import threading
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sortedcontainers import SortedKeyList
 
 from ..message import Message
+from ..timer_wheel import TimerService
+from ..utils import PRIORITY_SHIFT, Priority, get_id_ranges, get_timestamp
+from .limits import InboxBudget, InboxKey, InboxLimits, OverflowPolicy
+from .snapshot import SnapshotFile
 from .storage import StorageBackend
 
 
 class InMemoryStorage(StorageBackend):
     """
     An in-memory storage system for the message bus.
+
+    Each inbox is a sorted list of messages keyed by ID, so reading its head, adding a message and finding
+    a time window by bisection all take logarithmic time, however deep the inbox.
+    Inboxes are guarded by a lock, so clients can be notified on other threads than the senders'.
+
+    Inboxes can be bounded by limits. The size of a message is the length of its encoded content.
+
+    Messages with an expiry time are skipped on read, and removed in the background by a timer wheel
+    when they expire. Scheduled messages wait in a heap ordered by due time.
+
+    The stored messages are also indexed by thread, in a sorted list per thread keyed by ID like the inboxes,
+    with an entry per inbox holding the message.
+
+    Given a snapshot file, the inboxes are saved to it periodically, so a restarted storage can resume with
+    them. Snapshots are incremental, only the inboxes changed since the previous snapshot are written. They are
+    copy-on-write: the lists of the inboxes to save are frozen while they are encoded outside of the lock, and
+    copied by the first change made to them meanwhile. On restart the file is memory-mapped, and an inbox is
+    decoded from it when its client registers again.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        limits: Optional[InboxLimits] = None,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: Optional[float] = 1.0,
+    ) -> None:
         """
         Initializes the in-memory storage with an empty dictionary of inboxes.
+
+        :param limits: Optional budgets of the inboxes, unbounded if not given.
+        :param snapshot_path: Optional path of the snapshot file, restored from if it exists.
+        :param snapshot_interval: The time in seconds between two snapshots. If None, snapshots are only
+            saved by `save_snapshot` and when the storage is closed.
         """
-        self.inboxes: Dict[str, Dict[str, List[Message]]] = {}
+        self.inboxes: Dict[str, Dict[str, SortedKeyList]] = {}
+        self.lock = threading.RLock()
+        self.budget = InboxBudget(limits, self.lock) if limits else None
+        self.expiry = TimerService(self._expire, name="in-memory-storage-expiry")
+        self.scheduled: Dict[str, List[Tuple[int, int, Message]]] = {}
+        # The replies of each thread, in ID order, with an entry per inbox holding them
+        self.threads: Dict[str, Dict[int, List[Message]]] = {}
+
+        self.snapshot = SnapshotFile(snapshot_path) if snapshot_path else None
+        # The inboxes of the snapshot not decoded yet
+        self.restored: Set[InboxKey] = set(self.snapshot.get_mapped_inboxes()) if self.snapshot else set()
+        # The inboxes changed since the last snapshot, and those whose list is being saved
+        self.dirty: Set[InboxKey] = set()
+        self.frozen: Set[InboxKey] = set()
+        self.snapshot_lock = threading.Lock()
+        self.closed = threading.Event()
+        self.snapshot_thread: Optional[threading.Thread] = None
+        if self.snapshot and snapshot_interval is not None:
+            self.snapshot_thread = threading.Thread(
+                target=self._run_snapshots, args=(snapshot_interval,), name="in-memory-storage-snapshots", daemon=True
+            )
+            self.snapshot_thread.start()
 
     def create_inbox(self, message_bus_id: str, client_id: str) -> None:
         """
-        Create a new inbox for a client.
+        Create a new inbox for a client, or restore it from the snapshot.
 
         :param client_id: The ID of the client.
         """
-        if message_bus_id not in self.inboxes:
-            self.inboxes[message_bus_id] = {}
+        with self.lock:
+            if message_bus_id not in self.inboxes:
+                self.inboxes[message_bus_id] = {}
 
-        if client_id not in self.inboxes[message_bus_id]:
-            self.inboxes[message_bus_id][client_id] = []
+            if client_id not in self.inboxes[message_bus_id]:
+                if (message_bus_id, client_id) in self.restored:
+                    self._restore(message_bus_id, client_id)
+                else:
+                    self.inboxes[message_bus_id][client_id] = self._new_inbox()
+                    self._mark_dirty(message_bus_id, client_id)
 
     def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
         """
@@ -34,8 +98,16 @@ class InMemoryStorage(StorageBackend):
 
         :param client_id: The ID of the client.
         """
-        if client_id in self.inboxes[message_bus_id]:
-            del self.inboxes[message_bus_id][client_id]
+        with self.lock:
+            if (message_bus_id, client_id) in self.restored:
+                self.restored.discard((message_bus_id, client_id))
+                self._mark_dirty(message_bus_id, client_id)
+            if client_id in self.inboxes[message_bus_id]:
+                for message in self.inboxes[message_bus_id].pop(client_id):
+                    self._unindex(message_bus_id, message)
+                if self.budget:
+                    self.budget.remove_inbox((message_bus_id, client_id))
+                self._mark_dirty(message_bus_id, client_id)
 
     def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
         """
@@ -44,8 +116,37 @@ class InMemoryStorage(StorageBackend):
         :param recipient_id: The ID of the recipient client.
         :param message: The message to be added.
         """
-        inbox = self.inboxes[message_bus_id][recipient_id]
-        heapq.heappush(inbox, message)
+        self._add(message_bus_id, [(recipient_id, message)])
+
+    def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients, or to none if one of them rejects it.
+
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        self._add(message_bus_id, [(recipient_id, message) for recipient_id in recipient_ids])
+
+    def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient, or none of them if one is rejected.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        self._add(message_bus_id, [(recipient_id, message) for message in messages])
+
+    def _add(self, message_bus_id: str, entries: List[Tuple[str, Message]]) -> None:
+        with self.lock:
+            admitted = self._admit(message_bus_id, entries)
+            batches: Dict[str, List[Message]] = {}
+            for recipient_id, message in admitted:
+                batches.setdefault(recipient_id, []).append(message)
+            for recipient_id, messages in batches.items():
+                self._get_writable_inbox(message_bus_id, recipient_id).update(messages)
+                for message in messages:
+                    self._index(message_bus_id, message)
+                    self._schedule_expiry(message_bus_id, recipient_id, message)
 
     def get_next_unread_message(
         self, message_bus_id: str, recipient_id: str, last_read_message_id: int
@@ -57,15 +158,19 @@ class InMemoryStorage(StorageBackend):
         :param last_read_message_id: The ID of the last read message.
         :return: The next unread message, if one exists.
         """
-        response: Optional[Message] = None
+        with self.lock:
+            response: Optional[Message] = None
 
-        if (recipient_id in self.inboxes[message_bus_id]) and (self.inboxes[message_bus_id][recipient_id]):
-            next_message = heapq.heappop(self.inboxes[message_bus_id][recipient_id])
-            while next_message.id == last_read_message_id:
-                next_message = heapq.heappop(self.inboxes[message_bus_id][recipient_id])
-            response = next_message
+            inbox = self.inboxes[message_bus_id].get(recipient_id)
+            if inbox:
+                inbox = self._get_writable_inbox(message_bus_id, recipient_id)
+            while inbox:
+                next_message = self._pop(message_bus_id, recipient_id, 0)
+                if next_message.id != last_read_message_id and not next_message.is_expired():
+                    response = next_message
+                    break
 
-        return response
+            return response
 
     def remove_received_message(
         self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
@@ -77,9 +182,333 @@ class InMemoryStorage(StorageBackend):
         :param recipient_ids: The List of IDs for the recipient client.
         :param message_id: The ID of the message to be removed.
         """
-        for recipient_id in recipient_ids:
-            filtered = [
-                m for m in self.inboxes[message_bus_id][recipient_id] if m.sender != sender_id or m.id != message_id
-            ]
-            self.inboxes[message_bus_id][recipient_id] = filtered
-            heapq.heapify(self.inboxes[message_bus_id][recipient_id])
+        with self.lock:
+            for recipient_id in recipient_ids:
+                inbox = self.inboxes[message_bus_id][recipient_id]
+                start, end = self._bisect(inbox, message_id), self._bisect(inbox, message_id + 1)
+                if start == end:
+                    continue
+                inbox = self._get_writable_inbox(message_bus_id, recipient_id)
+                for index in reversed(range(start, end)):
+                    if inbox[index].sender == sender_id:
+                        self._pop(message_bus_id, recipient_id, index)
+
+    def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        with self.lock:
+            inbox = self.inboxes[message_bus_id].get(recipient_id)
+            if not inbox:
+                return []
+            messages: List[Message] = []
+            for low, high in get_id_ranges(start_timestamp, end_timestamp):
+                messages.extend(inbox[self._bisect(inbox, low) : self._bisect(inbox, high)])
+            return [message for message in messages if not message.is_expired()]
+
+    def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        with self.lock:
+            inbox = self.inboxes[message_bus_id].get(recipient_id)
+            if not inbox:
+                return 0
+            removed = 0
+            for low, high in get_id_ranges(start_timestamp, end_timestamp):
+                start, end = self._bisect(inbox, low), self._bisect(inbox, high)
+                if start == end:
+                    continue
+                inbox = self._get_writable_inbox(message_bus_id, recipient_id)
+                for message in inbox[start:end]:
+                    self._unindex(message_bus_id, message)
+                    if self.budget:
+                        self.budget.remove((message_bus_id, recipient_id), self._size(message))
+                del inbox[start:end]
+                removed += end - start
+            return removed
+
+    def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread still stored, from the index of the replies and the first message,
+        looked up by its ID in the inboxes.
+
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        with self.lock:
+            # The thread may have messages in inboxes of the snapshot whose clients did not register again
+            for key in [key for key in self.restored if key[0] == message_bus_id]:
+                self.create_inbox(*key)
+
+            messages: List[Message] = []
+            for inbox in self.inboxes.get(message_bus_id, {}).values():
+                index = self._bisect(inbox, thread_id)
+                if index < len(inbox) and inbox[index].id == thread_id and inbox[index].thread_id == thread_id:
+                    messages.append(inbox[index])
+                    break
+            for message in self.threads.get(message_bus_id, {}).get(thread_id, []):
+                # The entries of a message in several inboxes are next to each other
+                if not messages or messages[-1].id != message.id:
+                    messages.append(message)
+            return sorted(message for message in messages if not message.is_expired())
+
+    def _index(self, message_bus_id: str, message: Message) -> None:
+        """
+        Add an entry for a reply to the index of its thread. The first message of a thread is not indexed,
+        so a thread without replies has no entry.
+        """
+        if message.thread_id is None or message.thread_id == message.id:
+            return
+        # Messages mostly come in ID order, where insort appends
+        bisect.insort(self.threads.setdefault(message_bus_id, {}).setdefault(message.thread_id, []), message)
+
+    def _unindex(self, message_bus_id: str, message: Message) -> None:
+        """
+        Remove an entry for a reply from the index of its thread.
+        """
+        thread_id = message.thread_id
+        if thread_id is None or thread_id == message.id:
+            return
+        threads = self.threads.get(message_bus_id, {})
+        thread = threads.get(thread_id)
+        if not thread:
+            return
+        index = bisect.bisect_left(thread, message)
+        if index < len(thread) and thread[index].id == message.id:
+            del thread[index]
+            if not thread:
+                del threads[thread_id]
+
+    def _restore(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Decode an inbox from the snapshot, dropping the messages which expired in the meantime.
+        """
+        assert self.snapshot is not None
+        key = (message_bus_id, client_id)
+        self.restored.discard(key)
+        inbox = self._new_inbox(message for message in self.snapshot.read_inbox(key) if not message.is_expired())
+        self.inboxes[message_bus_id][client_id] = inbox
+        for message in inbox:
+            self._index(message_bus_id, message)
+            self._schedule_expiry(message_bus_id, client_id, message)
+            if self.budget:
+                self.budget.add(key, self._size(message))
+
+    def _mark_dirty(self, message_bus_id: str, client_id: str) -> None:
+        if self.snapshot:
+            self.dirty.add((message_bus_id, client_id))
+
+    def _get_writable_inbox(self, message_bus_id: str, recipient_id: str) -> SortedKeyList:
+        """
+        Get an inbox to change, copying it first if a snapshot is saving it.
+
+        Callers holding the list of the inbox must use the one returned from then on.
+        """
+        inbox = self.inboxes[message_bus_id][recipient_id]
+        if self.snapshot:
+            key = (message_bus_id, recipient_id)
+            self.dirty.add(key)
+            if key in self.frozen:
+                self.frozen.discard(key)
+                inbox = self.inboxes[message_bus_id][recipient_id] = inbox.copy()
+        return inbox
+
+    def save_snapshot(self) -> None:
+        """
+        Save the inboxes changed since the last snapshot to the snapshot file.
+        """
+        if self.snapshot is None:
+            raise ValueError("The storage has no snapshot file")
+
+        with self.snapshot_lock:
+            with self.lock:
+                inboxes = {key: self.inboxes.get(key[0], {}).get(key[1]) for key in self.dirty}
+                self.dirty = set()
+                self.frozen.update(key for key, inbox in inboxes.items() if inbox is not None)
+
+            try:
+                self.snapshot.save(
+                    {
+                        key: None if inbox is None else [message for message in inbox if not message.is_expired()]
+                        for key, inbox in inboxes.items()
+                    }
+                )
+            except BaseException:
+                with self.lock:
+                    self.dirty.update(inboxes)
+                raise
+            finally:
+                with self.lock:
+                    self.frozen.difference_update(inboxes)
+
+    def _run_snapshots(self, interval: float) -> None:
+        while not self.closed.wait(interval):
+            try:
+                self.save_snapshot()
+            except Exception:
+                logging.exception("Failed to save the snapshot of the in-memory storage")
+
+    def _schedule_expiry(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        if message.expires_at is not None:
+            self.expiry.schedule(message.expires_at, (message_bus_id, recipient_id, message))
+
+    def _expire(self, items: List[Any]) -> None:
+        """
+        Remove the messages whose expiry timers fired, unless they were read or removed in the meantime.
+
+        :param items: The (message bus ID, recipient ID, message) of the timers.
+        """
+        with self.lock:
+            for message_bus_id, recipient_id, message in items:
+                inbox = self.inboxes.get(message_bus_id, {}).get(recipient_id)
+                if not inbox:
+                    continue
+                for index in range(self._bisect(inbox, message.id), self._bisect(inbox, message.id + 1)):
+                    if inbox[index] is message:
+                        self._pop(message_bus_id, recipient_id, index)
+                        break
+
+    def schedule_message(self, message_bus_id: str, message: Message, deliver_at: int) -> None:
+        """
+        Keep a message in the heap of scheduled messages until it is due.
+
+        :param message: The message.
+        :param deliver_at: The due time of the message in milliseconds since the Unix epoch.
+        """
+        with self.lock:
+            heapq.heappush(self.scheduled.setdefault(message_bus_id, []), (deliver_at, message.id, message))
+
+    def pop_due_messages(self, message_bus_id: str, now: int, limit: int) -> List[Message]:
+        """
+        Remove and return the scheduled messages which are due.
+
+        :param now: The current time in milliseconds since the Unix epoch.
+        :param limit: The maximum number of messages to return.
+        :return: The messages due, earliest first.
+        """
+        with self.lock:
+            scheduled = self.scheduled.get(message_bus_id, [])
+            messages: List[Message] = []
+            while scheduled and scheduled[0][0] <= now and len(messages) < limit:
+                messages.append(heapq.heappop(scheduled)[2])
+            return messages
+
+    def get_next_due_time(self, message_bus_id: str) -> Optional[int]:
+        """
+        Get the due time of the earliest scheduled message.
+
+        :return: The due time in milliseconds since the Unix epoch, or None if no message is scheduled.
+        """
+        with self.lock:
+            scheduled = self.scheduled.get(message_bus_id)
+            return scheduled[0][0] if scheduled else None
+
+    def close(self) -> None:
+        """
+        Stop the background removal of expired messages, and save a last snapshot if there is a snapshot file.
+        """
+        self.expiry.close()
+        if self.snapshot and not self.closed.is_set():
+            self.closed.set()
+            if self.snapshot_thread is not None:
+                self.snapshot_thread.join()
+            self.save_snapshot()
+            self.snapshot.close()
+
+    @staticmethod
+    def _new_inbox(messages: Iterable[Message] = ()) -> SortedKeyList:
+        """
+        Create a list of messages kept sorted by ID, for an inbox.
+        """
+        return SortedKeyList(messages, key=attrgetter("id"))
+
+    @staticmethod
+    def _bisect(inbox: SortedKeyList, message_id: int) -> int:
+        """
+        Find the position of the first message of an inbox with an ID of at least the given one.
+
+        :param inbox: The sorted inbox.
+        :param message_id: The message ID.
+        :return: The position in the inbox.
+        """
+        return inbox.bisect_key_left(message_id)
+
+    @staticmethod
+    def _size(message: Message) -> int:
+        return len(message.get_content())
+
+    def _admit(self, message_bus_id: str, entries: List[Tuple[str, Message]]) -> List[Tuple[str, Message]]:
+        """
+        Make room for new messages in the budgets of their inboxes.
+
+        :param entries: The recipient ID and the message of each message.
+        :return: The entries to store, without the messages the drop policy chose to drop.
+        :raises InboxFullError: If a message does not fit, once the budget taken by the others is given back.
+        """
+        if not self.budget:
+            return entries
+
+        admitted: List[Tuple[str, Message]] = []
+        try:
+            for entry in entries:
+                recipient_id, message = entry
+                if self.budget.admit((message_bus_id, recipient_id), self._size(message), message.id, self._evict):
+                    admitted.append(entry)
+        except BaseException:
+            for recipient_id, message in admitted:
+                self.budget.remove((message_bus_id, recipient_id), self._size(message))
+            raise
+        return admitted
+
+    def _pop(self, message_bus_id: str, recipient_id: str, index: int) -> Message:
+        message = self._get_writable_inbox(message_bus_id, recipient_id).pop(index)
+        self._unindex(message_bus_id, message)
+        if self.budget:
+            self.budget.remove((message_bus_id, recipient_id), self._size(message))
+        return message
+
+    def _evict(self, key: InboxKey, policy: OverflowPolicy, message_id: int) -> Optional[int]:
+        """
+        Remove a message from an inbox to make room for a new one.
+
+        :param key: The inbox.
+        :param policy: The overflow policy choosing the message to remove.
+        :param message_id: The ID of the new message.
+        :return: The size of the removed message, or None if the new message is the one to drop.
+        """
+        inbox = self.inboxes[key[0]][key[1]]
+        if not inbox:
+            return None
+        inbox = self._get_writable_inbox(*key)
+
+        if policy == OverflowPolicy.DROP_LOWEST_PRIORITY:
+            # Lower priorities have higher IDs, and so do newer messages within a priority
+            if message_id > inbox[-1].id:
+                return None
+            index = len(inbox) - 1
+        else:
+            # The oldest message is the first one of one of the priority bands
+            heads = {self._bisect(inbox, priority << PRIORITY_SHIFT) for priority in Priority}
+            index = min(
+                (head for head in heads if head < len(inbox)),
+                key=lambda head: get_timestamp(inbox[head].id),
+            )
+
+        message = inbox.pop(index)
+        self._unindex(key[0], message)
+        return self._size(message)
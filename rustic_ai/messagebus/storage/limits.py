@@ -0,0 +1,250 @@
+import threading
+import time
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Tuple
+
+# An inbox is identified by the ID of its message bus and the ID of its client
+InboxKey = Tuple[str, str]
+
+# Removes a message from an inbox to make room for a new one, given the overflow policy and the ID of the new
+# message. Returns the size of the removed message, or None if the new message is the one to drop.
+Evictor = Callable[[InboxKey, 'OverflowPolicy', int], Optional[int]]
+
+WatermarkCallback = Callable[[str, str], None]
+
+
+class InboxFullError(Exception):
+    """
+    Raised when a message does not fit in the budget of an inbox.
+    """
+
+    pass
+
+
+class OverflowPolicy(Enum):
+    """
+    What a storage backend does with a message exceeding a budget.
+    """
+
+    # Wait for the recipients to read messages, up to the block timeout
+    BLOCK = "block"
+    # Raise an InboxFullError
+    REJECT = "reject"
+    # Drop the message of the lowest priority, the newest one among equals, which may be the new message
+    DROP_LOWEST_PRIORITY = "drop_lowest_priority"
+    # Drop the oldest message
+    DROP_OLDEST = "drop_oldest"
+
+
+class InboxLimits:
+    """
+    The budgets of the inboxes of a storage backend, and what happens when they are exceeded.
+
+    Budgets apply per inbox and to all the inboxes together, in number of messages and in bytes.
+    When the global budget is exceeded, messages are dropped from the largest inbox.
+    """
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        total_max_messages: Optional[int] = None,
+        total_max_bytes: Optional[int] = None,
+        overflow_policy: OverflowPolicy = OverflowPolicy.REJECT,
+        block_timeout: Optional[float] = None,
+        high_water_mark: float = 0.8,
+        low_water_mark: float = 0.5,
+        on_high_water_mark: Optional[WatermarkCallback] = None,
+        on_low_water_mark: Optional[WatermarkCallback] = None,
+    ):
+        """
+        Initialize the limits.
+
+        :param max_messages: The maximum number of messages in an inbox.
+        :param max_bytes: The maximum size of the messages in an inbox.
+        :param total_max_messages: The maximum number of messages in all the inboxes.
+        :param total_max_bytes: The maximum size of the messages in all the inboxes.
+        :param overflow_policy: What to do with a message exceeding a budget.
+        :param block_timeout: How long to block a sender with the BLOCK policy, in seconds, forever if not given.
+        :param high_water_mark: The fill ratio of an inbox budget above which on_high_water_mark is called.
+        :param low_water_mark: The fill ratio of an inbox budget below which on_low_water_mark is called,
+            once the inbox went above the high water mark.
+        :param on_high_water_mark: Called with the message bus ID and the client ID of an inbox filling up.
+            It runs while the storage is locked, so it must not block.
+        :param on_low_water_mark: Called with the message bus ID and the client ID of an inbox draining.
+        """
+        if not 0 <= low_water_mark <= high_water_mark <= 1:
+            raise ValueError("Water marks must satisfy 0 <= low_water_mark <= high_water_mark <= 1")
+
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.total_max_messages = total_max_messages
+        self.total_max_bytes = total_max_bytes
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.high_water_mark = high_water_mark
+        self.low_water_mark = low_water_mark
+        self.on_high_water_mark = on_high_water_mark
+        self.on_low_water_mark = on_low_water_mark
+
+
+class InboxBudget:
+    """
+    Tracks the number and size of the messages of every inbox of a storage backend against its limits.
+
+    Accounting is incremental: the backend reports the size of each message it adds or removes, and
+    the budget never looks at the stored messages. All methods must be called with the lock of the
+    backend held, the same lock the budget was created with.
+    """
+
+    def __init__(self, limits: InboxLimits, lock: threading.RLock) -> None:
+        """
+        Initialize the budget.
+
+        :param limits: The limits to enforce.
+        :param lock: The lock of the storage backend guarding its inboxes.
+        """
+        self.limits = limits
+        self.condition = threading.Condition(lock)
+        # Number of messages and bytes per inbox
+        self.usage: Dict[InboxKey, List[int]] = {}
+        self.total_messages = 0
+        self.total_bytes = 0
+        self.dropped_messages = 0
+        self.above_high_water_mark: Dict[InboxKey, bool] = {}
+
+    def admit(self, key: InboxKey, size: int, message_id: int, evict: Evictor) -> bool:
+        """
+        Make room for a new message in an inbox, and account for it.
+
+        :param key: The inbox.
+        :param size: The size of the new message.
+        :param message_id: The ID of the new message.
+        :param evict: Removes a message to make room, used by the drop policies.
+        :return: Whether the message is to be stored, False if the drop policy chose to drop it.
+        """
+        if self._exceeds(1, size, self.limits.max_messages, self.limits.max_bytes) or self._exceeds(
+            1, size, self.limits.total_max_messages, self.limits.total_max_bytes
+        ):
+            # It would not fit in an empty inbox, waiting or dropping other messages cannot make room for it
+            raise InboxFullError(
+                f"Message of {size} bytes exceeds the budget of inbox {key[1]} of message bus {key[0]}"
+            )
+
+        deadline = None
+        if self.limits.block_timeout is not None:
+            deadline = time.monotonic() + self.limits.block_timeout
+
+        while True:
+            victim = self._get_overflowing_inbox(key, size)
+            if victim is None:
+                break
+
+            policy = self.limits.overflow_policy
+            if policy == OverflowPolicy.REJECT:
+                raise InboxFullError(f"Inbox {key[1]} of message bus {key[0]} is full")
+            elif policy == OverflowPolicy.BLOCK:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if (remaining is not None and remaining <= 0) or not self.condition.wait(remaining):
+                    raise InboxFullError(f"Timed out waiting for room in inbox {key[1]} of message bus {key[0]}")
+            else:
+                self.dropped_messages += 1
+                evicted_size = evict(victim, policy, message_id)
+                if evicted_size is None:
+                    return False
+                self.remove(victim, evicted_size)
+
+        usage = self.usage.setdefault(key, [0, 0])
+        usage[0] += 1
+        usage[1] += size
+        self.total_messages += 1
+        self.total_bytes += size
+        self._check_water_marks(key)
+        return True
+
+    def add(self, key: InboxKey, size: int) -> None:
+        """
+        Account for a message already stored, without enforcing the limits.
+
+        :param key: The inbox.
+        :param size: The size of the message.
+        """
+        usage = self.usage.setdefault(key, [0, 0])
+        usage[0] += 1
+        usage[1] += size
+        self.total_messages += 1
+        self.total_bytes += size
+
+    def remove(self, key: InboxKey, size: int) -> None:
+        """
+        Account for a message removed from an inbox.
+
+        :param key: The inbox.
+        :param size: The size of the message.
+        """
+        usage = self.usage.get(key)
+        if usage is None:
+            return
+
+        usage[0] -= 1
+        usage[1] -= size
+        self.total_messages -= 1
+        self.total_bytes -= size
+        self._check_water_marks(key)
+        self.condition.notify_all()
+
+    def remove_inbox(self, key: InboxKey) -> None:
+        """
+        Account for an inbox removed with all its messages.
+
+        :param key: The inbox.
+        """
+        messages, size = self.usage.pop(key, (0, 0))
+        self.above_high_water_mark.pop(key, None)
+        self.total_messages -= messages
+        self.total_bytes -= size
+        self.condition.notify_all()
+
+    def _get_overflowing_inbox(self, key: InboxKey, size: int) -> Optional[InboxKey]:
+        """
+        Find the inbox to make room in for a new message.
+
+        :return: The inbox itself if its budget is exceeded, the largest inbox if the global budget is exceeded,
+            or None if the message fits.
+        """
+        limits = self.limits
+        messages, total_size = self.usage.get(key, (0, 0))
+        if self._exceeds(messages + 1, total_size + size, limits.max_messages, limits.max_bytes):
+            return key
+
+        if self._exceeds(
+            self.total_messages + 1, self.total_bytes + size, limits.total_max_messages, limits.total_max_bytes
+        ):
+            largest = max(self.usage, key=lambda inbox: (self.usage[inbox][1], self.usage[inbox][0]), default=key)
+            return largest if self.usage.get(largest, (0, 0))[0] else key
+
+        return None
+
+    @staticmethod
+    def _exceeds(messages: int, size: int, max_messages: Optional[int], max_bytes: Optional[int]) -> bool:
+        return (max_messages is not None and messages > max_messages) or (max_bytes is not None and size > max_bytes)
+
+    def _fill_ratio(self, key: InboxKey) -> float:
+        messages, size = self.usage.get(key, (0, 0))
+        ratios = [0.0]
+        if self.limits.max_messages:
+            ratios.append(messages / self.limits.max_messages)
+        if self.limits.max_bytes:
+            ratios.append(size / self.limits.max_bytes)
+        return max(ratios)
+
+    def _check_water_marks(self, key: InboxKey) -> None:
+        ratio = self._fill_ratio(key)
+        if not self.above_high_water_mark.get(key) and ratio >= self.limits.high_water_mark > 0:
+            self.above_high_water_mark[key] = True
+            if self.limits.on_high_water_mark:
+                self.limits.on_high_water_mark(*key)
+        elif self.above_high_water_mark.get(key) and ratio <= self.limits.low_water_mark:
+            self.above_high_water_mark[key] = False
+            if self.limits.on_low_water_mark:
+                self.limits.on_low_water_mark(*key)
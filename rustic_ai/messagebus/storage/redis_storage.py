@@ -1,36 +1,363 @@
-from typing import List, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import redis
 
 from ..message import Message
+from ..utils import get_id_ranges
+from .compression import Compressor, decompress
 from .storage import StorageBackend
 
 
-class RedisStorage(StorageBackend):
+class RedisInboxes:
+    """
+    The layout of inboxes in Redis, shared by the blocking and asyncio storages.
+
+    Each inbox is a sorted set of encoded messages scored by their IDs. The messages with an expiry time
+    are also kept in a companion sorted set scored by that time, so the expired messages are found
+    with a range query instead of a scan of the inbox. Scheduled messages wait in a sorted set
+    per message bus, scored by their due time.
+
+    Every thread has a sorted set too, indexing the stored messages of the thread as `<message ID>:<recipient ID>`
+    members scored by message ID, so a thread is read with a range query and a lookup per message. Each inbox
+    keeps the thread of its messages in a last sorted set of `<message ID>:<thread ID>` members scored by message
+    ID, so the messages removed by time range or with the inbox leave their threads without being decoded.
+    """
+
+    def __init__(self, codec: str = "json", compression: Optional[Compressor] = None):
+        """
+        Initialize the layout.
+
+        :param codec: The name of the wire codec used to encode stored messages.
+        :param compression: Optional compressor applied to large encoded messages.
+        """
+        self.codec = Message.get_codec(codec).name
+        self.compression = compression
+
+    def _encode(self, message: Message) -> bytes:
+        record = message.encode(self.codec)
+        return self.compression.compress(record) if self.compression else record
+
+    def _decode(self, data: bytes) -> Message:
+        return Message.decode(decompress(data))
+
+    def _get_inbox_id(self, message_bus_id: str, client_id: str) -> str:
+        """
+        Get the ID of the inbox for a client.
+
+        :param message_bus_id: The ID of the message bus.
+        :param client_id: The ID of the client.
+        :return: The ID of the client's inbox.
+        """
+        return f"{message_bus_id}-{client_id}"
+
+    def _get_expiry_id(self, inbox_id: str) -> str:
+        """
+        Get the ID of the sorted set of the expiring messages of an inbox.
+
+        :param inbox_id: The ID of the inbox.
+        :return: The ID of the expiry set of the inbox.
+        """
+        return f"{inbox_id}:expiry"
+
+    def _get_schedule_id(self, message_bus_id: str) -> str:
+        """
+        Get the ID of the sorted set of the scheduled messages of a message bus.
+
+        :param message_bus_id: The ID of the message bus.
+        :return: The ID of the schedule of the message bus.
+        """
+        return f"{message_bus_id}:scheduled"
+
+    def _get_thread_key(self, message_bus_id: str, thread_id: int) -> str:
+        """
+        Get the ID of the sorted set indexing the messages of a thread.
+
+        :param message_bus_id: The ID of the message bus.
+        :param thread_id: The ID of the thread.
+        :return: The ID of the index of the thread.
+        """
+        return f"{message_bus_id}:thread:{thread_id}"
+
+    def _get_thread_map_id(self, inbox_id: str) -> str:
+        """
+        Get the ID of the sorted set of the threads of the messages of an inbox.
+
+        :param inbox_id: The ID of the inbox.
+        :return: The ID of the thread map of the inbox.
+        """
+        return f"{inbox_id}:threads"
+
+    @staticmethod
+    def _parse_thread_map(members: List[bytes]) -> List[Tuple[int, int]]:
+        """
+        Parse the members of the thread map of an inbox.
+
+        :param members: The `<message ID>:<thread ID>` members.
+        :return: The message IDs with their thread IDs.
+        """
+        threads: List[Tuple[int, int]] = []
+        for member in members:
+            message_id, thread_id = member.split(b":", 1)
+            threads.append((int(message_id), int(thread_id)))
+        return threads
+
+    def _get_thread_entries(
+        self, message_bus_id: str, recipient_id: str, messages: List[Message]
+    ) -> Dict[str, Dict[Union[str, bytes], int]]:
+        """
+        Get the entries of messages of an inbox in the indexes of their threads.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages.
+        :return: The entries scored by message ID, by thread index.
+        """
+        return self._get_thread_entries_of(
+            message_bus_id,
+            recipient_id,
+            [(message.id, message.thread_id) for message in messages if message.thread_id is not None],
+        )
+
+    def _get_thread_entries_of(
+        self, message_bus_id: str, recipient_id: str, threads: List[Tuple[int, int]]
+    ) -> Dict[str, Dict[Union[str, bytes], int]]:
+        """
+        Get the entries of messages of an inbox in the indexes of their threads, from their IDs.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param threads: The message IDs with their thread IDs.
+        :return: The entries scored by message ID, by thread index.
+        """
+        entries: Dict[str, Dict[Union[str, bytes], int]] = {}
+        for message_id, thread_id in threads:
+            thread_key = self._get_thread_key(message_bus_id, thread_id)
+            entries.setdefault(thread_key, {})[f"{message_id}:{recipient_id}"] = message_id
+        return entries
+
+    def _add_messages(self, pipeline: Any, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Queue the addition of messages to an inbox, to its expiry set and to the indexes of their threads.
+
+        :param pipeline: The pipeline, blocking or asyncio.
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        payload, expiry_payload = self._get_payloads(messages)
+        pipeline.zadd(inbox_id, payload)
+        if expiry_payload:
+            pipeline.zadd(self._get_expiry_id(inbox_id), expiry_payload)
+        thread_map: Dict[Union[str, bytes], int] = {
+            f"{message.id}:{message.thread_id}": message.id for message in messages if message.thread_id is not None
+        }
+        if thread_map:
+            pipeline.zadd(self._get_thread_map_id(inbox_id), thread_map)
+        for thread_key, entries in self._get_thread_entries(message_bus_id, recipient_id, messages).items():
+            pipeline.zadd(thread_key, entries)
+
+    def _remove_messages(
+        self, pipeline: Any, message_bus_id: str, recipient_id: str, removed: List[Tuple[bytes, Message]]
+    ) -> None:
+        """
+        Queue the removal of messages from an inbox, from its expiry set and from the indexes of their threads.
+        The removal from the inbox is the first command queued.
+
+        :param pipeline: The pipeline, blocking or asyncio.
+        :param recipient_id: The ID of the recipient client.
+        :param removed: The encoded messages, with the messages.
+        """
+        threads = [(message.id, message.thread_id) for _, message in removed if message.thread_id is not None]
+        self._remove_records(pipeline, message_bus_id, recipient_id, [data for data, _ in removed], threads)
+
+    def _remove_records(
+        self,
+        pipeline: Any,
+        message_bus_id: str,
+        recipient_id: str,
+        records: List[bytes],
+        threads: List[Tuple[int, int]],
+    ) -> None:
+        """
+        Queue the removal of encoded messages from an inbox, from its expiry set, from its thread map and from
+        the indexes of their threads. The removal from the inbox is the first command queued.
+
+        :param pipeline: The pipeline, blocking or asyncio.
+        :param recipient_id: The ID of the recipient client.
+        :param records: The encoded messages.
+        :param threads: The IDs of the messages with their thread IDs.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        pipeline.zrem(inbox_id, *records)
+        pipeline.zrem(self._get_expiry_id(inbox_id), *records)
+        if threads:
+            pipeline.zrem(
+                self._get_thread_map_id(inbox_id), *(f"{message_id}:{thread_id}" for message_id, thread_id in threads)
+            )
+        for thread_key, entries in self._get_thread_entries_of(message_bus_id, recipient_id, threads).items():
+            pipeline.zrem(thread_key, *entries)
+
+    def _queue_time_range(self, pipeline: Any, inbox_id: str, id_ranges: List[Tuple[int, int]]) -> None:
+        """
+        Queue the reads of the messages of an inbox within priority bands, with their scores,
+        and of the entries of its thread map within the same bands.
+
+        :param pipeline: The pipeline, blocking or asyncio.
+        :param inbox_id: The ID of the inbox.
+        :param id_ranges: The (lowest, highest) bounds of the IDs of each band, the highest being exclusive.
+        """
+        for low, high in id_ranges:
+            pipeline.zrangebyscore(inbox_id, low, high, withscores=True)
+        for low, high in id_ranges:
+            pipeline.zrangebyscore(self._get_thread_map_id(inbox_id), low, high)
+
+    def _select_time_range_records(
+        self, id_ranges: List[Tuple[int, int]], results: List[Any]
+    ) -> Tuple[List[bytes], List[Tuple[int, int]]]:
+        """
+        Pick the messages to remove by time range, from the reads queued by `_queue_time_range`.
+
+        Scores are the message IDs rounded to doubles, so a message scored strictly within the rounded bounds
+        of its band is within the band. Only the messages scored as a bound are decoded to compare their IDs.
+
+        :param id_ranges: The (lowest, highest) bounds of the IDs of each band, the highest being exclusive.
+        :param results: The results of the reads.
+        :return: The encoded messages within the bands, and the IDs of the messages within them with their thread IDs.
+        """
+        records: List[bytes] = []
+        threads: List[Tuple[int, int]] = []
+        for (low, high), band, thread_band in zip(id_ranges, results, results[len(id_ranges) :]):
+            for message_data, score in band:
+                if float(low) < score < float(high) or low <= self._decode(message_data).id < high:
+                    records.append(message_data)
+            threads.extend(entry for entry in self._parse_thread_map(thread_band) if low <= entry[0] < high)
+        return records, threads
+
+    def _get_thread_lookups(self, message_bus_id: str, members: List[bytes]) -> List[Tuple[str, int]]:
+        """
+        Find the inbox and the ID of the message of each entry of a thread index.
+
+        :param message_bus_id: The ID of the message bus.
+        :param members: The entries of the thread index.
+        :return: The inbox IDs and message IDs.
+        """
+        lookups: List[Tuple[str, int]] = []
+        for member in members:
+            message_id, recipient_id = member.decode("utf-8").split(":", 1)
+            lookups.append((self._get_inbox_id(message_bus_id, recipient_id), int(message_id)))
+        return lookups
+
+    def _collect_thread(
+        self, lookups: List[Tuple[str, int]], members: List[bytes], candidates: List[List[bytes]]
+    ) -> Tuple[List[Message], List[bytes]]:
+        """
+        Pick the messages of a thread among the messages read from the inboxes by score.
+
+        :param lookups: The inbox IDs and message IDs of the entries of the thread index.
+        :param members: The entries of the thread index.
+        :param candidates: The encoded messages scored as each entry, read from its inbox.
+        :return: The unexpired messages of the thread, once each, ordered by ID, and the entries of the messages
+            no longer in their inbox.
+        """
+        messages: Dict[int, Message] = {}
+        stale: List[bytes] = []
+        for (_, message_id), member, found in zip(lookups, members, candidates):
+            message = next(
+                (message for message in map(self._decode, found) if message.id == message_id),
+                None,
+            )
+            if message is None:
+                stale.append(member)
+            elif message_id not in messages and not message.is_expired():
+                messages[message_id] = message
+        return sorted(messages.values()), stale
+
+    def _get_payloads(
+        self, messages: List[Message]
+    ) -> Tuple[Dict[Union[str, bytes], int], Dict[Union[str, bytes], int]]:
+        """
+        Encode messages for a ZADD to an inbox and to its expiry set.
+
+        :param messages: The messages.
+        :return: The encoded messages scored by ID, and the encoded expiring messages scored by expiry time.
+        """
+        payload: Dict[Union[str, bytes], int] = {}
+        expiry_payload: Dict[Union[str, bytes], int] = {}
+        for message in messages:
+            record = self._encode(message)
+            payload[record] = message.id
+            if message.expires_at is not None:
+                expiry_payload[record] = message.expires_at
+        return payload, expiry_payload
+
+    @staticmethod
+    def _now() -> int:
+        return time.time_ns() // 1_000_000
+
+    def _filter_time_range(self, id_ranges: List[Tuple[int, int]], bands: List[List[bytes]]) -> List[Message]:
+        """
+        Decode the messages read from each priority band with an inclusive ZRANGEBYSCORE,
+        dropping the ones rounded into the band from outside of it.
+
+        :param id_ranges: The (lowest, highest) bounds of the IDs of each band, the highest being exclusive.
+        :param bands: The encoded messages read from each band.
+        :return: The messages within the bands, ordered by ID.
+        """
+        return [message for _, message in self._select_time_range(id_ranges, bands) if not message.is_expired()]
+
+    def _select_time_range(
+        self, id_ranges: List[Tuple[int, int]], bands: List[List[bytes]]
+    ) -> List[Tuple[bytes, Message]]:
+        """
+        Decode the messages read from each priority band with an inclusive ZRANGEBYSCORE,
+        keeping the ones whose exact ID is within the band.
+
+        :param id_ranges: The (lowest, highest) bounds of the IDs of each band, the highest being exclusive.
+        :param bands: The encoded messages read from each band.
+        :return: The encoded messages within the bands with the messages, ordered by ID.
+        """
+        selected: List[Tuple[bytes, Message]] = []
+        for (low, high), band in zip(id_ranges, bands):
+            band_messages = [(message_data, self._decode(message_data)) for message_data in band]
+            selected.extend(
+                sorted((entry for entry in band_messages if low <= entry[1].id < high), key=lambda entry: entry[1].id)
+            )
+        return selected
+
+
+class RedisStorage(RedisInboxes, StorageBackend):
     """
     RedisStorage represents a Redis-based storage system for the message bus.
     """
 
-    def __init__(self, redis_connection: redis.StrictRedis):
+    def __init__(
+        self, redis_connection: redis.StrictRedis, codec: str = "json", compression: Optional[Compressor] = None
+    ):
         """
-        Initialize the storage with Redis connection parameters.
+        Initialize the storage with a Redis connection.
 
-        :param host: The hostname of the Redis server.
-        :param port: The port of the Redis server.
-        :param db: The database number to use in the Redis server.
+        :param redis_connection: The connection to the Redis server.
+        :param codec: The name of the wire codec used to encode stored messages.
+        :param compression: Optional compressor applied to large encoded messages.
         """
+        super().__init__(codec, compression)
         self.redis = redis_connection
 
     @classmethod
-    def create_storage(cls, host: str, port: int, db: int):
+    def create_storage(
+        cls, host: str, port: int, db: int, codec: str = "json", compression: Optional[Compressor] = None
+    ):
         """
         Initialize the storage with Redis connection parameters.
 
         :param host: The hostname of the Redis server.
         :param port: The port of the Redis server.
         :param db: The database number to use in the Redis server.
+        :param codec: The name of the wire codec used to encode stored messages.
+        :param compression: Optional compressor applied to large encoded messages.
         """
-        return cls(redis.Redis(host=host, port=port, db=db))
+        return cls(redis.Redis(host=host, port=port, db=db), codec, compression)
 
     def create_inbox(self, message_bus_id: str, client_id: str) -> None:
         """
@@ -47,7 +374,14 @@ class RedisStorage(StorageBackend):
 
         :param client_id: The ID of the client.
         """
-        self.redis.delete(self._get_inbox_id(message_bus_id, client_id))
+        inbox_id = self._get_inbox_id(message_bus_id, client_id)
+        thread_map_id = self._get_thread_map_id(inbox_id)
+        threads = self._parse_thread_map(self.redis.zrange(thread_map_id, 0, -1))
+        pipeline = self.redis.pipeline(transaction=False)
+        for thread_key, entries in self._get_thread_entries_of(message_bus_id, client_id, threads).items():
+            pipeline.zrem(thread_key, *entries)
+        pipeline.delete(inbox_id, self._get_expiry_id(inbox_id), thread_map_id)
+        pipeline.execute()
 
     def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
         """
@@ -56,7 +390,34 @@ class RedisStorage(StorageBackend):
         :param recipient_id: The ID of the recipient client.
         :param message: The message to be added.
         """
-        self.redis.zadd(self._get_inbox_id(message_bus_id, recipient_id), {message.serialize(): message.id})
+        self.add_messages_to_inbox(message_bus_id, recipient_id, [message])
+
+    def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients in a single round trip.
+
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for recipient_id in recipient_ids:
+            self._add_messages(pipeline, message_bus_id, recipient_id, [message])
+        pipeline.execute()
+
+    def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient in a single round trip, with a single ZADD
+        to the inbox, a second one for the expiring messages and one per thread index.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        if not messages:
+            return
+
+        pipeline = self.redis.pipeline(transaction=False)
+        self._add_messages(pipeline, message_bus_id, recipient_id, messages)
+        pipeline.execute()
 
     def get_next_unread_message(
         self, message_bus_id: str, recipient_id: str, last_read_message_id: int
@@ -68,20 +429,17 @@ class RedisStorage(StorageBackend):
         :param last_read_message_id: The ID of the last read message.
         :return: The next unread message, if one exists.
         """
-        message_data = self.redis.zrange(self._get_inbox_id(message_bus_id, recipient_id), 0, 0)
-        if message_data:
-            message = Message.deserialize(message_data[0])
-
-            while message.id == last_read_message_id:
-                self.redis.zrem(self._get_inbox_id(message_bus_id, recipient_id), message.serialize())
-                message_data = self.redis.zrange(self._get_inbox_id(message_bus_id, recipient_id), 0, 0)
-                if not message_data:
-                    return None
-                message = Message.deserialize(message_data[0])
-
-            return message
-        else:
-            return None
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        message_data = self.redis.zrange(inbox_id, 0, 0)
+        while message_data:
+            message = self._decode(message_data[0])
+            if not message.is_expired() and message.id != last_read_message_id:
+                return message
+            pipeline = self.redis.pipeline(transaction=False)
+            self._remove_messages(pipeline, message_bus_id, recipient_id, [(message_data[0], message)])
+            pipeline.execute()
+            message_data = self.redis.zrange(inbox_id, 0, 0)
+        return None
 
     def remove_received_message(
         self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
@@ -96,17 +454,136 @@ class RedisStorage(StorageBackend):
         for recipient_id in recipient_ids:
             inbox = self.redis.zrange(self._get_inbox_id(message_bus_id, recipient_id), 0, -1)
             for message_data in inbox:
-                message = Message.deserialize(message_data)
+                message = self._decode(message_data)
                 if message.sender == sender_id and message.id == message_id:
-                    self.redis.zrem(self._get_inbox_id(message_bus_id, recipient_id), message_data)
+                    pipeline = self.redis.pipeline(transaction=False)
+                    self._remove_messages(pipeline, message_bus_id, recipient_id, [(message_data, message)])
+                    pipeline.execute()
                     break
 
-    def _get_inbox_id(self, message_bus_id: str, client_id: str) -> str:
+    def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
         """
-        Get the ID of the inbox for a client.
+        Read the messages of an inbox sent within a time window, without removing them.
 
-        :param message_bus_id: The ID of the message bus.
-        :param client_id: The ID of the client.
-        :return: The ID of the client's inbox.
+        Scores are the message IDs rounded to doubles, so each priority band is read with an inclusive
+        ZRANGEBYSCORE and the messages rounded into it from outside the window are filtered out.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
         """
-        return f"{message_bus_id}-{client_id}"
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for low, high in id_ranges:
+            pipeline.zrangebyscore(inbox_id, low, high)
+
+        return self._filter_time_range(id_ranges, pipeline.execute())
+
+    def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window.
+
+        The messages of each priority band and their entries in the thread map of the inbox are read with
+        an inclusive ZRANGEBYSCORE, then removed from the inbox and their threads with a single round trip.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+
+        pipeline = self.redis.pipeline(transaction=False)
+        self._queue_time_range(pipeline, inbox_id, id_ranges)
+        records, threads = self._select_time_range_records(id_ranges, pipeline.execute())
+        if not records:
+            return 0
+
+        pipeline = self.redis.pipeline(transaction=False)
+        self._remove_records(pipeline, message_bus_id, recipient_id, records, threads)
+        return pipeline.execute()[0]
+
+    def purge_expired_messages(self, message_bus_id: str, recipient_id: str) -> int:
+        """
+        Remove the expired messages of an inbox, found by a range query on its expiry set.
+
+        :param recipient_id: The ID of the recipient client.
+        :return: The number of messages removed.
+        """
+        inbox_id = self._get_inbox_id(message_bus_id, recipient_id)
+        expired = self.redis.zrangebyscore(self._get_expiry_id(inbox_id), "-inf", self._now())
+        if not expired:
+            return 0
+
+        pipeline = self.redis.pipeline()
+        self._remove_messages(pipeline, message_bus_id, recipient_id, [(data, self._decode(data)) for data in expired])
+        return pipeline.execute()[0]
+
+    def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread still stored, from the index of the thread. Each message is looked up
+        by score in an inbox holding it, with a single round trip for the whole thread.
+
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        thread_key = self._get_thread_key(message_bus_id, thread_id)
+        members = self.redis.zrange(thread_key, 0, -1)
+        if not members:
+            return []
+
+        lookups = self._get_thread_lookups(message_bus_id, members)
+        pipeline = self.redis.pipeline(transaction=False)
+        for inbox_id, message_id in lookups:
+            pipeline.zrangebyscore(inbox_id, message_id, message_id)
+        messages, stale = self._collect_thread(lookups, members, pipeline.execute())
+        if stale:
+            # Left behind by a removal racing with the addition of the message
+            self.redis.zrem(thread_key, *stale)
+        return messages
+
+    def schedule_message(self, message_bus_id: str, message: Message, deliver_at: int) -> None:
+        """
+        Add a message to the schedule of the message bus.
+
+        :param message: The message.
+        :param deliver_at: The due time of the message in milliseconds since the Unix epoch.
+        """
+        self.redis.zadd(self._get_schedule_id(message_bus_id), {self._encode(message): deliver_at})
+
+    def pop_due_messages(self, message_bus_id: str, now: int, limit: int) -> List[Message]:
+        """
+        Remove and return the scheduled messages which are due. A message is only returned
+        to the caller whose ZREM removed it, so several buses can share the schedule.
+
+        :param now: The current time in milliseconds since the Unix epoch.
+        :param limit: The maximum number of messages to return.
+        :return: The messages due, earliest first.
+        """
+        schedule_id = self._get_schedule_id(message_bus_id)
+        due = self.redis.zrangebyscore(schedule_id, "-inf", now, start=0, num=limit)
+        if not due:
+            return []
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for message_data in due:
+            pipeline.zrem(schedule_id, message_data)
+        removed = pipeline.execute()
+        return [self._decode(message_data) for message_data, count in zip(due, removed) if count]
+
+    def get_next_due_time(self, message_bus_id: str) -> Optional[int]:
+        """
+        Get the due time of the earliest scheduled message.
+
+        :return: The due time in milliseconds since the Unix epoch, or None if no message is scheduled.
+        """
+        earliest = self.redis.zrange(self._get_schedule_id(message_bus_id), 0, 0, withscores=True)
+        return int(earliest[0][1]) if earliest else None
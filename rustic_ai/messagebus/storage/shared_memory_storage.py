@@ -0,0 +1,693 @@
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import selectors
+import struct
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, cast
+
+from ..message import BinaryCodec, Message
+from ..utils import get_id_ranges
+from .limits import InboxFullError
+from .storage import StorageBackend
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+# An inbox entry is the message ID, used for ordering, and the encoded message
+InboxEntry = Tuple[int, bytes]
+
+
+def _is_running(pid: int) -> bool:
+    """
+    Tell whether a process is still running.
+    """
+    if sys.platform == "win32":  # pragma: no cover
+        # Signal 0 is not a probe on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedMemoryRing:
+    """
+    A ring buffer of records in a named shared memory segment, readable and writable from any local process.
+
+    The segment starts with the total number of bytes ever written and ever read, each on its own cache line,
+    followed by the ring. A record is its length and kind, followed by its payload. The writer copies a record
+    into the ring before publishing it by advancing the write offset, and the reader consumes records before
+    advancing the read offset, so the single reader never waits for writers and writers never wait for it.
+    Writers in different processes serialize on a file lock, opened once per ring, writers within a process
+    on a thread lock. The reader listens on a named pipe, which the writers of other processes signal.
+    """
+
+    WRITE_OFFSET = 0
+    READ_OFFSET = 64
+    DATA_OFFSET = 128
+
+    OFFSET = struct.Struct("=Q")
+    RECORD_HEADER = struct.Struct("!IB")
+
+    def __init__(self, name: str, capacity: int, create: bool) -> None:
+        """
+        Create or attach to a ring.
+
+        :param name: The name of the shared memory segment.
+        :param capacity: The size of the ring in bytes, used when creating it.
+        :param create: Whether to create the segment, or attach to an existing one.
+        """
+        self.name = name
+        if create:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=self.DATA_OFFSET + capacity)
+            self.memory.buf[: self.DATA_OFFSET] = bytes(self.DATA_OFFSET)  # type: ignore
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            # The segment belongs to the process that created it, not to the resource tracker of this one
+            resource_tracker.unregister(self.memory._name, "shared_memory")  # type: ignore
+        self.buffer = cast(memoryview, self.memory.buf)
+        self.capacity = self.memory.size - self.DATA_OFFSET
+        self.lock = threading.Lock()
+        self.lock_file = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self.lock_fd: Optional[int] = None
+        self.fifo = os.path.join(tempfile.gettempdir(), f"{name}.fifo")
+        # The ends of the pipe held by the reader, and the end the writers of other processes signal through
+        self.listen_fds: Optional[Tuple[int, int]] = None
+        self.signal_fd: Optional[int] = None
+
+    def _get_offset(self, position: int) -> int:
+        # Offsets only grow, read until two reads agree so a concurrent update is never seen half written
+        offset = self.OFFSET.unpack_from(self.buffer, position)[0]
+        while True:
+            again = self.OFFSET.unpack_from(self.buffer, position)[0]
+            if again == offset:
+                return offset
+            offset = again
+
+    def _set_offset(self, position: int, offset: int) -> None:
+        self.OFFSET.pack_into(self.buffer, position, offset)
+
+    def _copy_in(self, offset: int, data: bytes) -> None:
+        start = offset % self.capacity
+        first = min(len(data), self.capacity - start)
+        base = self.DATA_OFFSET
+        self.buffer[base + start : base + start + first] = data[:first]
+        self.buffer[base : base + len(data) - first] = data[first:]
+
+    def _copy_out(self, offset: int, length: int) -> bytes:
+        start = offset % self.capacity
+        first = min(length, self.capacity - start)
+        base = self.DATA_OFFSET
+        return bytes(self.buffer[base + start : base + start + first]) + bytes(
+            self.buffer[base : base + length - first]
+        )
+
+    @contextmanager
+    def _writer_lock(self) -> Iterator[None]:
+        with self.lock:
+            if fcntl is None:  # pragma: no cover
+                yield
+                return
+            if self.lock_fd is None:
+                self.lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def write(self, records: List[Tuple[int, bytes]]) -> None:
+        """
+        Append records to the ring, all or none of them.
+
+        :param records: The (kind, payload) records.
+        """
+        data = b"".join(self.RECORD_HEADER.pack(len(payload), kind) + payload for kind, payload in records)
+        with self._writer_lock():
+            write_offset = self._get_offset(self.WRITE_OFFSET)
+            read_offset = self._get_offset(self.READ_OFFSET)
+            if len(data) > self.capacity - (write_offset - read_offset):
+                raise InboxFullError(f"Shared memory ring {self.name} is full")
+            self._copy_in(write_offset, data)
+            self._set_offset(self.WRITE_OFFSET, write_offset + len(data))
+
+    def read(self) -> List[Tuple[int, bytes]]:
+        """
+        Consume all the records published so far. Only one process may read a ring.
+
+        :return: The (kind, payload) records.
+        """
+        read_offset = self._get_offset(self.READ_OFFSET)
+        write_offset = self._get_offset(self.WRITE_OFFSET)
+
+        records = []
+        while read_offset < write_offset:
+            length, kind = self.RECORD_HEADER.unpack(self._copy_out(read_offset, self.RECORD_HEADER.size))
+            records.append((kind, self._copy_out(read_offset + self.RECORD_HEADER.size, length)))
+            read_offset += self.RECORD_HEADER.size + length
+
+        self._set_offset(self.READ_OFFSET, read_offset)
+        return records
+
+    def listen(self) -> Optional[int]:
+        """
+        Create the named pipe of the ring and open it for reading, unless the platform has no named pipes.
+
+        :return: The end of the pipe to read the signals of the writers from.
+        """
+        if self.listen_fds is None and hasattr(os, "mkfifo"):
+            try:
+                os.mkfifo(self.fifo, 0o666)
+            except FileExistsError:
+                pass
+            read_fd = os.open(self.fifo, os.O_RDONLY | os.O_NONBLOCK)
+            # Holding a writing end too keeps the pipe from reporting the end of the file between writers
+            self.listen_fds = (read_fd, os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK))
+        return self.listen_fds[0] if self.listen_fds else None
+
+    def signal(self) -> None:
+        """
+        Wake the reader of the ring, when it listens from another process. A full pipe has a signal pending already,
+        and a pipe without a reader is opened again on the next signal.
+        """
+        if self.listen_fds is not None or not hasattr(os, "mkfifo"):
+            return
+        with self.lock:
+            try:
+                if self.signal_fd is None:
+                    self.signal_fd = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+                os.write(self.signal_fd, b"\0")
+            except BlockingIOError:
+                pass
+            except OSError:
+                if self.signal_fd is not None:
+                    os.close(self.signal_fd)
+                    self.signal_fd = None
+
+    def close(self) -> None:
+        fds = [self.lock_fd, self.signal_fd, *(self.listen_fds or ())]
+        for fd in fds:
+            if fd is not None:
+                os.close(fd)
+        self.lock_fd = self.signal_fd = self.listen_fds = None
+        self.memory.close()
+
+    def unlink(self) -> None:
+        self.memory.unlink()
+        for path in (self.lock_file, self.fifo):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ClientRegistry:
+    """
+    The clients of a message bus registered by the processes of a machine, kept in a directory of files.
+
+    Each client has a file holding its ID, the ID of its process and its topic patterns. A generation number,
+    mapped from a file of the directory and bumped by every change, tells the processes when to list the clients
+    again. The clients of processes no longer running are skipped.
+    """
+
+    GENERATION = struct.Struct("=Q")
+    SUFFIX = ".client"
+
+    def __init__(self, path: str) -> None:
+        """
+        Open the registry, creating it if needed.
+
+        :param path: The path of the directory of the registry.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = os.open(os.path.join(path, "generation"), os.O_RDWR | os.O_CREAT, 0o666)
+        with self._lock():
+            if os.fstat(self.fd).st_size < self.GENERATION.size:
+                os.ftruncate(self.fd, self.GENERATION.size)
+        self.generation = mmap.mmap(self.fd, self.GENERATION.size)
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        with self.lock:
+            if fcntl is None:  # pragma: no cover
+                yield
+                return
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _get_path(self, client_id: str) -> str:
+        digest = hashlib.sha256(client_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest[:24] + self.SUFFIX)
+
+    def _bump(self) -> None:
+        self.GENERATION.pack_into(self.generation, 0, self.get_generation() + 1)
+
+    def get_generation(self) -> int:
+        """
+        Get the number of changes of the registry so far.
+        """
+        return self.GENERATION.unpack_from(self.generation, 0)[0]
+
+    def add(self, client_id: str, topic_patterns: Iterable[str] = ()) -> None:
+        """
+        Register a client of this process, or update its topic patterns.
+
+        :param client_id: The ID of the client.
+        :param topic_patterns: The topic patterns the client subscribes to.
+        """
+        path = self._get_path(client_id)
+        entry = {"client_id": client_id, "pid": os.getpid(), "topic_patterns": sorted(topic_patterns)}
+        with self._lock():
+            # The entry is replaced at once, so it is never read half written
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(temporary_path, path)
+            self._bump()
+
+    def remove(self, client_id: str) -> None:
+        """
+        Unregister a client.
+
+        :param client_id: The ID of the client.
+        """
+        with self._lock():
+            try:
+                os.remove(self._get_path(client_id))
+            except FileNotFoundError:
+                return
+            self._bump()
+
+    def get_clients(self) -> Tuple[int, Dict[str, Set[str]]]:
+        """
+        List the clients of the running processes.
+
+        :return: The generation listed, and the topic patterns of each client.
+        """
+        generation = self.get_generation()
+        clients: Dict[str, Set[str]] = {}
+        for name in os.listdir(self.path):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.path, name)) as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                continue
+            if _is_running(entry["pid"]):
+                clients[entry["client_id"]] = set(entry["topic_patterns"])
+        return generation, clients
+
+    def close(self) -> None:
+        self.generation.close()
+        os.close(self.fd)
+
+
+class SharedMemoryStorage(StorageBackend):
+    """
+    A storage system whose inboxes can be written by the other processes of a machine.
+
+    Each inbox is a ring buffer in shared memory, created by the process of its client. Any local process
+    using a storage with the same namespace can write to it. Messages are encoded with the binary codec.
+    The process of the client moves the messages out of the ring into a priority queue as it reads them,
+    so only that process may read the inbox, remove it or query it by time.
+
+    The process of an inbox can watch it: every write from another process signals the named pipe of the inbox,
+    and a thread of the storage calls the function watching it. The registry of each bus lists the clients of
+    all the processes, which a SharedMemoryMessageBus routes to. A plain MessageBus only knows the clients of
+    its own process, which then find the messages of other processes by watching or polling their inboxes.
+    Scheduled messages are kept in a heap of the process scheduling them, until they are due. Threads are read
+    from the inboxes of this process, selecting their messages by the thread ID in the binary header.
+    """
+
+    MESSAGE = 0
+    REMOVAL = 1
+
+    REMOVAL_HEADER = struct.Struct("!Q")
+
+    def __init__(self, namespace: str = "rusticai", capacity: int = 1 << 20) -> None:
+        """
+        Initialize the storage.
+
+        :param namespace: The namespace of the shared memory segments, shared by the processes of a bus.
+        :param capacity: The size in bytes of the ring buffer of each inbox.
+        """
+        self.namespace = namespace
+        self.capacity = capacity
+        self.codec = BinaryCodec()
+        self.rings: Dict[Tuple[str, str], SharedMemoryRing] = {}
+        self.pending: Dict[Tuple[str, str], List[InboxEntry]] = {}
+        self.registries: Dict[str, ClientRegistry] = {}
+        # The scheduled messages of each bus, kept by the process which scheduled them
+        self.scheduled: Dict[str, List[Tuple[int, int, Message]]] = {}
+        self.lock = threading.RLock()
+        # The thread calling the functions watching the inboxes, woken up by the pipe of the selector to stop
+        self.selector: Optional[selectors.BaseSelector] = None
+        self.selector_pipe: Optional[Tuple[int, int]] = None
+        self.listener: Optional[threading.Thread] = None
+
+    def _get_segment_name(self, message_bus_id: str, client_id: str) -> str:
+        # Segment names are limited in length on some platforms, so the inbox is hashed
+        digest = hashlib.sha256(f"{self.namespace}/{message_bus_id}/{client_id}".encode("utf-8")).hexdigest()
+        return f"rmb_{digest[:24]}"
+
+    def get_registry(self, message_bus_id: str) -> ClientRegistry:
+        """
+        Get the registry of the clients of a bus, shared by the processes using this namespace.
+
+        :return: The registry.
+        """
+        with self.lock:
+            registry = self.registries.get(message_bus_id)
+            if registry is None:
+                digest = hashlib.sha256(f"{self.namespace}/{message_bus_id}".encode("utf-8")).hexdigest()
+                path = os.path.join(tempfile.gettempdir(), f"rmb_{digest[:24]}.clients")
+                registry = self.registries[message_bus_id] = ClientRegistry(path)
+            return registry
+
+    def _get_ring(self, message_bus_id: str, client_id: str) -> SharedMemoryRing:
+        key = (message_bus_id, client_id)
+        ring = self.rings.get(key)
+        if ring is None:
+            ring = SharedMemoryRing(self._get_segment_name(message_bus_id, client_id), self.capacity, create=False)
+            self.rings[key] = ring
+        return ring
+
+    def create_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Create the ring buffer of the inbox of a client, attaching to it if it already exists.
+
+        :param client_id: The ID of the client.
+        """
+        key = (message_bus_id, client_id)
+        with self.lock:
+            if key not in self.rings:
+                name = self._get_segment_name(message_bus_id, client_id)
+                try:
+                    self.rings[key] = SharedMemoryRing(name, self.capacity, create=True)
+                except FileExistsError:
+                    self.rings[key] = SharedMemoryRing(name, self.capacity, create=False)
+            self.rings[key].listen()
+            self.pending.setdefault(key, [])
+
+    def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Remove the inbox of a client and free its shared memory.
+
+        :param client_id: The ID of the client.
+        """
+        key = (message_bus_id, client_id)
+        with self.lock:
+            self.unwatch_inbox(message_bus_id, client_id)
+            self.pending.pop(key, None)
+            ring = self.rings.pop(key, None)
+            if ring is not None:
+                ring.close()
+                ring.unlink()
+
+    def detach_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Detach from the inbox of a client of another process, which may have removed it, so that the next write
+        attaches to its current ring.
+
+        :param client_id: The ID of the client.
+        """
+        key = (message_bus_id, client_id)
+        with self.lock:
+            if key not in self.pending and key in self.rings:
+                self.rings.pop(key).close()
+
+    def watch_inbox(self, message_bus_id: str, client_id: str, callback: Callable[[], None]) -> None:
+        """
+        Call a function, on a thread of the storage, whenever another process writes to an inbox of this process.
+        Without named pipes, the platform has no such signal and the inbox must be polled.
+
+        :param client_id: The ID of the client, whose inbox was created by this storage.
+        :param callback: The function to call.
+        """
+        with self.lock:
+            key = (message_bus_id, client_id)
+            if key not in self.pending or key not in self.rings:
+                raise ValueError(f"Inbox {client_id} was not created by this storage")
+            fd = self.rings[key].listen()
+            if fd is None:  # pragma: no cover
+                return
+            if self.selector is None:
+                self.selector = selectors.DefaultSelector()
+                self.selector_pipe = os.pipe()
+                self.selector.register(self.selector_pipe[0], selectors.EVENT_READ)
+                self.listener = threading.Thread(target=self._listen, args=(self.selector,), daemon=True)
+                self.listener.start()
+            if fd in self.selector.get_map():
+                self.selector.modify(fd, selectors.EVENT_READ, callback)
+            else:
+                self.selector.register(fd, selectors.EVENT_READ, callback)
+
+    def unwatch_inbox(self, message_bus_id: str, client_id: str) -> None:
+        """
+        Stop calling the function watching an inbox.
+
+        :param client_id: The ID of the client.
+        """
+        with self.lock:
+            ring = self.rings.get((message_bus_id, client_id))
+            if self.selector is not None and ring is not None and ring.listen_fds is not None:
+                if ring.listen_fds[0] in self.selector.get_map():
+                    self.selector.unregister(ring.listen_fds[0])
+
+    def _listen(self, selector: selectors.BaseSelector) -> None:
+        """
+        Call the functions watching the inboxes signalled, until the pipe of the selector is written to.
+        """
+        while True:
+            for key, _ in selector.select():
+                if key.data is None:
+                    return
+                with self.lock:
+                    # The inbox may have been removed meanwhile, and its descriptor reused
+                    if selector.get_map().get(key.fd) is not key:
+                        continue
+                    try:
+                        # One call covers all the signals pending
+                        while os.read(key.fd, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                try:
+                    key.data()
+                except Exception:
+                    logging.exception("Failed to notify the watcher of an inbox")
+
+    def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        """
+        Add a message to the recipient's inbox.
+
+        :param recipient_id: The ID of the recipient client.
+        :param message: The message to be added.
+        """
+        self.add_messages_to_inbox(message_bus_id, recipient_id, [message])
+
+    def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient with a single write to its ring.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        if not messages:
+            return
+        records = [(self.MESSAGE, message.encode(self.codec.name)) for message in messages]
+        with self.lock:
+            ring = self._get_ring(message_bus_id, recipient_id)
+        ring.write(records)
+        ring.signal()
+
+    def _drain(self, message_bus_id: str, client_id: str) -> List[InboxEntry]:
+        """
+        Move the messages published in the ring of an inbox to its priority queue.
+
+        :return: The priority queue of the inbox, as a heap of (message ID, record) entries.
+        """
+        key = (message_bus_id, client_id)
+        pending = self.pending.setdefault(key, [])
+        if key not in self.rings:
+            return pending
+
+        for kind, payload in self.rings[key].read():
+            if kind == self.MESSAGE:
+                heapq.heappush(pending, (self.codec.HEADER.unpack_from(payload, 1)[0], payload))
+            else:
+                message_id = self.REMOVAL_HEADER.unpack_from(payload)[0]
+                sender_id = payload[self.REMOVAL_HEADER.size :].decode("utf-8")
+                kept = [
+                    entry for entry in pending if entry[0] != message_id or Message.decode(entry[1]).sender != sender_id
+                ]
+                if len(kept) != len(pending):
+                    heapq.heapify(kept)
+                    pending[:] = kept
+        return pending
+
+    def get_next_unread_message(
+        self, message_bus_id: str, recipient_id: str, last_read_message_id: int
+    ) -> Optional[Message]:
+        """
+        Retrieve the next unread message for a client.
+
+        :param recipient_id: The ID of the recipient client.
+        :param last_read_message_id: The ID of the last read message.
+        :return: The next unread message, if one exists.
+        """
+        with self.lock:
+            pending = self._drain(message_bus_id, recipient_id)
+            while pending:
+                message_id, record = heapq.heappop(pending)
+                if message_id != last_read_message_id:
+                    message = Message.decode(record)
+                    if not message.is_expired():
+                        return message
+            return None
+
+    def remove_received_message(
+        self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
+    ) -> None:
+        """
+        Remove a sent message from the recipient's inbox. The removal is queued in the ring of each
+        inbox, behind the message, and applied by the process of the recipient.
+
+        :param sender_id: The ID of the sender client.
+        :param recipient_ids: The List of IDs for the recipient client.
+        :param message_id: The ID of the message to be removed.
+        """
+        removal = self.REMOVAL_HEADER.pack(message_id) + sender_id.encode("utf-8")
+        for recipient_id in recipient_ids:
+            with self.lock:
+                ring = self._get_ring(message_bus_id, recipient_id)
+            ring.write([(self.REMOVAL, removal)])
+
+    def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+        with self.lock:
+            pending = self._drain(message_bus_id, recipient_id)
+            selected = sorted(entry for entry in pending if any(low <= entry[0] < high for low, high in id_ranges))
+        messages = [Message.decode(record) for _, record in selected]
+        return [message for message in messages if not message.is_expired()]
+
+    def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+        with self.lock:
+            pending = self._drain(message_bus_id, recipient_id)
+            kept = [entry for entry in pending if not any(low <= entry[0] < high for low, high in id_ranges)]
+            removed = len(pending) - len(kept)
+            heapq.heapify(kept)
+            pending[:] = kept
+        return removed
+
+    def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread held by the inboxes of this process. The inboxes are drained first,
+        and only the records whose header holds the thread ID are decoded.
+
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        records: Dict[int, bytes] = {}
+        with self.lock:
+            for key in [key for key in self.pending if key[0] == message_bus_id]:
+                for message_id, record in self._drain(*key):
+                    if self.codec.HEADER.unpack_from(record, 1)[1] == thread_id:
+                        records.setdefault(message_id, record)
+        messages = [Message.decode(records[message_id]) for message_id in sorted(records)]
+        return [message for message in messages if not message.is_expired()]
+
+    def schedule_message(self, message_bus_id: str, message: Message, deliver_at: int) -> None:
+        """
+        Keep a message in the heap of scheduled messages of this process until it is due.
+
+        :param message: The message.
+        :param deliver_at: The due time of the message in milliseconds since the Unix epoch.
+        """
+        with self.lock:
+            heapq.heappush(self.scheduled.setdefault(message_bus_id, []), (deliver_at, message.id, message))
+
+    def pop_due_messages(self, message_bus_id: str, now: int, limit: int) -> List[Message]:
+        """
+        Remove and return the scheduled messages which are due.
+
+        :param now: The current time in milliseconds since the Unix epoch.
+        :param limit: The maximum number of messages to return.
+        :return: The messages due, earliest first.
+        """
+        with self.lock:
+            scheduled = self.scheduled.get(message_bus_id, [])
+            messages: List[Message] = []
+            while scheduled and scheduled[0][0] <= now and len(messages) < limit:
+                messages.append(heapq.heappop(scheduled)[2])
+            return messages
+
+    def get_next_due_time(self, message_bus_id: str) -> Optional[int]:
+        """
+        Get the due time of the earliest scheduled message.
+
+        :return: The due time in milliseconds since the Unix epoch, or None if no message is scheduled.
+        """
+        with self.lock:
+            scheduled = self.scheduled.get(message_bus_id)
+            return scheduled[0][0] if scheduled else None
+
+    def close(self) -> None:
+        """
+        Stop watching the inboxes and detach from all the shared memory segments, without removing the inboxes.
+        """
+        with self.lock:
+            selector, selector_pipe, listener = self.selector, self.selector_pipe, self.listener
+            self.selector = self.selector_pipe = self.listener = None
+        if selector is not None and selector_pipe is not None and listener is not None:
+            # The functions watching the inboxes may use the storage, so the listener is joined without the lock
+            os.write(selector_pipe[1], b"\0")
+            listener.join()
+            selector.close()
+            for fd in selector_pipe:
+                os.close(fd)
+        with self.lock:
+            for ring in self.rings.values():
+                ring.close()
+            self.rings.clear()
+            for registry in self.registries.values():
+                registry.close()
+            self.registries.clear()
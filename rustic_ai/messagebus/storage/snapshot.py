@@ -0,0 +1,194 @@
+import mmap
+import os
+import struct
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from ..message import Message
+from .limits import InboxKey
+
+# The offset and the length of the segment of an inbox in a snapshot file
+Segment = Tuple[int, int]
+
+
+class SnapshotFile:
+    """
+    An append-only file of encoded inboxes, holding the snapshots of an in-memory storage.
+
+    The file starts with a header locating the index of the latest snapshot. A snapshot appends a segment
+    for each inbox changed since the previous one and a new index of the segments of all the inboxes,
+    then points the header at the new index once both are on disk. A crash while saving a snapshot
+    therefore leaves the previous one in place. The file is compacted when the segments no longer indexed
+    outgrow the live ones.
+
+    A segment is the sequence of the length prefixed, binary encoded messages of an inbox. The file is
+    memory-mapped when opened, so an inbox of the snapshot is decoded only when it is read, and the content
+    of its messages stays in the mapped pages until it is accessed.
+    """
+
+    MAGIC = b"RUSTSNAP"
+
+    # magic, index offset, index length
+    HEADER = struct.Struct("!8sQQ")
+    # segment offset, segment length, message bus ID length, client ID length
+    INDEX_ENTRY = struct.Struct("!QQHH")
+    RECORD_LENGTH = struct.Struct("!I")
+
+    def __init__(self, path: str, compaction_ratio: float = 2.0) -> None:
+        """
+        Open a snapshot file, creating it if it does not exist.
+
+        :param path: The path of the file.
+        :param compaction_ratio: How many times larger than its live content the file grows before it is compacted.
+        """
+        self.path = path
+        self.compaction_ratio = compaction_ratio
+        self.codec = Message.get_codec("binary")
+
+        if not os.path.exists(path):
+            self._write_file(path, b"", {})
+        self.file = open(path, "r+b")
+        self.view: Optional[mmap.mmap] = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = self.HEADER.unpack_from(self.view)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+
+        # The segments of the latest snapshot in the file, and those of the snapshot found in the memory map
+        self.segments: Dict[InboxKey, Segment] = self._decode_index(
+            self.view[index_offset : index_offset + index_length]
+        )
+        self.mapped_segments = dict(self.segments)
+        self.size = os.path.getsize(path)
+
+    def get_mapped_inboxes(self) -> List[InboxKey]:
+        """
+        Get the inboxes of the snapshot found when the file was opened.
+
+        :return: The inboxes, as (message bus ID, client ID).
+        """
+        return list(self.mapped_segments)
+
+    def read_inbox(self, key: InboxKey) -> List[Message]:
+        """
+        Decode the messages of an inbox of the snapshot found when the file was opened.
+
+        :param key: The inbox.
+        :return: The messages of the inbox, their content still in the memory map.
+        """
+        offset, length = self.mapped_segments[key]
+        if self.view is None:
+            raise ValueError(f"Snapshot file {self.path} is closed")
+
+        view = memoryview(self.view)
+        messages = []
+        end = offset + length
+        while offset < end:
+            record_length = self.RECORD_LENGTH.unpack_from(view, offset)[0]
+            offset += self.RECORD_LENGTH.size
+            messages.append(self.codec.decode(view[offset : offset + record_length]))
+            offset += record_length
+        return messages
+
+    def save(self, inboxes: Mapping[InboxKey, Optional[List[Message]]]) -> None:
+        """
+        Save a snapshot of the inboxes changed since the previous one.
+
+        :param inboxes: The messages of each changed inbox, None for the inboxes removed.
+        """
+        segments = dict(self.segments)
+        offset = self.size
+        chunks = []
+        for key, messages in inboxes.items():
+            if messages is None:
+                segments.pop(key, None)
+                continue
+            segment = self._encode_segment(messages)
+            segments[key] = (offset, len(segment))
+            chunks.append(segment)
+            offset += len(segment)
+        index = self._encode_index(segments)
+        chunks.append(index)
+
+        self.file.seek(self.size)
+        self.file.write(b"".join(chunks))
+        self._sync()
+        self.file.seek(0)
+        self.file.write(self.HEADER.pack(self.MAGIC, offset, len(index)))
+        self._sync()
+        self.segments = segments
+        self.size = offset + len(index)
+
+        live_size = self.HEADER.size + sum(length for _, length in segments.values()) + len(index)
+        if self.size > self.compaction_ratio * live_size:
+            self._compact()
+
+    def _compact(self) -> None:
+        """
+        Rewrite the file with the segments of the latest snapshot only, copied as they are.
+
+        The file is replaced rather than truncated, so the pages of the memory map stay valid.
+        """
+        segments: Dict[InboxKey, Segment] = {}
+        chunks = []
+        offset = self.HEADER.size
+        for key, (old_offset, length) in self.segments.items():
+            self.file.seek(old_offset)
+            chunks.append(self.file.read(length))
+            segments[key] = (offset, length)
+            offset += length
+
+        temporary_path = f"{self.path}.tmp"
+        self._write_file(temporary_path, b"".join(chunks), segments)
+        os.replace(temporary_path, self.path)
+        self.file.close()
+        self.file = open(self.path, "r+b")
+        self.segments = segments
+        self.size = os.path.getsize(self.path)
+
+    def _write_file(self, path: str, data: bytes, segments: Dict[InboxKey, Segment]) -> None:
+        """
+        Write a complete file, given the segments following its header.
+        """
+        index = self._encode_index(segments)
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.HEADER.size + len(data), len(index)))
+            f.write(data)
+            f.write(index)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _encode_segment(self, messages: List[Message]) -> bytes:
+        # The codec is used directly, so the encoded messages are not cached by the messages in memory
+        records = [self.codec.encode(message) for message in messages]
+        return b"".join(self.RECORD_LENGTH.pack(len(record)) + record for record in records)
+
+    def _encode_index(self, segments: Dict[InboxKey, Segment]) -> bytes:
+        entries = []
+        for (message_bus_id, client_id), (offset, length) in segments.items():
+            bus = message_bus_id.encode("utf-8")
+            client = client_id.encode("utf-8")
+            entries.append(self.INDEX_ENTRY.pack(offset, length, len(bus), len(client)) + bus + client)
+        return b"".join(entries)
+
+    def _decode_index(self, data: bytes) -> Dict[InboxKey, Segment]:
+        segments: Dict[InboxKey, Segment] = {}
+        offset = 0
+        while offset < len(data):
+            segment_offset, length, bus_length, client_length = self.INDEX_ENTRY.unpack_from(data, offset)
+            offset += self.INDEX_ENTRY.size
+            message_bus_id = data[offset : offset + bus_length].decode("utf-8")
+            offset += bus_length
+            client_id = data[offset : offset + client_length].decode("utf-8")
+            offset += client_length
+            segments[(message_bus_id, client_id)] = (segment_offset, length)
+        return segments
+
+    def close(self) -> None:
+        """
+        Close the file. The memory map is released once no message read from it is left.
+        """
+        self.file.close()
+        self.view = None
@@ -1,31 +1,55 @@
-import json
-from typing import Any, List, Optional
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
-from sqlalchemy import BigInteger, Column, Enum, Numeric, String, create_engine
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Enum,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    and_,
+    create_engine,
+    delete,
+    func,
+    insert,
+    inspect,
+    or_,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.orm.decl_api import declarative_base
 from sqlalchemy.types import TypeDecorator
 
 from ..message import Message
-from ..utils import Priority
+from ..utils import Priority, get_id_ranges
+from .blob_store import BlobStore, blob_reference, get_blob_digest
+from .compression import Compressor, decompress
 from .storage import StorageBackend
 
 
 class BigIntType(TypeDecorator):
     """
-    A type decorator for SQLAlchemy to support 64-bit integers.
+    A type decorator for SQLAlchemy to store unsigned 64-bit integers, such as message IDs, in a BIGINT column.
+
+    Values are shifted down by 2^63 to fit the signed column. The shift keeps their order, so sorting
+    and range scans on the column behave as on the original values, and no precision is lost.
     """
 
     impl = BigInteger
 
     cache_ok = True
 
-    def load_dialect_impl(self, dialect):  # pragma: no cover
-        if dialect.name == "sqlite":
-            return dialect.type_descriptor(Numeric)
-        else:
-            return dialect.type_descriptor(BigInteger)
+    OFFSET = 1 << 63
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(value) - self.OFFSET
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else int(value) + self.OFFSET
 
 
 Base: Any = declarative_base()
@@ -42,8 +66,182 @@ class MessageTable(Base):
     message_bus_id = Column(String, primary_key=True)
     recipient_id = Column(String, primary_key=True)
     sender_id = Column(String)
-    content = Column(String)
+    content = Column(LargeBinary)
     priority = Column(Enum(Priority))
+    expires_at = Column(BigInteger, nullable=True)
+    thread_id = Column(BigIntType, nullable=True)
+    in_reply_to = Column(BigIntType, nullable=True)
+    topic = Column(String, nullable=True)
+
+    # The expired messages of an inbox are found with a range scan on the expiry index,
+    # and the messages of a thread, in order, with a range scan on the thread index
+    __table_args__ = (
+        Index("ix_message_expiry", "message_bus_id", "recipient_id", "expires_at"),
+        Index("ix_message_thread", "message_bus_id", "thread_id", "id"),
+    )
+
+
+def unexpired(now: Optional[int] = None) -> Any:
+    """
+    Build the condition selecting the messages which have not expired.
+
+    :param now: The current time in milliseconds since the Unix epoch, the wall clock time if not given.
+    :return: The condition on the message table.
+    """
+    if now is None:
+        now = time.time_ns() // 1_000_000
+    return or_(MessageTable.expires_at.is_(None), MessageTable.expires_at > now)
+
+
+class ScheduledMessageTable(Base):
+    """
+    A table to keep scheduled messages in until they are due.
+    """
+
+    __tablename__ = "scheduled_message"
+
+    id = Column(BigIntType, primary_key=True)
+    message_bus_id = Column(String, primary_key=True)
+    deliver_at = Column(BigInteger, nullable=False)
+    record = Column(LargeBinary)
+
+    # The messages due are found with a range scan on this index
+    __table_args__ = (Index("ix_scheduled_message_due", "message_bus_id", "deliver_at"),)
+
+
+class BlobTable(Base):
+    """
+    A table to store large message contents in, once per content.
+    """
+
+    __tablename__ = "blob"
+
+    digest = Column(String, primary_key=True)
+    data = Column(LargeBinary)
+    references = Column(Integer, nullable=False)
+
+
+class SchemaVersionTable(Base):
+    """
+    A table holding the version of the layout of the other tables.
+    """
+
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+
+
+# Version 1 stores the IDs shifted by 2^63, the contents as binary, and the expiry and thread columns
+SCHEMA_VERSION = 1
+
+
+class SchemaVersionError(Exception):
+    """
+    Raised when the tables of a database were created with a layout the storage cannot read.
+    """
+
+    pass
+
+
+def create_tables(connection: Connection) -> None:
+    """
+    Create the tables of the SQL storages, or check the version of the existing ones.
+
+    The message table of a database without a schema version was created before the IDs were shifted,
+    and before the content became binary and the expiry and thread columns were added. Its rows would be
+    read as other IDs, so it has to be migrated or dropped rather than used.
+
+    :param connection: A connection to the database, in a transaction.
+    """
+    inspector = inspect(connection)
+    if inspector.has_table(MessageTable.__tablename__) and not inspector.has_table(SchemaVersionTable.__tablename__):
+        raise SchemaVersionError(
+            f"The message table predates schema version {SCHEMA_VERSION} and has to be migrated or dropped"
+        )
+
+    Base.metadata.create_all(connection)
+    version = connection.execute(SchemaVersionTable.__table__.select()).scalar()
+    if version is None:
+        connection.execute(insert(SchemaVersionTable.__table__).values(version=SCHEMA_VERSION))
+    elif version != SCHEMA_VERSION:
+        raise SchemaVersionError(f"The tables have schema version {version}, not {SCHEMA_VERSION}")
+
+
+class SQLBlobStore(BlobStore):
+    """
+    A blob store keeping payloads in the blob table.
+
+    Every method takes an optional session, so blob updates can share the transaction of the message rows.
+    Reference counts are changed by a single statement, an upsert when a payload is stored, so stores
+    sharing the database do not lose each other's updates.
+    """
+
+    # The dialects storing a payload with INSERT ... ON CONFLICT DO UPDATE
+    UPSERT_DIALECTS: Dict[str, Any] = {"postgresql": postgresql, "sqlite": sqlite}
+
+    def __init__(self, session_factory: sessionmaker) -> None:
+        """
+        Initialize the blob store.
+
+        :param session_factory: The session factory of the database holding the blob table.
+        """
+        self.Session = session_factory
+
+    def put(self, data: bytes, references: int = 1, session: Optional[Session] = None) -> str:
+        if session is None:
+            with self.Session.begin() as session:  # type: ignore
+                return self.put(data, references, session)
+
+        digest = self.digest(data)
+        dialect = session.get_bind().dialect.name
+        if dialect in self.UPSERT_DIALECTS:
+            statement = (
+                self.UPSERT_DIALECTS[dialect].insert(BlobTable).values(digest=digest, data=data, references=references)
+            )
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[BlobTable.digest], set_={"references": BlobTable.references + references}
+                )
+            )
+            return digest
+
+        # Other databases have no portable upsert, the row is locked while its count is updated
+        blob = session.query(BlobTable).filter(BlobTable.digest == digest).with_for_update().first()
+        if blob is None:
+            session.add(BlobTable(digest=digest, data=data, references=references))
+        else:
+            blob.references += references
+        return digest
+
+    def get(self, digest: str, session: Optional[Session] = None) -> memoryview:
+        if session is None:
+            with self.Session() as session:
+                return self.get(digest, session)
+
+        data = session.query(BlobTable.data).filter(BlobTable.digest == digest).scalar()
+        if data is None:
+            raise KeyError(digest)
+        return memoryview(data).toreadonly()
+
+    def release(self, digest: str, references: int = 1, session: Optional[Session] = None) -> None:
+        if session is None:
+            with self.Session.begin() as session:  # type: ignore
+                return self.release(digest, references, session)
+
+        session.execute(
+            update(BlobTable.__table__)
+            .where(BlobTable.digest == digest)
+            .values(references=BlobTable.references - references)
+        )
+        session.execute(delete(BlobTable.__table__).where(and_(BlobTable.digest == digest, BlobTable.references <= 0)))
+
+    def __contains__(self, digest: object) -> bool:
+        with self.Session() as session:
+            return session.query(BlobTable.digest).filter(BlobTable.digest == digest).first() is not None
+
+    def __len__(self) -> int:
+        with self.Session() as session:
+            return session.query(BlobTable).count()
 
 
 class SQLStorage(StorageBackend):
@@ -51,15 +249,26 @@ class SQLStorage(StorageBackend):
     A SQL based storage system for the message bus.
     """
 
-    def __init__(self, connection_string: str):
+    def __init__(
+        self,
+        connection_string: str,
+        compression: Optional[Compressor] = None,
+        blob_threshold: Optional[int] = None,
+    ):
         """
         Initialize the storage system.
 
         :param connection_string: SQLAlchemy compatible connection string
+        :param compression: Optional compressor applied to large message contents
+        :param blob_threshold: Optional content size in bytes from which contents are stored once in the blob table
         """
+        self.compression = compression
+        self.blob_threshold = blob_threshold
         self.engine: Engine = create_engine(connection_string)
-        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            create_tables(connection)
         self.Session = sessionmaker(bind=self.engine)
+        self.blob_store = SQLBlobStore(self.Session)
 
     def create_inbox(self, message_bus_id: str, client_id: str) -> None:
         # No action required as inboxes are not explicitly created in this storage
@@ -73,9 +282,9 @@ class SQLStorage(StorageBackend):
         :param client_id: The ID of the client.
         """
         with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
-            session.query(MessageTable).filter_by(message_bus_id=message_bus_id, recipient_id=client_id).delete(
-                synchronize_session=False
-            )
+            query = session.query(MessageTable).filter_by(message_bus_id=message_bus_id, recipient_id=client_id)
+            self._release_blobs(session, query)
+            query.delete(synchronize_session=False)
 
     def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
         """
@@ -85,16 +294,82 @@ class SQLStorage(StorageBackend):
         :param recipient_id: The ID of the recipient client.
         :param message: The message to be added.
         """
+        self.add_message_to_inboxes(message_bus_id, [recipient_id], message)
+
+    def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients in a single transaction.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
         with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
-            new_message = MessageTable(
-                id=message.id,
-                message_bus_id=message_bus_id,
-                sender_id=message.sender,
-                recipient_id=recipient_id,
-                content=message.get_content(),
-                priority=message.priority,
+            content = self._store_content(session, message, len(recipient_ids))
+            session.add_all(
+                [
+                    MessageTable(
+                        id=message.id,
+                        message_bus_id=message_bus_id,
+                        sender_id=message.sender,
+                        recipient_id=recipient_id,
+                        content=content,
+                        priority=message.priority,
+                        expires_at=message.expires_at,
+                        thread_id=message.thread_id,
+                        in_reply_to=message.in_reply_to,
+                        topic=message.topic,
+                    )
+                    for recipient_id in recipient_ids
+                ]
             )
-            session.add(new_message)
+
+    def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient with a single multi-row insert.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        if not messages:
+            return
+
+        with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
+            session.execute(
+                insert(MessageTable.__table__),
+                [
+                    {
+                        "id": message.id,
+                        "message_bus_id": message_bus_id,
+                        "sender_id": message.sender,
+                        "recipient_id": recipient_id,
+                        "content": self._store_content(session, message, 1),
+                        "priority": message.priority,
+                        "expires_at": message.expires_at,
+                        "thread_id": message.thread_id,
+                        "in_reply_to": message.in_reply_to,
+                        "topic": message.topic,
+                    }
+                    for message in messages
+                ],
+            )
+
+    def _store_content(self, session: Session, message: Message, references: int) -> bytes:
+        """
+        Prepare the content of a message for its rows, moving it to the blob table if it is large.
+
+        :param session: The session adding the message.
+        :param message: The message.
+        :param references: The number of rows that will hold the content.
+        :return: The content to store in the rows.
+        """
+        content = message.get_content().encode("utf-8")
+        if self.compression:
+            content = self.compression.compress(content)
+        if self.blob_threshold is not None and len(content) >= self.blob_threshold:
+            content = blob_reference(self.blob_store.put(content, references, session))
+        return content
 
     def get_next_unread_message(
         self, message_bus_id: str, recipient_id: str, last_read_message_id: int
@@ -114,21 +389,133 @@ class SQLStorage(StorageBackend):
                     MessageTable.message_bus_id == message_bus_id,
                     MessageTable.recipient_id == recipient_id,
                     MessageTable.id > last_read_message_id,
+                    unexpired(),
                 )
                 .order_by(MessageTable.id)
                 .first()
             )
             if result is not None:
-                message = Message(
-                    int(result.id),
-                    result.sender_id,
-                    json.loads(result.content),
-                    priority=result.priority,
-                )
-                return message
+                return self._to_message(session, result)
             else:
                 return None
 
+    def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+        if not id_ranges:
+            return []
+
+        with self.Session() as session:
+            query = self._query_time_range(session, message_bus_id, recipient_id, id_ranges).filter(unexpired())
+            return [self._to_message(session, result) for result in query.order_by(MessageTable.id)]
+
+    def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        id_ranges = get_id_ranges(start_timestamp, end_timestamp)
+        if not id_ranges:
+            return 0
+
+        with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
+            query = self._query_time_range(session, message_bus_id, recipient_id, id_ranges)
+            self._release_blobs(session, query)
+            return query.delete(synchronize_session=False)
+
+    @staticmethod
+    def _query_time_range(
+        session: Session, message_bus_id: str, recipient_id: str, id_ranges: List[Tuple[int, int]]
+    ) -> Any:
+        """
+        Query the messages of an inbox within the given ID ranges, one range scan per priority band.
+
+        :param session: The session to query with.
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :param id_ranges: The (lowest, highest) bounds of the IDs, the highest being exclusive.
+        :return: The query.
+        """
+        return session.query(MessageTable).filter(
+            MessageTable.message_bus_id == message_bus_id,
+            MessageTable.recipient_id == recipient_id,
+            or_(*[MessageTable.id.between(low, high - 1) for low, high in id_ranges]),
+        )
+
+    def _to_message(self, session: Session, result: Any) -> Message:
+        """
+        Build a message from its row, resolving its content from the blob table if needed.
+
+        :param session: The session the row was read with.
+        :param result: The row.
+        :return: The message.
+        """
+        content: Union[bytes, memoryview] = result.content
+        digest = get_blob_digest(content)
+        if digest is not None:
+            content = self.blob_store.get(digest, session)
+        return Message.from_encoded_content(
+            int(result.id),
+            result.sender_id,
+            decompress(content),
+            priority=result.priority,
+            thread_id=result.thread_id,
+            in_reply_to=result.in_reply_to,
+            topic=result.topic,
+            expires_at=result.expires_at,
+        )
+
+    def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread, found with a range scan on the thread index.
+
+        :param message_bus_id: The ID of the message bus.
+        :param thread_id: The ID of the thread.
+        :return: The messages of the thread, once each, ordered by ID.
+        """
+        with self.Session() as session:
+            results = (
+                session.query(MessageTable)
+                .filter(
+                    MessageTable.message_bus_id == message_bus_id,
+                    MessageTable.thread_id == thread_id,
+                    unexpired(),
+                )
+                .order_by(MessageTable.id)
+            )
+            return self._unique_messages(session, results)
+
+    def _unique_messages(self, session: Session, results: Iterable[Any]) -> List[Message]:
+        """
+        Build the messages of rows ordered by ID, once for the rows of all their recipients.
+
+        :param session: The session the rows were read with.
+        :param results: The rows.
+        :return: The messages.
+        """
+        messages: List[Message] = []
+        for result in results:
+            if not messages or messages[-1].id != int(result.id):
+                messages.append(self._to_message(session, result))
+        return messages
+
     def remove_received_message(
         self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
     ) -> None:
@@ -141,12 +528,112 @@ class SQLStorage(StorageBackend):
         :param message_id: The ID of the message to be removed.
         """
         with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
-            session.query(MessageTable).filter(
+            query = session.query(MessageTable).filter(
                 MessageTable.message_bus_id == message_bus_id,
                 MessageTable.recipient_id.in_(recipient_ids),
                 MessageTable.sender_id == sender_id,
                 MessageTable.id == message_id,
+            )
+            self._release_blobs(session, query)
+            query.delete(synchronize_session=False)
+
+    def purge_expired_messages(self, message_bus_id: str, recipient_id: str) -> int:
+        """
+        Remove the expired messages of an inbox, found with a range scan on the expiry index.
+
+        :param message_bus_id: The ID of the message bus.
+        :param recipient_id: The ID of the recipient client.
+        :return: The number of messages removed.
+        """
+        with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
+            query = session.query(MessageTable).filter(
+                MessageTable.message_bus_id == message_bus_id,
+                MessageTable.recipient_id == recipient_id,
+                MessageTable.expires_at <= time.time_ns() // 1_000_000,
+            )
+            self._release_blobs(session, query)
+            return query.delete(synchronize_session=False)
+
+    def schedule_message(self, message_bus_id: str, message: Message, deliver_at: int) -> None:
+        """
+        Keep a message in the table of scheduled messages until it is due.
+
+        :param message_bus_id: The ID of the message bus.
+        :param message: The message.
+        :param deliver_at: The due time of the message in milliseconds since the Unix epoch.
+        """
+        record = message.encode("json")
+        if self.compression:
+            record = self.compression.compress(record)
+        with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
+            session.add(
+                ScheduledMessageTable(
+                    id=message.id, message_bus_id=message_bus_id, deliver_at=deliver_at, record=record
+                )
+            )
+
+    def pop_due_messages(self, message_bus_id: str, now: int, limit: int) -> List[Message]:
+        """
+        Remove and return the scheduled messages which are due. The rows are locked and skipped
+        by the other buses sharing the table, on the databases supporting it.
+
+        :param message_bus_id: The ID of the message bus.
+        :param now: The current time in milliseconds since the Unix epoch.
+        :param limit: The maximum number of messages to return.
+        :return: The messages due, earliest first.
+        """
+        with self.Session.begin() as session:  # type: ignore  # mypy cries about sessionmaker doesn't have begin method
+            rows = (
+                session.query(ScheduledMessageTable)
+                .filter(
+                    ScheduledMessageTable.message_bus_id == message_bus_id,
+                    ScheduledMessageTable.deliver_at <= now,
+                )
+                .order_by(ScheduledMessageTable.deliver_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not rows:
+                return []
+
+            messages = [Message.decode(decompress(row.record)) for row in rows]
+            session.query(ScheduledMessageTable).filter(
+                ScheduledMessageTable.message_bus_id == message_bus_id,
+                ScheduledMessageTable.id.in_([int(row.id) for row in rows]),
             ).delete(synchronize_session=False)
+            return messages
+
+    def get_next_due_time(self, message_bus_id: str) -> Optional[int]:
+        """
+        Get the due time of the earliest scheduled message.
+
+        :param message_bus_id: The ID of the message bus.
+        :return: The due time in milliseconds since the Unix epoch, or None if no message is scheduled.
+        """
+        with self.Session() as session:
+            return (
+                session.query(func.min(ScheduledMessageTable.deliver_at))
+                .filter(ScheduledMessageTable.message_bus_id == message_bus_id)
+                .scalar()
+            )
+
+    def _release_blobs(self, session: Session, query: Any) -> None:
+        """
+        Release the blobs referenced by the messages a query selects, before the messages are deleted.
+        Nothing is selected unless the blob store is in use.
+
+        :param session: The session deleting the messages.
+        :param query: The query selecting the messages.
+        """
+        if self.blob_threshold is None:
+            return
+
+        contents: Iterable[bytes] = (row.content for row in query.with_entities(MessageTable.content))
+        for content in contents:
+            digest = get_blob_digest(content)
+            if digest is not None:
+                self.blob_store.release(digest, 1, session)
 
     def close_connection(self) -> None:
         """
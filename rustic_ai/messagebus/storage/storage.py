@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from typing import List, Optional
 
 from ..message import Message
+from ..utils import EPOCH, get_timestamp
 
 
 class StorageBackend(ABC):
@@ -37,6 +38,31 @@ class StorageBackend(ABC):
         """
         pass  # pragma: no cover
 
+    def add_message_to_inboxes(self, message_bus_id: str, recipient_ids: List[str], message: Message) -> None:
+        """
+        Add a message to the inboxes of all the given recipients.
+
+        Backends that encode messages should override this to encode the message once and share
+        the encoded payload across all the recipients.
+
+        :param recipient_ids: The IDs of the recipient clients.
+        :param message: The message to be added.
+        """
+        for recipient_id in recipient_ids:
+            self.add_message_to_inbox(message_bus_id, recipient_id, message)
+
+    def add_messages_to_inbox(self, message_bus_id: str, recipient_id: str, messages: List[Message]) -> None:
+        """
+        Add a batch of messages to the inbox of a recipient.
+
+        Backends should override this to write the whole batch in a single operation.
+
+        :param recipient_id: The ID of the recipient client.
+        :param messages: The messages to be added.
+        """
+        for message in messages:
+            self.add_message_to_inbox(message_bus_id, recipient_id, message)
+
     @abstractmethod
     def get_next_unread_message(
         self, message_bus_id: str, recipient_id: str, last_read_message_id: int
@@ -62,3 +88,109 @@ class StorageBackend(ABC):
         :param message_id: The ID of the message to be removed.
         """
         pass  # pragma: no cover
+
+    def get_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> List[Message]:
+        """
+        Read the messages of an inbox sent within a time window, without removing them.
+
+        The timestamp is part of the message ID, so backends should override this with one range scan
+        over the IDs of each priority band, see `get_id_ranges`. The default reads the whole inbox.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The messages, ordered by ID.
+        """
+        messages: List[Message] = []
+        message = self.get_next_unread_message(message_bus_id, recipient_id, 0)
+        while message is not None:
+            if start_timestamp <= get_timestamp(message.id) < end_timestamp:
+                messages.append(message)
+            message = self.get_next_unread_message(message_bus_id, recipient_id, message.id)
+        return messages
+
+    def remove_messages_in_time_range(
+        self, message_bus_id: str, recipient_id: str, start_timestamp: int, end_timestamp: int
+    ) -> int:
+        """
+        Remove the messages of an inbox sent within a time window.
+
+        Backends should override this to remove the messages with one range delete over the IDs of each
+        priority band. The default removes the messages read by `get_messages_in_time_range` one by one.
+
+        :param recipient_id: The ID of the recipient client.
+        :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive.
+        :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive.
+        :return: The number of messages removed.
+        """
+        messages = self.get_messages_in_time_range(message_bus_id, recipient_id, start_timestamp, end_timestamp)
+        for message in messages:
+            self.remove_received_message(message_bus_id, message.sender, [recipient_id], message.id)
+        return len(messages)
+
+    def purge_messages_before(self, message_bus_id: str, recipient_id: str, timestamp: int) -> int:
+        """
+        Remove the messages of an inbox sent before a point in time, to enforce a retention period.
+
+        :param recipient_id: The ID of the recipient client.
+        :param timestamp: The point in time in milliseconds since the Unix epoch.
+        :return: The number of messages removed.
+        """
+        return self.remove_messages_in_time_range(message_bus_id, recipient_id, EPOCH, timestamp)
+
+    def purge_expired_messages(self, message_bus_id: str, recipient_id: str) -> int:
+        """
+        Remove the expired messages of an inbox.
+
+        Expired messages are never returned by the reads of a storage. Backends which purge them
+        in the background, or which leave them to the store itself, have nothing to do here.
+
+        :param recipient_id: The ID of the recipient client.
+        :return: The number of messages removed.
+        """
+        return 0
+
+    def get_thread(self, message_bus_id: str, thread_id: int) -> List[Message]:
+        """
+        Read the messages of a thread still stored, in any inbox, through an index of the threads
+        rather than a scan of the inboxes.
+
+        :param thread_id: The ID of the thread, which is the ID of its first message.
+        :return: The messages of the thread, once each whatever their number of recipients, ordered by ID.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not index threads")
+
+    def schedule_message(self, message_bus_id: str, message: Message, deliver_at: int) -> None:
+        """
+        Keep a message until it is due, to be sent by the message bus then.
+
+        :param message: The message.
+        :param deliver_at: The due time of the message in milliseconds since the Unix epoch.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support scheduled messages")
+
+    def pop_due_messages(self, message_bus_id: str, now: int, limit: int) -> List[Message]:
+        """
+        Remove and return the scheduled messages which are due.
+
+        :param now: The current time in milliseconds since the Unix epoch.
+        :param limit: The maximum number of messages to return.
+        :return: The messages due, earliest first.
+        """
+        return []
+
+    def get_next_due_time(self, message_bus_id: str) -> Optional[int]:
+        """
+        Get the due time of the earliest scheduled message.
+
+        :return: The due time in milliseconds since the Unix epoch, or None if no message is scheduled.
+        """
+        return None
+
+    def close(self) -> None:
+        """
+        Release the resources of the storage.
+        """
+        pass
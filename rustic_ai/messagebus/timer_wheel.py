@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+
+class TimerHandle:
+    """
+    A timer scheduled on a TimerWheel, which can be cancelled.
+    """
+
+    __slots__ = ("deadline", "item", "cancelled")
+
+    def __init__(self, deadline: int, item: Any) -> None:
+        self.deadline = deadline
+        self.item = item
+        self.cancelled = False
+
+
+class TimerWheel:
+    """
+    A hierarchical timer wheel, scheduling and cancelling timers in constant time.
+
+    Time is cut in ticks. The first wheel has a slot per tick for the next `slots` ticks, and every
+    following wheel has a slot per full turn of the previous one. A timer goes in the slot of its deadline
+    in the finest wheel covering it, and moves down to a finer wheel when that slot comes up, so each timer
+    is only touched a few times whatever the number of timers. Cancelled timers are dropped when their slot
+    comes up.
+
+    Times are integers, in milliseconds by convention. The wheel is not thread-safe, see TimerService.
+    """
+
+    def __init__(self, tick: int = 10, slots: int = 256, levels: int = 4, start: Optional[int] = None) -> None:
+        """
+        Initialize the wheel.
+
+        :param tick: The resolution of the wheel. Timers fire on the first tick at or after their deadline.
+        :param slots: The number of slots of each wheel, a power of two.
+        :param levels: The number of wheels. Deadlines beyond the range of the last wheel wait in its last slot.
+        :param start: The current time, the current wall clock time in milliseconds if not given.
+        """
+        if slots & (slots - 1):
+            raise ValueError("The number of slots must be a power of two")
+
+        self.tick = tick
+        self.slots = slots
+        self.bits = slots.bit_length() - 1
+        self.levels = levels
+        self.wheels: List[List[List[TimerHandle]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current_tick = (start if start is not None else time.time_ns() // 1_000_000) // tick
+        self.count = 0
+
+    def __len__(self) -> int:
+        """
+        The number of timers scheduled, including the cancelled ones not dropped yet.
+        """
+        return self.count
+
+    def schedule(self, deadline: int, item: Any) -> TimerHandle:
+        """
+        Schedule a timer.
+
+        :param deadline: The time the timer fires at.
+        :param item: The item returned by `advance` when the timer fires.
+        :return: The handle of the timer.
+        """
+        handle = TimerHandle(deadline, item)
+        self._insert(handle, self.current_tick + 1)
+        self.count += 1
+        return handle
+
+    def cancel(self, handle: TimerHandle) -> None:
+        """
+        Cancel a timer. Cancelling a timer which already fired has no effect.
+
+        :param handle: The handle of the timer.
+        """
+        handle.cancelled = True
+
+    def _insert(self, handle: TimerHandle, earliest_tick: int) -> None:
+        # Round the deadline up, a timer never fires early
+        deadline_tick = max(-(-handle.deadline // self.tick), earliest_tick)
+        delta = deadline_tick - self.current_tick
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)) or level == self.levels - 1:
+                if delta >= 1 << (self.bits * (level + 1)):
+                    # Out of range, wait in the farthest slot and go round again
+                    deadline_tick = self.current_tick + (1 << (self.bits * (level + 1))) - 1
+                index = (deadline_tick >> (self.bits * level)) & (self.slots - 1)
+                self.wheels[level][index].append(handle)
+                return
+
+    def advance(self, now: int) -> List[Any]:
+        """
+        Move the wheel to a point in time, firing the timers due by then.
+
+        :param now: The current time.
+        :return: The items of the timers fired, in no particular order.
+        """
+        fired: List[Any] = []
+        target_tick = now // self.tick
+        while self.current_tick < target_tick:
+            if not self.count:
+                # Nothing to fire, skip the empty ticks
+                self.current_tick = target_tick
+                break
+
+            self.current_tick += 1
+            self._cascade(1)
+
+            slot = self.wheels[0][self.current_tick & (self.slots - 1)]
+            if slot:
+                self.wheels[0][self.current_tick & (self.slots - 1)] = []
+                self.count -= len(slot)
+                fired.extend(handle.item for handle in slot if not handle.cancelled)
+        return fired
+
+    def _cascade(self, level: int) -> None:
+        """
+        Move the timers of the slot of a coarser wheel coming up to the finer wheels, when the finer wheel
+        completes a turn.
+        """
+        if level >= self.levels or self.current_tick & ((1 << (self.bits * level)) - 1):
+            return
+
+        self._cascade(level + 1)
+        index = (self.current_tick >> (self.bits * level)) & (self.slots - 1)
+        slot = self.wheels[level][index]
+        if slot:
+            self.wheels[level][index] = []
+            for handle in slot:
+                if handle.cancelled:
+                    self.count -= 1
+                else:
+                    # Timers due on this tick land in the slot about to fire
+                    self._insert(handle, self.current_tick)
+
+
+class TimerService:
+    """
+    Runs a TimerWheel on a background thread, handing the items of the timers fired to a callback.
+
+    The thread starts with the first timer scheduled, so a service never used costs nothing.
+    Timers are scheduled in milliseconds since the Unix epoch.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[List[Any]], None],
+        tick: int = 10,
+        slots: int = 256,
+        levels: int = 4,
+        name: str = "timer-wheel",
+    ) -> None:
+        """
+        Initialize the service.
+
+        :param callback: Called on the background thread with the items of the timers fired on a tick.
+        :param tick: The resolution of the wheel in milliseconds.
+        :param slots: The number of slots of each wheel, a power of two.
+        :param levels: The number of wheels.
+        :param name: The name of the background thread.
+        """
+        self.callback = callback
+        self.wheel = TimerWheel(tick, slots, levels)
+        self.name = name
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+    def schedule(self, deadline: int, item: Any) -> TimerHandle:
+        """
+        Schedule a timer, from any thread.
+
+        :param deadline: The time the timer fires at, in milliseconds since the Unix epoch.
+        :param item: The item handed to the callback when the timer fires.
+        :return: The handle of the timer.
+        """
+        with self.condition:
+            if not len(self.wheel):
+                # The wheel stood still while empty, catch up with the clock at no cost
+                self.wheel.advance(time.time_ns() // 1_000_000)
+                self.condition.notify_all()
+            handle = self.wheel.schedule(deadline, item)
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            return handle
+
+    def cancel(self, handle: TimerHandle) -> None:
+        """
+        Cancel a timer, from any thread.
+
+        :param handle: The handle of the timer.
+        """
+        with self.condition:
+            self.wheel.cancel(handle)
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                # Sleep until the next tick, or until a timer is scheduled if there are none
+                self.condition.wait(self.wheel.tick / 1000 if len(self.wheel) else None)
+                if self.closed:
+                    return
+                fired = self.wheel.advance(time.time_ns() // 1_000_000)
+
+            if fired:
+                try:
+                    self.callback(fired)
+                except Exception:
+                    logging.exception("Error in timer callback")
+
+    def close(self) -> None:
+        """
+        Stop the background thread. The pending timers never fire.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
@@ -1,6 +1,11 @@
+import threading
 import time
 from datetime import datetime, timezone
 from enum import IntEnum
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy
 
 # Define the date
 date = datetime(2023, 1, 1, tzinfo=timezone.utc)
@@ -35,6 +40,81 @@ class Priority(IntEnum):
     URGENT = 0
 
 
+def encode_gemstone_id(priority: int, timestamp: int, machine_id: int, sequence_number: int) -> int:
+    """
+    Encode the parts of a Gemstone ID straight into its integer form.
+
+    :param priority: The priority of the ID (between 0 and 7, inclusive)
+    :param timestamp: The timestamp in milliseconds since the Unix epoch
+    :param machine_id: The ID of the machine generating the ID
+    :param sequence_number: The sequence number within the millisecond
+    :return: The ID as an integer
+    """
+    return (
+        ((priority & PRIORITY_BITMASK) << PRIORITY_SHIFT)
+        | ((timestamp - EPOCH) << TIMESTAMP_SHIFT)
+        | ((machine_id & MACHINE_ID_BITMASK) << MACHINE_ID_SHIFT)
+        | (sequence_number & SEQUENCE_BITMASK)
+    )
+
+
+def get_timestamp(id: int) -> int:
+    """
+    Get the timestamp of an ID in its integer form, without decoding the other parts.
+
+    :param id: The ID as an integer
+    :return: The timestamp in milliseconds since the Unix epoch
+    """
+    return ((id >> TIMESTAMP_SHIFT) & ((1 << (PRIORITY_SHIFT - TIMESTAMP_SHIFT)) - 1)) + EPOCH
+
+
+def get_time_after(delay: float) -> int:
+    """
+    Get the point in time a delay from now.
+
+    :param delay: The delay in seconds
+    :return: The point in time in milliseconds since the Unix epoch
+    """
+    return time.time_ns() // 1_000_000 + int(delay * 1000)
+
+
+def get_expiry_time(ttl: Optional[float], sent_at: Optional[int] = None) -> Optional[int]:
+    """
+    Get the expiry time of a message with a time to live.
+
+    :param ttl: The time to live in seconds, or None for a message that never expires
+    :param sent_at: The time the message is sent at in milliseconds since the Unix epoch, now if not given
+    :return: The expiry time in milliseconds since the Unix epoch, or None
+    """
+    if ttl is None:
+        return None
+    if sent_at is None:
+        return get_time_after(ttl)
+    return sent_at + int(ttl * 1000)
+
+
+def get_id_ranges(start_timestamp: int, end_timestamp: int) -> List[Tuple[int, int]]:
+    """
+    Get the ranges of IDs generated within a time window, one per priority band.
+
+    The timestamp sits right below the priority bits, so within a priority band the IDs of a time window
+    form a contiguous range regardless of the machine ID and sequence number.
+
+    :param start_timestamp: The start of the window in milliseconds since the Unix epoch, inclusive
+    :param end_timestamp: The end of the window in milliseconds since the Unix epoch, exclusive
+    :return: The (lowest, highest) bounds of the IDs of each priority band, the highest being exclusive
+    """
+    start_timestamp = max(start_timestamp, EPOCH)
+    end_timestamp = min(end_timestamp, EPOCH + (1 << (PRIORITY_SHIFT - TIMESTAMP_SHIFT)))
+    if end_timestamp <= start_timestamp:
+        return []
+
+    return [
+        (encode_gemstone_id(priority, start_timestamp, 0, 0), encode_gemstone_id(priority, end_timestamp, 0, 0))
+        for priority in sorted(Priority)
+    ]
+
+
 class GemstoneID:
     def __init__(self, priority: Priority, timestamp: int, machine_id: int, sequence_number: int):
         self.priority: int = priority.value
@@ -43,12 +123,7 @@ class GemstoneID:
         self.sequence_number = sequence_number
 
     def to_int(self):
-        p = (self.priority & PRIORITY_BITMASK) << PRIORITY_SHIFT
-        t = (self.timestamp - EPOCH) << TIMESTAMP_SHIFT
-        m = (self.machine_id & MACHINE_ID_BITMASK) << MACHINE_ID_SHIFT
-        s = self.sequence_number & SEQUENCE_BITMASK
-
-        return p | t | m | s
+        return encode_gemstone_id(self.priority, self.timestamp, self.machine_id, self.sequence_number)
 
     @classmethod
     def from_int(cls, id):
@@ -59,6 +134,38 @@ class GemstoneID:
 
         return cls(Priority(priority), timestamp, machine_id, sequence_number)
 
+    @staticmethod
+    def decode_array(ids: Union[Iterable[int], 'numpy.ndarray']) -> Dict[str, 'numpy.ndarray']:
+        """
+        Decode many IDs at once with NumPy, which must be installed.
+
+        IDs of the lower priorities do not fit a signed 64-bit integer, so arrays of int64 are
+        reinterpreted as unsigned.
+
+        :param ids: The IDs, as an array or an iterable of integers
+        :return: The priority, timestamp (milliseconds since the Unix epoch), machine_id and
+            sequence_number columns, keyed by name
+        """
+        try:
+            import numpy as np
+        except ImportError:  # pragma: no cover
+            raise ImportError("GemstoneID.decode_array requires numpy, install it with `pip install numpy`") from None
+
+        if not isinstance(ids, np.ndarray):
+            ids = np.fromiter(ids, dtype=np.uint64)
+        elif ids.dtype != np.uint64:
+            ids = ids.astype(np.int64, copy=False).view(np.uint64)
+
+        timestamp_mask = (1 << (PRIORITY_SHIFT - TIMESTAMP_SHIFT)) - 1
+        machine_id_mask = (1 << (TIMESTAMP_SHIFT - MACHINE_ID_SHIFT)) - 1
+
+        return {
+            "priority": ((ids >> np.uint64(PRIORITY_SHIFT)) & np.uint64(PRIORITY_BITMASK)).astype(np.uint8),
+            "timestamp": ((ids >> np.uint64(TIMESTAMP_SHIFT)) & np.uint64(timestamp_mask)).astype(np.int64) + EPOCH,
+            "machine_id": ((ids >> np.uint64(MACHINE_ID_SHIFT)) & np.uint64(machine_id_mask)).astype(np.uint16),
+            "sequence_number": (ids & np.uint64(SEQUENCE_BITMASK)).astype(np.uint16),
+        }
+
     def __lt__(self, other):
         if not isinstance(other, GemstoneID):
             raise TypeError(f"Cannot compare GemstoneID to {type(other)}")
@@ -84,10 +191,103 @@ class GemstoneID:
 
 
 class GemstoneGenerator:
-    def __init__(self, machine_id: int):
+    """
+    A thread-safe generator of Gemstone IDs for a machine.
+
+    When the sequence numbers of the current millisecond run out, the generator borrows the next
+    millisecond instead of waiting for the clock to reach it.
+
+    By default a clock moving backwards raises a ClockMovedBackwardsError. In hybrid clock mode the
+    generator keeps using the last timestamp it saw instead, like a hybrid logical clock, so IDs stay
+    monotonic per machine. Every such step back is recorded in the skew metrics.
+    """
+
+    def __init__(self, machine_id: int, hybrid_clock: bool = False):
+        """
+        Initialize the generator.
+
+        :param machine_id: The ID of the machine generating the IDs
+        :param hybrid_clock: Whether to tolerate the clock moving backwards instead of raising
+        """
         self.machine_id = machine_id
+        self.hybrid_clock = hybrid_clock
         self.sequence_number = 0
         self.last_timestamp = -1
+        self.last_clock_timestamp = -1
+        # The last reading of the clock, behind the last timestamp while a step back is being absorbed
+        self.last_clock_reading = -1
+        self.lock = threading.Lock()
+
+        # Skew metrics, in milliseconds, of the steps back of the clock absorbed in hybrid clock mode
+        self.clock_skew_count = 0
+        self.last_clock_skew = 0
+        self.max_clock_skew = 0
+
+    def _reserve_sequence_numbers(self, count: int) -> List[Tuple[int, int, int]]:
+        """
+        Reserve the next sequence numbers. The caller must hold the lock.
+
+        :param count: The number of sequence numbers to reserve
+        :return: The reserved blocks as (timestamp, first sequence number, count) tuples
+        """
+        clock_reading = timestamp = time.time_ns() // 1000000
+        if timestamp < self.last_clock_timestamp:
+            if not self.hybrid_clock:
+                raise ClockMovedBackwardsError("Clock moved backwards!")
+            # A step back is counted once, when the clock is first seen going backwards
+            self._record_clock_skew(self.last_clock_timestamp - timestamp, timestamp < self.last_clock_reading)
+            # Keep the last timestamp seen, so the IDs below continue from it
+            timestamp = self.last_clock_timestamp
+        self.last_clock_reading = clock_reading
+        self.last_clock_timestamp = timestamp
+
+        if timestamp <= self.last_timestamp:
+            # Still in the last millisecond, or in one borrowed ahead of the clock
+            timestamp = self.last_timestamp
+            sequence_number = self.sequence_number + 1
+        else:
+            sequence_number = 0
+
+        blocks = []
+        while count > 0:
+            if sequence_number > SEQUENCE_BITMASK:
+                # All sequence numbers of this millisecond are used, borrow the next one
+                timestamp += 1
+                sequence_number = 0
+
+            block_size = min(count, SEQUENCE_BITMASK + 1 - sequence_number)
+            blocks.append((timestamp, sequence_number, block_size))
+            sequence_number += block_size
+            count -= block_size
+
+        self.last_timestamp = timestamp
+        self.sequence_number = sequence_number - 1
+        return blocks
+
+    def _record_clock_skew(self, skew: int, new_step: bool) -> None:
+        """
+        Record the skew of a clock reading behind the last timestamp.
+
+        :param skew: How far behind the reading is, in milliseconds
+        :param new_step: Whether the clock went back since its previous reading, rather than still catching up
+        """
+        if new_step:
+            self.clock_skew_count += 1
+        self.last_clock_skew = skew
+        self.max_clock_skew = max(self.max_clock_skew, skew)
+
+    def get_clock_skew_metrics(self) -> Dict[str, int]:
+        """
+        Get the metrics of the steps back of the clock absorbed in hybrid clock mode.
+
+        :return: The number of steps back, and the last and largest ones in milliseconds
+        """
+        with self.lock:
+            return {
+                "count": self.clock_skew_count,
+                "last_skew": self.last_clock_skew,
+                "max_skew": self.max_clock_skew,
+            }
 
     def get_id(self, priority: Priority) -> GemstoneID:
         """
@@ -96,20 +296,40 @@ class GemstoneGenerator:
         :param priority: The priority of the ID (between 0 and 7, inclusive)
         :return: The generated ID
         """
+        with self.lock:
+            ((timestamp, sequence_number, _),) = self._reserve_sequence_numbers(1)
 
-        timestamp = time.time_ns() // 1000000
-        if timestamp < self.last_timestamp:  # TBD: Write test case
-            raise ClockMovedBackwardsError("Clock moved backwards!")
+        return GemstoneID(priority, timestamp, self.machine_id, sequence_number)
 
-        if timestamp == self.last_timestamp:
-            self.sequence_number = (self.sequence_number + 1) & SEQUENCE_BITMASK
-            if self.sequence_number == 0:  # TBD: Write test case
-                # We have already generated 4096 IDs in this millisecond, wait until the next one
-                while timestamp <= self.last_timestamp:
-                    timestamp = time.time_ns() // 1000000
-        else:
-            self.sequence_number = 0
+    def get_int_id(self, priority: Priority) -> int:
+        """
+        Generate a new ID straight in its integer form, without building a GemstoneID.
 
-        self.last_timestamp = timestamp
+        :param priority: The priority of the ID (between 0 and 7, inclusive)
+        :return: The generated ID as an integer
+        """
+        with self.lock:
+            ((timestamp, sequence_number, _),) = self._reserve_sequence_numbers(1)
+
+        return encode_gemstone_id(priority, timestamp, self.machine_id, sequence_number)
+
+    def reserve(self, count: int, priority: Priority) -> List[int]:
+        """
+        Generate a block of IDs with the given priority in a single critical section.
+        IDs within the same millisecond are consecutive integers.
+
+        :param count: The number of IDs to generate
+        :param priority: The priority of the IDs (between 0 and 7, inclusive)
+        :return: The generated IDs, in increasing order
+        """
+        if count <= 0:
+            return []
+
+        with self.lock:
+            blocks = self._reserve_sequence_numbers(count)
 
-        return GemstoneID(priority, timestamp, self.machine_id, self.sequence_number)
+        ids: List[int] = []
+        for timestamp, first_sequence_number, block_size in blocks:
+            base = encode_gemstone_id(priority, timestamp, self.machine_id, first_sequence_number)
+            ids.extend(range(base, base + block_size))
+        return ids
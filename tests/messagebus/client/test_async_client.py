@@ -1,6 +1,10 @@
+import asyncio
+import threading
 import unittest
 
-from rustic_ai.messagebus import AsyncClient, MessageBus
+import fakeredis
+
+from rustic_ai.messagebus import AsyncClient, AsyncMessageBus, AsyncRedisStorage, MessageBus, RedisStorage, SimpleClient
 
 
 class TestAsyncClient(unittest.IsolatedAsyncioTestCase):
@@ -45,5 +49,110 @@ class TestAsyncClient(unittest.IsolatedAsyncioTestCase):
             await self.client_1.send_message('{"message": "Hello",}', ['client_2'])  # malformed JSON
 
 
+class TestAsyncClientOutsideTheLoop(unittest.TestCase):
+    def test_client_created_before_the_loop(self):
+        message_bus = MessageBus()
+        sender = SimpleClient('sender', message_bus)
+        receiver = AsyncClient('receiver', message_bus)
+        sent = sender.send_message({"data": "Hello"}, ['receiver'])
+
+        # The client waits on the loop it is first used from
+        self.assertEqual(asyncio.run(receiver.receive(timeout=5)), sent)
+        self.assertEqual(asyncio.run(receiver.async_send_message({}, ['sender'])), sender.get_next_unread_message())
+
+
+class TestAsyncMessageBus(unittest.IsolatedAsyncioTestCase):
+    waiting_clients = 1000
+
+    async def asyncSetUp(self):
+        self.message_bus = AsyncMessageBus()
+        self.sender = AsyncClient('sender', self.message_bus)
+        self.receiver = AsyncClient('receiver', self.message_bus)
+
+    async def test_async_for(self):
+        async def consume():
+            received = []
+            async for message in self.receiver:
+                received.append(message)
+            return received
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        sent = [await self.sender.async_send_message({"index": index}, ['receiver']) for index in range(3)]
+        await asyncio.sleep(0)
+        self.receiver.close()
+
+        self.assertListEqual(await asyncio.wait_for(consumer, 5), sent)
+
+    async def test_send_from_another_thread(self):
+        sender = SimpleClient('thread_sender', self.message_bus)
+        thread = threading.Timer(0.01, sender.send_message, ({"data": "Hello"}, ['receiver']))
+        thread.start()
+
+        message = await self.receiver.receive(timeout=5)
+        thread.join()
+        self.assertEqual(message.content, {"data": "Hello"})
+
+    async def test_many_waiting_clients(self):
+        receivers = [AsyncClient(f'receiver_{index}', self.message_bus) for index in range(self.waiting_clients)]
+        waiters = [asyncio.create_task(receiver.receive(timeout=5)) for receiver in receivers]
+        await asyncio.sleep(0)
+
+        message = await self.sender.async_send_message({"data": "Hello"})
+        received = await asyncio.gather(*waiters)
+        self.assertTrue(all(received_message == message for received_message in received))
+
+    async def test_receive_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receiver.receive(timeout=0.01)
+
+    async def test_async_request(self):
+        async def respond():
+            request = await self.receiver.receive(timeout=5)
+            self.receiver.reply(request, {"answer": request.content["question"] + 1})
+
+        responder = asyncio.create_task(respond())
+        reply = await self.sender.async_request({"question": 1}, 'receiver', timeout=5)
+        await responder
+
+        self.assertEqual(reply.content, {"answer": 2})
+        self.assertIsNone(await self.sender.async_get_next_unread_message())
+
+    async def test_async_request_timeout(self):
+        with self.assertRaises(TimeoutError):
+            await self.sender.async_request({}, 'receiver', timeout=0.01)
+
+
+class TestAsyncMessageBusWithAsyncStorage(TestAsyncMessageBus):
+    # Every waiting client has a read in flight on a connection of the pool of the Redis client, 100 at most
+    waiting_clients = 50
+
+    async def asyncSetUp(self):
+        server = fakeredis.FakeServer()
+        self.async_storage = AsyncRedisStorage(fakeredis.FakeAsyncRedis(server=server))
+        self.message_bus = AsyncMessageBus(
+            storage_backend=RedisStorage(fakeredis.FakeStrictRedis(server=server)),
+            async_storage_backend=self.async_storage,
+        )
+        self.sender = AsyncClient('sender', self.message_bus)
+        self.receiver = AsyncClient('receiver', self.message_bus)
+
+    async def asyncTearDown(self):
+        # The clients remove their inboxes now, rather than once collected, after the Redis server is gone
+        for client in list(self.message_bus.clients.values()):
+            self.message_bus.unregister_client(client)
+        await self.message_bus.async_close()
+
+    async def test_messages_go_through_the_async_storage(self):
+        sent = await self.sender.async_send_message({"data": "Hello"}, ['receiver'])
+
+        self.assertEqual(await self.async_storage.get_next_unread_message(self.message_bus.id, 'receiver', 0), sent)
+        self.assertEqual(await self.receiver.receive(timeout=5), sent)
+
+    async def test_async_storage_needs_its_storage_backend(self):
+        with self.assertRaises(ValueError):
+            AsyncMessageBus(async_storage_backend=self.async_storage)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -57,6 +57,19 @@ class TestCallbackClient(unittest.TestCase):
         assert received_messages[0] == message1
         assert received_messages[1] == message2
 
+    # Tests that a single notification for a batch of messages triggers the callback function for each
+    def test_receive_batch_of_messages(self):
+        received_messages = []
+
+        def callback(message):
+            received_messages.append(message)
+
+        message_bus = MessageBus()
+        client = CallbackClient('client1', message_bus, callback)  # noqa: F841
+        messages = [Message(id, 'sender', {'key': id}, ['client1']) for id in (1, 2, 3)]
+        message_bus.send_messages(messages)
+        assert received_messages == messages
+
     # Tests that the client can handle an empty message
     def test_empty_message(self):
         received_messages = []
@@ -36,7 +36,15 @@ class TestSimpleClient(unittest.TestCase):
         message = self.client_1.send_message({"message": "Hello"}, ['client_2'])
         self.client_1.remove_sent_message(["client_2"], message.id)
 
-        self.assertListEqual(self.message_bus.storage.inboxes[self.message_bus.id]['client_2'], [])
+        self.assertListEqual(list(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']), [])
+
+    def test_send_messages(self):
+        messages = self.client_1.send_messages([{"message": "Hello"}, {"message": "World"}], ['client_2'])
+
+        self.assertEqual(len(messages), 2)
+        self.assertLess(messages[0].id, messages[1].id)
+        self.assertListEqual(list(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']), messages)
+        self.assertEqual(self.client_2.get_next_unread_message().content, {"message": "Hello"})
 
     def test_send_message_to_non_existent_client(self):
         with self.assertRaises(Exception):  # Adjust this based on your implementation
@@ -2,6 +2,7 @@ import unittest
 
 from rustic_ai.messagebus import (
     BroadcastRoutingPolicy,
+    ConsistentHashRoutingPolicy,
     DirectOrFallbackRoutingPolicy,
     HashBasedRoutingPolicy,
     Message,
@@ -9,6 +10,7 @@ from rustic_ai.messagebus import (
     MessageProperties,
     Priority,
     SimpleClient,
+    TopicRoutingPolicy,
 )
 
 
@@ -66,5 +68,133 @@ class TestRoutingPolicy(unittest.TestCase):
         self.assertIn(recipients[0], self.clients.keys())
 
 
+class TestConsistentHashRoutingPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = ConsistentHashRoutingPolicy([MessageProperties.CONTENT])
+        self.message_bus = MessageBus(id="test_bus", routing_policy=self.policy)
+        self.clients = {
+            client_id: SimpleClient(client_id, self.message_bus) for client_id in (f"agent_{n}" for n in range(5))
+        }
+        self.messages = [
+            Message(self.message_bus.generate_message_id(Priority.NORMAL), "agent_0", {"key": n}) for n in range(2000)
+        ]
+
+    def _route(self):
+        return {
+            message.content["key"]: self.policy.get_recipients(message, self.message_bus.clients)[0]
+            for message in self.messages
+        }
+
+    def test_same_properties_same_client(self):
+        routes = self._route()
+        self.assertDictEqual(self._route(), routes)
+        self.assertSetEqual(set(routes.values()), set(self.clients))
+
+    def test_registering_a_client_only_moves_keys_to_it(self):
+        before = self._route()
+        SimpleClient("agent_5", self.message_bus)
+        after = self._route()
+
+        moved = [key for key in before if after[key] != before[key]]
+        self.assertTrue(moved)
+        self.assertLess(len(moved), len(before) / 3)
+        self.assertTrue(all(after[key] == "agent_5" for key in moved))
+
+    def test_unregistering_a_client_only_moves_its_keys(self):
+        before = self._route()
+        self.message_bus.unregister_client(self.clients["agent_2"])
+        after = self._route()
+
+        self.assertNotIn("agent_2", self.policy.ring)
+        for key, client_id in before.items():
+            if client_id != "agent_2":
+                self.assertEqual(after[key], client_id)
+
+    def test_policy_set_after_registration(self):
+        policy = ConsistentHashRoutingPolicy([MessageProperties.CONTENT])
+        self.message_bus.set_routing_policy(policy)
+        self.assertListEqual(policy.ring.nodes, sorted(self.clients))
+
+        # Without the registration hooks, the ring follows the clients it is given
+        policy = ConsistentHashRoutingPolicy([MessageProperties.CONTENT])
+        recipients = policy.get_recipients(self.messages[0], {"agent_1": self.clients["agent_1"]})
+        self.assertListEqual(recipients, ["agent_1"])
+        self.assertListEqual(policy.ring.nodes, ["agent_1"])
+
+    def test_send_message(self):
+        message = self.clients["agent_0"].send_message({"key": 7})
+        recipient = self.policy.get_recipients(message, self.message_bus.clients)[0]
+        self.assertEqual(self.clients[recipient].get_next_unread_message(), message)
+
+
+class TestTopicRoutingPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = TopicRoutingPolicy()
+        self.message_bus = MessageBus(id="test_bus", routing_policy=self.policy)
+        self.clients = {
+            client_id: SimpleClient(client_id, self.message_bus)
+            for client_id in ("publisher", "results", "planner_results", "logs", "errors", "everything")
+        }
+        self.clients["results"].subscribe("agents.*.results")
+        self.clients["planner_results"].subscribe("agents.planner.results")
+        self.clients["logs"].subscribe("logs.#")
+        self.clients["errors"].subscribe("logs.#.error")
+        self.clients["everything"].subscribe("#")
+
+    def _recipients(self, topic):
+        message = Message(self.message_bus.generate_message_id(Priority.NORMAL), "publisher", {}, topic=topic)
+        return self.policy.get_recipients(message, self.message_bus.clients)
+
+    def test_wildcards(self):
+        self.assertListEqual(self._recipients("agents.planner.results"), ["everything", "planner_results", "results"])
+        self.assertListEqual(self._recipients("agents.coder.results"), ["everything", "results"])
+        self.assertListEqual(self._recipients("agents.coder.results.partial"), ["everything"])
+        self.assertListEqual(self._recipients("logs"), ["everything", "logs"])
+        self.assertListEqual(self._recipients("logs.error"), ["errors", "everything", "logs"])
+        self.assertListEqual(self._recipients("logs.agents.coder.error"), ["errors", "everything", "logs"])
+
+    def test_no_topic(self):
+        message = Message(self.message_bus.generate_message_id(Priority.NORMAL), "publisher", {})
+        self.assertListEqual(self.policy.get_recipients(message, self.message_bus.clients), [])
+
+    def test_sender_is_excluded(self):
+        message = Message(self.message_bus.generate_message_id(Priority.NORMAL), "logs", {}, topic="logs.info")
+        self.assertListEqual(self.policy.get_recipients(message, self.message_bus.clients), ["everything"])
+
+    def test_unsubscribe(self):
+        self.clients["logs"].subscribe("audit")
+        self.clients["logs"].unsubscribe("logs.#")
+        self.assertListEqual(self._recipients("logs.info"), ["everything"])
+        self.assertListEqual(self._recipients("audit"), ["everything", "logs"])
+
+        self.clients["logs"].unsubscribe()
+        self.assertListEqual(self._recipients("audit"), ["everything"])
+
+    def test_unregistered_client_is_unsubscribed(self):
+        self.message_bus.unregister_client(self.clients["everything"])
+        self.assertListEqual(self._recipients("logs.info"), ["logs"])
+        self.assertNotIn("everything", self.policy.subscriptions.patterns)
+
+    def test_send_message_with_topic(self):
+        message = self.clients["publisher"].send_message({"status": "done"}, topic="agents.coder.results")
+        self.assertEqual(self.clients["results"].get_next_unread_message(), message)
+        self.assertIsNone(self.clients["planner_results"].get_next_unread_message())
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(ValueError):
+            self.clients["logs"].subscribe("logs..error")
+
+    def test_subscriptions_are_ignored_without_topic_routing(self):
+        message_bus = MessageBus()
+        client = SimpleClient("client", message_bus)
+        other = SimpleClient("other", message_bus)
+        client.subscribe("logs.#")
+        client.unsubscribe("logs.#")
+        client.unsubscribe()
+
+        message = other.send_message({"level": "info"}, topic="logs.info")
+        self.assertEqual(client.get_next_unread_message(), message)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,227 @@
+import multiprocessing
+import unittest
+import unittest.mock
+
+from rustic_ai.messagebus import (
+    CallbackClient,
+    ConsistentHashRoutingPolicy,
+    MessageProperties,
+    ShardedMessageBus,
+    SimpleClient,
+    TopicRoutingPolicy,
+)
+
+
+def _client_id(message_bus: ShardedMessageBus, shard_id: str, prefix: str = "client") -> str:
+    index = 0
+    while message_bus.get_shard(f"{prefix}_{index}") != shard_id:
+        index += 1
+    return f"{prefix}_{index}"
+
+
+def _run_echo_shard(local_address, addresses, stop) -> None:
+    message_bus = ShardedMessageBus("remote", {"local": local_address}, id="bus", machine_id=2)
+
+    def echo(message):
+        client.send_message(message.content, [message.sender])
+
+    client = CallbackClient(_client_id(message_bus, "remote", "echo"), message_bus, echo)
+    addresses.put((message_bus.address, client.client_id))
+    stop.wait(30)
+    message_bus.close()
+
+
+class TestShardedMessageBus(unittest.TestCase):
+    def setUp(self):
+        self.shards = []
+        for index in range(3):
+            peers = {shard.shard_id: shard.address for shard in self.shards}
+            shard = ShardedMessageBus(f"shard_{index}", peers, id="bus", machine_id=index + 1)
+            for peer in self.shards:
+                peer.add_shard(shard.shard_id, shard.address)
+            self.shards.append(shard)
+
+    def tearDown(self):
+        for shard in self.shards:
+            shard.close()
+
+    def _client(self, shard: ShardedMessageBus, prefix: str = "client") -> SimpleClient:
+        return SimpleClient(_client_id(shard, shard.shard_id, prefix), shard)
+
+    def test_client_placement(self):
+        client_id = _client_id(self.shards[0], "shard_1")
+        self.assertTrue(all(shard.get_shard(client_id) == "shard_1" for shard in self.shards))
+        with self.assertRaises(ValueError):
+            SimpleClient(client_id, self.shards[0])
+
+    def test_send_to_other_shards(self):
+        sender = self._client(self.shards[0])
+        receivers = [self._client(self.shards[1]), self._client(self.shards[2])]
+
+        message = sender.send_message({"data": "Hello"}, [receiver.client_id for receiver in receivers])
+        for receiver in receivers:
+            self.assertTrue(receiver.new_message_event.is_set())
+            self.assertEqual(receiver.get_next_unread_message(), message)
+
+    def test_broadcast_across_shards(self):
+        sender = self._client(self.shards[0], "sender")
+        receivers = [self._client(shard) for shard in self.shards]
+
+        messages = sender.send_messages([{"index": 0}, {"index": 1}])
+        for receiver in receivers:
+            self.assertEqual(receiver.get_next_unread_message(), messages[0])
+            self.assertEqual(receiver.get_next_unread_message(), messages[1])
+        self.assertIsNone(sender.get_next_unread_message())
+
+    def test_single_recipient_policy_routes_once_across_shards(self):
+        for shard in self.shards:
+            shard.set_routing_policy(ConsistentHashRoutingPolicy([MessageProperties.CONTENT]))
+        sender = self._client(self.shards[0], "sender")
+        receivers = [self._client(shard) for shard in self.shards]
+
+        messages = sender.send_messages([{"index": index} for index in range(20)])
+        # The policy may pick the sender too
+        received = {client.client_id: [] for client in receivers + [sender]}
+        for receiver in receivers + [sender]:
+            message = receiver.get_next_unread_message()
+            while message is not None:
+                received[receiver.client_id].append(message)
+                message = receiver.get_next_unread_message()
+
+        # Each message reaches a single client of the whole bus, and a client of another shard may get it
+        self.assertListEqual(sorted(message for inbox in received.values() for message in inbox), messages)
+        self.assertGreater(sum(1 for inbox in received.values() if inbox), 1)
+
+    def test_subscriptions_across_shards(self):
+        for shard in self.shards:
+            shard.set_routing_policy(TopicRoutingPolicy())
+        sender = self._client(self.shards[0], "sender")
+        receivers = [self._client(self.shards[1]), self._client(self.shards[2])]
+        for receiver in receivers:
+            receiver.message_bus.subscribe(receiver.client_id, "news.*")
+
+        message = sender.send_message({"data": "Hello"}, topic="news.sport")
+        for receiver in receivers:
+            self.assertEqual(receiver.get_next_unread_message(), message)
+
+        receivers[0].message_bus.unsubscribe(receivers[0].client_id, "news.*")
+        message = sender.send_message({"data": "Hello again"}, topic="news.sport")
+        self.assertIsNone(receivers[0].get_next_unread_message())
+        self.assertEqual(receivers[1].get_next_unread_message(), message)
+
+    def test_remove_received_message(self):
+        sender = self._client(self.shards[0])
+        receiver = self._client(self.shards[1])
+
+        message = sender.send_message({"data": "Hello"}, [receiver.client_id])
+        self.shards[0].remove_received_message(sender.client_id, ['*'], message.id)
+        self.assertIsNone(receiver.get_next_unread_message())
+
+    def test_send_failing_to_reach_a_shard_can_be_retried(self):
+        sender = self._client(self.shards[0])
+        receiver = self._client(self.shards[1])
+        peer = self.shards[0].peers["shard_1"]
+
+        with unittest.mock.patch.object(peer, "deliver", side_effect=OSError("Connection reset")):
+            with self.assertRaises(OSError):
+                sender.send_message({"n": 1}, [receiver.client_id], idempotency_key="k")
+
+        # The key of the message which could not be delivered is not kept, so its retry goes through
+        retried = sender.send_message({"n": 1}, [receiver.client_id], idempotency_key="k")
+        self.assertEqual(receiver.get_next_unread_message(), retried)
+
+    def test_request_reply_across_shards(self):
+        requester = self._client(self.shards[0])
+        responder = self._client(self.shards[1])
+
+        future = requester.request({"question": 1}, responder.client_id, timeout=5)
+        reply = responder.reply(responder.get_next_unread_message(), {"answer": 2})
+
+        self.assertEqual(future.result(5), reply)
+        self.assertIsNone(requester.get_next_unread_message())
+
+    def test_messages_wait_for_their_client(self):
+        sender = self._client(self.shards[0])
+        client_id = _client_id(self.shards[0], "shard_2")
+        message = sender.send_message({"data": "Hello"}, [client_id])
+
+        receiver = SimpleClient(client_id, self.shards[2])
+        self.assertEqual(receiver.get_next_unread_message(), message)
+
+    def test_add_shard_moves_only_the_clients_it_takes_over(self):
+        sender = self._client(self.shards[0], "sender")
+        client_ids = [f"client_{index}" for index in range(30)]
+        for client_id in client_ids:
+            sender.send_message({"to": client_id}, [client_id])
+        before = {client_id: self.shards[0].get_shard(client_id) for client_id in client_ids}
+
+        new_shard = ShardedMessageBus(
+            "shard_3", {shard.shard_id: shard.address for shard in self.shards}, id="bus", machine_id=4
+        )
+        moved = sorted(
+            client_id for shard in self.shards for client_id in shard.add_shard("shard_3", new_shard.address)
+        )
+        self.shards.append(new_shard)
+
+        self.assertListEqual(
+            moved,
+            sorted(
+                client_id
+                for client_id in client_ids + [sender.client_id]
+                if new_shard.get_shard(client_id) == "shard_3"
+            ),
+        )
+        self.assertTrue(moved)
+        for client_id in client_ids:
+            if client_id not in moved:
+                self.assertEqual(new_shard.get_shard(client_id), before[client_id])
+
+        # The unread messages of the moved clients followed them
+        for client_id in set(moved).intersection(client_ids):
+            receiver = SimpleClient(client_id, new_shard)
+            self.assertEqual(receiver.get_next_unread_message().content, {"to": client_id})
+
+    def test_remove_shard_moves_its_clients(self):
+        sender = self._client(self.shards[0], "sender")
+        receiver = self._client(self.shards[2])
+        sender.send_message({"data": "Hello"}, [receiver.client_id])
+
+        leaving = self.shards.pop()
+        moved = leaving.remove_shard("shard_2")
+        for shard in self.shards:
+            self.assertListEqual(shard.remove_shard("shard_2"), [])
+        leaving.close()
+
+        self.assertListEqual(moved, [receiver.client_id])
+        new_shard = next(shard for shard in self.shards if shard.shard_id == shard.get_shard(receiver.client_id))
+        moved_receiver = SimpleClient(receiver.client_id, new_shard)
+        self.assertEqual(moved_receiver.get_next_unread_message().content, {"data": "Hello"})
+
+
+class TestShardedMessageBusProcesses(unittest.TestCase):
+    def test_shards_in_separate_processes(self):
+        context = multiprocessing.get_context("spawn")
+        addresses = context.Queue()
+        stop = context.Event()
+
+        message_bus = ShardedMessageBus("local", id="bus", machine_id=1)
+        process = context.Process(target=_run_echo_shard, args=(message_bus.address, addresses, stop))
+        process.start()
+        try:
+            address, echo_id = addresses.get(timeout=30)
+            message_bus.add_shard("remote", address)
+            client = SimpleClient(_client_id(message_bus, "local"), message_bus)
+
+            message = client.send_message({"data": "Hello"}, [echo_id])
+            self.assertTrue(client.new_message_event.wait(10))
+            reply = client.get_next_unread_message()
+            self.assertEqual(reply.sender, echo_id)
+            self.assertEqual(reply.content, message.content)
+        finally:
+            stop.set()
+            process.join(30)
+            message_bus.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+
+from rustic_ai.messagebus import AsyncStorageBackend, Message
+from rustic_ai.messagebus.utils import GemstoneGenerator, Priority, encode_gemstone_id
+
+
+class AbstractTests(object):
+    class TestAsyncStorageBackendABC(ABC):
+        @abstractmethod
+        def get_storage_backend(self) -> AsyncStorageBackend:
+            pass
+
+        async def asyncSetUp(self):
+            self.storage = self.get_storage_backend()
+            self.id_generator = GemstoneGenerator(1)
+
+        async def asyncTearDown(self):
+            await self.storage.close()
+
+        def _get_id(self, priority: Priority) -> int:
+            return self.id_generator.get_int_id(priority)
+
+        async def test_create_and_remove_inbox(self):
+            await self.storage.create_inbox("message_bus_1", "test_client")
+            await self.storage.add_message_to_inbox(
+                "message_bus_1",
+                "test_client",
+                Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello!"}),
+            )
+            self.assertIsNotNone(await self.storage.get_next_unread_message("message_bus_1", "test_client", 0))
+            await self.storage.remove_inbox("message_bus_1", "test_client")
+            self.assertIsNone(await self.storage.get_next_unread_message("message_bus_1", "test_client", 0))
+
+        async def test_add_and_get_multiple_messages(self):
+            await self.storage.create_inbox("message_bus_1", "test_client")
+            msg1 = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello!"})
+            time.sleep(0.001)
+            msg2 = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello again!"})
+            await self.storage.add_message_to_inbox("message_bus_1", "test_client", msg1)
+            await self.storage.add_message_to_inbox("message_bus_1", "test_client", msg2)
+
+            retrieved_msg1 = await self.storage.get_next_unread_message("message_bus_1", "test_client", 0)
+            retrieved_msg2 = await self.storage.get_next_unread_message("message_bus_1", "test_client", msg1.id)
+            retrieved_msg3 = await self.storage.get_next_unread_message("message_bus_1", "test_client", msg2.id)
+            self.assertEqual(msg1, retrieved_msg1)
+            self.assertEqual(msg2, retrieved_msg2)
+            self.assertIsNone(retrieved_msg3)
+
+        async def test_add_message_to_multiple_inboxes(self):
+            recipients = ["test_client_1", "test_client_2", "test_client_3"]
+            msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello all! " * 1000})
+            await self.storage.add_message_to_inboxes("message_bus_1", recipients, msg)
+
+            for recipient in recipients:
+                self.assertEqual(msg, await self.storage.get_next_unread_message("message_bus_1", recipient, 0))
+
+        async def test_add_messages_to_inbox(self):
+            messages = [
+                Message(id, "test_client", {"content": f"Hello {index}!"}, priority=Priority.HIGH)
+                for index, id in enumerate(self.id_generator.reserve(3, Priority.HIGH))
+            ]
+            await self.storage.add_messages_to_inbox("message_bus_1", "test_client", messages)
+            await self.storage.add_messages_to_inbox("message_bus_1", "test_client", [])
+
+            last_read_message_id = 0
+            for msg in messages:
+                retrieved_msg = await self.storage.get_next_unread_message(
+                    "message_bus_1", "test_client", last_read_message_id
+                )
+                self.assertEqual(msg, retrieved_msg)
+                last_read_message_id = retrieved_msg.id
+
+        async def test_remove_received_message(self):
+            msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello!"})
+            await self.storage.add_message_to_inboxes("message_bus_2", ["test_client_1", "test_client_2"], msg)
+            await self.storage.remove_received_message("message_bus_2", "other_client", ["test_client_1"], msg.id)
+            await self.storage.remove_received_message("message_bus_2", "test_client", ["test_client_1"], msg.id)
+
+            self.assertIsNone(await self.storage.get_next_unread_message("message_bus_2", "test_client_1", 0))
+            self.assertEqual(msg, await self.storage.get_next_unread_message("message_bus_2", "test_client_2", 0))
+
+        async def test_time_range_queries(self):
+            start = 1_700_000_000_000
+
+            def message(priority: Priority, timestamp: int, machine_id: int, sequence_number: int) -> Message:
+                id = encode_gemstone_id(priority, timestamp, machine_id, sequence_number)
+                return Message(id, "test_client", {"timestamp": timestamp}, priority=priority)
+
+            before = [message(Priority.NORMAL, start - 10, 1, 0), message(Priority.LOWEST, start - 1, 255, 4095)]
+            within = [
+                message(Priority.HIGH, start + 9, 255, 4095),
+                message(Priority.LOW, start, 1, 0),
+                message(Priority.LOWEST, start + 5, 1, 7),
+            ]
+            after = [message(Priority.URGENT, start + 10, 1, 0)]
+            await self.storage.add_messages_to_inbox("message_bus_1", "test_client", before + within + after)
+
+            self.assertListEqual(
+                await self.storage.get_messages_in_time_range("message_bus_1", "test_client", start, start + 10),
+                within,
+            )
+            self.assertEqual(await self.storage.purge_messages_before("message_bus_1", "test_client", start), 2)
+            self.assertEqual(
+                await self.storage.remove_messages_in_time_range("message_bus_1", "test_client", start, start + 10),
+                3,
+            )
+            self.assertEqual(await self.storage.get_next_unread_message("message_bus_1", "test_client", 0), after[0])
+
+        async def test_concurrent_round_trips(self):
+            recipients = [f"test_client_{index}" for index in range(100)]
+            messages = [
+                Message(self._get_id(Priority.NORMAL), "test_client", {"recipient": recipient})
+                for recipient in recipients
+            ]
+            await asyncio.gather(
+                *(
+                    self.storage.add_message_to_inbox("message_bus_1", recipient, msg)
+                    for recipient, msg in zip(recipients, messages)
+                )
+            )
+
+            received = await asyncio.gather(
+                *(self.storage.get_next_unread_message("message_bus_1", recipient, 0) for recipient in recipients)
+            )
+            self.assertListEqual(received, messages)
+
+        async def test_expired_messages_are_skipped_and_purged(self):
+            now = int(time.time() * 1000)
+            expired = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1}, expires_at=now - 1000)
+            expiring = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 2}, expires_at=now + 60_000)
+            lasting = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 3})
+            await self.storage.add_messages_to_inbox("message_bus_1", "test_client", [expired, expiring, lasting])
+            await self.storage.add_message_to_inbox("message_bus_1", "other_client", expired)
+
+            self.assertListEqual(
+                await self.storage.get_messages_in_time_range(
+                    "message_bus_1", "test_client", now - 60_000, now + 60_000
+                ),
+                [expiring, lasting],
+            )
+            self.assertEqual(await self.storage.purge_expired_messages("message_bus_1", "test_client"), 1)
+            self.assertEqual(await self.storage.purge_expired_messages("message_bus_1", "test_client"), 0)
+            self.assertIsNone(await self.storage.get_next_unread_message("message_bus_1", "other_client", 0))
+
+            first = await self.storage.get_next_unread_message("message_bus_1", "test_client", 0)
+            self.assertEqual(first, expiring)
+            self.assertEqual(first.expires_at, now + 60_000)
+            self.assertEqual(
+                await self.storage.get_next_unread_message("message_bus_1", "test_client", first.id), lasting
+            )
+
+        async def test_get_thread(self):
+            root = Message(self._get_id(Priority.NORMAL), "client_1", {"n": 0}, topic="chat")
+            reply = Message(
+                self._get_id(Priority.NORMAL),
+                "client_2",
+                {"n": 1},
+                thread_id=root.id,
+                in_reply_to=root.id,
+                topic="chat",
+            )
+            follow_up = Message(
+                self._get_id(Priority.HIGH), "client_1", {"n": 2}, thread_id=root.id, in_reply_to=reply.id
+            )
+            await self.storage.add_message_to_inboxes("message_bus_1", ["client_2", "client_3"], root)
+            await self.storage.add_messages_to_inbox("message_bus_1", "client_1", [reply])
+            await self.storage.add_message_to_inbox("message_bus_1", "client_2", follow_up)
+
+            thread = await self.storage.get_thread("message_bus_1", root.id)
+            self.assertListEqual(thread, sorted([root, reply, follow_up]))
+            read = await self.storage.get_messages_in_time_range(
+                "message_bus_1", "client_1", 0, int(time.time() * 1000) + 1
+            )
+            self.assertEqual((read[0].thread_id, read[0].in_reply_to, read[0].topic), (root.id, root.id, "chat"))
+
+            await self.storage.remove_received_message("message_bus_1", "client_1", ["client_2", "client_3"], root.id)
+            await self.storage.remove_inbox("message_bus_1", "client_1")
+            self.assertListEqual(await self.storage.get_thread("message_bus_1", root.id), [follow_up])
+            await self.storage.purge_messages_before("message_bus_1", "client_2", int(time.time() * 1000) + 1)
+            self.assertListEqual(await self.storage.get_thread("message_bus_1", root.id), [])
@@ -2,7 +2,7 @@ import time
 from abc import ABC, abstractmethod
 
 from rustic_ai.messagebus import Message, StorageBackend
-from rustic_ai.messagebus.utils import GemstoneGenerator, Priority
+from rustic_ai.messagebus.utils import GemstoneGenerator, Priority, encode_gemstone_id
 
 
 class AbstractTests(object):
@@ -56,6 +56,44 @@ class AbstractTests(object):
             self.assertIsNone(retrieved_msg3)
             self.storage.remove_inbox("message_bus_1", "test_client")
 
+        def test_add_and_get_large_message(self):
+            self.storage.create_inbox("message_bus_1", "test_client")
+            msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello! " * 10000})
+            self.storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+            retrieved_msg = self.storage.get_next_unread_message("message_bus_1", "test_client", 0)
+            self.assertEqual(msg, retrieved_msg)
+            self.storage.remove_inbox("message_bus_1", "test_client")
+
+        def test_add_message_to_multiple_inboxes(self):
+            recipients = ["test_client_1", "test_client_2", "test_client_3"]
+            for recipient in recipients:
+                self.storage.create_inbox("message_bus_1", recipient)
+
+            msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello all!"})
+            self.storage.add_message_to_inboxes("message_bus_1", recipients, msg)
+
+            for recipient in recipients:
+                self.assertEqual(msg, self.storage.get_next_unread_message("message_bus_1", recipient, 0))
+                self.storage.remove_inbox("message_bus_1", recipient)
+
+        def test_add_messages_to_inbox(self):
+            self.storage.create_inbox("message_bus_1", "test_client")
+            messages = [
+                Message(id, "test_client", {"content": f"Hello {index}!"}, priority=Priority.HIGH)
+                for index, id in enumerate(self.id_generator.reserve(3, Priority.HIGH))
+            ]
+            self.storage.add_messages_to_inbox("message_bus_1", "test_client", messages)
+            self.storage.add_messages_to_inbox("message_bus_1", "test_client", [])
+
+            last_read_message_id = 0
+            for msg in messages:
+                retrieved_msg = self.storage.get_next_unread_message(
+                    "message_bus_1", "test_client", last_read_message_id
+                )
+                self.assertEqual(msg, retrieved_msg)
+                last_read_message_id = retrieved_msg.id
+            self.storage.remove_inbox("message_bus_1", "test_client")
+
         def test_remove_received_message(self):
             self.storage.create_inbox("message_bus_2", "test_client_1")
             msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello!"})
@@ -68,3 +106,157 @@ class AbstractTests(object):
             self.assertIsNone(next_message)
 
             self.storage.remove_inbox("message_bus_2", "test_client_1")
+
+        def test_time_range_queries(self):
+            self.storage.create_inbox("message_bus_1", "test_client")
+            start = 1_700_000_000_000
+
+            def message(priority: Priority, timestamp: int, machine_id: int, sequence_number: int) -> Message:
+                id = encode_gemstone_id(priority, timestamp, machine_id, sequence_number)
+                return Message(id, "test_client", {"timestamp": timestamp}, priority=priority)
+
+            # The IDs right outside the window round to its bounds when stored as doubles
+            before = [message(Priority.NORMAL, start - 10, 1, 0), message(Priority.LOWEST, start - 1, 255, 4095)]
+            within = [
+                message(Priority.HIGH, start + 9, 255, 4095),
+                message(Priority.LOW, start, 1, 0),
+                message(Priority.LOWEST, start + 5, 1, 7),
+            ]
+            after = [message(Priority.URGENT, start + 10, 1, 0)]
+            for msg in before + within + after:
+                self.storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+
+            self.assertListEqual(
+                self.storage.get_messages_in_time_range("message_bus_1", "test_client", start, start + 10), within
+            )
+            self.assertListEqual(
+                self.storage.get_messages_in_time_range("message_bus_1", "test_client", start, start), []
+            )
+
+            self.assertEqual(self.storage.purge_messages_before("message_bus_1", "test_client", start), 2)
+            self.assertEqual(
+                self.storage.remove_messages_in_time_range("message_bus_1", "test_client", start, start + 10), 3
+            )
+            self.assertEqual(self.storage.get_next_unread_message("message_bus_1", "test_client", 0), after[0])
+            self.storage.remove_inbox("message_bus_1", "test_client")
+
+        def test_expired_messages_are_skipped(self):
+            self.storage.create_inbox("message_bus_1", "test_client")
+            now = int(time.time() * 1000)
+            expired = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1}, expires_at=now - 1000)
+            expiring = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 2}, expires_at=now + 60_000)
+            lasting = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 3})
+            self.storage.add_messages_to_inbox("message_bus_1", "test_client", [expired, expiring, lasting])
+
+            self.assertListEqual(
+                self.storage.get_messages_in_time_range("message_bus_1", "test_client", now - 60_000, now + 60_000),
+                [expiring, lasting],
+            )
+            self.assertGreaterEqual(self.storage.purge_expired_messages("message_bus_1", "test_client"), 0)
+
+            first = self.storage.get_next_unread_message("message_bus_1", "test_client", 0)
+            self.assertEqual(first, expiring)
+            self.assertEqual(first.expires_at, now + 60_000)
+            second = self.storage.get_next_unread_message("message_bus_1", "test_client", first.id)
+            self.assertEqual(second, lasting)
+            self.assertIsNone(second.expires_at)
+            self.assertIsNone(self.storage.get_next_unread_message("message_bus_1", "test_client", second.id))
+            self.storage.remove_inbox("message_bus_1", "test_client")
+
+        def test_get_thread(self):
+            root = Message(self._get_id(Priority.NORMAL), "client_1", {"n": 0}, topic="chat")
+            reply = Message(
+                self._get_id(Priority.NORMAL),
+                "client_2",
+                {"n": 1},
+                thread_id=root.id,
+                in_reply_to=root.id,
+                topic="chat",
+            )
+            other = Message(self._get_id(Priority.NORMAL), "client_1", {"n": 2})
+            follow_up = Message(
+                self._get_id(Priority.HIGH), "client_1", {"n": 3}, thread_id=root.id, in_reply_to=reply.id
+            )
+            try:
+                self.assertListEqual(self.storage.get_thread("message_bus_1", root.id), [])
+            except NotImplementedError:
+                self.skipTest("Threads are not indexed")
+            for client_id in ["client_1", "client_2", "client_3"]:
+                self.storage.create_inbox("message_bus_1", client_id)
+
+            self.storage.add_message_to_inboxes("message_bus_1", ["client_2", "client_3"], root)
+            self.storage.add_messages_to_inbox("message_bus_1", "client_1", [reply, other])
+            self.storage.add_message_to_inbox("message_bus_1", "client_2", follow_up)
+
+            thread = self.storage.get_thread("message_bus_1", root.id)
+            self.assertListEqual(thread, sorted([root, reply, follow_up]))
+            stored_reply = next(message for message in thread if message.id == reply.id)
+            self.assertEqual(stored_reply.thread_id, root.id)
+            self.assertEqual(stored_reply.in_reply_to, root.id)
+            self.assertEqual(stored_reply.topic, "chat")
+            self.assertListEqual(self.storage.get_thread("message_bus_1", other.id), [other])
+            self.assertListEqual(self.storage.get_thread("message_bus_1", reply.id), [])
+
+            # The fields survive a round trip through the inbox
+            read = self.storage.get_messages_in_time_range("message_bus_1", "client_1", 0, int(time.time() * 1000) + 1)
+            self.assertListEqual(read, [reply, other])
+            self.assertEqual((read[0].thread_id, read[0].in_reply_to, read[0].topic), (root.id, root.id, "chat"))
+
+            # A message stays in the thread as long as an inbox holds it
+            self.storage.remove_received_message("message_bus_1", "client_1", ["client_2"], root.id)
+            self.assertListEqual(self.storage.get_thread("message_bus_1", root.id), sorted([root, reply, follow_up]))
+            self.storage.remove_received_message("message_bus_1", "client_1", ["client_3"], root.id)
+            self.storage.remove_inbox("message_bus_1", "client_1")
+            self.assertListEqual(self.storage.get_thread("message_bus_1", root.id), [follow_up])
+            self.assertListEqual(self.storage.get_thread("message_bus_1", other.id), [])
+
+            self.storage.remove_messages_in_time_range("message_bus_1", "client_2", 0, int(time.time() * 1000) + 1)
+            self.assertListEqual(self.storage.get_thread("message_bus_1", root.id), [])
+
+        def test_scheduled_messages(self):
+            now = int(time.time() * 1000)
+            messages = [
+                Message(self._get_id(Priority.NORMAL), "test_client", {"n": n}, ["other_client"]) for n in range(4)
+            ]
+            try:
+                self.storage.schedule_message("message_bus_1", messages[0], now + 30)
+            except NotImplementedError:
+                self.skipTest("Scheduled messages are not supported")
+            self.storage.schedule_message("message_bus_1", messages[1], now + 10)
+            self.storage.schedule_message("message_bus_1", messages[2], now + 20)
+            self.storage.schedule_message("message_bus_1", messages[3], now + 60_000)
+            self.storage.schedule_message("message_bus_2", messages[0], now)
+
+            self.assertEqual(self.storage.get_next_due_time("message_bus_1"), now + 10)
+            self.assertListEqual(self.storage.pop_due_messages("message_bus_1", now + 5, 10), [])
+            due = self.storage.pop_due_messages("message_bus_1", now + 30, 2)
+            self.assertListEqual(due, [messages[1], messages[2]])
+            self.assertListEqual(due[0].recipients, ["other_client"])
+            self.assertEqual(self.storage.get_next_due_time("message_bus_1"), now + 30)
+            self.assertListEqual(self.storage.pop_due_messages("message_bus_1", now + 30, 10), [messages[0]])
+            self.assertEqual(self.storage.get_next_due_time("message_bus_1"), now + 60_000)
+
+            self.assertListEqual(self.storage.pop_due_messages("message_bus_2", now, 10), [messages[0]])
+            self.assertIsNone(self.storage.get_next_due_time("message_bus_2"))
+
+    class TestBlobStorageBackendABC(TestStorageBackendABC):
+        """
+        Tests for storage backends keeping large payloads in a blob store.
+        """
+
+        def test_large_message_is_stored_once(self):
+            recipients = ["test_client_1", "test_client_2", "test_client_3"]
+            for recipient in recipients:
+                self.storage.create_inbox("message_bus_1", recipient)
+
+            msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello! " * 10000})
+            self.storage.add_message_to_inboxes("message_bus_1", recipients, msg)
+            self.assertEqual(len(self.storage.blob_store), 1)
+
+            self.assertEqual(msg, self.storage.get_next_unread_message("message_bus_1", "test_client_1", 0))
+            self.storage.remove_received_message("message_bus_1", "test_client", ["test_client_2"], msg.id)
+            self.assertEqual(len(self.storage.blob_store), 1)
+
+            self.storage.remove_inbox("message_bus_1", "test_client_3")
+            self.storage.remove_received_message("message_bus_1", "test_client", ["test_client_1"], msg.id)
+            self.assertEqual(len(self.storage.blob_store), 0)
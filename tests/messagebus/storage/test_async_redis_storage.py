@@ -0,0 +1,31 @@
+import unittest
+
+import fakeredis
+
+from rustic_ai.messagebus import AsyncRedisStorage, AsyncStorageBackend, Message, Priority, RedisStorage
+from rustic_ai.messagebus.storage.compression import Compressor
+
+from .async_storage_backend_base_test import AbstractTests
+
+
+class TestAsyncRedisStorage(AbstractTests.TestAsyncStorageBackendABC, unittest.IsolatedAsyncioTestCase):
+    def get_storage_backend(self) -> AsyncStorageBackend:
+        self.server = fakeredis.FakeServer()
+        return AsyncRedisStorage(fakeredis.FakeAsyncRedis(server=self.server))
+
+    async def test_shares_inboxes_with_redis_storage(self):
+        storage = RedisStorage(fakeredis.FakeStrictRedis(server=self.server))
+        msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello!"})
+        storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+
+        self.assertEqual(msg, await self.storage.get_next_unread_message("message_bus_1", "test_client", 0))
+
+
+class TestAsyncRedisStorageCompressed(TestAsyncRedisStorage):
+    def get_storage_backend(self) -> AsyncStorageBackend:
+        self.server = fakeredis.FakeServer()
+        return AsyncRedisStorage(fakeredis.FakeAsyncRedis(server=self.server), "binary", Compressor("zlib"))
+
+
+if __name__ == '__main__':
+    unittest.main()
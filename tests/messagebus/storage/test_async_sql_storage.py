@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from rustic_ai.messagebus import (
+    AsyncClient,
+    AsyncMessageBus,
+    AsyncSQLStorage,
+    AsyncStorageBackend,
+    SimpleClient,
+    SQLStorage,
+)
+from rustic_ai.messagebus.storage.compression import Compressor
+
+from .async_storage_backend_base_test import AbstractTests
+
+HAS_AIOSQLITE = importlib.util.find_spec("aiosqlite") is not None
+
+
+@unittest.skipUnless(HAS_AIOSQLITE, "aiosqlite is not installed")
+class TestAsyncSQLStorage(AbstractTests.TestAsyncStorageBackendABC, unittest.IsolatedAsyncioTestCase):
+    def get_storage_backend(self) -> AsyncStorageBackend:
+        return AsyncSQLStorage(f"sqlite+aiosqlite:///{self.database}")
+
+    async def asyncSetUp(self):
+        # Every connection to an in-memory SQLite database gets its own database, so concurrent sessions need a file
+        descriptor, self.database = tempfile.mkstemp(suffix=".db")
+        os.close(descriptor)
+        await super().asyncSetUp()
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        os.remove(self.database)
+
+    def test_blob_store_is_bound_to_the_database(self):
+        self.assertIs(self.storage.blob_store.Session.kw["bind"], self.storage.engine.sync_engine)
+
+    async def test_message_bus_on_the_async_storage(self):
+        sql_storage = SQLStorage(f"sqlite:///{self.database}")
+        message_bus = AsyncMessageBus(storage_backend=sql_storage, async_storage_backend=self.storage)
+        sender = AsyncClient("sender", message_bus)
+        receiver = SimpleClient("receiver", message_bus)
+
+        # Sent through the async storage, read through the storage sharing its tables
+        sent = await sender.async_send_message({"data": "x" * 1024}, ["receiver"])
+        received = receiver.get_next_unread_message()
+        self.assertEqual((received.id, received.content), (sent.id, sent.content))
+        # Released by the bus, the clients remove their inboxes at the end of the test, while the database is there
+        message_bus.unregister_client(sender)
+        message_bus.unregister_client(receiver)
+        message_bus.close()
+
+
+@unittest.skipUnless(HAS_AIOSQLITE, "aiosqlite is not installed")
+class TestAsyncSQLStorageWithBlobs(TestAsyncSQLStorage):
+    def get_storage_backend(self) -> AsyncStorageBackend:
+        return AsyncSQLStorage(
+            f"sqlite+aiosqlite:///{self.database}", compression=Compressor("zlib", threshold=256), blob_threshold=64
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from rustic_ai.messagebus.storage.blob_store import FileBlobStore, InMemoryBlobStore, blob_reference, get_blob_digest
+from rustic_ai.messagebus.storage.sql_storage import Base, BlobTable, SQLBlobStore
+
+
+class BlobStoreTests(object):
+    def test_payload_is_stored_once(self):
+        digest1 = self.blob_store.put(b"payload")
+        digest2 = self.blob_store.put(b"payload", 2)
+        self.assertEqual(digest1, digest2)
+        self.assertEqual(len(self.blob_store), 1)
+        self.assertIn(digest1, self.blob_store)
+
+    def test_get_returns_a_view(self):
+        digest = self.blob_store.put(b"payload")
+        view = self.blob_store.get(digest)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(view), b"payload")
+
+    def test_payload_is_deleted_with_last_reference(self):
+        digest = self.blob_store.put(b"payload", 2)
+        self.blob_store.release(digest)
+        self.assertIn(digest, self.blob_store)
+        self.blob_store.release(digest)
+        self.assertNotIn(digest, self.blob_store)
+        self.assertEqual(len(self.blob_store), 0)
+
+    def test_view_outlives_the_payload(self):
+        digest = self.blob_store.put(b"payload")
+        view = self.blob_store.get(digest)
+        self.blob_store.release(digest)
+        self.assertEqual(bytes(view), b"payload")
+
+    def test_reference(self):
+        digest = self.blob_store.put(b"payload")
+        self.assertEqual(get_blob_digest(blob_reference(digest)), digest)
+        self.assertIsNone(get_blob_digest(b"payload"))
+
+
+class TestInMemoryBlobStore(BlobStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.blob_store = InMemoryBlobStore()
+
+
+class TestFileBlobStore(BlobStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.blob_store = FileBlobStore(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_mapped_file_is_replaced_rather_than_rewritten(self):
+        digest = self.blob_store.put(b"payload")
+        view = self.blob_store.get(digest)
+        mapped_file = os.stat(os.path.join(self.temp_dir, digest))
+        # The reference count is lost, e.g. on a crash, while the payload file is still mapped
+        os.remove(os.path.join(self.temp_dir, f"{digest}.refs"))
+
+        self.blob_store.put(b"payload")
+        self.assertNotEqual(os.stat(os.path.join(self.temp_dir, digest)).st_ino, mapped_file.st_ino)
+        self.blob_store.release(digest)
+
+        self.assertEqual(bytes(view), b"payload")
+        self.assertEqual(len(self.blob_store), 0)
+
+
+class TestSQLBlobStore(BlobStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.temp_dir, 'blobs.db')}")
+        Base.metadata.create_all(self.engine)
+        self.blob_store = SQLBlobStore(sessionmaker(self.engine))
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.temp_dir)
+
+    def test_concurrent_puts_count_every_reference(self):
+        # Each thread has its own store, as the processes sharing the database would
+        stores = [SQLBlobStore(sessionmaker(self.engine)) for _ in range(4)]
+
+        def put(blob_store):
+            for _ in range(20):
+                blob_store.put(b"payload")
+
+        threads = [threading.Thread(target=put, args=(blob_store,)) for blob_store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.blob_store.Session() as session:
+            self.assertEqual(session.query(BlobTable.references).scalar(), 80)
+        self.assertEqual(len(self.blob_store), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
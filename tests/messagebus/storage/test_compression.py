@@ -0,0 +1,35 @@
+import unittest
+
+from rustic_ai.messagebus.storage.compression import Compressor, decompress
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.payload = b'{"content": "' + b"Hello! " * 1000 + b'"}'
+
+    def test_round_trip_with_each_algorithm(self):
+        for algorithm in ("zlib", "lzma", "bz2"):
+            compressed = Compressor(algorithm).compress(self.payload)
+            self.assertLess(len(compressed), len(self.payload))
+            self.assertEqual(decompress(compressed), self.payload)
+
+    def test_payload_below_threshold_is_not_compressed(self):
+        compressor = Compressor(threshold=len(self.payload) + 1)
+        self.assertIs(compressor.compress(self.payload), self.payload)
+
+    def test_incompressible_payload_is_stored_as_is(self):
+        payload = bytes(range(256))
+        self.assertIs(Compressor(threshold=0).compress(payload), payload)
+
+    def test_uncompressed_payload_is_read_as_is(self):
+        self.assertIs(decompress(self.payload), self.payload)
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            Compressor("zstd")
+        with self.assertRaises(ValueError):
+            decompress(b"\x00?data")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import os
+import shutil
 import tempfile
+import time
 import unittest
 
-from rustic_ai.messagebus import FileBasedStorage, StorageBackend
+from rustic_ai.messagebus import FileBasedStorage, Message, Priority, StorageBackend
+from rustic_ai.messagebus.storage.compression import Compressor
 
 from .storage_backend_base_test import AbstractTests
 
@@ -13,6 +16,7 @@ class TestFileBasedStorage(AbstractTests.TestStorageBackendABC, unittest.TestCas
         return FileBasedStorage(self.temp_dir)
 
     def tearDown(self):
+        self.storage.close()
         # Cleanup the temporary directory after each test
         for root, dirs, files in os.walk(self.temp_dir, topdown=False):
             for name in files:
@@ -20,3 +24,92 @@ class TestFileBasedStorage(AbstractTests.TestStorageBackendABC, unittest.TestCas
             for name in dirs:
                 os.rmdir(os.path.join(root, name))
         os.rmdir(self.temp_dir)
+
+    def test_expired_messages_are_removed_in_the_background(self):
+        self.storage.create_inbox("message_bus_1", "test_client")
+        now = int(time.time() * 1000)
+        messages = [
+            Message(self._get_id(Priority.NORMAL), "test_client", {"n": n}, expires_at=now + 50) for n in range(3)
+        ]
+        lasting = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 3})
+        self.storage.add_messages_to_inbox("message_bus_1", "test_client", messages + [lasting])
+
+        deadline = time.time() + 5
+        while len(self.storage._load_inbox("message_bus_1", "test_client")) > 1 and time.time() < deadline:
+            time.sleep(0.01)
+        inbox = self.storage._load_inbox("message_bus_1", "test_client")
+        self.assertListEqual([message_id for message_id, _ in inbox], [lasting.id])
+
+    def test_scheduled_messages_survive_restarts(self):
+        msg = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1})
+        self.storage.schedule_message("message_bus_1", msg, 1000)
+
+        storage = FileBasedStorage(self.temp_dir)
+        self.assertEqual(storage.get_next_due_time("message_bus_1"), 1000)
+        self.assertListEqual(storage.pop_due_messages("message_bus_1", 1000, 10), [msg])
+        self.assertIsNone(self.storage.get_next_due_time("message_bus_1"))
+
+    def test_create_inbox_keeps_existing_messages(self):
+        self.storage.create_inbox("message_bus_1", "test_client")
+        msg = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1})
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+
+        storage = FileBasedStorage(self.temp_dir)
+        storage.create_inbox("message_bus_1", "test_client")
+        self.assertEqual(storage.get_next_unread_message("message_bus_1", "test_client", 0), msg)
+
+    def test_thread_index_survives_restarts_and_drops_read_messages(self):
+        self.storage.create_inbox("message_bus_1", "test_client")
+        root = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 0})
+        reply = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1}, thread_id=root.id)
+        self.storage.add_messages_to_inbox("message_bus_1", "test_client", [root, reply])
+
+        storage = FileBasedStorage(self.temp_dir)
+        self.assertListEqual(storage.get_thread("message_bus_1", root.id), [root, reply])
+        storage.get_next_unread_message("message_bus_1", "test_client", 0)
+
+        self.assertListEqual(storage.get_thread("message_bus_1", root.id), [reply])
+        self.assertListEqual(
+            FileBasedStorage(self.temp_dir)._get_thread_index("message_bus_1").get(root.id),
+            [(reply.id, "test_client")],
+        )
+        storage.close()
+
+    def test_thread_index_drops_the_messages_leaving_the_inboxes(self):
+        for client_id in ["client_1", "client_2"]:
+            self.storage.create_inbox("message_bus_1", client_id)
+        messages = [Message(self._get_id(Priority.NORMAL), "sender", {"n": n}) for n in range(500)]
+        self.storage.add_messages_to_inbox("message_bus_1", "client_1", messages)
+        self.storage.add_messages_to_inbox("message_bus_1", "client_2", messages)
+
+        message = self.storage.get_next_unread_message("message_bus_1", "client_1", 0)
+        while message is not None:
+            message = self.storage.get_next_unread_message("message_bus_1", "client_1", message.id)
+        self.storage.remove_messages_in_time_range("message_bus_1", "client_2", 0, int(time.time() * 1000) + 1)
+        self.storage.add_message_to_inbox("message_bus_1", "client_2", messages[0])
+        self.storage.remove_inbox("message_bus_1", "client_2")
+
+        # The index is one file per message bus, emptied as the messages left the inboxes
+        self.assertDictEqual(self.storage._get_thread_index("message_bus_1").threads, {})
+        self.assertListEqual(sorted(os.listdir(os.path.join(self.temp_dir, "message_bus_1"))), ["client_1.inbox"])
+
+
+class TestFileBasedStorageBinaryCodec(TestFileBasedStorage):
+    def get_storage_backend(self) -> StorageBackend:
+        self.temp_dir = tempfile.mkdtemp()
+        return FileBasedStorage(self.temp_dir, codec="binary")
+
+
+class TestFileBasedStorageCompressed(TestFileBasedStorage):
+    def get_storage_backend(self) -> StorageBackend:
+        self.temp_dir = tempfile.mkdtemp()
+        return FileBasedStorage(self.temp_dir, codec="binary", compression=Compressor("bz2"))
+
+
+class TestFileBasedStorageWithBlobs(AbstractTests.TestBlobStorageBackendABC, unittest.TestCase):
+    def get_storage_backend(self) -> StorageBackend:
+        self.temp_dir = tempfile.mkdtemp()
+        return FileBasedStorage(self.temp_dir, codec="binary", blob_threshold=4096)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
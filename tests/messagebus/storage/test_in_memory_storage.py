@@ -1,6 +1,11 @@
+import os
+import random
+import shutil
+import tempfile
+import time
 import unittest
 
-from rustic_ai.messagebus import InMemoryStorage, StorageBackend
+from rustic_ai.messagebus import InMemoryStorage, Message, Priority, StorageBackend
 
 from .storage_backend_base_test import AbstractTests
 
@@ -9,6 +14,219 @@ class TestInMemoryStorage(AbstractTests.TestStorageBackendABC, unittest.TestCase
     def get_storage_backend(self) -> StorageBackend:
         return InMemoryStorage()
 
+    def tearDown(self):
+        self.storage.close()
+
+    def test_expired_messages_are_removed_in_the_background(self):
+        self.storage.create_inbox("message_bus_1", "test_client")
+        now = int(time.time() * 1000)
+        expiring = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1}, expires_at=now + 50)
+        lasting = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 2}, expires_at=now + 60_000)
+        self.storage.add_messages_to_inbox("message_bus_1", "test_client", [expiring, lasting])
+
+        deadline = time.time() + 5
+        while len(self.storage.inboxes["message_bus_1"]["test_client"]) > 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertListEqual(list(self.storage.inboxes["message_bus_1"]["test_client"]), [lasting])
+
+    def test_deep_inbox_is_read_in_order(self):
+        self.storage.create_inbox("message_bus_1", "test_client")
+        messages = [Message(self._get_id(Priority.NORMAL), "sender", {"n": n}) for n in range(20_000)]
+        shuffled = messages[:]
+        random.Random(0).shuffle(shuffled)
+        for start in range(0, len(shuffled), 1000):
+            self.storage.add_messages_to_inbox("message_bus_1", "test_client", shuffled[start : start + 1000])
+
+        read = []
+        message = self.storage.get_next_unread_message("message_bus_1", "test_client", 0)
+        while message is not None:
+            read.append(message)
+            message = self.storage.get_next_unread_message("message_bus_1", "test_client", message.id)
+        self.assertListEqual(read, messages)
+
+    def test_only_threads_with_replies_are_indexed(self):
+        self.storage.create_inbox("message_bus_1", "test_client")
+        root = Message(self._get_id(Priority.NORMAL), "sender", {"n": 0})
+        self.storage.add_messages_to_inbox(
+            "message_bus_1", "test_client", [root, Message(self._get_id(Priority.NORMAL), "sender", {"n": 1})]
+        )
+        self.assertDictEqual(self.storage.threads.get("message_bus_1", {}), {})
+
+        reply = Message(self._get_id(Priority.NORMAL), "other", {"n": 2}, thread_id=root.id, in_reply_to=root.id)
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", reply)
+        self.assertDictEqual(self.storage.threads["message_bus_1"], {root.id: [reply]})
+        self.assertListEqual(self.storage.get_thread("message_bus_1", root.id), [root, reply])
+
+        self.storage.remove_received_message("message_bus_1", "other", ["test_client"], reply.id)
+        self.assertDictEqual(self.storage.threads["message_bus_1"], {})
+
+
+class TestInMemoryStorageWithSnapshots(TestInMemoryStorage):
+    def get_storage_backend(self) -> StorageBackend:
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.temp_dir, "inboxes.snapshot")
+        # Snapshots are saved continuously, so the changes made while they are saved are covered too
+        return InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=0.001)
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _restart(self) -> InMemoryStorage:
+        self.storage.close()
+        self.storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        return self.storage
+
+    def test_inboxes_are_restored(self):
+        self.storage.create_inbox("message_bus_1", "client_1")
+        self.storage.create_inbox("message_bus_1", "client_2")
+        messages = [
+            Message(self._get_id(Priority.NORMAL), "sender", {"n": n}, ["client_1"], thread_id=1, topic="topic")
+            for n in range(3)
+        ]
+        self.storage.add_messages_to_inbox("message_bus_1", "client_1", messages)
+        self.storage.add_message_to_inbox("message_bus_1", "client_2", messages[0])
+        self.storage.get_next_unread_message("message_bus_1", "client_1", 0)
+
+        storage = self._restart()
+
+        # Inboxes are decoded when their client registers again
+        self.assertDictEqual(storage.inboxes, {})
+        self.assertListEqual(storage.get_thread("message_bus_1", 1), messages)
+        self.assertListEqual(list(storage.inboxes["message_bus_1"]["client_1"]), messages[1:])
+        self.assertEqual(storage.inboxes["message_bus_1"]["client_1"][0].topic, "topic")
+        storage.create_inbox("message_bus_1", "client_2")
+        self.assertEqual(storage.get_next_unread_message("message_bus_1", "client_2", 0), messages[0])
+
+    def test_removed_inboxes_are_not_restored(self):
+        self.storage.create_inbox("message_bus_1", "client_1")
+        self.storage.add_message_to_inbox("message_bus_1", "client_1", Message(self._get_id(Priority.NORMAL), "s", {}))
+        self.storage.save_snapshot()
+        self.storage.remove_inbox("message_bus_1", "client_1")
+
+        storage = self._restart()
+
+        self.assertSetEqual(storage.restored, set())
+        storage.create_inbox("message_bus_1", "client_1")
+        self.assertIsNone(storage.get_next_unread_message("message_bus_1", "client_1", 0))
+
+    def test_expired_messages_are_not_restored(self):
+        self.storage.create_inbox("message_bus_1", "client_1")
+        now = int(time.time() * 1000)
+        expiring = Message(self._get_id(Priority.NORMAL), "s", {"n": 1}, expires_at=now + 50)
+        lasting = Message(self._get_id(Priority.NORMAL), "s", {"n": 2}, expires_at=now + 60_000)
+        self.storage.add_messages_to_inbox("message_bus_1", "client_1", [expiring, lasting])
+
+        storage = self._restart()
+        time.sleep(0.06)
+
+        storage.create_inbox("message_bus_1", "client_1")
+        self.assertListEqual(list(storage.inboxes["message_bus_1"]["client_1"]), [lasting])
+
+    def test_snapshots_are_incremental(self):
+        self.storage.close()
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        for client_id in ("client_1", "client_2"):
+            storage.create_inbox("message_bus_1", client_id)
+            messages = [Message(self._get_id(Priority.NORMAL), "s", {"data": "x" * 100}) for _ in range(10)]
+            storage.add_messages_to_inbox("message_bus_1", client_id, messages)
+        storage.save_snapshot()
+        size = storage.snapshot.size
+        segment_1 = storage.snapshot.segments[("message_bus_1", "client_1")]
+
+        storage.get_next_unread_message("message_bus_1", "client_2", 0)
+        storage.save_snapshot()
+
+        # Only the changed inbox is written again
+        self.assertEqual(storage.snapshot.segments[("message_bus_1", "client_1")], segment_1)
+        self.assertGreaterEqual(storage.snapshot.segments[("message_bus_1", "client_2")][0], size)
+        self.assertLess(storage.snapshot.size - size, segment_1[1] + 100)
+
+        # Nothing changed, nothing written but the index
+        size = storage.snapshot.size
+        storage.save_snapshot()
+        self.assertLess(storage.snapshot.size - size, 100)
+        storage.close()
+
+    def test_snapshot_file_is_compacted(self):
+        self.storage.close()
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        storage.create_inbox("message_bus_1", "client_1")
+        storage.add_messages_to_inbox(
+            "message_bus_1", "client_1", [Message(self._get_id(Priority.NORMAL), "s", {"n": n}) for n in range(100)]
+        )
+        storage.save_snapshot()
+        for _ in range(20):
+            storage.get_next_unread_message("message_bus_1", "client_1", 0)
+            storage.save_snapshot()
+
+        self.assertLessEqual(
+            os.path.getsize(self.snapshot_path), 2 * storage.snapshot.segments[("message_bus_1", "client_1")][1] + 100
+        )
+        storage.close()
+
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        storage.create_inbox("message_bus_1", "client_1")
+        self.assertListEqual(
+            [message.content["n"] for message in storage.inboxes["message_bus_1"]["client_1"]], list(range(20, 100))
+        )
+        storage.close()
+
+    def test_changes_during_a_snapshot_are_copied_on_write(self):
+        self.storage.close()
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        storage.create_inbox("message_bus_1", "client_1")
+        first = Message(self._get_id(Priority.NORMAL), "s", {"n": 1})
+        storage.add_message_to_inbox("message_bus_1", "client_1", first)
+        frozen = storage.inboxes["message_bus_1"]["client_1"]
+        storage.frozen.add(("message_bus_1", "client_1"))
+
+        second = Message(self._get_id(Priority.NORMAL), "s", {"n": 2})
+        storage.add_message_to_inbox("message_bus_1", "client_1", second)
+
+        # The list being saved is left as it was
+        self.assertListEqual(list(frozen), [first])
+        self.assertListEqual(list(storage.inboxes["message_bus_1"]["client_1"]), [first, second])
+        self.assertNotIn(("message_bus_1", "client_1"), storage.frozen)
+        storage.close()
+
+    def test_interrupted_snapshot_keeps_the_previous_one(self):
+        self.storage.close()
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        storage.create_inbox("message_bus_1", "client_1")
+        message = Message(self._get_id(Priority.NORMAL), "s", {"n": 1})
+        storage.add_message_to_inbox("message_bus_1", "client_1", message)
+        storage.save_snapshot()
+        storage.snapshot.close()
+
+        # A snapshot written but never pointed at by the header
+        with open(self.snapshot_path, "ab") as f:
+            f.write(b"\x00" * 64)
+
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        storage.create_inbox("message_bus_1", "client_1")
+        self.assertListEqual(list(storage.inboxes["message_bus_1"]["client_1"]), [message])
+        storage.add_message_to_inbox("message_bus_1", "client_1", Message(self._get_id(Priority.NORMAL), "s", {}))
+        storage.close()
+
+        storage = InMemoryStorage(snapshot_path=self.snapshot_path, snapshot_interval=None)
+        storage.create_inbox("message_bus_1", "client_1")
+        self.assertEqual(len(storage.inboxes["message_bus_1"]["client_1"]), 2)
+        storage.close()
+
+    def test_not_a_snapshot_file(self):
+        path = os.path.join(self.temp_dir, "other")
+        with open(path, "wb") as f:
+            f.write(b"x" * 64)
+        with self.assertRaises(ValueError):
+            InMemoryStorage(snapshot_path=path)
+
+    def test_save_snapshot_without_file(self):
+        storage = InMemoryStorage()
+        with self.assertRaises(ValueError):
+            storage.save_snapshot()
+        storage.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,219 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from abc import ABC, abstractmethod
+
+from rustic_ai.messagebus import Message
+from rustic_ai.messagebus.storage import (
+    FileBasedStorage,
+    InboxFullError,
+    InboxLimits,
+    InMemoryStorage,
+    OverflowPolicy,
+    StorageBackend,
+)
+from rustic_ai.messagebus.utils import GemstoneGenerator, Priority
+
+
+class AbstractTests(object):
+    class TestInboxLimitsABC(ABC):
+        @abstractmethod
+        def get_storage_backend(self, limits: InboxLimits) -> StorageBackend:
+            pass
+
+        def setUp(self):
+            self.id_generator = GemstoneGenerator(1)
+
+        def _create(self, limits: InboxLimits, *client_ids: str) -> StorageBackend:
+            storage = self.get_storage_backend(limits)
+            for client_id in client_ids:
+                storage.create_inbox("bus", client_id)
+            return storage
+
+        def _message(self, priority: Priority = Priority.NORMAL, index: int = 0) -> Message:
+            # Sleep so every message has its own millisecond, making the oldest one unambiguous
+            time.sleep(0.001)
+            return Message(self.id_generator.get_int_id(priority), "sender", {"index": index}, priority=priority)
+
+        def _drain(self, storage: StorageBackend, client_id: str):
+            messages = []
+            message = storage.get_next_unread_message("bus", client_id, 0)
+            while message is not None:
+                messages.append(message)
+                message = storage.get_next_unread_message("bus", client_id, message.id)
+            return messages
+
+        def test_reject(self):
+            storage = self._create(InboxLimits(max_messages=2), "client")
+            storage.add_message_to_inbox("bus", "client", self._message())
+            storage.add_message_to_inbox("bus", "client", self._message())
+            with self.assertRaises(InboxFullError):
+                storage.add_message_to_inbox("bus", "client", self._message())
+
+            # Reading a message makes room for another one
+            storage.get_next_unread_message("bus", "client", 0)
+            storage.add_message_to_inbox("bus", "client", self._message())
+
+        def test_rejected_message_is_stored_in_no_inbox(self):
+            storage = self._create(InboxLimits(max_messages=1), "client_1", "client_2", "client_3")
+            storage.add_message_to_inbox("bus", "client_2", self._message())
+            with self.assertRaises(InboxFullError):
+                storage.add_message_to_inboxes("bus", ["client_1", "client_2", "client_3"], self._message())
+            with self.assertRaises(InboxFullError):
+                storage.add_messages_to_inbox("bus", "client_3", [self._message(), self._message()])
+
+            self.assertListEqual(self._drain(storage, "client_1"), [])
+            self.assertListEqual(self._drain(storage, "client_3"), [])
+            self.assertEqual(storage.budget.total_messages, 1)
+
+        def test_drop_oldest(self):
+            storage = self._create(InboxLimits(max_messages=2, overflow_policy=OverflowPolicy.DROP_OLDEST), "client")
+            messages = [
+                self._message(Priority.LOW, 0),
+                self._message(Priority.HIGH, 1),
+                self._message(Priority.NORMAL, 2),
+            ]
+            for message in messages:
+                storage.add_message_to_inbox("bus", "client", message)
+
+            self.assertListEqual(self._drain(storage, "client"), [messages[1], messages[2]])
+            self.assertEqual(storage.budget.dropped_messages, 1)
+
+        def test_drop_lowest_priority(self):
+            limits = InboxLimits(max_messages=2, overflow_policy=OverflowPolicy.DROP_LOWEST_PRIORITY)
+            storage = self._create(limits, "client")
+            low, normal, high, lowest = (
+                self._message(Priority.LOW),
+                self._message(Priority.NORMAL),
+                self._message(Priority.HIGH),
+                self._message(Priority.LOWEST),
+            )
+            for message in (low, normal, high, lowest):
+                storage.add_message_to_inbox("bus", "client", message)
+
+            # The low priority message made room for the high one, the lowest one was dropped on arrival
+            self.assertListEqual(self._drain(storage, "client"), [high, normal])
+            self.assertEqual(storage.budget.dropped_messages, 2)
+
+        def test_byte_budget(self):
+            storage = self._create(InboxLimits(max_bytes=1000), "client")
+            storage.add_message_to_inbox("bus", "client", self._message())
+            large = Message(self.id_generator.get_int_id(Priority.NORMAL), "sender", {"data": "x" * 1000})
+            with self.assertRaises(InboxFullError):
+                storage.add_message_to_inbox("bus", "client", large)
+
+        def test_oversize_message_is_rejected_whatever_the_policy(self):
+            for policy in OverflowPolicy:
+                limits = InboxLimits(max_bytes=1000, total_max_bytes=5000, overflow_policy=policy)
+                storage = self._create(limits, "client")
+                kept = self._message()
+                storage.add_message_to_inbox("bus", "client", kept)
+                for budget in (1000, 5000):
+                    large = Message(self.id_generator.get_int_id(Priority.NORMAL), "sender", {"data": "x" * budget})
+                    # Rejected at once, without blocking forever or dropping the messages stored
+                    with self.assertRaises(InboxFullError):
+                        storage.add_message_to_inbox("bus", "client", large)
+                self.assertListEqual(self._drain(storage, "client"), [kept])
+                storage.close()
+
+        def test_global_budget_drops_from_largest_inbox(self):
+            limits = InboxLimits(total_max_messages=3, overflow_policy=OverflowPolicy.DROP_OLDEST)
+            storage = self._create(limits, "slow", "fast")
+            slow = [self._message(index=index) for index in range(2)]
+            storage.add_messages_to_inbox("bus", "slow", slow)
+            fast = [self._message(index=index) for index in range(2)]
+            storage.add_messages_to_inbox("bus", "fast", fast)
+
+            self.assertListEqual(self._drain(storage, "slow"), slow[1:])
+            self.assertListEqual(self._drain(storage, "fast"), fast)
+
+        def test_block(self):
+            limits = InboxLimits(max_messages=1, overflow_policy=OverflowPolicy.BLOCK, block_timeout=0.05)
+            storage = self._create(limits, "client")
+            first = self._message(index=0)
+            storage.add_message_to_inbox("bus", "client", first)
+            with self.assertRaises(InboxFullError):
+                storage.add_message_to_inbox("bus", "client", self._message())
+
+            # A reader makes room while the sender is blocked
+            storage.budget.limits.block_timeout = 5
+            reader = threading.Timer(0.05, storage.get_next_unread_message, ("bus", "client", 0))
+            reader.start()
+            second = self._message(index=1)
+            storage.add_message_to_inbox("bus", "client", second)
+            reader.join()
+            self.assertListEqual(self._drain(storage, "client"), [second])
+
+        def test_water_marks(self):
+            events = []
+            limits = InboxLimits(
+                max_messages=4,
+                high_water_mark=0.75,
+                low_water_mark=0.25,
+                on_high_water_mark=lambda bus, client: events.append(("high", client)),
+                on_low_water_mark=lambda bus, client: events.append(("low", client)),
+            )
+            storage = self._create(limits, "client")
+            storage.add_messages_to_inbox("bus", "client", [self._message(index=index) for index in range(3)])
+            self.assertListEqual(events, [("high", "client")])
+
+            storage.get_next_unread_message("bus", "client", 0)
+            self.assertListEqual(events, [("high", "client")])
+            self._drain(storage, "client")
+            self.assertListEqual(events, [("high", "client"), ("low", "client")])
+
+        def test_remove_inbox_releases_budget(self):
+            storage = self._create(InboxLimits(total_max_messages=2), "client_1", "client_2")
+            storage.add_messages_to_inbox("bus", "client_1", [self._message(), self._message()])
+            storage.remove_inbox("bus", "client_1")
+            storage.add_messages_to_inbox("bus", "client_2", [self._message(), self._message()])
+            self.assertEqual(storage.budget.total_messages, 2)
+
+
+class TestInMemoryStorageLimits(AbstractTests.TestInboxLimitsABC, unittest.TestCase):
+    def get_storage_backend(self, limits: InboxLimits) -> StorageBackend:
+        return InMemoryStorage(limits=limits)
+
+
+class TestFileBasedStorageLimits(AbstractTests.TestInboxLimitsABC, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_storage_backend(self, limits: InboxLimits) -> StorageBackend:
+        return FileBasedStorage(self.directory, limits=limits)
+
+    def test_rejected_message_releases_its_blob(self):
+        storage = FileBasedStorage(self.directory, blob_threshold=1000, limits=InboxLimits(max_messages=1))
+        for client_id in ("client_1", "client_2"):
+            storage.create_inbox("bus", client_id)
+        storage.add_message_to_inbox("bus", "client_2", self._message())
+        large = Message(self.id_generator.get_int_id(Priority.NORMAL), "sender", {"data": "x" * 2000})
+
+        with self.assertRaises(InboxFullError):
+            storage.add_message_to_inboxes("bus", ["client_1", "client_2"], large)
+        self.assertEqual(len(storage.blob_store), 0)
+
+        storage.add_message_to_inbox("bus", "client_1", large)
+        self.assertEqual(len(storage.blob_store), 1)
+        self.assertEqual(storage.get_next_unread_message("bus", "client_1", 0), large)
+        self.assertEqual(len(storage.blob_store), 0)
+        storage.close()
+
+    def test_existing_messages_are_accounted(self):
+        storage = self.get_storage_backend(InboxLimits())
+        storage.create_inbox("bus", "client")
+        storage.add_messages_to_inbox("bus", "client", [self._message(), self._message()])
+
+        reopened = self.get_storage_backend(InboxLimits(max_messages=2))
+        with self.assertRaises(InboxFullError):
+            reopened.add_message_to_inbox("bus", "client", self._message())
+
+
+if __name__ == '__main__':
+    unittest.main()
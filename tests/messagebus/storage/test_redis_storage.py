@@ -1,8 +1,11 @@
+import time
 import unittest
+import unittest.mock
 
 import fakeredis
 
-from rustic_ai.messagebus import RedisStorage, StorageBackend
+from rustic_ai.messagebus import Message, Priority, RedisStorage, StorageBackend
+from rustic_ai.messagebus.storage.compression import Compressor
 
 from .storage_backend_base_test import AbstractTests
 
@@ -15,3 +18,68 @@ class TestRedisStorage(AbstractTests.TestStorageBackendABC, unittest.TestCase):
     def tearDown(self):
         # Clean up fake Redis database after each test
         self.storage.redis.flushall()
+
+    def test_purge_expired_messages(self):
+        now = int(time.time() * 1000)
+        expired = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1}, expires_at=now - 1000)
+        expiring = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 2}, expires_at=now + 60_000)
+        self.storage.add_message_to_inboxes("message_bus_1", ["test_client", "other_client"], expired)
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", expiring)
+
+        self.assertEqual(self.storage.purge_expired_messages("message_bus_1", "test_client"), 1)
+        self.assertEqual(self.storage.purge_expired_messages("message_bus_1", "test_client"), 0)
+        self.assertEqual(self.storage.get_next_unread_message("message_bus_1", "test_client", 0), expiring)
+        self.assertEqual(self.storage.purge_expired_messages("message_bus_1", "other_client"), 1)
+
+    def test_expiry_set_is_removed_with_the_inbox(self):
+        msg = Message(
+            self._get_id(Priority.NORMAL), "test_client", {"n": 1}, expires_at=int(time.time() * 1000) + 60_000
+        )
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+        self.storage.remove_inbox("message_bus_1", "test_client")
+        self.assertListEqual(self.storage.redis.keys(), [])
+
+    def test_messages_leave_their_threads_without_being_decoded(self):
+        root = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 0})
+        replies = [
+            Message(self._get_id(Priority.NORMAL), "test_client", {"n": n}, thread_id=root.id) for n in range(1, 4)
+        ]
+        self.storage.add_messages_to_inbox("message_bus_1", "client_1", [root] + replies)
+        self.storage.add_messages_to_inbox("message_bus_1", "client_2", [root] + replies)
+        now = int(time.time() * 1000)
+
+        with unittest.mock.patch.object(self.storage, "_decode", side_effect=AssertionError("decoded")):
+            self.storage.remove_inbox("message_bus_1", "client_1")
+            self.assertEqual(
+                self.storage.remove_messages_in_time_range("message_bus_1", "client_2", now - 60_000, now + 60_000), 4
+            )
+        self.assertListEqual(self.storage.redis.keys(), [])
+
+
+class TestRedisStorageBinaryCodec(TestRedisStorage):
+    def get_storage_backend(self) -> StorageBackend:
+        server = fakeredis.FakeServer()
+        return RedisStorage(fakeredis.FakeStrictRedis(server=server), codec="binary")
+
+    def test_reads_messages_written_with_another_codec(self):
+        json_storage = RedisStorage(self.storage.redis, codec="json")
+        msg1 = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello!"})
+        time.sleep(0.001)
+        msg2 = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello again!"})
+        json_storage.add_message_to_inbox("message_bus_1", "test_client", msg1)
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", msg2)
+
+        self.assertEqual(msg1, self.storage.get_next_unread_message("message_bus_1", "test_client", 0))
+        self.assertEqual(msg2, self.storage.get_next_unread_message("message_bus_1", "test_client", msg1.id))
+
+
+class TestRedisStorageCompressed(TestRedisStorage):
+    def get_storage_backend(self) -> StorageBackend:
+        server = fakeredis.FakeServer()
+        return RedisStorage(fakeredis.FakeStrictRedis(server=server), compression=Compressor("lzma"))
+
+    def test_large_messages_are_stored_compressed(self):
+        msg = Message(self._get_id(Priority.NORMAL), "test_client", {"content": "Hello! " * 10000})
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+        stored = self.storage.redis.zrange(self.storage._get_inbox_id("message_bus_1", "test_client"), 0, 0)[0]
+        self.assertLess(len(stored), len(msg.encode()) / 10)
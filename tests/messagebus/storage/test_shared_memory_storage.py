@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import unittest
+import uuid
+
+from rustic_ai.messagebus import InboxFullError, Message, MessageBus, SharedMemoryStorage, SimpleClient, StorageBackend
+from rustic_ai.messagebus.utils import GemstoneGenerator, Priority
+
+from .storage_backend_base_test import AbstractTests
+
+
+def _send_from_child(namespace: str, count: int) -> None:
+    storage = SharedMemoryStorage(namespace)
+    id_generator = GemstoneGenerator(2)
+    for index in range(count):
+        message = Message(id_generator.get_int_id(Priority.NORMAL), "child", {"index": index})
+        storage.add_message_to_inbox("bus", "parent", message)
+    storage.close()
+
+
+def _register_and_exit(namespace: str) -> None:
+    storage = SharedMemoryStorage(namespace)
+    storage.get_registry("bus").add("orphan", ["orders.*"])
+    storage.close()
+
+
+class TestSharedMemoryStorage(AbstractTests.TestStorageBackendABC, unittest.TestCase):
+    def get_storage_backend(self) -> StorageBackend:
+        self.namespace = uuid.uuid4().hex
+        return SharedMemoryStorage(self.namespace)
+
+    def tearDown(self):
+        for message_bus_id, client_id in list(self.storage.rings):
+            self.storage.remove_inbox(message_bus_id, client_id)
+        registry_paths = [registry.path for registry in self.storage.registries.values()]
+        self.storage.close()
+        for path in registry_paths:
+            shutil.rmtree(path)
+
+    def _drain(self, client_id: str):
+        messages = []
+        message = self.storage.get_next_unread_message("bus", client_id, 0)
+        while message is not None:
+            messages.append(message)
+            message = self.storage.get_next_unread_message("bus", client_id, message.id)
+        return messages
+
+    def test_ring_wraps_around(self):
+        self.storage.create_inbox("bus", "client")
+        for index in range(100):
+            message = Message(self._get_id(Priority.NORMAL), "sender", {"data": "x" * 20000, "index": index})
+            self.storage.add_message_to_inbox("bus", "client", message)
+            self.assertEqual(self.storage.get_next_unread_message("bus", "client", 0), message)
+
+    def test_full_ring(self):
+        self.storage.create_inbox("bus", "client")
+        with self.assertRaises(InboxFullError):
+            for index in range(100):
+                message = Message(self._get_id(Priority.NORMAL), "sender", {"data": "x" * 20000, "index": index})
+                self.storage.add_message_to_inbox("bus", "client", message)
+
+        # Reading moves the messages out of the ring, making room again
+        self.assertEqual(len(self._drain("client")), index)
+        self.storage.add_message_to_inbox("bus", "client", message)
+
+    def test_other_process_sends(self):
+        self.storage.create_inbox("bus", "parent")
+        child = multiprocessing.get_context("spawn").Process(target=_send_from_child, args=(self.namespace, 20))
+        child.start()
+        child.join(30)
+        self.assertEqual(child.exitcode, 0)
+
+        messages = self._drain("parent")
+        self.assertListEqual([message.content["index"] for message in messages], list(range(20)))
+        self.assertTrue(all(message.sender == "child" for message in messages))
+
+    def test_writes_of_other_processes_wake_the_watched_inbox(self):
+        self.storage.create_inbox("bus", "parent")
+        signalled = threading.Event()
+        self.storage.watch_inbox("bus", "parent", signalled.set)
+
+        # Writes from this process are not signalled, the bus of the process notifies its clients itself
+        self.storage.add_message_to_inbox("bus", "parent", Message(self._get_id(Priority.NORMAL), "parent", {}))
+        self.assertFalse(signalled.wait(0.1))
+
+        child = multiprocessing.get_context("spawn").Process(target=_send_from_child, args=(self.namespace, 1))
+        child.start()
+        child.join(30)
+        self.assertEqual(child.exitcode, 0)
+        self.assertTrue(signalled.wait(10))
+        self.assertEqual(len(self._drain("parent")), 2)
+
+        with self.assertRaises(ValueError):
+            self.storage.watch_inbox("bus", "unknown", signalled.set)
+
+    def test_writer_lock_is_opened_once(self):
+        self.storage.create_inbox("bus", "client")
+        ring = self.storage.rings[("bus", "client")]
+        self.storage.add_message_to_inbox("bus", "client", Message(self._get_id(Priority.NORMAL), "sender", {}))
+        lock_fd = ring.lock_fd
+        self.storage.add_message_to_inbox("bus", "client", Message(self._get_id(Priority.NORMAL), "sender", {}))
+        self.assertIsNotNone(lock_fd)
+        self.assertEqual(ring.lock_fd, lock_fd)
+
+    def test_registry_lists_the_clients_of_running_processes(self):
+        registry = self.storage.get_registry("bus")
+        generation = registry.get_generation()
+        registry.add("client", ["orders.*"])
+        self.assertEqual(registry.get_generation(), generation + 1)
+        self.assertEqual(registry.get_clients(), (generation + 1, {"client": {"orders.*"}}))
+
+        # A process which exited without unregistering its client is skipped
+        child = multiprocessing.get_context("spawn").Process(target=_register_and_exit, args=(self.namespace,))
+        child.start()
+        child.join(30)
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(registry.get_clients()[1], {"client": {"orders.*"}})
+
+        registry.remove("client")
+        registry.remove("orphan")
+        self.assertEqual(registry.get_clients(), (generation + 4, {}))
+        self.assertEqual(os.listdir(registry.path), ["generation"])
+
+    def test_client_of_a_bus_polls_the_messages_of_other_processes(self):
+        message_bus = MessageBus(id="bus", storage_backend=self.storage)
+        client = SimpleClient("parent", message_bus)
+        child = multiprocessing.get_context("spawn").Process(target=_send_from_child, args=(self.namespace, 3))
+        child.start()
+        child.join(30)
+        self.assertEqual(child.exitcode, 0)
+
+        # The message bus only knows the clients of its own process
+        with self.assertRaises(ValueError):
+            client.send_message({}, ["child"])
+        self.assertListEqual([client.get_next_unread_message().content["index"] for _ in range(3)], [0, 1, 2])
+        message_bus.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
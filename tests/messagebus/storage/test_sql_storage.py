@@ -1,6 +1,14 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
-from rustic_ai.messagebus import SQLStorage, StorageBackend
+from sqlalchemy import create_engine, text
+
+from rustic_ai.messagebus import Message, Priority, SQLStorage, StorageBackend
+from rustic_ai.messagebus.storage import SchemaVersionError
+from rustic_ai.messagebus.storage.compression import Compressor
 
 from .storage_backend_base_test import AbstractTests
 
@@ -17,3 +25,79 @@ class TestSQLBasedStorage(AbstractTests.TestStorageBackendABC, unittest.TestCase
     def tearDown(self):
         # Close the connection after each test
         self.sql_storage.engine.dispose()
+
+    def test_purge_expired_messages(self):
+        now = int(time.time() * 1000)
+        expired = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 1}, expires_at=now - 1000)
+        expiring = Message(self._get_id(Priority.NORMAL), "test_client", {"n": 2}, expires_at=now + 60_000)
+        self.storage.add_message_to_inboxes("message_bus_1", ["test_client", "other_client"], expired)
+        self.storage.add_message_to_inbox("message_bus_1", "test_client", expiring)
+
+        self.assertEqual(self.storage.purge_expired_messages("message_bus_1", "test_client"), 1)
+        self.assertEqual(self.storage.purge_expired_messages("message_bus_1", "test_client"), 0)
+        self.assertEqual(self.storage.get_next_unread_message("message_bus_1", "test_client", 0), expiring)
+        self.assertEqual(self.storage.purge_expired_messages("message_bus_1", "other_client"), 1)
+
+
+class TestSQLBasedStorageCompressed(TestSQLBasedStorage):
+    def get_storage_backend(self) -> StorageBackend:
+        self.sql_storage = SQLStorage("sqlite://", compression=Compressor("zlib", threshold=256))
+        return self.sql_storage
+
+
+class TestSQLBasedStorageWithBlobs(AbstractTests.TestBlobStorageBackendABC, unittest.TestCase):
+    def get_storage_backend(self) -> StorageBackend:
+        self.sql_storage = SQLStorage("sqlite://", blob_threshold=4096)
+        return self.sql_storage
+
+    def test_purging_expired_messages_releases_their_blobs(self):
+        content = {"content": "x" * 10000}
+        msg = Message(self._get_id(Priority.NORMAL), "test_client", content, expires_at=int(time.time() * 1000) - 1)
+        self.storage.add_message_to_inboxes("message_bus_1", ["test_client", "other_client"], msg)
+        self.assertEqual(len(self.sql_storage.blob_store), 1)
+
+        self.storage.purge_expired_messages("message_bus_1", "test_client")
+        self.assertEqual(len(self.sql_storage.blob_store), 1)
+        self.storage.purge_expired_messages("message_bus_1", "other_client")
+        self.assertEqual(len(self.sql_storage.blob_store), 0)
+
+    def tearDown(self):
+        self.sql_storage.engine.dispose()
+
+
+class TestSQLSchemaVersion(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.connection_string = f"sqlite:///{os.path.join(self.temp_dir, 'messages.db')}"
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_tables_are_reopened(self):
+        storage = SQLStorage(self.connection_string)
+        msg = Message(1 << 63, "test_client", {"n": 1})
+        storage.add_message_to_inbox("message_bus_1", "test_client", msg)
+        storage.engine.dispose()
+
+        storage = SQLStorage(self.connection_string)
+        self.assertEqual(storage.get_next_unread_message("message_bus_1", "test_client", 0), msg)
+        storage.engine.dispose()
+
+    def test_tables_without_a_version_are_rejected(self):
+        engine = create_engine(self.connection_string)
+        with engine.begin() as connection:
+            # The layout of the message table before the IDs were shifted
+            connection.execute(
+                text(
+                    "CREATE TABLE message (id NUMERIC, message_bus_id VARCHAR, recipient_id VARCHAR, "
+                    "sender_id VARCHAR, content VARCHAR, priority VARCHAR, "
+                    "PRIMARY KEY (id, message_bus_id, recipient_id))"
+                )
+            )
+        engine.dispose()
+
+        with self.assertRaises(SchemaVersionError):
+            SQLStorage(self.connection_string)
+        # The check does not mark the tables as current
+        with self.assertRaises(SchemaVersionError):
+            SQLStorage(self.connection_string)
@@ -0,0 +1,52 @@
+import unittest
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from rustic_ai.messagebus import Message, StorageBackend
+
+from .storage_backend_base_test import AbstractTests
+
+
+class MinimalStorage(StorageBackend):
+    """
+    A storage backend implementing only the abstract methods, as a third-party backend written
+    before the optional methods were added would.
+    """
+
+    def __init__(self) -> None:
+        self.inboxes: Dict[str, Dict[str, List[Message]]] = defaultdict(dict)
+
+    def create_inbox(self, message_bus_id: str, client_id: str) -> None:
+        self.inboxes[message_bus_id].setdefault(client_id, [])
+
+    def remove_inbox(self, message_bus_id: str, client_id: str) -> None:
+        self.inboxes[message_bus_id].pop(client_id, None)
+
+    def add_message_to_inbox(self, message_bus_id: str, recipient_id: str, message: Message) -> None:
+        inbox = self.inboxes[message_bus_id].setdefault(recipient_id, [])
+        inbox.append(message)
+        inbox.sort()
+
+    def get_next_unread_message(
+        self, message_bus_id: str, recipient_id: str, last_read_message_id: int
+    ) -> Optional[Message]:
+        for message in self.inboxes[message_bus_id].get(recipient_id, []):
+            if message.id > last_read_message_id and not message.is_expired():
+                return message
+        return None
+
+    def remove_received_message(
+        self, message_bus_id: str, sender_id: str, recipient_ids: List[str], message_id: int
+    ) -> None:
+        for recipient_id in recipient_ids:
+            inbox = self.inboxes[message_bus_id].get(recipient_id, [])
+            inbox[:] = [message for message in inbox if message.id != message_id]
+
+
+class TestMinimalStorage(AbstractTests.TestStorageBackendABC, unittest.TestCase):
+    def get_storage_backend(self) -> StorageBackend:
+        return MinimalStorage()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import unittest
+
+from rustic_ai.messagebus import DeduplicationFilter, Message
+
+
+class TestDeduplicationFilter(unittest.TestCase):
+    def test_duplicates_within_the_window(self):
+        dedup = DeduplicationFilter(window=1)
+        self.assertFalse(dedup.is_duplicate("a", now=0))
+        self.assertTrue(dedup.is_duplicate("a", now=999))
+        self.assertFalse(dedup.is_duplicate("b", now=999))
+
+    def test_keys_leave_the_window(self):
+        dedup = DeduplicationFilter(window=1)
+        dedup.is_duplicate("a", now=0)
+        dedup.is_duplicate("b", now=500)
+        self.assertFalse(dedup.is_duplicate("a", now=1000))
+        # The window starts when a key is first seen, and the expired key was seen anew
+        self.assertTrue(dedup.is_duplicate("a", now=1400))
+        self.assertEqual(len(dedup), 2)
+        dedup.is_duplicate("c", now=1500)
+        self.assertEqual(len(dedup), 2)
+
+    def test_memory_is_bounded(self):
+        dedup = DeduplicationFilter(window=60, capacity=100)
+        for key in range(1000):
+            dedup.is_duplicate(key, now=key)
+        self.assertEqual(len(dedup), 100)
+        self.assertTrue(dedup.is_duplicate(999, now=1000))
+        self.assertFalse(dedup.is_duplicate(0, now=1000))
+
+    def test_filter_messages(self):
+        dedup = DeduplicationFilter()
+        messages = [
+            Message(1, "sender_1", {}, idempotency_key="a"),
+            Message(2, "sender_1", {}, idempotency_key="a"),
+            Message(3, "sender_2", {}, idempotency_key="a"),
+            Message(4, "sender_1", {}),
+            Message(5, "sender_1", {}),
+        ]
+        self.assertListEqual([message.id for message in dedup.filter(messages)], [1, 3, 4, 5])
+        self.assertListEqual(dedup.filter(messages[:3]), [])
+
+        dedup.clear()
+        self.assertEqual(len(dedup.filter(messages[:3])), 2)
+
+    def test_forget(self):
+        dedup = DeduplicationFilter()
+        messages = [Message(1, "sender_1", {}, idempotency_key="a"), Message(2, "sender_1", {})]
+        kept = dedup.filter(messages)
+
+        dedup.forget(kept)
+        self.assertEqual(len(dedup), 0)
+        self.assertListEqual(dedup.filter(messages), messages)
+
+    def test_concurrent_checks(self):
+        dedup = DeduplicationFilter()
+        new_keys = []
+
+        def check():
+            for key in range(1000):
+                if not dedup.is_duplicate(key):
+                    new_keys.append(key)
+
+        threads = [threading.Thread(target=check) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(sorted(new_keys), list(range(1000)))
+
+    def test_capacity_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            DeduplicationFilter(capacity=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
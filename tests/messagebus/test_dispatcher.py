@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from rustic_ai.messagebus import CallbackClient, ExecutorDispatcher, MessageBus, SimpleClient
+
+
+class TestExecutorDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = ExecutorDispatcher(max_workers=4)
+        self.message_bus = MessageBus(dispatcher=self.dispatcher)
+        self.sender = SimpleClient('sender', self.message_bus)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def test_send_does_not_wait_for_callbacks(self):
+        release = threading.Event()
+        received = []
+
+        def slow_callback(message):
+            release.wait(5)
+            received.append(message)
+
+        CallbackClient('slow', self.message_bus, slow_callback)
+
+        start = time.monotonic()
+        message = self.sender.send_message({"data": "Hello"}, ['slow'])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertListEqual(received, [])
+
+        release.set()
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+        self.assertListEqual(received, [message])
+
+    def test_client_notifications_are_serial(self):
+        running = {'slow': 0, 'fast': 0}
+        overlaps = []
+        received = {'slow': [], 'fast': []}
+        lock = threading.Lock()
+
+        def callback(client_id):
+            def handle(message):
+                with lock:
+                    running[client_id] += 1
+                    if running[client_id] > 1:
+                        overlaps.append(client_id)
+                time.sleep(0.001)
+                received[client_id].append(message)
+                with lock:
+                    running[client_id] -= 1
+
+            return handle
+
+        CallbackClient('slow', self.message_bus, callback('slow'))
+        CallbackClient('fast', self.message_bus, callback('fast'))
+
+        sent = [self.sender.send_message({"index": index}, ['slow', 'fast']) for index in range(50)]
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+
+        self.assertListEqual(overlaps, [])
+        self.assertListEqual(received['slow'], sent)
+        self.assertListEqual(received['fast'], sent)
+
+    def test_callback_errors_do_not_stop_dispatch(self):
+        received = []
+
+        def callback(message):
+            received.append(message)
+            raise Exception('Error in callback')
+
+        CallbackClient('failing', self.message_bus, callback)
+        sent = self.sender.send_messages([{"index": 0}, {"index": 1}], ['failing'])
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+        self.assertListEqual(received, sent)
+
+    def test_given_executor(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        dispatcher = ExecutorDispatcher(executor)
+        message_bus = MessageBus(dispatcher=dispatcher)
+        sender = SimpleClient('sender', message_bus)
+        receiver = SimpleClient('receiver', message_bus)
+
+        sender.send_message({"data": "Hello"}, ['receiver'])
+        self.assertTrue(dispatcher.wait_until_idle(5))
+        self.assertTrue(receiver.new_message_event.is_set())
+
+        # The executor belongs to the caller, shutting down the dispatcher leaves it running
+        dispatcher.shutdown()
+        self.assertEqual(executor.submit(lambda: 42).result(), 42)
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
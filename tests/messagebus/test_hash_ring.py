@@ -0,0 +1,55 @@
+import unittest
+
+from rustic_ai.messagebus import ConsistentHashRing
+
+
+class TestConsistentHashRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = ConsistentHashRing(["shard_1", "shard_2", "shard_3"])
+        self.keys = [f"client_{index}" for index in range(3000)]
+
+    def test_keys_are_spread(self):
+        counts = {node: 0 for node in self.ring.nodes}
+        for key in self.keys:
+            counts[self.ring.get_node(key)] += 1
+
+        for count in counts.values():
+            self.assertGreater(count, 500)
+
+    def test_placement_is_stable(self):
+        other = ConsistentHashRing(["shard_3", "shard_1", "shard_2"])
+        self.assertListEqual([self.ring.get_node(key) for key in self.keys], [other.get_node(key) for key in self.keys])
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        before = {key: self.ring.get_node(key) for key in self.keys}
+        self.ring.add_node("shard_4")
+        moved = [key for key in self.keys if self.ring.get_node(key) != before[key]]
+
+        self.assertTrue(moved)
+        self.assertLess(len(moved), len(self.keys) / 2)
+        self.assertTrue(all(self.ring.get_node(key) == "shard_4" for key in moved))
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        before = {key: self.ring.get_node(key) for key in self.keys}
+        self.ring.remove_node("shard_2")
+
+        self.assertListEqual(self.ring.nodes, ["shard_1", "shard_3"])
+        for key in self.keys:
+            if before[key] != "shard_2":
+                self.assertEqual(self.ring.get_node(key), before[key])
+
+    def test_adding_nodes_at_once(self):
+        ring = ConsistentHashRing()
+        ring.add_nodes(["shard_2", "shard_1", "shard_3", "shard_1"])
+
+        self.assertListEqual(ring.points, sorted(ring.points))
+        self.assertEqual(len(ring.points), 3 * ring.virtual_nodes)
+        self.assertListEqual([ring.get_node(key) for key in self.keys], [self.ring.get_node(key) for key in self.keys])
+
+    def test_empty_ring(self):
+        with self.assertRaises(ValueError):
+            ConsistentHashRing().get_node("client")
+
+
+if __name__ == '__main__':
+    unittest.main()
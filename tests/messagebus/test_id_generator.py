@@ -1,7 +1,24 @@
+import threading
 import time
 import unittest
+from types import ModuleType
+from typing import Optional
+from unittest.mock import patch
 
-from rustic_ai.messagebus.utils import GemstoneGenerator, Priority
+from rustic_ai.messagebus.utils import (
+    SEQUENCE_BITMASK,
+    ClockMovedBackwardsError,
+    GemstoneGenerator,
+    GemstoneID,
+    Priority,
+    encode_gemstone_id,
+)
+
+np: Optional[ModuleType]
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
 
 
 class TestUtils(unittest.TestCase):
@@ -61,6 +78,144 @@ class TestUtils(unittest.TestCase):
         id3 = id1.from_int(id2)
         self.assertEqual(id1, id3)
 
+    def test_id_generator_is_thread_safe(self):
+        ids = []
+
+        def generate():
+            generated = [self.generator.get_id(Priority.NORMAL).to_int() for _ in range(2000)]
+            ids.extend(generated)
+
+        threads = [threading.Thread(target=generate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(ids)), 8 * 2000)
+
+    def test_reserve(self):
+        ids = self.generator.reserve(100, Priority.HIGH)
+        self.assertEqual(len(set(ids)), 100)
+        self.assertEqual(ids, sorted(ids))
+        for id in ids:
+            gemstone_id = GemstoneID.from_int(id)
+            self.assertEqual(gemstone_id.priority, Priority.HIGH)
+            self.assertEqual(gemstone_id.machine_id, 1)
+
+        # IDs generated afterwards come after the reserved block
+        self.assertGreater(self.generator.get_id(Priority.HIGH).to_int(), ids[-1])
+        self.assertEqual(self.generator.reserve(0, Priority.HIGH), [])
+
+    def test_reserve_borrows_the_next_millisecond(self):
+        count = 3 * (SEQUENCE_BITMASK + 1)
+        ids = self.generator.reserve(count, Priority.NORMAL)
+        self.assertEqual(len(set(ids)), count)
+        self.assertEqual(ids, sorted(ids))
+
+        # Consecutive sequence numbers in one millisecond are consecutive integers
+        gemstone_ids = [GemstoneID.from_int(id) for id in ids]
+        self.assertEqual(ids[1] - ids[0], 1)
+        self.assertGreaterEqual(gemstone_ids[-1].timestamp - gemstone_ids[0].timestamp, 2)
+
+        # The generator keeps counting from the borrowed millisecond
+        next_id = self.generator.get_id(Priority.NORMAL)
+        self.assertGreater(next_id.to_int(), ids[-1])
+
+    def test_concurrent_reserve(self):
+        blocks = []
+
+        def reserve():
+            blocks.append(self.generator.reserve(5000, Priority.NORMAL))
+
+        threads = [threading.Thread(target=reserve) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ids = [id for block in blocks for id in block]
+        self.assertEqual(len(set(ids)), 4 * 5000)
+
+    def test_int_id_matches_gemstone_id(self):
+        id = self.generator.get_int_id(Priority.HIGH)
+        decoded = GemstoneID.from_int(id)
+        self.assertEqual(decoded.priority, Priority.HIGH)
+        self.assertEqual(decoded.machine_id, 1)
+        self.assertEqual(
+            encode_gemstone_id(decoded.priority, decoded.timestamp, decoded.machine_id, decoded.sequence_number), id
+        )
+        self.assertGreater(self.generator.get_int_id(Priority.HIGH), id)
+
+    @unittest.skipUnless(np, "numpy is not installed")
+    def test_decode_array(self):
+        ids = [self.generator.get_int_id(priority) for priority in Priority] + self.generator.reserve(3, Priority.LOW)
+        columns = GemstoneID.decode_array(ids)
+
+        for column in (columns, GemstoneID.decode_array(np.array(ids, dtype=np.uint64))):
+            for index, id in enumerate(ids):
+                expected = GemstoneID.from_int(id)
+                self.assertEqual(column["priority"][index], expected.priority)
+                self.assertEqual(column["timestamp"][index], expected.timestamp)
+                self.assertEqual(column["machine_id"][index], expected.machine_id)
+                self.assertEqual(column["sequence_number"][index], expected.sequence_number)
+
+    @unittest.skipUnless(np, "numpy is not installed")
+    def test_decode_signed_array(self):
+        # Low priority IDs wrap around when stored as signed 64-bit integers, e.g. in a database column
+        ids = [self.generator.get_int_id(Priority.LOW), self.generator.get_int_id(Priority.URGENT)]
+        signed = np.array(ids, dtype=np.uint64).view(np.int64)
+        self.assertLess(signed[0], 0)
+
+        columns = GemstoneID.decode_array(signed)
+        self.assertListEqual(columns["priority"].tolist(), [Priority.LOW, Priority.URGENT])
+        self.assertListEqual(
+            columns["sequence_number"].tolist(), [GemstoneID.from_int(id).sequence_number for id in ids]
+        )
+
+    def test_clock_moved_backwards(self):
+        with patch(
+            "rustic_ai.messagebus.utils.time.time_ns",
+            side_effect=[1_700_000_000_000_000_000, 1_699_999_999_995_000_000],
+        ):
+            self.generator.get_id(Priority.NORMAL)
+            with self.assertRaises(ClockMovedBackwardsError):
+                self.generator.get_id(Priority.NORMAL)
+
+    def test_hybrid_clock(self):
+        generator = GemstoneGenerator(1, hybrid_clock=True)
+        milliseconds = [1_700_000_000_000, 1_699_999_999_995, 1_699_999_999_998, 1_699_999_999_990, 1_700_000_000_001]
+        with patch("rustic_ai.messagebus.utils.time.time_ns", side_effect=[ms * 1_000_000 for ms in milliseconds]):
+            ids = [generator.get_int_id(Priority.NORMAL) for _ in milliseconds]
+
+        self.assertListEqual(ids, sorted(set(ids)))
+        self.assertListEqual(
+            [GemstoneID.from_int(id).timestamp for id in ids],
+            [1_700_000_000_000] * 4 + [1_700_000_000_001],
+        )
+        # Two steps back: to 995, caught up from until 998, then to 990
+        self.assertDictEqual(generator.get_clock_skew_metrics(), {"count": 2, "last_skew": 10, "max_skew": 10})
+
+    def test_hybrid_clock_counts_a_step_back_once(self):
+        generator = GemstoneGenerator(1, hybrid_clock=True)
+        milliseconds = [1_700_000_000_000] + [1_699_999_999_995] * 10
+        with patch("rustic_ai.messagebus.utils.time.time_ns", side_effect=[ms * 1_000_000 for ms in milliseconds]):
+            for _ in milliseconds:
+                generator.get_int_id(Priority.NORMAL)
+
+        self.assertDictEqual(generator.get_clock_skew_metrics(), {"count": 1, "last_skew": 5, "max_skew": 5})
+
+    def test_hybrid_clock_reserve(self):
+        generator = GemstoneGenerator(1, hybrid_clock=True)
+        with patch(
+            "rustic_ai.messagebus.utils.time.time_ns",
+            side_effect=[1_700_000_000_000_000_000, 1_699_999_999_999_000_000],
+        ):
+            first = generator.reserve(10, Priority.HIGH)
+            second = generator.reserve(10, Priority.HIGH)
+
+        self.assertGreater(second[0], first[-1])
+        self.assertEqual(generator.get_clock_skew_metrics()["last_skew"], 1)
+
     # Test raise error on comparison with non-GemstoneID
     def test_id_comparison_with_non_id(self):
         id1 = self.generator.get_id(Priority.URGENT)
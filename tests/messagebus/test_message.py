@@ -29,11 +29,107 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(message.sender, deserialized.sender)
         self.assertEqual(message.content, deserialized.content)
 
+    def test_message_is_slotted(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"})
+        with self.assertRaises(AttributeError):
+            message.unknown_field = "value"
+
+    def test_deserialization_decodes_content_lazily(self):
+        message = Message(
+            self._get_id(Priority.HIGH), "test_sender", {"content": "Hello!"}, ["r1"], priority=Priority.HIGH
+        )
+        # Corrupt the content part only, headers must still be readable without touching the content
+        serialized = message.serialize().replace("Hello!", '"broken')
+        deserialized = Message.deserialize(serialized)
+        self.assertEqual(deserialized.id, message.id)
+        self.assertEqual(deserialized.sender, "test_sender")
+        self.assertEqual(deserialized.priority, Priority.HIGH)
+        self.assertEqual(deserialized.recipients, ["r1"])
+        with self.assertRaises(ValueError):
+            deserialized.content
+
+    def test_deserialization_keeps_serialized_form(self):
+        serialized = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"}).serialize()
+        self.assertIs(Message.deserialize(serialized).serialize(), serialized)
+        self.assertEqual(Message.deserialize(serialized.encode("utf-8")).content, {"content": "Hello!"})
+
+    def test_deserialization_of_single_document_format(self):
+        serialized = '{"id": 1, "sender": "test_sender", "content": {"content": "Hello!"}, "priority": 4}'
+        deserialized = Message.deserialize(serialized)
+        self.assertEqual(deserialized.id, 1)
+        self.assertEqual(deserialized.content, {"content": "Hello!"})
+
+    def test_codec_round_trip(self):
+        message = Message(
+            self._get_id(Priority.HIGH),
+            "test_sender",
+            {"content": "Hello!", "values": [1, 2.5, None]},
+            ["r1", "r2"],
+            priority=Priority.HIGH,
+            in_reply_to=42,
+            topic="agents.results",
+            expires_at=1_700_000_000_000,
+            idempotency_key="request-1",
+        )
+        for codec in ("json", "binary"):
+            decoded = Message.decode(message.encode(codec))
+            self.assertEqual(decoded.to_dict(), message.to_dict())
+
+    def test_binary_codec_is_compact(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"}, ["r1"])
+        self.assertLess(len(message.encode("binary")), len(message.encode("json")) / 2)
+
+    def test_binary_codec_keeps_optional_fields_empty(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"}, topic="")
+        decoded = Message.decode(message.encode("binary"))
+        self.assertEqual(decoded.recipients, [])
+        self.assertIsNone(decoded.in_reply_to)
+        self.assertEqual(decoded.topic, "")
+        self.assertEqual(decoded.thread_id, message.id)
+        self.assertIsNone(decoded.expires_at)
+        self.assertIsNone(decoded.idempotency_key)
+
+    def test_message_expiry(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"}, expires_at=1000)
+        self.assertFalse(message.is_expired(999))
+        self.assertTrue(message.is_expired(1000))
+        self.assertTrue(message.is_expired())
+        self.assertFalse(Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"}).is_expired())
+
+    def test_encoded_form_is_invalidated_by_set_content(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"})
+        message.encode("binary")
+        message.set_content({"content": "Goodbye!"})
+        self.assertEqual(Message.decode(message.encode("binary")).content, {"content": "Goodbye!"})
+
+    def test_unknown_codec(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"})
+        with self.assertRaises(ValueError):
+            message.encode("unknown")
+        with self.assertRaises(ValueError):
+            Message.decode(b"\xff")
+
     def test_set_content(self):
         message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"})
         message.set_content({"content": "Goodbye!"})
         self.assertEqual(message.content, {"content": "Goodbye!"})
 
+    def test_encoded_forms_are_cached(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"})
+        self.assertIs(message.get_content(), message.get_content())
+        self.assertIs(message.serialize(), message.serialize())
+
+    def test_set_content_invalidates_encoded_forms(self):
+        message = Message(self._get_id(Priority.NORMAL), "test_sender", {"content": "Hello!"})
+        message.serialize()
+        message.get_content()
+        message.set_content({"content": "Goodbye!"})
+        self.assertIn("Goodbye!", message.get_content())
+        self.assertEqual(Message.deserialize(message.serialize()).content, {"content": "Goodbye!"})
+
+        message.content = {"content": "Hello again!"}
+        self.assertIn("Hello again!", message.serialize())
+
     def test_message_sorting_by_time(self):
         message1 = Message(self._get_id(Priority.NORMAL), "test_sender", '{"content": "Hello!"}')
         message2 = Message(self._get_id(Priority.NORMAL), "test_sender", '{"content": "Hello!"}')
@@ -1,6 +1,16 @@
 import unittest
+from unittest.mock import patch
 
-from rustic_ai.messagebus import BroadcastRoutingPolicy, InMemoryStorage, MessageBus, SimpleClient
+from rustic_ai.messagebus import (
+    BroadcastRoutingPolicy,
+    InboxFullError,
+    InboxLimits,
+    InMemoryStorage,
+    Message,
+    MessageBus,
+    Priority,
+    SimpleClient,
+)
 
 
 class TestMessageBus(unittest.TestCase):
@@ -61,6 +71,103 @@ class TestMessageBus(unittest.TestCase):
         self.assertEqual(len(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']), 0)
         self.assertEqual(len(self.message_bus.storage.inboxes[self.message_bus.id]['client_3']), 0)
 
+    def test_send_messages(self):
+        ids = self.message_bus.generate_message_ids(3, Priority.NORMAL)
+        messages = [
+            Message(ids[0], 'client_1', {"data": 0}),
+            Message(ids[1], 'client_1', {"data": 1}, ['client_2']),
+            Message(ids[2], 'client_1', {"data": 2}),
+        ]
+
+        storage = self.message_bus.storage
+        with patch.object(storage, 'add_messages_to_inbox', wraps=storage.add_messages_to_inbox) as add:
+            with patch.object(self.client_2, 'notify_new_message') as notify:
+                self.message_bus.send_messages(messages)
+
+        # One bulk write per recipient, and one notification per recipient
+        self.assertEqual(add.call_count, 2)
+        notify.assert_called_once_with()
+        self.assertListEqual(list(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']), messages)
+        self.assertListEqual(
+            list(self.message_bus.storage.inboxes[self.message_bus.id]['client_3']), [messages[0], messages[2]]
+        )
+        self.assertListEqual(list(self.message_bus.storage.inboxes[self.message_bus.id]['client_1']), [])
+
+    def test_send_messages_with_invalid_recipient(self):
+        ids = self.message_bus.generate_message_ids(2, Priority.NORMAL)
+        messages = [Message(ids[0], 'client_1', {"data": 0}), Message(ids[1], 'client_1', {"data": 1}, ['nobody'])]
+
+        with self.assertRaises(ValueError):
+            self.message_bus.send_messages(messages)
+
+        # Nothing is stored when a message of the batch cannot be routed
+        self.assertListEqual(list(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']), [])
+
+    def test_send_message_with_idempotency_key(self):
+        inboxes = self.message_bus.storage.inboxes[self.message_bus.id]
+        first = self.client_1.send_message({"data": "Hello"}, ['client_2'], idempotency_key="request-1")
+        self.client_1.send_message({"data": "Hello"}, ['client_2'], idempotency_key="request-1")
+        self.assertListEqual(list(inboxes['client_2']), [first])
+
+        # Keys are scoped by sender
+        second = self.client_3.send_message({"data": "Hello"}, ['client_2'], idempotency_key="request-1")
+        self.assertListEqual(list(inboxes['client_2']), [first, second])
+
+    def test_send_message_with_invalid_recipient_can_be_retried(self):
+        message_id = self.message_bus.generate_message_id(Priority.NORMAL)
+        with self.assertRaises(ValueError):
+            self.message_bus.send_message(Message(message_id, 'client_1', {}, ['nobody'], idempotency_key="key"))
+
+        message = self.client_1.send_message({}, ['client_2'], idempotency_key="key")
+        self.assertListEqual(list(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']), [message])
+
+    def test_send_message_failing_to_store_can_be_retried(self):
+        message_bus = MessageBus(storage_backend=InMemoryStorage(InboxLimits(max_messages=1)))
+        sender = SimpleClient('sender', message_bus)
+        receiver = SimpleClient('receiver', message_bus)
+        sender.send_message({"n": 0}, ['receiver'])
+        with self.assertRaises(InboxFullError):
+            sender.send_message({"n": 1}, ['receiver'], idempotency_key="k")
+        batch = [Message(message_bus.generate_message_id(Priority.NORMAL), 'sender', {}, idempotency_key="b")]
+        with self.assertRaises(InboxFullError):
+            message_bus.send_messages(batch)
+
+        # The keys of the messages which could not be stored are not kept, so their retries go through
+        receiver.get_next_unread_message()
+        retried = sender.send_message({"n": 1}, ['receiver'], idempotency_key="k")
+        self.assertEqual(receiver.get_next_unread_message(), retried)
+        message_bus.send_messages(batch)
+        self.assertEqual(receiver.get_next_unread_message(), batch[0])
+        message_bus.close()
+
+    def test_send_messages_with_idempotency_keys(self):
+        ids = self.message_bus.generate_message_ids(4, Priority.NORMAL)
+        messages = [
+            Message(ids[0], 'client_1', {"data": 0}, ['client_2'], idempotency_key="a"),
+            Message(ids[1], 'client_1', {"data": 1}, ['client_2'], idempotency_key="a"),
+            Message(ids[2], 'client_1', {"data": 2}, ['client_2']),
+            Message(ids[3], 'client_1', {"data": 3}, ['client_2']),
+        ]
+        self.message_bus.send_messages(messages)
+        self.message_bus.send_messages(messages[:1])
+        self.assertListEqual(
+            list(self.message_bus.storage.inboxes[self.message_bus.id]['client_2']),
+            [messages[0], messages[2], messages[3]],
+        )
+
+    def test_get_thread(self):
+        root = self.client_1.send_message({"data": "question"})
+        unrelated = self.client_1.send_message({"data": "unrelated"}, ['client_2'])
+        replies = [self.client_2.reply(root, {"data": "answer 2"}), self.client_3.reply(root, {"data": "answer 3"})]
+
+        self.assertListEqual(self.message_bus.get_thread(root.id), [root] + replies)
+        self.assertListEqual(self.message_bus.get_thread(unrelated.id), [unrelated])
+
+        # The replies are read, the question is still in the inbox of client_3
+        while self.client_1.get_next_unread_message() is not None:
+            pass
+        self.assertListEqual(self.message_bus.get_thread(root.id), [root])
+
 
 if __name__ == '__main__':
     unittest.main()
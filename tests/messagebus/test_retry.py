@@ -0,0 +1,166 @@
+import threading
+import time
+import unittest
+
+from rustic_ai.messagebus import CallbackClient, InMemoryStorage, Message, MessageBus, RetryPolicy, SimpleClient
+from rustic_ai.messagebus.retry import RetryScheduler
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_delays_grow_exponentially_up_to_the_maximum(self):
+        policy = RetryPolicy(max_attempts=6, initial_delay=0.5, multiplier=3, max_delay=10)
+        self.assertListEqual([policy.get_delay(n) for n in range(1, 6)], [0.5, 1.5, 4.5, 10, 10])
+
+    def test_invalid_max_attempts(self):
+        with self.assertRaises(ValueError):
+            RetryPolicy(max_attempts=0)
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def test_clients_are_notified_when_due(self):
+        storage = InMemoryStorage()
+        message_bus = MessageBus(storage_backend=storage)
+        notified = threading.Event()
+        threads = []
+
+        def callback(message):
+            pass
+
+        client = CallbackClient('client', message_bus, callback)
+        client.notify_new_message = lambda: (threads.append(threading.current_thread().name), notified.set())
+        scheduler = RetryScheduler()
+        start = time.time()
+
+        scheduler.schedule(0.05, client, lambda: 1 / 0)
+        scheduler.schedule(0.05, client, lambda: None)
+
+        # A failing callback does not stop the others, and clients are notified off the thread of the timers
+        self.assertTrue(notified.wait(5))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+        self.assertListEqual(threads, [threads[0]])
+        self.assertNotEqual(threads[0], "message-retries")
+        scheduler.close()
+
+
+class TestCallbackRetries(unittest.TestCase):
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.message_bus = MessageBus(storage_backend=self.storage)
+        self.sender = SimpleClient('sender', self.message_bus)
+
+    def tearDown(self):
+        self.message_bus.close()
+
+    def _wait_for_dead_letter(self, timeout: float = 5) -> Message:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            dead_letter = self.message_bus.get_next_dead_letter()
+            if dead_letter is not None:
+                return dead_letter
+            time.sleep(0.005)
+        self.fail("No dead letter")
+
+    def test_transient_failure_is_retried(self):
+        attempts = []
+        handled = threading.Event()
+
+        def callback(message):
+            attempts.append(message)
+            if len(attempts) < 3:
+                raise Exception('Transient error')
+            handled.set()
+
+        CallbackClient('receiver', self.message_bus, callback, RetryPolicy(initial_delay=0.01))
+        sent = self.sender.send_message({"data": "Hello"}, ['receiver'])
+
+        # The first attempt runs on the delivery path, the retries after their delay
+        self.assertEqual(len(attempts), 1)
+        self.assertTrue(handled.wait(5))
+        self.assertListEqual(attempts, [sent] * 3)
+        self.assertIsNone(self.message_bus.get_next_dead_letter())
+
+    def test_failing_message_goes_to_dead_letters(self):
+        received = []
+
+        def callback(message):
+            received.append(message)
+            if message.content["fail"]:
+                raise ValueError('Permanent error')
+
+        CallbackClient('receiver', self.message_bus, callback, RetryPolicy(max_attempts=2, initial_delay=0.01))
+        failing = self.sender.send_message({"fail": True}, ['receiver'])
+        # Other messages are handled while the failing one waits for its retry
+        passing = self.sender.send_message({"fail": False}, ['receiver'])
+
+        dead_letter = self._wait_for_dead_letter()
+
+        self.assertListEqual(received, [failing, passing, failing])
+        self.assertEqual(dead_letter.sender, 'receiver')
+        self.assertEqual(dead_letter.priority, failing.priority)
+        self.assertEqual(dead_letter.content["message"], failing.to_dict())
+        self.assertEqual(dead_letter.content["error"], "ValueError: Permanent error")
+        self.assertEqual(dead_letter.content["attempts"], 2)
+        self.assertIsNone(self.message_bus.get_next_dead_letter(dead_letter.id))
+
+    def test_retries_do_not_overlap_deliveries(self):
+        active = []
+        overlaps = []
+        handled = threading.Event()
+        attempts = []
+
+        def callback(message):
+            active.append(message)
+            if len(active) > 1:
+                overlaps.append(message)
+            time.sleep(0.001)
+            active.remove(message)
+            if message.content["fail"]:
+                attempts.append(threading.current_thread().name)
+                if len(attempts) < 3:
+                    raise Exception('Transient error')
+                handled.set()
+
+        CallbackClient('receiver', self.message_bus, callback, RetryPolicy(initial_delay=0.01))
+        self.sender.send_message({"fail": True}, ['receiver'])
+        deadline = time.time() + 5
+        while not handled.is_set() and time.time() < deadline:
+            self.sender.send_message({"fail": False}, ['receiver'])
+
+        self.assertTrue(handled.is_set())
+        # The retries run on the delivery path, one message of the client at a time
+        self.assertListEqual(overlaps, [])
+        self.assertNotIn("message-retries", attempts)
+
+    def test_single_attempt_goes_to_dead_letters_at_once(self):
+        def callback(message):
+            raise Exception('Error in callback')
+
+        CallbackClient('receiver', self.message_bus, callback, RetryPolicy(max_attempts=1))
+        sent = self.sender.send_message({}, ['receiver'])
+
+        dead_letter = self.message_bus.get_next_dead_letter()
+        self.assertEqual(dead_letter.content["message"]["id"], sent.id)
+        self.assertEqual(dead_letter.content["attempts"], 1)
+
+    def test_no_policy_drops_the_message(self):
+        received = []
+
+        def callback(message):
+            received.append(message)
+            raise Exception('Error in callback')
+
+        CallbackClient('receiver', self.message_bus, callback)
+        self.sender.send_message({}, ['receiver'])
+
+        self.assertEqual(len(received), 1)
+        self.assertIsNone(self.message_bus.get_next_dead_letter())
+
+    def test_dead_letter_inbox_is_reserved(self):
+        with self.assertRaises(ValueError):
+            SimpleClient(MessageBus.DEAD_LETTER_INBOX, self.message_bus)
+        with self.assertRaises(ValueError):
+            self.sender.send_message({}, [MessageBus.DEAD_LETTER_INBOX])
+
+
+if __name__ == '__main__':
+    unittest.main()
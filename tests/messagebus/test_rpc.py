@@ -0,0 +1,162 @@
+import threading
+import unittest
+from concurrent.futures import CancelledError
+
+from rustic_ai.messagebus import CallbackClient, InMemoryStorage, Message, MessageBus, SimpleClient
+from rustic_ai.messagebus.rpc import ReplyIndex
+
+
+class TestReplyIndex(unittest.TestCase):
+    def setUp(self):
+        self.replies = ReplyIndex()
+
+    def tearDown(self):
+        self.replies.close()
+
+    def test_resolve(self):
+        future = self.replies.register(1, 'client_1')
+        reply = Message(2, 'client_2', {}, recipients=['client_1', 'client_3'], in_reply_to=1)
+
+        self.assertListEqual(self.replies.resolve(reply, ['client_1', 'client_3']), ['client_3'])
+        self.assertIs(future.result(0), reply)
+        self.assertEqual(len(self.replies), 0)
+
+    def test_unrelated_messages_are_untouched(self):
+        future = self.replies.register(1, 'client_1')
+
+        self.assertListEqual(self.replies.resolve(Message(2, 'client_2', {}), ['client_1']), ['client_1'])
+        other_reply = Message(3, 'client_2', {}, in_reply_to=7)
+        self.assertListEqual(self.replies.resolve(other_reply, ['client_1']), ['client_1'])
+        # A reply to the request sent to someone else than the requester does not resolve it
+        misrouted = Message(4, 'client_2', {}, in_reply_to=1)
+        self.assertListEqual(self.replies.resolve(misrouted, ['client_3']), ['client_3'])
+        self.assertFalse(future.done())
+
+    def test_timeout(self):
+        future = self.replies.register(1, 'client_1', timeout=0.02)
+
+        with self.assertRaises(TimeoutError):
+            future.result(5)
+        self.assertEqual(len(self.replies), 0)
+        reply = Message(2, 'client_2', {}, in_reply_to=1)
+        self.assertListEqual(self.replies.resolve(reply, ['client_1']), ['client_1'])
+
+    def test_cancel(self):
+        future_1 = self.replies.register(1, 'client_1', timeout=60)
+        future_2 = self.replies.register(2, 'client_2')
+
+        self.replies.cancel('client_1')
+
+        self.assertTrue(future_1.cancelled())
+        self.assertFalse(future_2.done())
+        self.assertEqual(len(self.replies), 1)
+
+    def test_reply_after_cancel_goes_to_inbox(self):
+        future = self.replies.register(1, 'client_1')
+        future.cancel()
+
+        reply = Message(2, 'client_2', {}, in_reply_to=1)
+        self.assertListEqual(self.replies.resolve(reply, ['client_1']), ['client_1'])
+
+
+class TestRequestReply(unittest.TestCase):
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.message_bus = MessageBus(storage_backend=self.storage)
+        self.requester = SimpleClient('requester', self.message_bus)
+        self.responder = SimpleClient('responder', self.message_bus)
+
+    def tearDown(self):
+        self.message_bus.close()
+
+    def test_request_reply(self):
+        future = self.requester.request({"question": 1}, 'responder', timeout=5)
+        request = self.responder.get_next_unread_message()
+        self.assertEqual(request.content, {"question": 1})
+
+        reply = self.responder.reply(request, {"answer": 2})
+
+        self.assertEqual(future.result(0), reply)
+        self.assertEqual(reply.in_reply_to, request.id)
+        self.assertEqual(reply.thread_id, request.thread_id)
+        # The reply is never stored in the inbox of the requester
+        self.assertIsNone(self.requester.get_next_unread_message())
+        self.assertFalse(self.requester.new_message_event.is_set())
+        self.assertEqual(len(self.message_bus.replies), 0)
+
+    def test_unrelated_traffic_stays_in_inbox(self):
+        future = self.requester.request({}, 'responder')
+        other = self.responder.send_message({"data": "unrelated"}, ['requester'])
+
+        reply = self.responder.reply(self.responder.get_next_unread_message(), {})
+
+        self.assertEqual(future.result(0), reply)
+        self.assertEqual(self.requester.get_next_unread_message(), other)
+        self.assertIsNone(self.requester.get_next_unread_message())
+
+    def test_batched_reply(self):
+        future = self.requester.request({}, 'responder')
+        request = self.responder.get_next_unread_message()
+        reply = Message(
+            self.message_bus.generate_message_id(request.priority),
+            'responder',
+            {},
+            recipients=['requester'],
+            in_reply_to=request.id,
+        )
+
+        self.message_bus.send_messages([reply])
+
+        self.assertEqual(future.result(0), reply)
+        self.assertIsNone(self.requester.get_next_unread_message())
+
+    def test_request_timeout(self):
+        future = self.requester.request({}, 'responder', timeout=0.02)
+
+        with self.assertRaises(TimeoutError):
+            future.result(5)
+
+        # A late reply lands in the inbox
+        reply = self.responder.reply(self.responder.get_next_unread_message(), {})
+        self.assertEqual(self.requester.get_next_unread_message(), reply)
+
+    def test_request_to_unknown_client(self):
+        with self.assertRaises(ValueError):
+            self.requester.request({}, 'nobody')
+        self.assertEqual(len(self.message_bus.replies), 0)
+
+    def test_unregister_cancels_requests(self):
+        future = self.requester.request({}, 'responder')
+
+        self.message_bus.unregister_client(self.requester)
+
+        with self.assertRaises(CancelledError):
+            future.result(0)
+
+    def test_concurrent_requests(self):
+        def answer(message):
+            responder.reply(message, {"n": message.content["n"] * 2})
+
+        responder = CallbackClient('doubler', self.message_bus, answer)
+        results = {}
+
+        def ask(n):
+            results[n] = self.requester.request({"n": n}, 'doubler', timeout=5).result(5).content["n"]
+
+        threads = [threading.Thread(target=ask, args=(n,)) for n in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertDictEqual(results, {n: n * 2 for n in range(50)})
+        self.assertIsNone(self.requester.get_next_unread_message())
+
+    def test_timeouts_cost_no_thread_per_request(self):
+        threads = threading.active_count()
+        futures = [self.requester.request({}, 'responder', timeout=60) for _ in range(100)]
+
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        for future in futures:
+            future.cancel()
+        self.assertEqual(len(self.message_bus.replies), 0)
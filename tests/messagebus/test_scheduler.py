@@ -0,0 +1,143 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from rustic_ai.messagebus import InMemoryStorage, Message, MessageBus, Priority, SimpleClient
+
+
+class TestMessageScheduler(unittest.TestCase):
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.message_bus = MessageBus(machine_id=1, storage_backend=self.storage)
+        self.client_1 = SimpleClient('client_1', self.message_bus)
+        self.client_2 = SimpleClient('client_2', self.message_bus)
+
+    def tearDown(self):
+        self.message_bus.close()
+
+    def _wait_for_message(self, client: SimpleClient, timeout: float = 5) -> Message:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            message = client.get_next_unread_message()
+            if message is not None:
+                return message
+            time.sleep(0.005)
+        self.fail("No message delivered")
+
+    def test_delayed_message(self):
+        scheduled = self.client_1.send_message({"data": "later"}, ['client_2'], delay=0.05)
+        sent = self.client_1.send_message({"data": "now"}, ['client_2'])
+        self.assertEqual(self.client_2.get_next_unread_message(), sent)
+        self.assertIsNone(self.client_2.get_next_unread_message())
+
+        delivered = self._wait_for_message(self.client_2)
+        self.assertEqual(delivered.content, {"data": "later"})
+        self.assertEqual(delivered.sender, 'client_1')
+        # Delivered with a new ID, after the messages already delivered
+        self.assertGreater(delivered.id, sent.id)
+        self.assertEqual(delivered.thread_id, delivered.id)
+        self.assertNotEqual(delivered.id, scheduled.id)
+
+    def test_messages_are_delivered_in_due_order(self):
+        now = int(time.time() * 1000)
+        self.client_1.send_message({"n": 2}, ['client_2'], deliver_at=now + 60)
+        self.client_1.send_message({"n": 1}, ['client_2'], deliver_at=now + 30)
+        self.client_1.send_message({"n": 3}, ['client_2'], deliver_at=now + 90)
+
+        received = [self._wait_for_message(self.client_2).content["n"] for _ in range(3)]
+        self.assertListEqual(received, [1, 2, 3])
+
+    def test_ttl_starts_at_delivery(self):
+        now = int(time.time() * 1000)
+        scheduled = self.client_1.send_message({}, ['client_2'], deliver_at=now + 10_000, ttl=5)
+        self.assertEqual(scheduled.expires_at, now + 15_000)
+
+    def test_scheduled_idempotent_message(self):
+        self.client_1.send_message({}, ['client_2'], delay=60, idempotency_key="retry-1")
+        self.client_1.send_message({}, ['client_2'], delay=60, idempotency_key="retry-1")
+        self.assertEqual(len(self.storage.scheduled[self.message_bus.id]), 1)
+
+    def test_scheduled_messages_cost_no_threads(self):
+        threads = threading.active_count()
+        for n in range(10_000):
+            self.client_1.send_message({"n": n}, ['client_2'], delay=60)
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        self.assertEqual(
+            self.storage.get_next_due_time(self.message_bus.id),
+            min(deliver_at for deliver_at, _, _ in self.storage.scheduled[self.message_bus.id]),
+        )
+
+    def test_message_to_a_client_gone_is_dropped(self):
+        self.message_bus.scheduler.retry_delay = 0.01
+        self.message_bus.scheduler.max_attempts = 3
+        self.client_1.send_message({"n": 1}, ['client_2'], delay=0.02)
+        client_3 = SimpleClient('client_3', self.message_bus)
+        self.client_1.send_message({"n": 2}, ['client_3'], delay=0.02)
+        self.message_bus.unregister_client(client_3)
+
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(self._wait_for_message(self.client_2).content, {"n": 1})
+            deadline = time.time() + 5
+            while self.storage.get_next_due_time(self.message_bus.id) is not None and time.time() < deadline:
+                time.sleep(0.005)
+        self.assertDictEqual(self.message_bus.scheduler.attempts, {})
+
+    def test_message_waits_for_its_recipient_to_register(self):
+        self.message_bus.scheduler.retry_delay = 0.01
+        self.message_bus.scheduler.max_attempts = 1000
+        self.client_1.send_message({"n": 1}, ['client_3'], delay=0.01)
+        client_3 = SimpleClient('client_3', self.message_bus)
+        self.message_bus.unregister_client(client_3)
+        time.sleep(0.1)
+        self.assertTrue(self.message_bus.scheduler.attempts)
+
+        # The first client is kept referenced, so its finalizer does not unregister the second one
+        client_3_again = SimpleClient('client_3', self.message_bus)
+        self.assertEqual(self._wait_for_message(client_3_again).content, {"n": 1})
+
+    def test_message_failing_in_the_storage_is_not_lost(self):
+        self.message_bus.scheduler.retry_delay = 0.01
+        add_messages_to_inbox = self.storage.add_messages_to_inbox
+        schedule_message = self.storage.schedule_message
+        failures = {"add": 2, "schedule": 1}
+
+        def failing_add(*args):
+            if failures["add"]:
+                failures["add"] -= 1
+                raise RuntimeError("Storage unavailable")
+            add_messages_to_inbox(*args)
+
+        def failing_schedule(*args):
+            # The message is scheduled, then fails to be scheduled again once it failed to be sent
+            if failures["schedule"] and not failures["add"]:
+                failures["schedule"] -= 1
+                raise RuntimeError("Storage unavailable")
+            schedule_message(*args)
+
+        # The message can be neither sent nor scheduled again at first, and is held until the storage recovers
+        with patch.object(self.storage, 'add_messages_to_inbox', failing_add), patch.object(
+            self.storage, 'schedule_message', failing_schedule
+        ), self.assertLogs(level="ERROR"):
+            self.client_1.send_message({"n": 1}, ['client_2'], delay=0.01)
+            self.assertEqual(self._wait_for_message(self.client_2).content, {"n": 1})
+        self.assertDictEqual(failures, {"add": 0, "schedule": 0})
+        self.assertListEqual(self.message_bus.scheduler.held, [])
+
+    def test_scheduled_messages_are_delivered_after_a_restart(self):
+        message_id = self.message_bus.generate_message_id(Priority.NORMAL)
+        self.message_bus.close()
+        self.storage.schedule_message(
+            self.message_bus.id, Message(message_id, 'client_1', {"data": "pending"}, ['client_2']), 0
+        )
+
+        restarted = MessageBus(id=self.message_bus.id, machine_id=1, storage_backend=self.storage)
+        client = SimpleClient('client_2', restarted)
+        try:
+            self.assertEqual(self._wait_for_message(client).content, {"data": "pending"})
+        finally:
+            restarted.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import multiprocessing
+import queue
+import shutil
+import unittest
+import uuid
+
+from rustic_ai.messagebus import (
+    CallbackClient,
+    SharedMemoryMessageBus,
+    SharedMemoryStorage,
+    SimpleClient,
+    TopicRoutingPolicy,
+)
+
+
+def _run_echo_process(namespace: str, ready, stop) -> None:
+    message_bus = SharedMemoryMessageBus(id="bus", machine_id=2, storage_backend=SharedMemoryStorage(namespace))
+
+    def echo(message):
+        client.send_message(message.content, [message.sender])
+
+    client = CallbackClient("echo", message_bus, echo)
+    ready.set()
+    stop.wait(30)
+    message_bus.unregister_client(client)
+    message_bus.close()
+    message_bus.storage.close()
+
+
+class TestSharedMemoryMessageBus(unittest.TestCase):
+    def setUp(self):
+        # Each bus stands for a process, with its own storage over the same namespace
+        self.namespace = uuid.uuid4().hex
+        self.buses = [
+            SharedMemoryMessageBus(
+                id="bus",
+                machine_id=index + 1,
+                storage_backend=SharedMemoryStorage(self.namespace),
+                routing_policy=TopicRoutingPolicy(),
+            )
+            for index in range(2)
+        ]
+
+    def tearDown(self):
+        registry_path = self.buses[0].registry.path
+        for message_bus in self.buses:
+            for client in list(message_bus.clients.values()):
+                message_bus.unregister_client(client)
+            message_bus.close()
+            message_bus.storage.close()
+        shutil.rmtree(registry_path)
+
+    def _callback_client(self, client_id: str, message_bus: SharedMemoryMessageBus) -> "queue.Queue":
+        received: queue.Queue = queue.Queue()
+        CallbackClient(client_id, message_bus, received.put)
+        return received
+
+    def test_send_to_a_client_of_another_process(self):
+        received = self._callback_client("receiver", self.buses[0])
+        sender = SimpleClient("sender", self.buses[1])
+
+        sender.send_message({"data": 1}, ["receiver"])
+        message = received.get(timeout=10)
+        self.assertEqual(message.content, {"data": 1})
+        self.assertEqual(message.sender, "sender")
+
+    def test_scheduled_message_to_a_client_of_another_process(self):
+        received = self._callback_client("receiver", self.buses[0])
+        sender = SimpleClient("sender", self.buses[1])
+
+        sender.send_message({"data": 1}, ["receiver"], delay=0.05)
+        self.assertEqual(received.get(timeout=10).content, {"data": 1})
+
+    def test_topic_subscriptions_of_other_processes(self):
+        received = self._callback_client("receiver", self.buses[0])
+        self.buses[0].subscribe("receiver", "orders.*")
+        sender = SimpleClient("sender", self.buses[1])
+
+        sender.send_message({"data": 1}, topic="orders.created")
+        sender.send_message({"data": 2}, topic="invoices.created")
+        self.assertEqual(received.get(timeout=10).content, {"data": 1})
+
+        self.buses[0].unsubscribe("receiver", "orders.*")
+        sender.send_message({"data": 3}, topic="orders.created")
+        self.buses[0].subscribe("receiver", "invoices.*")
+        sender.send_message({"data": 4}, topic="invoices.created")
+        self.assertEqual(received.get(timeout=10).content, {"data": 4})
+
+    def test_unregistered_client_of_another_process(self):
+        receiver = SimpleClient("receiver", self.buses[0])
+        sender = SimpleClient("sender", self.buses[1])
+        self.buses[0].unregister_client(receiver)
+
+        with self.assertRaises(ValueError):
+            sender.send_message({}, ["receiver"])
+
+    def test_client_registered_by_another_process(self):
+        SimpleClient("client", self.buses[0])
+        with self.assertRaises(ValueError):
+            SimpleClient("client", self.buses[1])
+
+    def test_reply_from_another_os_process(self):
+        context = multiprocessing.get_context("spawn")
+        ready, stop = context.Event(), context.Event()
+        child = context.Process(target=_run_echo_process, args=(self.namespace, ready, stop))
+        child.start()
+        try:
+            self.assertTrue(ready.wait(30))
+            received = self._callback_client("requester", self.buses[0])
+            self.buses[0].clients["requester"].send_message({"data": "ping"}, ["echo"])
+            message = received.get(timeout=10)
+            self.assertEqual(message.content, {"data": "ping"})
+            self.assertEqual(message.sender, "echo")
+        finally:
+            stop.set()
+            child.join(30)
+        self.assertEqual(child.exitcode, 0)
+        with self.assertRaises(ValueError):
+            self.buses[0].clients["requester"].send_message({}, ["echo"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import random
+import threading
+import time
+import unittest
+
+from rustic_ai.messagebus.timer_wheel import TimerService, TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+    def test_timers_fire_on_the_first_tick_after_their_deadline(self):
+        wheel = TimerWheel(tick=10, slots=4, levels=3, start=0)
+        wheel.schedule(25, "a")
+        wheel.schedule(30, "b")
+        self.assertEqual(len(wheel), 2)
+
+        self.assertListEqual(wheel.advance(29), [])
+        self.assertListEqual(wheel.advance(30), ["a", "b"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_past_deadlines_fire_on_the_next_tick(self):
+        wheel = TimerWheel(tick=10, start=1000)
+        wheel.schedule(500, "late")
+        self.assertListEqual(wheel.advance(1010), ["late"])
+
+    def test_cancelled_timers_do_not_fire(self):
+        wheel = TimerWheel(tick=10, slots=4, levels=2, start=0)
+        handle = wheel.schedule(100, "cancelled")
+        wheel.schedule(100, "kept")
+        wheel.cancel(handle)
+        self.assertListEqual(wheel.advance(200), ["kept"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_deadlines_beyond_the_range_of_the_wheels(self):
+        # Two wheels of four slots of 10 ms only cover 160 ms
+        wheel = TimerWheel(tick=10, slots=4, levels=2, start=0)
+        wheel.schedule(1000, "far")
+        self.assertListEqual(wheel.advance(990), [])
+        self.assertListEqual(wheel.advance(1000), ["far"])
+
+    def test_random_deadlines(self):
+        rng = random.Random(7)
+        wheel = TimerWheel(tick=1, slots=8, levels=3, start=0)
+        deadlines = {index: rng.randrange(1, 2000) for index in range(500)}
+        for index, deadline in deadlines.items():
+            wheel.schedule(deadline, index)
+
+        now = 0
+        while now < 2000:
+            now += rng.randrange(1, 20)
+            for index in wheel.advance(now):
+                self.assertLessEqual(deadlines[index], now)
+                self.assertGreater(deadlines.pop(index), now - 20)
+        self.assertDictEqual(deadlines, {})
+
+    def test_slots_must_be_a_power_of_two(self):
+        with self.assertRaises(ValueError):
+            TimerWheel(slots=100)
+
+
+class TestTimerService(unittest.TestCase):
+    def test_timers_fire_on_the_background_thread(self):
+        fired = []
+        done = threading.Event()
+
+        def callback(items):
+            fired.extend(items)
+            if len(fired) == 2:
+                done.set()
+
+        service = TimerService(callback, tick=5)
+        self.assertIsNone(service.thread)
+        now = int(time.time() * 1000)
+        service.schedule(now + 30, "second")
+        service.schedule(now + 10, "first")
+        service.cancel(service.schedule(now + 20, "cancelled"))
+
+        self.assertTrue(done.wait(5))
+        self.assertListEqual(fired, ["first", "second"])
+        service.close()
+        self.assertFalse(service.thread.is_alive())